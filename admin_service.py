@@ -6,7 +6,9 @@ from db import *
 from notification_service import *
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from db_encryption_wrapper import wrap_get_dict_function, wrap_get_list_function
+from db_async import adb, run_db
 from crypto_service import mask_card_number, mask_phone, mask_name
+from config import PAYMENT_RECONCILE_WINDOW_HOURS
 
 # Set up logging
 logging.basicConfig(
@@ -31,8 +33,12 @@ async def process_receipt_verification_update(order_id, is_verified):
         # Log the action for debugging
         logger.info(f"Processing receipt verification update for order {order_id}. Verified: {is_verified}")
         
+        # The status update queues the invalid receipt notice itself, but only
+        # once per order; a repeated rejection is announced from here
+        already_notified = is_verified is False and await adb.has_notification_log('invalid_receipt', order_id)
+        
         # Update status in database
-        status_updated = update_receipt_verification_status(order_id, is_verified)
+        status_updated = await adb.update_receipt_verification_status(order_id, is_verified)
         
         if not status_updated:
             logger.error(f"Failed to update verification status for order {order_id}")
@@ -41,7 +47,7 @@ async def process_receipt_verification_update(order_id, is_verified):
         # If verification is False (invalid), notify appropriate user
         if is_verified is False:
             # Get payment method to determine which type of receipt was rejected
-            payment_details = debug_order_payment(order_id)
+            payment_details = await adb.debug_order_payment(order_id)
             
             if payment_details:
                 payment_method = payment_details.get('payment_method')
@@ -50,7 +56,7 @@ async def process_receipt_verification_update(order_id, is_verified):
                     # This is an artisan commission receipt, notify artisan
                     logger.info(f"Commission receipt for order {order_id} marked as invalid, notifying artisan")
                     await notify_artisan_about_invalid_commission(order_id)
-                else:
+                elif already_notified or not payment_details.get('receipt_file_id'):
                     # This is a customer payment receipt, notify customer
                     logger.info(f"Payment receipt for order {order_id} marked as invalid, notifying customer")
                     await notify_customer_about_invalid_receipt(order_id)
@@ -75,85 +81,34 @@ async def process_admin_payment_completed_update(order_id, is_completed):
     """
     try:
         # Update status in database
-        status_updated = set_admin_payment_completed(order_id, is_completed)
+        status_updated = await adb.set_admin_payment_completed(order_id, is_completed)
         
         if not status_updated:
             logger.error(f"Failed to update admin payment status for order {order_id}")
             return False
         
-        # If payment is completed, notify artisan
+        # The artisan is notified through the payment event the update queued
         if is_completed:
-            logger.info(f"Admin payment for order {order_id} marked as completed, notifying artisan")
-            await notify_artisan_about_payment_transfer(order_id)
+            logger.info(f"Admin payment for order {order_id} marked as completed")
         
         return True
     except Exception as e:
         logger.error(f"Error in process_admin_payment_completed_update: {e}")
         return False
 
-# Function to periodically check for status changes
+# Fallback for payment notifications missed by the event path
 async def check_payment_status_changes():
-    """Periodically check for payment status changes in the database
+    """Queue payment notifications that no payment event covered
     
-    This function can be called in a loop at regular intervals
+    update_receipt_verification_status and the admin payment setters queue
+    their notifications in the same transaction as the status change. This
+    sweep only looks at payments updated within PAYMENT_RECONCILE_WINDOW_HOURS,
+    catching changes made outside those functions.
     """
     try:
-        from db import execute_query
-        
-        # Get orders with receipt_verified = 0 (meaning invalid)
-        # Only for card payments
-        invalid_receipts_query = """
-            SELECT order_id
-            FROM order_payments
-            WHERE receipt_verified = 0
-            AND payment_method != 'cash'
-            AND receipt_file_id IS NOT NULL
-            AND NOT EXISTS (
-                SELECT 1 FROM notification_log 
-                WHERE notification_type = 'invalid_receipt' 
-                AND target_id = order_id
-            )
-        """
-        
-        # Get orders with admin_payment_completed = true that haven't been notified
-        completed_payments_query = """
-            SELECT order_id
-            FROM order_payments
-            WHERE admin_payment_completed = TRUE
-            AND NOT EXISTS (
-                SELECT 1 FROM notification_log 
-                WHERE notification_type = 'payment_transfer' 
-                AND target_id = order_id
-            )
-        """
-        
-        # Check pending receipts
-        invalid_receipts = execute_query(invalid_receipts_query, fetchall=True)
-        for receipt in invalid_receipts:
-            order_id = receipt[0]
-            logger.info(f"Found pending receipt for order {order_id}")
-            await notify_customer_about_invalid_receipt(order_id)
-            
-            # Log notification
-            log_query = """
-                INSERT INTO notification_log (notification_type, target_id, created_at)
-                VALUES ('invalid_receipt', %s, CURRENT_TIMESTAMP)
-            """
-            execute_query(log_query, (order_id,), commit=True)
-        
-        # Check completed payments
-        completed_payments = execute_query(completed_payments_query, fetchall=True)
-        for payment in completed_payments:
-            order_id = payment[0]
-            logger.info(f"Found completed payment for order {order_id}")
-            await notify_artisan_about_payment_transfer(order_id)
-            
-            # Log notification
-            log_query = """
-                INSERT INTO notification_log (notification_type, target_id, created_at)
-                VALUES ('payment_transfer', %s, CURRENT_TIMESTAMP)
-            """
-            execute_query(log_query, (order_id,), commit=True)
+        queued = await adb.reconcile_payment_events(PAYMENT_RECONCILE_WINDOW_HOURS)
+        if queued:
+            logger.warning(f"Payment reconciliation queued {queued} missed notifications")
             
     except Exception as e:
         logger.error(f"Error in check_payment_status_changes: {e}")
@@ -170,21 +125,17 @@ async def verify_customer_fine_receipt(receipt_id, is_verified, admin_id):
         bool: True if successful, False otherwise
     """
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
         # Get receipt details
-        cursor.execute(
+        receipt = await adb.execute_query(
             """
             SELECT customer_id, file_id
             FROM customer_fine_receipts
             WHERE id = %s
             """,
-            (receipt_id,)
+            (receipt_id,),
+            fetchone=True
         )
         
-        receipt = cursor.fetchone()
-        
         if not receipt:
             logger.error(f"Receipt {receipt_id} not found")
             return False
@@ -192,28 +143,28 @@ async def verify_customer_fine_receipt(receipt_id, is_verified, admin_id):
         customer_id = receipt[0]
         
         # Update receipt status
-        cursor.execute(
+        await adb.execute_query(
             """
             UPDATE customer_fine_receipts
             SET status = %s, verified_by = %s, verified_at = CURRENT_TIMESTAMP
             WHERE id = %s
             """,
-            ('verified' if is_verified else 'rejected', admin_id, receipt_id)
+            ('verified' if is_verified else 'rejected', admin_id, receipt_id),
+            commit=True
         )
         
         # If verified, unblock customer
         if is_verified:
             # Unblock customer
-            unblock_customer(customer_id)
+            await adb.unblock_customer(customer_id)
             
             # Get customer telegram_id
-            cursor.execute(
+            customer_result = await adb.execute_query(
                 "SELECT telegram_id FROM customers WHERE id = %s",
-                (customer_id,)
+                (customer_id,),
+                fetchone=True
             )
             
-            customer_result = cursor.fetchone()
-            
             if customer_result and customer_result[0]:
                 # Notify customer
                 keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
@@ -233,13 +184,12 @@ async def verify_customer_fine_receipt(receipt_id, is_verified, admin_id):
                 )
         else:
             # Get customer telegram_id
-            cursor.execute(
+            customer_result = await adb.execute_query(
                 "SELECT telegram_id FROM customers WHERE id = %s",
-                (customer_id,)
+                (customer_id,),
+                fetchone=True
             )
             
-            customer_result = cursor.fetchone()
-            
             if customer_result and customer_result[0]:
                 # Create retry button
                 keyboard = InlineKeyboardMarkup()
@@ -258,16 +208,10 @@ async def verify_customer_fine_receipt(receipt_id, is_verified, admin_id):
                     parse_mode="Markdown"
                 )
         
-        conn.commit()
         return True
     except Exception as e:
         logger.error(f"Error verifying customer fine receipt: {e}")
-        if conn:
-            conn.rollback()
         return False
-    finally:
-        if conn:
-            conn.close()
 
 
 
@@ -284,14 +228,14 @@ async def request_customer_card_details(order_id, amount, reason):
     """
     try:
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for refund request")
             return False
         
         # Get customer details - normal version for direct contact
         customer_id = order.get('customer_id')
-        customer = get_customer_by_id(customer_id)
+        customer = await adb.get_customer_by_id(customer_id)
         if not customer:
             logger.error(f"Customer not found for order {order_id}")
             return False
@@ -302,16 +246,14 @@ async def request_customer_card_details(order_id, amount, reason):
             return False
         
         # Store refund info in database
-        from db import create_refund_request
-        refund_id = create_refund_request(order_id, amount, reason)
+        refund_id = await adb.create_refund_request(order_id, amount, reason)
         
         if not refund_id:
             logger.error(f"Failed to create refund request for order {order_id}")
             return False
         
         # Set context for the customer
-        from db import set_user_context
-        set_user_context(customer_telegram_id, {
+        await adb.set_user_context(customer_telegram_id, {
             "action": "provide_card_details",
             "refund_id": refund_id,
             "order_id": order_id,
@@ -334,8 +276,7 @@ async def request_customer_card_details(order_id, amount, reason):
         )
         
         # For admin notifications - get masked customer details
-        from db_encryption_wrapper import wrap_get_dict_function
-        masked_customer = wrap_get_dict_function(get_customer_by_id, mask=True)(customer_id)
+        masked_customer = await run_db(wrap_get_dict_function(get_customer_by_id, mask=True), customer_id)
         masked_customer_name = masked_customer.get('name', 'Müştəri')
         
         # Notify admins about the refund request creation with masked data
@@ -377,8 +318,7 @@ async def process_customer_card_details(customer_id, card_number, refund_id):
         from payment_service import secure_store_card_details
         
         # Get refund details and order_id
-        from db import get_refund_request
-        refund = get_refund_request(refund_id)
+        refund = await adb.get_refund_request(refund_id)
         if not refund:
             logger.error(f"Refund request {refund_id} not found")
             return False
@@ -387,14 +327,13 @@ async def process_customer_card_details(customer_id, card_number, refund_id):
         
         # Kart məlumatlarını şifrələnmiş şəkildə saxla
         # İstifadəçinin kart nömrəsini şifrələyərək saxlayır və yalnız əlaqəli açarla deşifrə edilə bilər
-        success = secure_store_card_details(order_id, card_number)
+        success = await run_db(secure_store_card_details, order_id, card_number)
         
         if not success:
             logger.error(f"Failed to securely store card details for order {order_id}")
         
         # 2. Refund request-i yenilə, lakin kart nömrəsini birbaşa saxlama
-        from db import update_refund_request
-        success = update_refund_request(refund_id, {
+        success = await adb.update_refund_request(refund_id, {
             'status': 'pending_admin'
             # Kart nömrəsini refund cədvəlində saxlamırıq. Əvəzinə, payment_card_details cədvəlində şifrələnmiş formada saxlayırıq.
         })
@@ -404,26 +343,22 @@ async def process_customer_card_details(customer_id, card_number, refund_id):
             return False
         
         # Get order details
-        from db import get_order_details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         
         if not order:
             logger.error(f"Order {order_id} not found for refund notification")
             return False
         
         # 3. Maskalanmış məlumatları almaq üçün xüsusi wrapper funksiya istifadə et
-        from db_encryption_wrapper import wrap_get_dict_function
         from db import get_customer_by_id
-        from crypto_service import mask_card_number
         
         # Müştəri məlumatlarını maskalanmış şəkildə al
-        masked_customer = wrap_get_dict_function(get_customer_by_id, mask=False)(customer_id)
+        masked_customer = await run_db(wrap_get_dict_function(get_customer_by_id, mask=False), customer_id)
         
         # Ad, telefon məlumatları maskalanmış olacaq, məs: "J*** D***"
         customer_name = masked_customer.get('name', 'Unknown')
         
         # Kart numarasını maskele
-        from crypto_service import mask_card_number
         card_number_display = mask_card_number(card_number)
         
         # 4. Adminlərə həssas məlumatları maskalanmış şəkildə göndər
@@ -449,7 +384,7 @@ async def process_customer_card_details(customer_id, card_number, refund_id):
         # 5. Müştəriyə məlumat göndər - normal, maskalanmamış şəkildə
         # Bu, müştərinin öz məlumatları olduğu üçün maskalanmağa ehtiyac yoxdur
         # Get normal customer data (not masked)
-        customer = get_customer_by_id(customer_id)
+        customer = await adb.get_customer_by_id(customer_id)
         customer_telegram_id = customer.get('telegram_id')
         
         if customer_telegram_id:
@@ -479,8 +414,7 @@ async def complete_refund_process(refund_id, admin_id):
     """
     try:
         # Update refund status
-        from db import update_refund_request
-        success = update_refund_request(refund_id, {
+        success = await adb.update_refund_request(refund_id, {
             'status': 'completed',
             'completed_by': admin_id,
             'completed_at': 'CURRENT_TIMESTAMP'
@@ -491,8 +425,7 @@ async def complete_refund_process(refund_id, admin_id):
             return False
         
         # Get refund details
-        from db import get_refund_request
-        refund = get_refund_request(refund_id)
+        refund = await adb.get_refund_request(refund_id)
         
         if not refund:
             logger.error(f"Refund request {refund_id} not found after update")
@@ -500,7 +433,7 @@ async def complete_refund_process(refund_id, admin_id):
         
         # Get order details
         order_id = refund.get('order_id')
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         
         if not order:
             logger.error(f"Order {order_id} not found for refund completion")
@@ -508,20 +441,19 @@ async def complete_refund_process(refund_id, admin_id):
         
         # Get customer details - normal version for notification to customer
         customer_id = order.get('customer_id')
-        customer = get_customer_by_id(customer_id)
+        customer = await adb.get_customer_by_id(customer_id)
         
         if not customer:
             logger.error(f"Customer {customer_id} not found for refund completion")
             return False
         
         # For admin notifications - get masked customer data
-        from db_encryption_wrapper import wrap_get_dict_function
-        masked_customer = wrap_get_dict_function(get_customer_by_id, mask=False)(customer_id)
+        masked_customer = await run_db(wrap_get_dict_function(get_customer_by_id, mask=False), customer_id)
         masked_customer_name = masked_customer.get('name', 'Müştəri')
         
         # Get card details in masked form for admin confirmation
         from payment_service import get_card_details
-        masked_card = get_card_details(order_id, mask=False)
+        masked_card = await run_db(get_card_details, order_id, mask=False)
         card_display = "Kart məlumatı yoxdur"
         if masked_card:
             card_display = masked_card.get('card_number', 'Kart məlumatı yoxdur')
@@ -0,0 +1,79 @@
+# benchmarks/decrypt_benchmark.py
+"""
+Measure bulk decryption throughput.
+
+Encrypts a set of telegram_id / name / phone style values with the bot's
+key and decrypts them serially with decrypt_data and in bulk with
+decrypt_many on the inline, thread and process pools. The decryption cache
+is purged before every run, so each run decrypts every value. Run from the
+project root (needs the same .env as the bot, no database):
+
+    python benchmarks/decrypt_benchmark.py
+    python benchmarks/decrypt_benchmark.py --rows 20000 --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crypto_service  # noqa: E402
+from crypto_service import encrypt_data, decrypt_data, decrypt_many, purge_decryption_cache  # noqa: E402
+
+
+def sample_values(rows):
+    kinds = [
+        lambda i: str(100000000 + i),
+        lambda i: f"Test İstifadəçi {i}",
+        lambda i: f"+99450{i % 10000000:07d}",
+    ]
+    return [encrypt_data(kinds[i % 3](i)) for i in range(rows)]
+
+
+def serial(ciphertexts):
+    return [decrypt_data(value) for value in ciphertexts]
+
+
+def bulk(pool, ciphertexts):
+    crypto_service.DECRYPT_POOL = pool
+    crypto_service.shutdown_decrypt_pool()
+    if pool != "inline":
+        # Start the workers outside the measurement
+        decrypt_many(ciphertexts[:crypto_service.DECRYPT_WORKERS * 2], threshold=1)
+    purge_decryption_cache()
+    started = time.perf_counter()
+    result = decrypt_many(ciphertexts, threshold=1)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=crypto_service.DECRYPT_WORKERS)
+    args = parser.parse_args()
+    crypto_service.DECRYPT_WORKERS = args.workers
+
+    ciphertexts = sample_values(args.rows)
+    purge_decryption_cache()
+    started = time.perf_counter()
+    expected = serial(ciphertexts)
+    serial_seconds = time.perf_counter() - started
+
+    print(f"{args.rows} values, {args.workers} workers")
+    print(f"{'mode':<10} {'workers':>7} {'seconds':>9} {'rows/s':>10} {'rows/s/core':>12} {'speedup':>8}")
+    print(f"{'serial':<10} {1:>7} {serial_seconds:>9.3f} {args.rows / serial_seconds:>10.0f} "
+          f"{args.rows / serial_seconds:>12.0f} {1:>8.2f}")
+    for pool in ("inline", "thread", "process"):
+        result, seconds = bulk(pool, ciphertexts)
+        if result != expected:
+            print(f"{pool:<10} returned different values")
+            continue
+        workers = 1 if pool == "inline" else args.workers
+        print(f"{pool:<10} {workers:>7} {seconds:>9.3f} {args.rows / seconds:>10.0f} "
+              f"{args.rows / seconds / workers:>12.0f} {serial_seconds / seconds:>8.2f}")
+    crypto_service.shutdown_decrypt_pool()
+
+
+if __name__ == "__main__":
+    main()
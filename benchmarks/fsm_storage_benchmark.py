@@ -0,0 +1,86 @@
+# benchmarks/fsm_storage_benchmark.py
+"""
+Measure FSM storage get_state / set_data latency.
+
+Compares aiogram's MemoryStorage with MySQLStorage, both with its local
+cache and reading through to MySQL on every call. Run from the project root
+(needs the same .env and database as the bot):
+
+    python benchmarks/fsm_storage_benchmark.py
+    python benchmarks/fsm_storage_benchmark.py --users 200 --rounds 5
+
+The benchmark writes to negative chat IDs, which Telegram never assigns to
+private chats, and deletes them afterwards.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.contrib.fsm_storage.memory import MemoryStorage  # noqa: E402
+from fsm_storage import MySQLStorage  # noqa: E402
+
+FIRST_CHAT = -900000000
+SAMPLE_DATA = {
+    "name": "Test İstifadəçi",
+    "phone": "+994501234567",
+    "service": "Santexnik",
+    "latitude": 40.4093,
+    "longitude": 49.8671,
+    "note": "Mətbəxdə su sızır",
+}
+
+
+async def timed(samples, coroutine):
+    started = time.perf_counter()
+    await coroutine
+    samples.append((time.perf_counter() - started) * 1000)
+
+
+async def run(storage, users, rounds):
+    chats = [FIRST_CHAT - i for i in range(users)]
+    get_state, set_data = [], []
+    for round_number in range(rounds):
+        for chat in chats:
+            await timed(set_data, storage.set_data(chat=chat, user=chat, data=dict(SAMPLE_DATA, round=round_number)))
+            await timed(get_state, storage.get_state(chat=chat, user=chat))
+    for chat in chats:
+        await storage.reset_state(chat=chat, user=chat, with_data=True)
+    return get_state, set_data
+
+
+def describe(samples):
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"{statistics.median(ordered):>9.3f} {p95:>9.3f} {max(ordered):>9.3f}"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    storages = [
+        ("memory", MemoryStorage()),
+        ("mysql (cached)", MySQLStorage(cache_seconds=300)),
+        ("mysql (no cache)", MySQLStorage(cache_seconds=0)),
+    ]
+
+    print(f"{args.users} users x {args.rounds} rounds, latency in ms")
+    print(f"{'storage':<18} {'operation':<10} {'p50':>9} {'p95':>9} {'max':>9}")
+    for name, storage in storages:
+        get_state, set_data = await run(storage, args.users, args.rounds)
+        print(f"{name:<18} {'get_state':<10} {describe(get_state)}")
+        print(f"{name:<18} {'set_data':<10} {describe(set_data)}")
+        if isinstance(storage, MySQLStorage):
+            stats = storage.stats()
+            print(f"{'':<18} cache hits {stats['cache_hits']}, misses {stats['cache_misses']}, errors {stats['errors']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+# benchmarks/geo_distance_benchmark.py
+"""
+Compare scalar and vectorised Haversine costs for artisan searches.
+
+Run from the project root (needs the same .env as the bot, since geo_helpers imports db):
+
+    python benchmarks/geo_distance_benchmark.py
+    python benchmarks/geo_distance_benchmark.py --sizes 1000 10000 100000 --repeat 7
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo_helpers import calculate_distance, calculate_distances, np  # noqa: E402
+
+# Customer location and a spread of artisans around Baku
+ORIGIN = (40.4093, 49.8671)
+RADIUS_KM = 25
+
+
+def make_artisans(count, seed=42):
+    rng = random.Random(seed)
+    latitudes = [ORIGIN[0] + rng.uniform(-1.5, 1.5) for _ in range(count)]
+    longitudes = [ORIGIN[1] + rng.uniform(-2.0, 2.0) for _ in range(count)]
+    return latitudes, longitudes
+
+
+def scalar(latitudes, longitudes):
+    distances = [calculate_distance(ORIGIN[0], ORIGIN[1], lat, lon) for lat, lon in zip(latitudes, longitudes)]
+    mask = [d <= RADIUS_KM for d in distances]
+    return distances, mask
+
+
+def vectorised(latitudes, longitudes):
+    return calculate_distances(ORIGIN[0], ORIGIN[1], latitudes, longitudes, RADIUS_KM)
+
+
+def best_of(func, args, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"NumPy: {np.__version__ if np is not None else 'not installed (pure Python fallback)'}")
+    print(f"{'artisans':>10} {'scalar ms':>12} {'batch(list) ms':>16} {'batch(array) ms':>17} {'speedup':>9} {'in radius':>10}")
+
+    for size in args.sizes:
+        latitudes, longitudes = make_artisans(size)
+
+        scalar_time = best_of(scalar, (latitudes, longitudes), args.repeat)
+        batch_time = best_of(vectorised, (latitudes, longitudes), args.repeat)
+
+        # Cost when the coordinates already live in arrays (e.g. cached per service)
+        if np is not None:
+            lat_array, lon_array = np.asarray(latitudes), np.asarray(longitudes)
+            array_time = best_of(vectorised, (lat_array, lon_array), args.repeat)
+        else:
+            array_time = batch_time
+
+        # Both paths must agree before their timings mean anything
+        expected, expected_mask = scalar(latitudes, longitudes)
+        distances, mask = vectorised(latitudes, longitudes)
+        worst = max(abs(float(a) - b) for a, b in zip(distances, expected))
+        if worst > 1e-6 or [bool(m) for m in mask] != expected_mask:
+            raise SystemExit(f"Vectorised result differs from scalar result (max error {worst} km)")
+
+        print(
+            f"{size:>10} {scalar_time * 1000:>12.2f} {batch_time * 1000:>16.2f} "
+            f"{array_time * 1000:>17.2f} {scalar_time / batch_time:>8.1f}x {sum(expected_mask):>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
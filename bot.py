@@ -17,19 +17,25 @@ from admin_service import (
     process_receipt_verification_update,
     process_admin_payment_completed_update
 )
-import asyncio
 from aiogram import Bot, Dispatcher, executor, types
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from fsm_storage import storage, MySQLStorage
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 
 from config import *
 import handlers.customer_handler
 import handlers.artisan_handler
-import db_setup
+from migrations import run_migrations
 from db import *
+from db_async import adb, run_db
+from timer_service import timers, TASK_ORDER_ACCEPTANCE, TASK_DIRECT_ORDER_ACCEPTANCE
+from telegram_dispatcher import PRIORITY_NORMAL, PRIORITY_BULK
+from outbox_service import outbox, send_via_outbox
+from broadcast_service import broadcasts, start_broadcast, broadcast_call, update_progress_message
+from key_rotation import start_reencryption_job
 import re
 import handlers.start
 import html
+from datetime import datetime, timedelta
 
 # Configure logging
 logging.basicConfig(
@@ -77,7 +83,6 @@ def is_admin(user_id):
 
 # Initialize bot and dispatcher
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
 dp = Dispatcher(bot, storage=storage)
 
 # Set up database
@@ -85,9 +90,6 @@ async def on_startup(dp):
     """Execute actions on startup"""
     logger.info("Starting bot...")
     
-    # Run database setup
-    db_setup.setup_database()
-    
     # Register all notification and service modules
     try:
         import notification_service
@@ -97,8 +99,19 @@ async def on_startup(dp):
     except Exception as e:
         logger.error(f"Error loading service modules: {e}")
     
-    # Start scheduled tasks
-    asyncio.create_task(scheduled_tasks())
+    # Arm persisted timers once every service has registered its handlers
+    await timers.start()
+    schedule_periodic_jobs()
+    
+    # Deliver queued notifications, including those left over from before a restart
+    outbox.start()
+    
+    # Continue broadcasts interrupted by a restart
+    broadcasts.start()
+    
+    # Re-encrypt values still under a retired key (only while ENCRYPTION_OLD_KEYS is set)
+    if REENCRYPT_ON_STARTUP:
+        start_reencryption_job()
     
     logger.info("Bot started successfully!")
 
@@ -114,9 +127,9 @@ async def start(message: types.Message):
         is_admin_user = user_id in BOT_ADMINS  # Admin olub-olmadığını yoxla
         
         # Check if user is a blocked customer
-        customer = get_customer_by_telegram_id(user_id)
+        customer = await adb.get_customer_by_telegram_id(user_id)
         if customer:
-            is_blocked, reason, amount, block_until = get_customer_blocked_status(customer['id'])
+            is_blocked, reason, amount, block_until = await adb.get_customer_blocked_status(customer['id'])
             if is_blocked:
                 # Show blocked message with payment instructions
                 block_text = (
@@ -230,7 +243,8 @@ async def admin_panel(message: types.Message):
         InlineKeyboardButton("📊 Statistika", callback_data="admin_stats"),
         InlineKeyboardButton("🗑️ İstifadəçi Sil", callback_data="admin_delete_user"),
         InlineKeyboardButton("📨 Ustalara Toplu Mesaj Göndər", callback_data="send_bulk_message_to_artisans"),
-        InlineKeyboardButton("📨 Müştərilərə Toplu Mesaj Göndər", callback_data="send_bulk_message_to_customers")
+        InlineKeyboardButton("📨 Müştərilərə Toplu Mesaj Göndər", callback_data="send_bulk_message_to_customers"),
+        InlineKeyboardButton("📮 Çatdırılmamış Bildirişlər", callback_data="admin_outbox")
     )
     
     await message.answer(
@@ -266,7 +280,8 @@ async def admin_command(message: types.Message):
         InlineKeyboardButton("📊 Statistika", callback_data="admin_stats"),
         InlineKeyboardButton("🗑️ İstifadəçi Sil", callback_data="admin_delete_user"),
         InlineKeyboardButton("📨 Ustalara Toplu Mesaj Göndər", callback_data="send_bulk_message_to_artisans"),
-        InlineKeyboardButton("📨 Müştərilərə Toplu Mesaj Göndər", callback_data="send_bulk_message_to_customers")
+        InlineKeyboardButton("📨 Müştərilərə Toplu Mesaj Göndər", callback_data="send_bulk_message_to_customers"),
+        InlineKeyboardButton("📮 Çatdırılmamış Bildirişlər", callback_data="admin_outbox")
     )
     
     await message.answer(
@@ -301,6 +316,8 @@ async def admin_menu_handlers(callback_query: types.CallbackQuery):
             await show_admin_stats(callback_query.message)
         elif menu_option == "admin_delete_user":
             await show_admin_delete_user(callback_query.message)
+        elif menu_option == "admin_outbox":
+            await show_admin_outbox(callback_query.message)
         elif menu_option == "send_bulk_message_to_artisans":
             await send_bulk_message_to_artisans(callback_query.message)
         elif menu_option == "send_bulk_message_to_customers":
@@ -320,7 +337,7 @@ async def show_admin_receipts(message):
     """Show payment receipts for admin to verify"""
     try:
         # Get unverified and pending receipts
-        from db import execute_query, get_artisan_by_id, get_customer_by_id
+        from db import get_artisan_by_id, get_customer_by_id
         from crypto_service import decrypt_data
         from db_encryption_wrapper import decrypt_dict_data
         
@@ -340,7 +357,7 @@ async def show_admin_receipts(message):
             LIMIT 50
         """
         
-        receipts = execute_query(query, fetchall=True, dict_cursor=True)
+        receipts = await adb.execute_query(query, fetchall=True, dict_cursor=True)
         
         if not receipts:
             await message.answer("📭 Yoxlanılası qəbz tapılmadı.")
@@ -353,8 +370,8 @@ async def show_admin_receipts(message):
             order_id = receipt['id']
             
             # Şifreleri çözülmüş müşteri ve usta bilgilerini al
-            customer = get_admin_customer_by_id(receipt['customer_id'])
-            artisan = get_admin_artisan_by_id(receipt['artisan_id'])
+            customer = await adb.get_admin_customer_by_id(receipt['customer_id'])
+            artisan = await adb.get_admin_artisan_by_id(receipt['artisan_id'])
             
             # Get verification status
             status_text = ""
@@ -488,7 +505,6 @@ async def show_admin_orders(message):
     """Show orders for admin to manage"""
     try:
         # Get recent orders
-        from db import execute_query, get_artisan_by_id, get_customer_by_id
         from crypto_service import decrypt_data
         from db_encryption_wrapper import decrypt_dict_data
         
@@ -502,7 +518,7 @@ async def show_admin_orders(message):
             LIMIT 10
         """
         
-        orders = execute_query(query, fetchall=True, dict_cursor=True)
+        orders = await adb.execute_query(query, fetchall=True, dict_cursor=True)
         
         if not orders:
             await message.answer("📭 Aktiv sifariş tapılmadı.")
@@ -527,8 +543,8 @@ async def show_admin_orders(message):
         # Display recent orders
         for order in orders:
             # Şifreleri çözülmüş müşteri ve usta bilgilerini al
-            customer_encrypted = get_customer_by_id(order['customer_id'])
-            artisan_encrypted = get_artisan_by_id(order['artisan_id'])
+            customer_encrypted = await adb.get_customer_by_id(order['customer_id'])
+            artisan_encrypted = await adb.get_artisan_by_id(order['artisan_id'])
             
             # Şifreleri çöz ve maskele
             customer = decrypt_dict_data(customer_encrypted, mask=False)
@@ -620,57 +636,25 @@ async def show_admin_users(message):
 async def show_admin_stats(message):
     """Show system statistics for admin"""
     try:
-        # Get basic stats from database
-        from db import execute_query
-        
-        # Total customers
-        customers_query = "SELECT COUNT(*) FROM customers"
-        total_customers = execute_query(customers_query, fetchone=True)[0]
-        
-        # Total artisans
-        artisans_query = "SELECT COUNT(*) FROM artisans"
-        total_artisans = execute_query(artisans_query, fetchone=True)[0]
-        
-        # Total orders
-        orders_query = "SELECT COUNT(*) FROM orders"
-        total_orders = execute_query(orders_query, fetchone=True)[0]
-        
-        # Completed orders
-        completed_query = "SELECT COUNT(*) FROM orders WHERE status = 'completed'"
-        completed_orders = execute_query(completed_query, fetchone=True)[0]
-        
-        # Cancelled orders
-        cancelled_query = "SELECT COUNT(*) FROM orders WHERE status = 'cancelled'"
-        cancelled_orders = execute_query(cancelled_query, fetchone=True)[0]
-        
-        # Total revenue
-        revenue_query = "SELECT COALESCE(SUM(admin_fee), 0) FROM order_payments"
-        total_revenue = execute_query(revenue_query, fetchone=True)[0]
-        
-        # Orders by service
-        service_query = """
-            SELECT service, COUNT(*) as count
-            FROM orders
-            GROUP BY service
-            ORDER BY count DESC
-            LIMIT 5
-        """
-        service_stats = execute_query(service_query, fetchall=True)
+        # Totals come from the hourly rollup table, not from full table scans
+        stats = await adb.get_admin_stats()
+        if stats is None:
+            raise Exception("Admin stats rollup unavailable")
         
         # Format service stats
         service_text = ""
-        for service, count in service_stats:
+        for service, count in stats['top_services']:
             service_text += f"• {service}: {count} sifariş\n"
         
         # Create statistics message
         stats_text = (
             "📊 <b>Sistem Statistikaları</b>\n\n"
-            f"👤 <b>Müştərilər:</b> {total_customers}\n"
-            f"👷‍♂️ <b>Ustalar:</b> {total_artisans}\n\n"
-            f"📋 <b>Ümumi sifarişlər:</b> {total_orders}\n"
-            f"✅ <b>Tamamlanmış sifarişlər:</b> {completed_orders}\n"
-            f"❌ <b>Ləğv edilmiş sifarişlər:</b> {cancelled_orders}\n\n"
-            f"💰 <b>Ümumi komissiya gəliri:</b> {total_revenue:.2f} AZN\n\n"
+            f"👤 <b>Müştərilər:</b> {stats['customers']}\n"
+            f"👷‍♂️ <b>Ustalar:</b> {stats['artisans']}\n\n"
+            f"📋 <b>Ümumi sifarişlər:</b> {stats['orders']}\n"
+            f"✅ <b>Tamamlanmış sifarişlər:</b> {stats['completed_orders']}\n"
+            f"❌ <b>Ləğv edilmiş sifarişlər:</b> {stats['cancelled_orders']}\n\n"
+            f"💰 <b>Ümumi komissiya gəliri:</b> {stats['revenue']:.2f} AZN\n\n"
             f"🔝 <b>Ən populyar xidmətlər:</b>\n{service_text}"
         )
         
@@ -692,6 +676,217 @@ async def show_admin_stats(message):
         logger.error(f"Error in show_admin_stats: {e}")
         await message.answer("❌ Statistikalar yüklənərkən xəta baş verdi. Zəhmət olmasa bir az sonra yenidən cəhd edin.")
 
+async def show_admin_outbox(message):
+    """Show the notification outbox: queue sizes and dead letters"""
+    try:
+        summary = await adb.get_outbox_summary()
+        dead = await adb.get_dead_outbox_messages(limit=10)
+        
+        def count(status):
+            return summary.get(status, {}).get("count", 0)
+        
+        oldest_pending = summary.get("pending", {}).get("oldest")
+        text = (
+            "📮 <b>Bildiriş növbəsi</b>\n\n"
+            f"⏳ <b>Gözləyir:</b> {count('pending')}"
+            + (f" (ən köhnəsi {oldest_pending:%d.%m %H:%M})" if oldest_pending else "") + "\n"
+            f"📤 <b>Göndərilir:</b> {count('sending')}\n"
+            f"✅ <b>Göndərilib:</b> {count('sent')}\n"
+            f"☠️ <b>Çatdırılmadı:</b> {count('dead')}\n"
+        )
+        
+        keyboard = InlineKeyboardMarkup(row_width=1)
+        if dead:
+            text += "\n<b>Son çatdırılmamış bildirişlər:</b>\n"
+            for item in dead:
+                preview = html.escape((item['payload'].get('text') or item['payload'].get('caption') or '')[:60])
+                text += (
+                    f"\n#{item['id']} <code>{html.escape(item['idempotency_key'][:40])}</code>\n"
+                    f"Cəhd: {item['attempts']} | {html.escape((item['last_error'] or '')[:80])}\n"
+                    f"<i>{preview}</i>\n"
+                )
+                keyboard.row(
+                    InlineKeyboardButton(f"🔁 #{item['id']} yenidən göndər", callback_data=f"outbox_retry_{item['id']}"),
+                    InlineKeyboardButton(f"🗑 #{item['id']} sil", callback_data=f"outbox_drop_{item['id']}")
+                )
+            keyboard.add(InlineKeyboardButton("🔁 Hamısını yenidən göndər", callback_data="outbox_retry_all"))
+        
+        keyboard.add(
+            InlineKeyboardButton("🔄 Yenilə", callback_data="admin_outbox"),
+            InlineKeyboardButton("🔙 Admin Menyusuna Qayıt", callback_data="back_to_admin")
+        )
+        
+        await message.answer(text, reply_markup=keyboard, parse_mode="HTML")
+        
+    except Exception as e:
+        logger.error(f"Error in show_admin_outbox: {e}")
+        await message.answer("❌ Bildiriş növbəsi yüklənərkən xəta baş verdi. Zəhmət olmasa bir az sonra yenidən cəhd edin.")
+
+@dp.callback_query_handler(lambda c: c.data.startswith('outbox_'))
+async def handle_outbox_action(callback_query: types.CallbackQuery):
+    """Requeue or drop dead-letter notifications"""
+    try:
+        if not is_admin(callback_query.from_user.id):
+            await callback_query.answer("❌ Bu əməliyyat yalnızca admin istifadəçilər üçün əlçatandır.", show_alert=True)
+            return
+        
+        action = callback_query.data
+        if action == "outbox_retry_all":
+            requeued = await adb.requeue_dead_outbox_messages()
+            await callback_query.answer(f"🔁 {requeued} bildiriş yenidən növbəyə qoyuldu")
+        elif action.startswith("outbox_retry_"):
+            message_id = int(action.split("_")[-1])
+            requeued = await adb.requeue_dead_outbox_messages([message_id])
+            await callback_query.answer("🔁 Yenidən növbəyə qoyuldu" if requeued else "Bildiriş artıq növbədə deyil")
+        elif action.startswith("outbox_drop_"):
+            message_id = int(action.split("_")[-1])
+            await adb.delete_dead_outbox_message(message_id)
+            await callback_query.answer("🗑 Silindi")
+        else:
+            await callback_query.answer()
+            return
+        
+        await show_admin_outbox(callback_query.message)
+        
+    except Exception as e:
+        logger.error(f"Error in handle_outbox_action: {e}")
+        await callback_query.answer("❌ Xəta baş verdi", show_alert=True)
+
+@dp.callback_query_handler(lambda c: c.data.startswith('broadcast_'))
+async def handle_broadcast_action(callback_query: types.CallbackQuery):
+    """Pause, resume or cancel a running broadcast"""
+    try:
+        if not is_admin(callback_query.from_user.id):
+            await callback_query.answer("❌ Bu əməliyyat yalnızca admin istifadəçilər üçün əlçatandır.", show_alert=True)
+            return
+        
+        _, action, job_id = callback_query.data.split("_")
+        job_id = int(job_id)
+        
+        if action == "pause":
+            changed = await adb.set_broadcast_job_status(job_id, 'paused', ['running'])
+            await callback_query.answer("⏸ Göndəriş dayandırıldı" if changed else "Göndəriş artıq davam etmir")
+        elif action == "resume":
+            changed = await adb.set_broadcast_job_status(job_id, 'running', ['paused'])
+            await callback_query.answer("▶️ Göndəriş davam edir" if changed else "Göndəriş dayandırılmayıb")
+            if changed:
+                broadcasts.kick()
+        elif action == "cancel":
+            changed = await adb.set_broadcast_job_status(job_id, 'cancelled', ['running', 'paused'])
+            await callback_query.answer("🛑 Göndəriş ləğv edildi" if changed else "Göndəriş artıq bitib")
+        else:
+            await callback_query.answer()
+            return
+        
+        # The sending worker reports again at its next checkpoint
+        job = await adb.get_broadcast_job(job_id)
+        await update_progress_message(job)
+        
+    except Exception as e:
+        logger.error(f"Error in handle_broadcast_action: {e}")
+        await callback_query.answer("❌ Xəta baş verdi", show_alert=True)
+
+# Periods offered by the "stats by date" button: callback suffix -> (title, days back, None = since start of month)
+ADMIN_STATS_PERIODS = {
+    "today": ("Bu gün", 0),
+    "7d": ("Son 7 gün", 6),
+    "30d": ("Son 30 gün", 29),
+    "month": ("Bu ay", None),
+}
+
+@dp.callback_query_handler(lambda c: c.data == 'stats_by_date')
+async def show_stats_period_options(callback_query: types.CallbackQuery):
+    """Let the admin choose a period for statistics"""
+    try:
+        if not is_admin(callback_query.from_user.id):
+            await callback_query.answer("❌ Bu əməliyyat yalnızca admin istifadəçilər üçün əlçatandır.", show_alert=True)
+            return
+        
+        keyboard = InlineKeyboardMarkup(row_width=2)
+        keyboard.add(*[
+            InlineKeyboardButton(title, callback_data=f"stats_period_{key}")
+            for key, (title, _) in ADMIN_STATS_PERIODS.items()
+        ])
+        keyboard.add(InlineKeyboardButton("🔙 Admin Menyusuna Qayıt", callback_data="back_to_admin"))
+        
+        await callback_query.message.answer("📅 Statistika dövrünü seçin:", reply_markup=keyboard)
+        await callback_query.answer()
+    except Exception as e:
+        logger.error(f"Error in show_stats_period_options: {e}")
+        await callback_query.answer("❌ Xəta baş verdi", show_alert=True)
+
+@dp.callback_query_handler(lambda c: c.data.startswith('stats_period_'))
+async def show_stats_for_period(callback_query: types.CallbackQuery):
+    """Show statistics for the selected period"""
+    try:
+        if not is_admin(callback_query.from_user.id):
+            await callback_query.answer("❌ Bu əməliyyat yalnızca admin istifadəçilər üçün əlçatandır.", show_alert=True)
+            return
+        
+        period = callback_query.data.replace('stats_period_', '')
+        if period not in ADMIN_STATS_PERIODS:
+            await callback_query.answer("❌ Naməlum dövr", show_alert=True)
+            return
+        
+        title, days_back = ADMIN_STATS_PERIODS[period]
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        start = today.replace(day=1) if days_back is None else today - timedelta(days=days_back)
+        
+        stats = await adb.get_admin_stats(start)
+        if stats is None:
+            raise Exception("Admin stats rollup unavailable")
+        
+        service_text = "".join(f"• {service}: {count} sifariş\n" for service, count in stats['top_services']) or "—\n"
+        
+        await callback_query.message.answer(
+            f"📅 <b>{title}</b> ({start.strftime('%d.%m.%Y')} - {datetime.now().strftime('%d.%m.%Y')})\n\n"
+            f"👤 <b>Yeni müştərilər:</b> {stats['customers']}\n"
+            f"👷‍♂️ <b>Yeni ustalar:</b> {stats['artisans']}\n\n"
+            f"📋 <b>Sifarişlər:</b> {stats['orders']}\n"
+            f"✅ <b>Tamamlanmış:</b> {stats['completed_orders']}\n"
+            f"❌ <b>Ləğv edilmiş:</b> {stats['cancelled_orders']}\n\n"
+            f"💰 <b>Komissiya gəliri:</b> {stats['revenue']:.2f} AZN\n\n"
+            f"🔝 <b>Ən populyar xidmətlər:</b>\n{service_text}",
+            parse_mode="HTML"
+        )
+        await callback_query.answer()
+    except Exception as e:
+        logger.error(f"Error in show_stats_for_period: {e}")
+        await callback_query.answer("❌ Statistikalar yüklənərkən xəta baş verdi", show_alert=True)
+
+@dp.callback_query_handler(lambda c: c.data == 'detailed_stats')
+async def show_detailed_stats(callback_query: types.CallbackQuery):
+    """Show a day-by-day report for the last 7 days"""
+    try:
+        if not is_admin(callback_query.from_user.id):
+            await callback_query.answer("❌ Bu əməliyyat yalnızca admin istifadəçilər üçün əlçatandır.", show_alert=True)
+            return
+        
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        start = today - timedelta(days=6)
+        daily = await adb.get_admin_daily_stats(start, today + timedelta(days=1))
+        
+        lines = []
+        for day in daily:
+            lines.append(
+                f"<b>{day['day'].strftime('%d.%m')}</b>: "
+                f"📋 {int(day['orders'])} | ✅ {int(day['completed_orders'])} | ❌ {int(day['cancelled_orders'])} | "
+                f"👤 +{int(day['customers'])} | 👷‍♂️ +{int(day['artisans'])} | 💰 {float(day['revenue']):.2f} AZN"
+            )
+        
+        report = "\n".join(lines) if lines else "Bu dövr üçün məlumat yoxdur."
+        
+        await callback_query.message.answer(
+            "📊 <b>Ətraflı hesabat (son 7 gün)</b>\n\n"
+            "📋 sifarişlər | ✅ tamamlanmış | ❌ ləğv edilmiş | 👤 yeni müştərilər | 👷‍♂️ yeni ustalar | 💰 komissiya\n\n"
+            f"{report}",
+            parse_mode="HTML"
+        )
+        await callback_query.answer()
+    except Exception as e:
+        logger.error(f"Error in show_detailed_stats: {e}")
+        await callback_query.answer("❌ Hesabat yüklənərkən xəta baş verdi", show_alert=True)
+
 async def show_admin_delete_user(message):
     """Show user deletion options for admin"""
     try:
@@ -796,12 +991,12 @@ async def process_delete_user_id(message: types.Message, state: FSMContext):
             return
         
         # Import database functions
-        from db import execute_query, get_customer_by_id, get_artisan_by_id
+        from db import execute_query
         from db_encryption_wrapper import decrypt_dict_data
         
         # Verify user exists and get info
         if user_type == "artisan":
-            user_data = get_artisan_by_id(user_id)
+            user_data = await adb.get_artisan_by_id(user_id)
             if not user_data:
                 await message.answer(f"❌ ID {user_id} ilə usta tapılmadı. Zəhmət olmasa, düzgün ID daxil edin:")
                 return
@@ -812,7 +1007,7 @@ async def process_delete_user_id(message: types.Message, state: FSMContext):
             user_title = "Usta"
             
         else:  # customer
-            user_data = get_customer_by_id(user_id)
+            user_data = await adb.get_customer_by_id(user_id)
             if not user_data:
                 await message.answer(f"❌ ID {user_id} ilə müştəri tapılmadı. Zəhmət olmasa, düzgün ID daxil edin:")
                 return
@@ -861,10 +1056,9 @@ async def confirm_delete_user(callback_query: types.CallbackQuery):
         user_id = int(parts[3])
         
         # Import deletion function
-        from db import delete_user_completely
         
         # Perform deletion
-        success = delete_user_completely(user_type, user_id)
+        success = await adb.delete_user_completely(user_type, user_id)
         
         if success:
             user_title = "Usta" if user_type == "artisan" else "Müştəri"
@@ -971,7 +1165,6 @@ async def user_actions_handler(callback_query: types.CallbackQuery):
 async def filter_orders(message, filter_type):
     """Show filtered orders based on type"""
     try:
-        from db import execute_query, get_artisan_by_id, get_customer_by_id
         from crypto_service import decrypt_data
         from db_encryption_wrapper import decrypt_dict_data
         
@@ -993,7 +1186,7 @@ async def filter_orders(message, filter_type):
         
         query += " ORDER BY o.created_at DESC LIMIT 10"
         
-        orders = execute_query(query, fetchall=True, dict_cursor=True)
+        orders = await adb.execute_query(query, fetchall=True, dict_cursor=True)
         
         if not orders:
             await message.answer(f"📭 Bu filterlə sifariş tapılmadı.")
@@ -1012,8 +1205,8 @@ async def filter_orders(message, filter_type):
         # Display filtered orders
         for order in orders:
             # Şifreleri çözülmüş müşteri ve usta bilgilerini al
-            customer_encrypted = get_customer_by_id(order['customer_id'])
-            artisan_encrypted = get_artisan_by_id(order['artisan_id'])
+            customer_encrypted = await adb.get_customer_by_id(order['customer_id'])
+            artisan_encrypted = await adb.get_artisan_by_id(order['artisan_id'])
             
             # Şifreleri çöz ve maskele
             customer = decrypt_dict_data(customer_encrypted, mask=False)
@@ -1072,19 +1265,18 @@ async def show_order_details(message, order_id):
     """Show detailed information about an order"""
     try:
         # Get comprehensive order details - gerçek veriler için düzeltme
-        from db import get_order_details, get_customer_by_id, get_artisan_by_id
         from crypto_service import decrypt_data
         from db_encryption_wrapper import decrypt_dict_data
         
-        order_encrypted = get_order_details(order_id)
+        order_encrypted = await adb.get_order_details(order_id)
         
         if not order_encrypted:
             await message.answer(f"❌ Sifariş #{order_id} tapılmadı.")
             return
         
         # Müşteri ve usta bilgilerini al ve şifrelerini çöz
-        customer_encrypted = get_customer_by_id(order_encrypted.get('customer_id'))
-        artisan_encrypted = get_artisan_by_id(order_encrypted.get('artisan_id'))
+        customer_encrypted = await adb.get_customer_by_id(order_encrypted.get('customer_id'))
+        artisan_encrypted = await adb.get_artisan_by_id(order_encrypted.get('artisan_id'))
         
         # Şifreleri çöz ve maskele
         customer = decrypt_dict_data(customer_encrypted, mask=False)
@@ -1186,10 +1378,9 @@ async def show_order_payment(message, order_id):
     """Show payment details for an order"""
     try:
         # Get payment details
-        from db import debug_order_payment, get_order_details
         
-        payment_details = debug_order_payment(order_id)
-        order = get_order_details(order_id)
+        payment_details = await adb.debug_order_payment(order_id)
+        order = await adb.get_order_details(order_id)
         
         if not payment_details:
             await message.answer(f"❌ Sifariş #{order_id} üçün ödəniş məlumatları tapılmadı.")
@@ -1270,16 +1461,17 @@ async def show_order_payment(message, order_id):
 async def admin_accept_order(message, order_id):
     """Admin accepts an order"""
     try:
-        from db import update_order_status
+        
+        # Notices to customer and artisan, committed together with the status
+        notices = []
+        await notify_about_order_status_change(order_id, "accepted", outbox=notices)
         
         # Update order status
-        success = update_order_status(order_id, "accepted")
+        success = await adb.update_order_status(order_id, "accepted", outbox=notices)
         
         if success:
+            await timers.cancel([TASK_ORDER_ACCEPTANCE, TASK_DIRECT_ORDER_ACCEPTANCE], order_id)
             await message.answer(f"✅ Sifariş #{order_id} qəbul edildi.")
-            
-            # Notify customer and artisan
-            await notify_about_order_status_change(order_id, "accepted")
         else:
             await message.answer(f"❌ Sifariş #{order_id} statusu yenilənərkən xəta baş verdi.")
             
@@ -1290,16 +1482,16 @@ async def admin_accept_order(message, order_id):
 async def admin_cancel_order(message, order_id):
     """Admin cancels an order"""
     try:
-        from db import update_order_status
+        
+        # Notices to customer and artisan, committed together with the status
+        notices = []
+        await notify_about_order_status_change(order_id, "cancelled", outbox=notices)
         
         # Update order status
-        success = update_order_status(order_id, "cancelled")
+        success = await adb.update_order_status(order_id, "cancelled", outbox=notices)
         
         if success:
             await message.answer(f"❌ Sifariş #{order_id} ləğv edildi.")
-            
-            # Notify customer and artisan
-            await notify_about_order_status_change(order_id, "cancelled")
         else:
             await message.answer(f"❌ Sifariş #{order_id} statusu yenilənərkən xəta baş verdi.")
             
@@ -1310,16 +1502,16 @@ async def admin_cancel_order(message, order_id):
 async def admin_complete_order(message, order_id):
     """Admin completes an order"""
     try:
-        from db import update_order_status
+        
+        # Notices to customer and artisan, committed together with the status
+        notices = []
+        await notify_about_order_status_change(order_id, "completed", outbox=notices)
         
         # Update order status
-        success = update_order_status(order_id, "completed")
+        success = await adb.update_order_status(order_id, "completed", outbox=notices)
         
         if success:
             await message.answer(f"✅ Sifariş #{order_id} tamamlandı.")
-            
-            # Notify customer and artisan
-            await notify_about_order_status_change(order_id, "completed")
         else:
             await message.answer(f"❌ Sifariş #{order_id} statusu yenilənərkən xəta baş verdi.")
             
@@ -1327,24 +1519,26 @@ async def admin_complete_order(message, order_id):
         logger.error(f"Error in admin_complete_order: {e}")
         await message.answer("❌ Xəta baş verdi. Zəhmət olmasa bir az sonra yenidən cəhd edin.")
 
-async def notify_about_order_status_change(order_id, status):
-    """Notify customer and artisan about order status change"""
+async def notify_about_order_status_change(order_id, status, outbox=None):
+    """Notify customer and artisan about order status change
+
+    With `outbox`, the notices are appended there for the status update to commit.
+    """
     try:
         from notification_service import notify_customer_about_order_status
-        from db import get_order_details, get_artisan_by_id
         
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         
         if not order:
             logger.error(f"Order {order_id} not found for notification")
             return
         
         # Notify customer
-        await notify_customer_about_order_status(order_id, status)
+        await notify_customer_about_order_status(order_id, status, outbox=outbox)
         
         # Notify artisan
-        artisan = get_artisan_by_id(order['artisan_id'])
+        artisan = await adb.get_artisan_by_id(order['artisan_id'])
         
         if artisan and artisan.get('telegram_id'):
             # Prepare status text
@@ -1362,8 +1556,10 @@ async def notify_about_order_status_change(order_id, status):
                 explanation = f"Yeni status: {status}"
             
             # Send notification to artisan
-            await bot.send_message(
+            await send_via_outbox(
+                f"artisan_order_status:{order_id}:{status}",
                 chat_id=artisan['telegram_id'],
+                outbox=outbox,
                 text=f"{status_text}\n\n"
                      f"Sifariş #{order_id}\n"
                      f"{explanation}",
@@ -1376,7 +1572,6 @@ async def notify_about_order_status_change(order_id, status):
 async def show_customers_list(message):
     """Show list of customers"""
     try:
-        from db import execute_query
         
         # Get recent customers with ratings
         query = """
@@ -1386,7 +1581,10 @@ async def show_customers_list(message):
             LIMIT 1000
         """
         
-        customers = execute_query(query, fetchall=True, dict_cursor=True)
+        customers = await adb.execute_query(query, fetchall=True, dict_cursor=True)
+        from db_encryption_wrapper import decrypt_dict_data, decrypt_list_bulk
+        # Bütün siyahı bir dəfəyə, event loop-dan kənarda deşifrə olunur
+        customers = await run_db(decrypt_list_bulk, customers)
         
         if not customers:
             await message.answer("📭 Müştəri tapılmadı.")
@@ -1396,11 +1594,8 @@ async def show_customers_list(message):
         
         # Send each customer as a separate message with options
         for customer in customers:
-            # Həssas məlumatları maskalanmış şəkildə al
-            from db_encryption_wrapper import wrap_get_dict_function
-            from db import get_customer_by_id
-            
-            masked_customer = wrap_get_dict_function(get_customer_by_id, mask=False)(customer['id'])
+            # Artıq deşifrə olunub (ayrıca sorğu lazım deyil)
+            masked_customer = decrypt_dict_data(customer)
             
             # Format date
             created_at = customer['created_at']
@@ -1472,7 +1667,6 @@ async def show_customers_list(message):
 async def show_artisans_list(message):
     """Show list of artisans"""
     try:
-        from db import execute_query
         
         # Get recent artisans
         query = """
@@ -1482,7 +1676,10 @@ async def show_artisans_list(message):
             LIMIT 1000
         """
         
-        artisans = execute_query(query, fetchall=True, dict_cursor=True)
+        artisans = await adb.execute_query(query, fetchall=True, dict_cursor=True)
+        from db_encryption_wrapper import decrypt_dict_data, decrypt_list_bulk
+        # Bütün siyahı bir dəfəyə, event loop-dan kənarda deşifrə olunur
+        artisans = await run_db(decrypt_list_bulk, artisans)
         
         if not artisans:
             await message.answer("📭 Usta tapılmadı.")
@@ -1492,11 +1689,8 @@ async def show_artisans_list(message):
         
         # Send each artisan as a separate message with options
         for artisan in artisans:
-            # Həssas məlumatları maskalanmış şəkildə al
-            from db_encryption_wrapper import wrap_get_dict_function
-            from db import get_artisan_by_id
-            
-            masked_artisan = wrap_get_dict_function(get_artisan_by_id, mask=False)(artisan['id'])
+            # Artıq deşifrə olunub (ayrıca sorğu lazım deyil)
+            masked_artisan = decrypt_dict_data(artisan)
             
             # Format date
             created_at = artisan['created_at']
@@ -1651,25 +1845,8 @@ async def process_search_query(message: types.Message, state: FSMContext):
 async def search_customers(message, query):
     """Search for customers"""
     try:
-        from db import execute_query
-        
-        # Build search query
-        search_query = """
-            SELECT id, name, phone, city, created_at, active
-            FROM customers
-            WHERE LOWER(name) LIKE LOWER(%s)
-               OR phone LIKE %s
-               OR id::text = %s
-            LIMIT 1000
-        """
-        
-        # Execute search
-        results = execute_query(
-            search_query, 
-            (f"%{query}%", f"%{query}%", query), 
-            fetchall=True,
-            dict_cursor=True
-        )
+        # Indexed lookup on the blind index; only the matches are decrypted
+        results = await adb.find_customers(query)
         
         if not results:
             await message.answer(f"🔍 '{query}' üçün heç bir müştəri tapılmadı.")
@@ -1726,26 +1903,8 @@ async def search_customers(message, query):
 async def search_artisans(message, query):
     """Search for artisans"""
     try:
-        from db import execute_query
-        
-        # Build search query
-        search_query = """
-            SELECT id, name, phone, city, service, rating, created_at, active
-            FROM artisans
-            WHERE LOWER(name) LIKE LOWER(%s)
-               OR phone LIKE %s
-               OR id::text = %s
-               OR LOWER(service) LIKE LOWER(%s)
-            LIMIT 1000
-        """
-        
-        # Execute search
-        results = execute_query(
-            search_query, 
-            (f"%{query}%", f"%{query}%", query, f"%{query}%"), 
-            fetchall=True,
-            dict_cursor=True
-        )
+        # Indexed lookup on the blind index; only the matches are decrypted
+        results = await adb.find_artisans(query)
         
         if not results:
             await message.answer(f"🔍 '{query}' üçün heç bir usta tapılmadı.")
@@ -1845,10 +2004,9 @@ async def user_block_actions(callback_query: types.CallbackQuery):
 async def show_block_customer_form(message, customer_id):
     """Show form to block a customer"""
     try:
-        from db import get_customer_by_id
         
         # Get customer info
-        customer = get_customer_by_id(customer_id)
+        customer = await adb.get_customer_by_id(customer_id)
         
         if not customer:
             await message.answer(f"❌ Müştəri #{customer_id} tapılmadı.")
@@ -1876,10 +2034,9 @@ async def show_block_customer_form(message, customer_id):
 async def show_block_artisan_form(message, artisan_id):
     """Show form to block an artisan"""
     try:
-        from db import get_artisan_by_id
         
         # Get artisan info
-        artisan = get_artisan_by_id(artisan_id)
+        artisan = await adb.get_artisan_by_id(artisan_id)
         
         if not artisan:
             await message.answer(f"❌ Usta #{artisan_id} tapılmadı.")
@@ -1955,12 +2112,10 @@ async def process_block_payment(message: types.Message, state: FSMContext):
         
         # Block user based on type
         if user_type == 'customer':
-            from db import block_customer
-            success = block_customer(user_id, block_reason, payment_amount)
+            success = await adb.block_customer(user_id, block_reason, payment_amount)
             user_label = "Müştəri"
         else:  # artisan
-            from db import block_artisan
-            success = block_artisan(user_id, block_reason, payment_amount)
+            success = await adb.block_artisan(user_id, block_reason, payment_amount)
             user_label = "Usta"
         
         if success:
@@ -1987,12 +2142,10 @@ async def notify_user_about_block(user_type, user_id, reason, amount):
     """Notify user about being blocked"""
     try:
         if user_type == 'customer':
-            from db import get_customer_by_id
-            user = get_customer_by_id(user_id)
+            user = await adb.get_customer_by_id(user_id)
             command = "/pay_customer_fine"
         else:  # artisan
-            from db import get_artisan_by_id
-            user = get_artisan_by_id(user_id)
+            user = await adb.get_artisan_by_id(user_id)
             command = "/pay_fine"
         
         if not user or not user.get('telegram_id'):
@@ -2024,17 +2177,16 @@ async def notify_user_about_block(user_type, user_id, reason, amount):
 async def unblock_customer_action(message, customer_id):
     """Unblock a customer"""
     try:
-        from db import unblock_customer, get_customer_by_id
         
         # Get customer info
-        customer = get_customer_by_id(customer_id)
+        customer = await adb.get_customer_by_id(customer_id)
         
         if not customer:
             await message.answer(f"❌ Müştəri #{customer_id} tapılmadı.")
             return
         
         # Unblock customer
-        success = unblock_customer(customer_id)
+        success = await adb.unblock_customer(customer_id)
         
         if success:
             await message.answer(f"✅ Müştəri #{customer_id} ({customer['name']}) blokdan çıxarıldı.")
@@ -2058,17 +2210,16 @@ async def unblock_customer_action(message, customer_id):
 async def unblock_artisan_action(message, artisan_id):
     """Unblock an artisan"""
     try:
-        from db import unblock_artisan, get_artisan_by_id
         
         # Get artisan info
-        artisan = get_artisan_by_id(artisan_id)
+        artisan = await adb.get_artisan_by_id(artisan_id)
         
         if not artisan:
             await message.answer(f"❌ Usta #{artisan_id} tapılmadı.")
             return
         
         # Unblock artisan
-        success = unblock_artisan(artisan_id)
+        success = await adb.unblock_artisan(artisan_id)
         
         if success:
             await message.answer(f"✅ Usta #{artisan_id} ({artisan['name']}) blokdan çıxarıldı.")
@@ -2109,12 +2260,10 @@ async def contact_user_actions(callback_query: types.CallbackQuery):
         
         # Get user info
         if user_type == 'customer':
-            from db import get_customer_by_id
-            user = get_customer_by_id(user_id)
+            user = await adb.get_customer_by_id(user_id)
             user_label = "Müştəri"
         else:  # artisan
-            from db import get_artisan_by_id
-            user = get_artisan_by_id(user_id)
+            user = await adb.get_artisan_by_id(user_id)
             user_label = "Usta"
         
         if not user:
@@ -2158,12 +2307,10 @@ async def process_admin_message(message: types.Message, state: FSMContext):
         
         # Get user info
         if user_type == 'customer':
-            from db import get_customer_by_id
-            user = get_customer_by_id(user_id)
+            user = await adb.get_customer_by_id(user_id)
             user_label = "Müştəri"
         else:  # artisan
-            from db import get_artisan_by_id
-            user = get_artisan_by_id(user_id)
+            user = await adb.get_artisan_by_id(user_id)
             user_label = "Usta"
         
         if not user or not user.get('telegram_id'):
@@ -2227,12 +2374,11 @@ async def user_orders_actions(callback_query: types.CallbackQuery):
 async def show_customer_orders(message, customer_id):
     """Show orders for a specific customer"""
     try:
-        from db import get_customer_by_id, get_customer_orders, get_artisan_by_id
         from crypto_service import decrypt_data
         from db_encryption_wrapper import decrypt_dict_data
         
         # Get customer info
-        customer_encrypted = get_customer_by_id(customer_id)
+        customer_encrypted = await adb.get_customer_by_id(customer_id)
         
         if not customer_encrypted:
             await message.answer(f"❌ Müştəri #{customer_id} tapılmadı.")
@@ -2242,7 +2388,7 @@ async def show_customer_orders(message, customer_id):
         customer = decrypt_dict_data(customer_encrypted, mask=False)
         
         # Get customer orders
-        orders_encrypted = get_customer_orders(customer_id)
+        orders_encrypted = await adb.get_customer_orders(customer_id)
         
         if not orders_encrypted:
             await message.answer(f"📭 Müştəri #{customer_id} ({customer['name']}) üçün hələ heç bir sifariş yoxdur.")
@@ -2261,7 +2407,7 @@ async def show_customer_orders(message, customer_id):
             
             # Usta bilgilerini al ve şifresini çöz
             if order.get('artisan_id'):
-                artisan = get_artisan_by_id(order.get('artisan_id'))
+                artisan = await adb.get_artisan_by_id(order.get('artisan_id'))
                 artisan_name = artisan.get('name', 'Təyin edilməyib') if artisan else 'Təyin edilməyib'
             else:
                 artisan_name = 'Təyin edilməyib'
@@ -2316,12 +2462,11 @@ async def show_customer_orders(message, customer_id):
 async def show_artisan_orders(message, artisan_id):
     """Show orders for a specific artisan"""
     try:
-        from db import get_artisan_by_id, execute_query, get_customer_by_id
         from crypto_service import decrypt_data
         from db_encryption_wrapper import decrypt_dict_data
         
         # Get artisan info
-        artisan_encrypted = get_artisan_by_id(artisan_id)
+        artisan_encrypted = await adb.get_artisan_by_id(artisan_id)
         
         if not artisan_encrypted:
             await message.answer(f"❌ Usta #{artisan_id} tapılmadı.")
@@ -2339,7 +2484,7 @@ async def show_artisan_orders(message, artisan_id):
             ORDER BY o.created_at DESC
         """
         
-        orders = execute_query(query, (artisan_id,), fetchall=True, dict_cursor=True)
+        orders = await adb.execute_query(query, (artisan_id,), fetchall=True, dict_cursor=True)
         
         if not orders:
             await message.answer(f"📭 Usta #{artisan_id} ({artisan['name']}) üçün hələ heç bir sifariş yoxdur.")
@@ -2354,7 +2499,7 @@ async def show_artisan_orders(message, artisan_id):
         # Display each order
         for order in orders:
             # Müşteri bilgilerini al ve şifresini çöz
-            customer_encrypted = get_customer_by_id(order.get('customer_id'))
+            customer_encrypted = await adb.get_customer_by_id(order.get('customer_id'))
             customer = decrypt_dict_data(customer_encrypted, mask=False) if customer_encrypted else None
             customer_name = customer.get('name', 'Təyin edilməyib') if customer else 'Təyin edilməyib'
             
@@ -2424,7 +2569,8 @@ async def back_to_admin_menu(callback_query: types.CallbackQuery):
             InlineKeyboardButton("📊 Statistika", callback_data="admin_stats"),
             InlineKeyboardButton("🗑️ İstifadəçi Sil", callback_data="admin_delete_user"),
             InlineKeyboardButton("📨 Ustalara Toplu Mesaj Göndər", callback_data="send_bulk_message_to_artisans"),
-            InlineKeyboardButton("📨 Müştərilərə Toplu Mesaj Göndər", callback_data="send_bulk_message_to_customers")
+            InlineKeyboardButton("📨 Müştərilərə Toplu Mesaj Göndər", callback_data="send_bulk_message_to_customers"),
+            InlineKeyboardButton("📮 Çatdırılmamış Bildirişlər", callback_data="admin_outbox")
         )
         
         await callback_query.message.answer(
@@ -2454,7 +2600,7 @@ async def pay_customer_fine_callback(callback_query: types.CallbackQuery):
         telegram_id = callback_query.from_user.id
         
         # Kullanıcı bilgilerini kontrol edelim
-        customer = get_customer_by_telegram_id(telegram_id)
+        customer = await adb.get_customer_by_telegram_id(telegram_id)
         
         if not customer:
             await callback_query.message.answer(
@@ -2463,7 +2609,7 @@ async def pay_customer_fine_callback(callback_query: types.CallbackQuery):
             return
                 
         # Blok durumunu kontrol edelim
-        is_blocked, reason, amount, block_until = get_customer_blocked_status(customer['id'])
+        is_blocked, reason, amount, block_until = await adb.get_customer_blocked_status(customer['id'])
         
         if not is_blocked:
             await callback_query.message.answer(
@@ -2510,8 +2656,7 @@ async def decline_refund(callback_query: types.CallbackQuery):
         refund_id = int(callback_query.data.split('_')[-1])
         
         # Update refund status to declined
-        from db import update_refund_request
-        update_refund_request(refund_id, {
+        await adb.update_refund_request(refund_id, {
             'status': 'declined'
         })
         
@@ -2521,8 +2666,7 @@ async def decline_refund(callback_query: types.CallbackQuery):
         )
         
         # Get refund details
-        from db import get_refund_request
-        refund = get_refund_request(refund_id)
+        refund = await adb.get_refund_request(refund_id)
         
         if refund:
             # Notify admins about the declined refund
@@ -2589,7 +2733,7 @@ async def process_card_number_input(message: types.Message):
     try:
         # Get user context
         telegram_id = message.from_user.id
-        context = get_user_context(telegram_id)
+        context = await adb.get_user_context(telegram_id)
         
         # Check if context is for providing card details
         if not context or context.get('action') != 'provide_card_details':
@@ -2615,7 +2759,7 @@ async def process_card_number_input(message: types.Message):
             return
         
         # Get customer ID
-        customer = get_customer_by_telegram_id(telegram_id)
+        customer = await adb.get_customer_by_telegram_id(telegram_id)
         if not customer:
             await message.answer(
                 "❌ Müştəri məlumatlarınız tapılmadı."
@@ -2633,7 +2777,7 @@ async def process_card_number_input(message: types.Message):
             return
         
         # Clear user context
-        clear_user_context(telegram_id)
+        await adb.clear_user_context(telegram_id)
         
     except Exception as e:
         logger.error(f"Error in process_card_number_input: {e}")
@@ -2866,58 +3010,32 @@ def register_all_handlers():
     
     logger.info("All handlers registered successfully!")
 
-async def scheduled_tasks():
-    """Run scheduled tasks at regular intervals"""
-    minute_counter = 0
+def schedule_periodic_jobs():
+    """Register recurring maintenance jobs on the timer service
     
-    while True:
-        try:
-            # Check delay reminders every minute
-            await process_delay_reminders()
-            
-            # Run payment status checks every 5 minutes
-            if minute_counter % 5 == 0:
-                from admin_service import check_payment_status_changes
-                await check_payment_status_changes()
-            
-            minute_counter += 1
-            
-            # Sleep for 1 minute
-            await asyncio.sleep(60)  # 1 minute
-        except Exception as e:
-            logger.error(f"Error in scheduled tasks: {e}")
-            # Sleep for 1 minute in case of error
-            await asyncio.sleep(60)
-
-async def process_delay_reminders():
-    """Process due delay reminders"""
-    try:
-        from db import get_due_delay_reminders, mark_delay_reminder_completed, mark_delay_reminder_failed
-        from order_status_service import send_delay_reminder
-        
-        # Get all delay reminders that are due
-        due_reminders = get_due_delay_reminders()
-        
-        for task_id, order_id in due_reminders:
-            try:
-                logger.info(f"Processing delay reminder for order {order_id}")
-                
-                # Send the reminder
-                success = await send_delay_reminder(order_id)
-                
-                if success:
-                    mark_delay_reminder_completed(task_id)
-                    logger.info(f"Delay reminder completed for order {order_id}")
-                else:
-                    mark_delay_reminder_failed(task_id)
-                    logger.error(f"Delay reminder failed for order {order_id}")
-                    
-            except Exception as e:
-                logger.error(f"Error processing delay reminder for order {order_id}: {e}")
-                mark_delay_reminder_failed(task_id)
-                
-    except Exception as e:
-        logger.error(f"Error in process_delay_reminders: {e}")
+    Each job runs once at startup and then again `interval` seconds after
+    the previous run finished. Delay reminders and other one-off timers are
+    woken by the timer service at their exact execution time. Exclusive jobs
+    run on one bot process only; the geo index lives in each process's memory,
+    so every process reconciles its own copy.
+    """
+    from admin_service import check_payment_status_changes
+    
+    # Payment writes queue their own notifications; this only catches missed ones
+    timers.every("payment_status_check", PAYMENT_RECONCILE_MINUTES * 60, check_payment_status_changes, exclusive=True)
+    
+    # Loads the artisan geo index on the first run, then reconciles it with MySQL
+    timers.every("geo_index_reconcile", GEO_INDEX_RECONCILE_MINUTES * 60, adb.reconcile_artisan_geo_index)
+    
+    # Backfills admin stats rollups on the first run, then rebuilds recent hours
+    timers.every("admin_stats_rollup", 60 * 60, adb.refresh_admin_stats_rollup, exclusive=True)
+    
+    # Rebuilds the admin stats buckets this process's writes touched
+    timers.every("admin_stats_flush", ADMIN_STATS_FLUSH_SECONDS, adb.flush_admin_stats, run_now=False)
+    
+    # Drops conversations abandoned for longer than FSM_STATE_TTL_HOURS
+    if isinstance(storage, MySQLStorage):
+        timers.every("fsm_purge", 60 * 60, storage.purge_expired, exclusive=True)
 
 async def admin_webhook_handler(request):
     """Handle webhooks from admin panel"""
@@ -2977,7 +3095,6 @@ async def send_bulk_message_to_artisans(message):
     """Start bulk message sending process for artisans"""
     try:
         # Get count of active artisans
-        from db import execute_query
         
         count_query = """
             SELECT COUNT(*) as count
@@ -2985,7 +3102,7 @@ async def send_bulk_message_to_artisans(message):
             WHERE active = TRUE AND telegram_id IS NOT NULL
         """
         
-        result = execute_query(count_query, fetchone=True, dict_cursor=True)
+        result = await adb.execute_query(count_query, fetchone=True, dict_cursor=True)
         artisan_count = result['count'] if result else 0
         
         await message.answer(
@@ -3006,7 +3123,6 @@ async def send_bulk_message_to_customers(message):
     """Start bulk message sending process for customers"""
     try:
         # Get count of active customers
-        from db import execute_query
         
         count_query = """
             SELECT COUNT(*) as count
@@ -3014,7 +3130,7 @@ async def send_bulk_message_to_customers(message):
             WHERE active = TRUE AND telegram_id IS NOT NULL
         """
         
-        result = execute_query(count_query, fetchone=True, dict_cursor=True)
+        result = await adb.execute_query(count_query, fetchone=True, dict_cursor=True)
         customer_count = result['count'] if result else 0
         
         await message.answer(
@@ -3042,151 +3158,25 @@ async def process_artisan_bulk_message(message: types.Message, state: FSMContext
             await message.answer("❌ Mesaj boş ola bilməz. Zəhmət olmasa, yenidən daxil edin:")
             return
         
-        # Get all active artisans
-        from db import execute_query
-        from crypto_service import decrypt_data
-        from aiogram.utils.exceptions import (
-            BotBlocked, ChatNotFound, UserDeactivated, 
-            TelegramAPIError, RetryAfter, MigrateToChat
+        # Send as a resumable broadcast job; its progress message replaces the final summary
+        bulk_text = (
+            f"📢 *Admin Mesajı*\n\n{bulk_message}\n\n"
+            f"Bu mesaj sistemin admin heyəti tərəfindən göndərilib. "
+            f"Cavab vermək üçün müştəri dəstəyinə yazın: {SUPPORT_PHONE}"
+        )
+        job = await start_broadcast(
+            "admin_message", "artisans",
+            [broadcast_call("send_message", text=bulk_text, parse_mode="Markdown")],
+            PRIORITY_NORMAL, admin_chat_id=message.chat.id
         )
         
-        artisans_query = """
-            SELECT telegram_id, name
-            FROM artisans
-            WHERE active = TRUE AND telegram_id IS NOT NULL
-        """
-        
-        artisans_encrypted = execute_query(artisans_query, fetchall=True, dict_cursor=True)
-        
-        if not artisans_encrypted:
-            await message.answer("❌ Aktiv usta tapılmadı.")
+        if not job:
+            await message.answer("❌ Toplu mesaj yaradıla bilmədi. Zəhmət olmasa bir az sonra yenidən cəhd edin.")
             await state.finish()
             return
         
-        # Decrypt telegram_id for each artisan
-        artisans = []
-        decrypt_errors = 0
-        
-        for artisan_enc in artisans_encrypted:
-            try:
-                decrypted_telegram_id = decrypt_data(artisan_enc['telegram_id'])
-                decrypted_name = decrypt_data(artisan_enc['name']) if artisan_enc['name'] else 'Unknown'
-                
-                # Validate telegram_id
-                if decrypted_telegram_id and str(decrypted_telegram_id).isdigit():
-                    telegram_id = int(decrypted_telegram_id)
-                    # Telegram user IDs are typically positive integers
-                    if telegram_id > 0:
-                        artisans.append({
-                            'telegram_id': telegram_id,
-                            'name': decrypted_name
-                        })
-                        logger.info(f"Successfully decrypted artisan: {telegram_id} - {decrypted_name}")
-                    else:
-                        logger.error(f"Invalid telegram_id for artisan: {decrypted_telegram_id}")
-                        decrypt_errors += 1
-                else:
-                    logger.error(f"Failed to decrypt or invalid telegram_id for artisan: {artisan_enc['telegram_id']}")
-                    decrypt_errors += 1
-                    
-            except Exception as e:
-                logger.error(f"Error decrypting artisan data: {e}, telegram_id: {artisan_enc.get('telegram_id')}")
-                decrypt_errors += 1
-                continue
-        
-        if not artisans:
+        if not job['total']:
             await message.answer("❌ Telegram ID-si olan aktiv usta tapılmadı.")
-            await state.finish()
-            return
-        
-        # Send confirmation with decrypt error info
-        confirmation_text = (
-            f"📨 Toplu mesaj göndərilir...\n"
-            f"Hədəf: {len(artisans)} usta\n"
-        )
-        if decrypt_errors > 0:
-            confirmation_text += f"⚠️ Şifrə çözümlə problemi: {decrypt_errors} usta\n"
-        confirmation_text += f"\nMesaj: {bulk_message}"
-        
-        await message.answer(confirmation_text)
-        
-        # Send message to all artisans
-        success_count = 0
-        failed_count = 0
-        bot_blocked_count = 0
-        chat_not_found_count = 0
-        user_deactivated_count = 0
-        other_errors_count = 0
-        
-        for artisan in artisans:
-            try:
-                await bot.send_message(
-                    chat_id=artisan['telegram_id'],
-                    text=f"📢 *Admin Mesajı*\n\n{bulk_message}\n\n"
-                         f"Bu mesaj sistemin admin heyəti tərəfindən göndərilib. "
-                         f"Cavab vermək üçün müştəri dəstəyinə yazın: {SUPPORT_PHONE}",
-                    parse_mode="Markdown"
-                )
-                success_count += 1
-                logger.info(f"✅ Bulk message sent successfully to artisan {artisan['telegram_id']} ({artisan['name']})")
-                
-            except BotBlocked:
-                logger.warning(f"❌ Bot blocked by artisan {artisan['telegram_id']} ({artisan['name']})")
-                bot_blocked_count += 1
-                failed_count += 1
-                
-            except ChatNotFound:
-                logger.warning(f"❌ Chat not found for artisan {artisan['telegram_id']} ({artisan['name']})")
-                chat_not_found_count += 1
-                failed_count += 1
-                
-            except UserDeactivated:
-                logger.warning(f"❌ User deactivated for artisan {artisan['telegram_id']} ({artisan['name']})")
-                user_deactivated_count += 1
-                failed_count += 1
-                
-            except MigrateToChat as e:
-                logger.warning(f"❌ Chat migrated for artisan {artisan['telegram_id']} ({artisan['name']}) to {e.migrate_to_chat_id}")
-                other_errors_count += 1
-                failed_count += 1
-                
-            except RetryAfter as e:
-                logger.warning(f"⏰ Rate limited for artisan {artisan['telegram_id']} ({artisan['name']}), retry after {e.timeout} seconds")
-                # You might want to implement retry logic here
-                other_errors_count += 1
-                failed_count += 1
-                
-            except TelegramAPIError as e:
-                logger.error(f"❌ Telegram API error for artisan {artisan['telegram_id']} ({artisan['name']}): {e}")
-                other_errors_count += 1
-                failed_count += 1
-                
-            except Exception as e:
-                logger.error(f"❌ Unexpected error for artisan {artisan['telegram_id']} ({artisan['name']}): {e}")
-                other_errors_count += 1
-                failed_count += 1
-        
-        # Send detailed summary
-        summary_text = f"✅ <b>Toplu mesaj göndərildi!</b>\n\n"
-        summary_text += f"📊 <b>Nəticə:</b>\n"
-        summary_text += f"• ✅ Uğurla göndərildi: {success_count}\n"
-        summary_text += f"• ❌ Uğursuz: {failed_count}\n"
-        summary_text += f"• 📊 Ümumi: {len(artisans)}\n\n"
-        
-        if failed_count > 0:
-            summary_text += f"<b>Uğursuzluq detalları:</b>\n"
-            if bot_blocked_count > 0:
-                summary_text += f"• 🚫 Bot bloklanıb: {bot_blocked_count}\n"
-            if chat_not_found_count > 0:
-                summary_text += f"• 🔍 Chat tapılmadı: {chat_not_found_count}\n"
-            if user_deactivated_count > 0:
-                summary_text += f"• 💤 İstifadəçi deaktiv: {user_deactivated_count}\n"
-            if decrypt_errors > 0:
-                summary_text += f"• 🔐 Şifrə problemi: {decrypt_errors}\n"
-            if other_errors_count > 0:
-                summary_text += f"• ⚠️ Digər xətalar: {other_errors_count}\n"
-        
-        await message.answer(summary_text, parse_mode="HTML")
         
         # Clear state
         await state.finish()
@@ -3201,7 +3191,8 @@ async def process_artisan_bulk_message(message: types.Message, state: FSMContext
             InlineKeyboardButton("📊 Statistika", callback_data="admin_stats"),
             InlineKeyboardButton("🗑️ İstifadəçi Sil", callback_data="admin_delete_user"),
             InlineKeyboardButton("📨 Ustalara Toplu Mesaj Göndər", callback_data="send_bulk_message_to_artisans"),
-            InlineKeyboardButton("📨 Müştərilərə Toplu Mesaj Göndər", callback_data="send_bulk_message_to_customers")
+            InlineKeyboardButton("📨 Müştərilərə Toplu Mesaj Göndər", callback_data="send_bulk_message_to_customers"),
+            InlineKeyboardButton("📮 Çatdırılmamış Bildirişlər", callback_data="admin_outbox")
         )
         
         await message.answer(
@@ -3227,151 +3218,25 @@ async def process_customer_bulk_message(message: types.Message, state: FSMContex
             await message.answer("❌ Mesaj boş ola bilməz. Zəhmət olmasa, yenidən daxil edin:")
             return
         
-        # Get all active customers
-        from db import execute_query
-        from crypto_service import decrypt_data
-        from aiogram.utils.exceptions import (
-            BotBlocked, ChatNotFound, UserDeactivated, 
-            TelegramAPIError, RetryAfter, MigrateToChat
+        # Send as a resumable broadcast job; its progress message replaces the final summary
+        bulk_text = (
+            f"📢 *Admin Mesajı*\n\n{bulk_message}\n\n"
+            f"Bu mesaj sistemin admin heyəti tərəfindən göndərilib. "
+            f"Cavab vermək üçün müştəri dəstəyinə yazın: {SUPPORT_PHONE}"
+        )
+        job = await start_broadcast(
+            "admin_message", "customers",
+            [broadcast_call("send_message", text=bulk_text, parse_mode="Markdown")],
+            PRIORITY_NORMAL, admin_chat_id=message.chat.id
         )
         
-        customers_query = """
-            SELECT telegram_id, name
-            FROM customers
-            WHERE active = TRUE AND telegram_id IS NOT NULL
-        """
-        
-        customers_encrypted = execute_query(customers_query, fetchall=True, dict_cursor=True)
-        
-        if not customers_encrypted:
-            await message.answer("❌ Aktiv müştəri tapılmadı.")
+        if not job:
+            await message.answer("❌ Toplu mesaj yaradıla bilmədi. Zəhmət olmasa bir az sonra yenidən cəhd edin.")
             await state.finish()
             return
         
-        # Decrypt telegram_id for each customer
-        customers = []
-        decrypt_errors = 0
-        
-        for customer_enc in customers_encrypted:
-            try:
-                decrypted_telegram_id = decrypt_data(customer_enc['telegram_id'])
-                decrypted_name = decrypt_data(customer_enc['name']) if customer_enc['name'] else 'Unknown'
-                
-                # Validate telegram_id
-                if decrypted_telegram_id and str(decrypted_telegram_id).isdigit():
-                    telegram_id = int(decrypted_telegram_id)
-                    # Telegram user IDs are typically positive integers
-                    if telegram_id > 0:
-                        customers.append({
-                            'telegram_id': telegram_id,
-                            'name': decrypted_name
-                        })
-                        logger.info(f"Successfully decrypted customer: {telegram_id} - {decrypted_name}")
-                    else:
-                        logger.error(f"Invalid telegram_id for customer: {decrypted_telegram_id}")
-                        decrypt_errors += 1
-                else:
-                    logger.error(f"Failed to decrypt or invalid telegram_id for customer: {customer_enc['telegram_id']}")
-                    decrypt_errors += 1
-                    
-            except Exception as e:
-                logger.error(f"Error decrypting customer data: {e}, telegram_id: {customer_enc.get('telegram_id')}")
-                decrypt_errors += 1
-                continue
-        
-        if not customers:
+        if not job['total']:
             await message.answer("❌ Telegram ID-si olan aktiv müştəri tapılmadı.")
-            await state.finish()
-            return
-        
-        # Send confirmation with decrypt error info
-        confirmation_text = (
-            f"📨 Toplu mesaj göndərilir...\n"
-            f"Hədəf: {len(customers)} müştəri\n"
-        )
-        if decrypt_errors > 0:
-            confirmation_text += f"⚠️ Şifrə çözümlə problemi: {decrypt_errors} müştəri\n"
-        confirmation_text += f"\nMesaj: {bulk_message}"
-        
-        await message.answer(confirmation_text)
-        
-        # Send message to all customers
-        success_count = 0
-        failed_count = 0
-        bot_blocked_count = 0
-        chat_not_found_count = 0
-        user_deactivated_count = 0
-        other_errors_count = 0
-        
-        for customer in customers:
-            try:
-                await bot.send_message(
-                    chat_id=customer['telegram_id'],
-                    text=f"📢 *Admin Mesajı*\n\n{bulk_message}\n\n"
-                         f"Bu mesaj sistemin admin heyəti tərəfindən göndərilib. "
-                         f"Cavab vermək üçün müştəri dəstəyinə yazın: {SUPPORT_PHONE}",
-                    parse_mode="Markdown"
-                )
-                success_count += 1
-                logger.info(f"✅ Bulk message sent successfully to customer {customer['telegram_id']} ({customer['name']})")
-                
-            except BotBlocked:
-                logger.warning(f"❌ Bot blocked by customer {customer['telegram_id']} ({customer['name']})")
-                bot_blocked_count += 1
-                failed_count += 1
-                
-            except ChatNotFound:
-                logger.warning(f"❌ Chat not found for customer {customer['telegram_id']} ({customer['name']})")
-                chat_not_found_count += 1
-                failed_count += 1
-                
-            except UserDeactivated:
-                logger.warning(f"❌ User deactivated for customer {customer['telegram_id']} ({customer['name']})")
-                user_deactivated_count += 1
-                failed_count += 1
-                
-            except MigrateToChat as e:
-                logger.warning(f"❌ Chat migrated for customer {customer['telegram_id']} ({customer['name']}) to {e.migrate_to_chat_id}")
-                other_errors_count += 1
-                failed_count += 1
-                
-            except RetryAfter as e:
-                logger.warning(f"⏰ Rate limited for customer {customer['telegram_id']} ({customer['name']}), retry after {e.timeout} seconds")
-                # You might want to implement retry logic here
-                other_errors_count += 1
-                failed_count += 1
-                
-            except TelegramAPIError as e:
-                logger.error(f"❌ Telegram API error for customer {customer['telegram_id']} ({customer['name']}): {e}")
-                other_errors_count += 1
-                failed_count += 1
-                
-            except Exception as e:
-                logger.error(f"❌ Unexpected error for customer {customer['telegram_id']} ({customer['name']}): {e}")
-                other_errors_count += 1
-                failed_count += 1
-        
-        # Send detailed summary
-        summary_text = f"✅ <b>Toplu mesaj göndərildi!</b>\n\n"
-        summary_text += f"📊 <b>Nəticə:</b>\n"
-        summary_text += f"• ✅ Uğurla göndərildi: {success_count}\n"
-        summary_text += f"• ❌ Uğursuz: {failed_count}\n"
-        summary_text += f"• 📊 Ümumi: {len(customers)}\n\n"
-        
-        if failed_count > 0:
-            summary_text += f"<b>Uğursuzluq detalları:</b>\n"
-            if bot_blocked_count > 0:
-                summary_text += f"• 🚫 Bot bloklanıb: {bot_blocked_count}\n"
-            if chat_not_found_count > 0:
-                summary_text += f"• 🔍 Chat tapılmadı: {chat_not_found_count}\n"
-            if user_deactivated_count > 0:
-                summary_text += f"• 💤 İstifadəçi deaktiv: {user_deactivated_count}\n"
-            if decrypt_errors > 0:
-                summary_text += f"• 🔐 Şifrə problemi: {decrypt_errors}\n"
-            if other_errors_count > 0:
-                summary_text += f"• ⚠️ Digər xətalar: {other_errors_count}\n"
-        
-        await message.answer(summary_text, parse_mode="HTML")
         
         # Clear state
         await state.finish()
@@ -3386,7 +3251,8 @@ async def process_customer_bulk_message(message: types.Message, state: FSMContex
             InlineKeyboardButton("📊 Statistika", callback_data="admin_stats"),
             InlineKeyboardButton("🗑️ İstifadəçi Sil", callback_data="admin_delete_user"),
             InlineKeyboardButton("📨 Ustalara Toplu Mesaj Göndər", callback_data="send_bulk_message_to_artisans"),
-            InlineKeyboardButton("📨 Müştərilərə Toplu Mesaj Göndər", callback_data="send_bulk_message_to_customers")
+            InlineKeyboardButton("📨 Müştərilərə Toplu Mesaj Göndər", callback_data="send_bulk_message_to_customers"),
+            InlineKeyboardButton("📮 Çatdırılmamış Bildirişlər", callback_data="admin_outbox")
         )
         
         await message.answer(
@@ -3405,7 +3271,6 @@ async def show_admin_orders(message):
     """Show orders for admin to manage"""
     try:
         # Get recent orders
-        from db import execute_query, get_artisan_by_id, get_customer_by_id
         from crypto_service import decrypt_data
         from db_encryption_wrapper import decrypt_dict_data
         
@@ -3419,7 +3284,7 @@ async def show_admin_orders(message):
             LIMIT 10
         """
         
-        orders = execute_query(query, fetchall=True, dict_cursor=True)
+        orders = await adb.execute_query(query, fetchall=True, dict_cursor=True)
         
         if not orders:
             await message.answer("📭 Aktiv sifariş tapılmadı.")
@@ -3444,8 +3309,8 @@ async def show_admin_orders(message):
         # Display recent orders
         for order in orders:
             # Şifreleri çözülmüş müşteri ve usta bilgilerini al
-            customer_encrypted = get_customer_by_id(order['customer_id'])
-            artisan_encrypted = get_artisan_by_id(order['artisan_id'])
+            customer_encrypted = await adb.get_customer_by_id(order['customer_id'])
+            artisan_encrypted = await adb.get_artisan_by_id(order['artisan_id'])
             
             # Şifreleri çöz ve maskele
             customer = decrypt_dict_data(customer_encrypted, mask=False)
@@ -3515,10 +3380,9 @@ async def show_admin_orders(message):
 async def show_admin_advertisement_receipts(message):
     """Show pending advertisement receipts for admin review"""
     try:
-        from db import get_pending_advertisement_receipts, get_admin_artisan_by_id
         from crypto_service import decrypt_data
         
-        pending_receipts = get_pending_advertisement_receipts()
+        pending_receipts = await adb.get_pending_advertisement_receipts()
         
         if not pending_receipts:
             await message.answer(
@@ -3536,7 +3400,7 @@ async def show_admin_advertisement_receipts(message):
         
         for receipt in pending_receipts:
             # Get properly decoded artisan name for admin view
-            artisan_data = get_admin_artisan_by_id(receipt['artisan_id']) if receipt.get('artisan_id') else None
+            artisan_data = await adb.get_admin_artisan_by_id(receipt['artisan_id']) if receipt.get('artisan_id') else None
             artisan_name = artisan_data['name'] if artisan_data else 'N/A'
             # Package info
             package_info = {
@@ -3598,11 +3462,10 @@ async def show_admin_advertisement_receipts(message):
 async def show_admin_advertisement_photos(message):
     """Show pending advertisement photos for admin review"""
     try:
-        from db import get_pending_advertisement_photos, get_admin_artisan_by_id
         from crypto_service import decrypt_data
         import json
         
-        pending_photos = get_pending_advertisement_photos()
+        pending_photos = await adb.get_pending_advertisement_photos()
         
         if not pending_photos:
             await message.answer(
@@ -3620,7 +3483,7 @@ async def show_admin_advertisement_photos(message):
         
         for advertisement in pending_photos:
             # Get properly decoded artisan name for admin view
-            artisan_data = get_admin_artisan_by_id(advertisement['artisan_id']) if advertisement.get('artisan_id') else None
+            artisan_data = await adb.get_admin_artisan_by_id(advertisement['artisan_id']) if advertisement.get('artisan_id') else None
             artisan_name = artisan_data['name'] if artisan_data else 'N/A'
             # Package info
             package_info = {
@@ -3723,11 +3586,10 @@ async def handle_advertisement_receipt_action(callback_query: types.CallbackQuer
         action = callback_query.data
         advertisement_id = int(action.split('_')[-1])
         
-        from db import get_advertisement_by_id, update_advertisement_status, clear_advertisement_receipt
         from crypto_service import decrypt_data
         
         # Get advertisement details
-        advertisement = get_advertisement_by_id(advertisement_id)
+        advertisement = await adb.get_advertisement_by_id(advertisement_id)
         if not advertisement:
             await callback_query.answer("❌ Reklam tapılmadı.", show_alert=True)
             return
@@ -3737,7 +3599,7 @@ async def handle_advertisement_receipt_action(callback_query: types.CallbackQuer
         
         if action.startswith('approve_ad_receipt_'):
             # Approve receipt
-            success = update_advertisement_status(advertisement_id, 'receipt_status', 'accepted')
+            success = await adb.update_advertisement_status(advertisement_id, 'receipt_status', 'accepted')
             
             if success:
                 await callback_query.answer("✅ Qəbz təsdiqləndi!", show_alert=True)
@@ -3776,8 +3638,8 @@ async def handle_advertisement_receipt_action(callback_query: types.CallbackQuer
                 
         elif action.startswith('reject_ad_receipt_'):
             # Reject receipt
-            success = update_advertisement_status(advertisement_id, 'receipt_status', 'rejected')
-            clear_receipt_success = clear_advertisement_receipt(advertisement_id)
+            success = await adb.update_advertisement_status(advertisement_id, 'receipt_status', 'rejected')
+            clear_receipt_success = await adb.clear_advertisement_receipt(advertisement_id)
             
             if success:
                 await callback_query.answer("❌ Qəbz rədd edildi!", show_alert=True)
@@ -3812,10 +3674,9 @@ async def handle_advertisement_receipt_action(callback_query: types.CallbackQuer
 async def show_advertisement_photos_for_approval(message, advertisement_id):
     """Show advertisement photos for admin approval if they exist"""
     try:
-        from db import get_advertisement_by_id, get_admin_artisan_by_id
         import json
         
-        advertisement = get_advertisement_by_id(advertisement_id)
+        advertisement = await adb.get_advertisement_by_id(advertisement_id)
         if not advertisement:
             return
         
@@ -3825,7 +3686,7 @@ async def show_advertisement_photos_for_approval(message, advertisement_id):
             
             if photos:
                 # Get properly decoded artisan name for admin view
-                artisan_data = get_admin_artisan_by_id(advertisement['artisan_id']) if advertisement.get('artisan_id') else None
+                artisan_data = await adb.get_admin_artisan_by_id(advertisement['artisan_id']) if advertisement.get('artisan_id') else None
                 artisan_name = artisan_data['name'] if artisan_data else 'N/A'
                 
                 await message.answer(
@@ -3876,14 +3737,13 @@ async def handle_advertisement_photos_action(callback_query: types.CallbackQuery
         action = callback_query.data
         advertisement_id = int(action.split('_')[-1])
         
-        from db import (get_advertisement_by_id, update_advertisement_status, 
-                       clear_advertisement_photos, get_artisan_subservices, 
+        from db import (get_artisan_subservices, 
                        get_random_customers, get_total_customers_count)
         from crypto_service import decrypt_data
         import json
         
         # Get advertisement details
-        advertisement = get_advertisement_by_id(advertisement_id)
+        advertisement = await adb.get_advertisement_by_id(advertisement_id)
         if not advertisement:
             await callback_query.answer("❌ Reklam tapılmadı.", show_alert=True)
             return
@@ -3893,8 +3753,8 @@ async def handle_advertisement_photos_action(callback_query: types.CallbackQuery
         
         if action.startswith('approve_ad_photos_'):
             # Approve photos and broadcast advertisement
-            success = update_advertisement_status(advertisement_id, 'photos_status', 'accepted')
-            success = success and update_advertisement_status(advertisement_id, 'advertisement_status', 'accepted')
+            success = await adb.update_advertisement_status(advertisement_id, 'photos_status', 'accepted')
+            success = success and await adb.update_advertisement_status(advertisement_id, 'advertisement_status', 'accepted')
             
             if success:
                 await callback_query.answer("✅ Reklam təsdiqləndi və yayımlanır!", show_alert=True)
@@ -3913,16 +3773,16 @@ async def handle_advertisement_photos_action(callback_query: types.CallbackQuery
                     logger.error(f"Error notifying artisan about final approval: {e}")
                 
                 # Broadcast advertisement to customers
-                await broadcast_advertisement(advertisement_id)
+                await broadcast_advertisement(advertisement_id, callback_query.from_user.id)
                 
             else:
                 await callback_query.answer("❌ Reklam təsdiqləməkdə xəta baş verdi.", show_alert=True)
                 
         elif action.startswith('reject_ad_photos_'):
             # Reject photos
-            success = update_advertisement_status(advertisement_id, 'photos_status', 'rejected')
-            success = success and update_advertisement_status(advertisement_id, 'advertisement_status', 'rejected')
-            clear_photos_success = clear_advertisement_photos(advertisement_id)
+            success = await adb.update_advertisement_status(advertisement_id, 'photos_status', 'rejected')
+            success = success and await adb.update_advertisement_status(advertisement_id, 'advertisement_status', 'rejected')
+            clear_photos_success = await adb.clear_advertisement_photos(advertisement_id)
             
             if success:
                 await callback_query.answer("❌ Fotoğraflar rədd edildi!", show_alert=True)
@@ -3971,7 +3831,8 @@ async def handle_advertisement_photos_action(callback_query: types.CallbackQuery
             InlineKeyboardButton("📊 Statistika", callback_data="admin_stats"),
             InlineKeyboardButton("🗑️ İstifadəçi Sil", callback_data="admin_delete_user"),
             InlineKeyboardButton("📨 Ustalara Toplu Mesaj Göndər", callback_data="send_bulk_message_to_artisans"),
-            InlineKeyboardButton("📨 Müştərilərə Toplu Mesaj Göndər", callback_data="send_bulk_message_to_customers")
+            InlineKeyboardButton("📨 Müştərilərə Toplu Mesaj Göndər", callback_data="send_bulk_message_to_customers"),
+            InlineKeyboardButton("📮 Çatdırılmamış Bildirişlər", callback_data="admin_outbox")
         )
         
         await callback_query.message.answer(
@@ -3985,16 +3846,18 @@ async def handle_advertisement_photos_action(callback_query: types.CallbackQuery
         logger.error(f"Error in handle_advertisement_photos_action: {e}")
         await callback_query.answer("❌ Xəta baş verdi.", show_alert=True)
 
-async def broadcast_advertisement(advertisement_id):
-    """Broadcast approved advertisement to target customers"""
+async def broadcast_advertisement(advertisement_id, admin_chat_id=None):
+    """Broadcast approved advertisement to target customers
+    
+    Args:
+        advertisement_id (int): ID of the approved advertisement
+        admin_chat_id (int, optional): Admin chat that receives the progress message
+    """
     try:
-        from db import (get_advertisement_by_id, get_artisan_subservices, 
-                       get_random_customers, get_total_customers_count)
-        from crypto_service import decrypt_data
         import json
         
         # Get advertisement details
-        advertisement = get_advertisement_by_id(advertisement_id)
+        advertisement = await adb.get_advertisement_by_id(advertisement_id)
         if not advertisement:
             logger.error(f"Advertisement {advertisement_id} not found for broadcasting")
             return
@@ -4008,33 +3871,17 @@ async def broadcast_advertisement(advertisement_id):
         
         target_users = package_info.get(advertisement['package_type'], {'users': 150})['users']
         
-        # Get total customers count
-        total_customers = get_total_customers_count()
-        
-        # Get customers to send to
-        if total_customers <= target_users:
-            # Send to all customers
-            from db import execute_query
-            customers_query = """
-                SELECT telegram_id, name FROM customers 
-                WHERE active = 1 AND telegram_id IS NOT NULL
-            """
-            customers_encrypted = execute_query(customers_query, fetchall=True, dict_cursor=True)
-        else:
-            # Send to random customers
-            customers_encrypted = get_random_customers(target_users)
-        
-        if not customers_encrypted:
-            logger.warning(f"No customers found for advertisement {advertisement_id}")
-            return
+        # Send to all customers when there are not more than the package reaches,
+        # otherwise to a random sample of that size
+        total_customers = await adb.get_total_customers_count()
+        sample_size = target_users if total_customers > target_users else None
         
         # Get artisan subservices for advertisement text
-        subservices = get_artisan_subservices(advertisement['artisan_id'])
+        subservices = await adb.get_artisan_subservices(advertisement['artisan_id'])
         subservice_names = [sub['subservice_name'] for sub in subservices[:2]]  # Take first 2
         
         # Get artisan name with proper decryption
-        from db import get_admin_artisan_by_id
-        artisan_data = get_admin_artisan_by_id(advertisement['artisan_id'])
+        artisan_data = await adb.get_admin_artisan_by_id(advertisement['artisan_id'])
         artisan_name = artisan_data.get('name', 'Usta') if artisan_data else 'Usta'
         
         # Create advertisement text
@@ -4055,81 +3902,54 @@ async def broadcast_advertisement(advertisement_id):
         if advertisement.get('advertisement_photos'):
             photos = json.loads(advertisement['advertisement_photos'])
         
-        # Send advertisement to customers
-        success_count = 0
-        failed_count = 0
-        
-        for customer_enc in customers_encrypted:
-            try:
-                decrypted_telegram_id = decrypt_data(customer_enc['telegram_id'])
-                if decrypted_telegram_id and str(decrypted_telegram_id).isdigit():
-                    telegram_id = int(decrypted_telegram_id)
-                    
-                    # Create order button
-                    keyboard = InlineKeyboardMarkup()
-                    keyboard.add(
-                        InlineKeyboardButton(
-                            "📞 Bu ustadan sifariş ver", 
-                            callback_data=f"orde_from_{advertisement['artisan_id']}"
-                        )
-                    )
-                    
-                    if photos:
-                        # Send all photos
-                        if len(photos) == 1:
-                            # Single photo
-                            await bot.send_photo(
-                                chat_id=telegram_id,
-                                photo=photos[0],
-                                caption=f"📢 *Reklam*\n\n{ad_text}",
-                                reply_markup=keyboard,
-                                parse_mode="Markdown"
-                            )
-                        else:
-                            # Multiple photos - send as media group
-                            from aiogram.types import MediaGroup, InputMediaPhoto
-                            media_group = MediaGroup()
-                            
-                            # Add first photo with caption
-                            media_group.attach_photo(
-                                photos[0],
-                                caption=f"📢 *Reklam*\n\n{ad_text}",
-                                parse_mode="Markdown"
-                            )
-                            
-                            # Add remaining photos without caption
-                            for photo in photos[1:]:
-                                media_group.attach_photo(photo)
-                            
-                            # Send media group
-                            await bot.send_media_group(
-                                chat_id=telegram_id,
-                                media=media_group
-                            )
-                            
-                            # Send order button separately
-                            await bot.send_message(
-                                chat_id=telegram_id,
-                                text="👆 Bu ustanın işlərinə baxın və sifariş verin:",
-                                reply_markup=keyboard
-                            )
-                    else:
-                        # Send text only
-                        await bot.send_message(
-                            chat_id=telegram_id,
-                            text=f"📢 *Reklam*\n\n{ad_text}",
-                            reply_markup=keyboard,
-                            parse_mode="Markdown"
-                        )
-                    
-                    success_count += 1
-                    
-            except Exception as e:
-                logger.error(f"Error sending advertisement to customer: {e}")
-                failed_count += 1
-                continue
+        # Create order button
+        keyboard = InlineKeyboardMarkup()
+        keyboard.add(
+            InlineKeyboardButton(
+                "📞 Bu ustadan sifariş ver", 
+                callback_data=f"orde_from_{advertisement['artisan_id']}"
+            )
+        )
+        caption = f"📢 *Reklam*\n\n{ad_text}"
+        
+        if len(photos) == 1:
+            # Single photo
+            calls = [broadcast_call(
+                "send_photo", photo=photos[0], caption=caption, reply_markup=keyboard, parse_mode="Markdown"
+            )]
+        elif photos:
+            # Multiple photos - send as media group, then the order button separately
+            from aiogram.types import MediaGroup
+            media_group = MediaGroup()
+            
+            # Add first photo with caption
+            media_group.attach_photo(photos[0], caption=caption, parse_mode="Markdown")
+            
+            # Add remaining photos without caption
+            for photo in photos[1:]:
+                media_group.attach_photo(photo)
+            
+            calls = [
+                broadcast_call("send_media_group", media=media_group),
+                broadcast_call(
+                    "send_message", text="👆 Bu ustanın işlərinə baxın və sifariş verin:", reply_markup=keyboard
+                ),
+            ]
+        else:
+            # Send text only
+            calls = [broadcast_call("send_message", text=caption, reply_markup=keyboard, parse_mode="Markdown")]
+        
+        # Send on the bulk lane as a resumable job; the dispatcher paces it
+        # and lets order messages overtake it
+        job = await start_broadcast(
+            "advertisement", "customers", calls, PRIORITY_BULK,
+            admin_chat_id=admin_chat_id, reference_id=advertisement_id, sample_size=sample_size
+        )
         
-        logger.info(f"Advertisement {advertisement_id} broadcasted to {success_count} customers, {failed_count} failed")
+        if job:
+            logger.info(f"Advertisement {advertisement_id} queued as broadcast {job['id']} for {job['total']} customers")
+        else:
+            logger.error(f"Could not create broadcast for advertisement {advertisement_id}")
         
     except Exception as e:
         logger.error(f"Error in broadcast_advertisement: {e}")
@@ -4201,7 +4021,6 @@ async def set_artisan_receipt_upload_state(telegram_id, advertisement_id):
 async def show_admin_fine_receipts(message):
     """Show fine receipts for admin to approve/reject"""
     try:
-        from db import execute_query, get_admin_customer_by_id, get_admin_artisan_by_id
         
         # Get pending fine receipts for both artisans and customers
         artisan_query = """
@@ -4222,8 +4041,8 @@ async def show_admin_fine_receipts(message):
             ORDER BY cfr.created_at DESC
         """
         
-        artisan_receipts = execute_query(artisan_query, fetchall=True, dict_cursor=True) or []
-        customer_receipts = execute_query(customer_query, fetchall=True, dict_cursor=True) or []
+        artisan_receipts = await adb.execute_query(artisan_query, fetchall=True, dict_cursor=True) or []
+        customer_receipts = await adb.execute_query(customer_query, fetchall=True, dict_cursor=True) or []
         
         # Combine and sort by date
         all_receipts = artisan_receipts + customer_receipts
@@ -4241,13 +4060,13 @@ async def show_admin_fine_receipts(message):
             user_type = receipt['user_type']
             
             if user_type == 'artisan':
-                user = get_admin_artisan_by_id(receipt['artisan_id'])
+                user = await adb.get_admin_artisan_by_id(receipt['artisan_id'])
                 user_title = "👷‍♂️ Usta"
                 callback_prefix = "approve_artisan_fine"
                 reject_prefix = "reject_artisan_fine"
                 user_id = receipt['artisan_id']
             else:
-                user = get_admin_customer_by_id(receipt['customer_id'])
+                user = await adb.get_admin_customer_by_id(receipt['customer_id'])
                 user_title = "👤 Müştəri"
                 callback_prefix = "approve_customer_fine"
                 reject_prefix = "reject_customer_fine"
@@ -4306,7 +4125,7 @@ async def handle_fine_receipt_action(callback_query: types.CallbackQuery):
         is_approved = action.startswith('approve')
         is_artisan = 'artisan' in action
         
-        from db import execute_query, unblock_artisan, unblock_customer
+        from db import unblock_artisan, unblock_customer
         
         if is_artisan:
             table_name = "fine_receipts"
@@ -4328,10 +4147,10 @@ async def handle_fine_receipt_action(callback_query: types.CallbackQuery):
             
             # Update receipt status
             update_query = f"UPDATE {table_name} SET status = 'approved' WHERE id = %s"
-            execute_query(update_query, (receipt_id,), commit=True)
+            await adb.execute_query(update_query, (receipt_id,), commit=True)
             
             # Unblock user
-            success = unblock_func(user_id)
+            success = await run_db(unblock_func, user_id)
             
             if success:
                 # Update message to show approval
@@ -4344,7 +4163,7 @@ async def handle_fine_receipt_action(callback_query: types.CallbackQuery):
                 )
                 
                 # Notify user about approval
-                user = get_user_func(user_id)
+                user = await run_db(get_user_func, user_id)
                 if user and user.get('telegram_id'):
                     await bot.send_message(
                         chat_id=user['telegram_id'],
@@ -4361,7 +4180,7 @@ async def handle_fine_receipt_action(callback_query: types.CallbackQuery):
             
             # Update receipt status
             update_query = f"UPDATE {table_name} SET status = 'rejected' WHERE id = %s"
-            execute_query(update_query, (receipt_id,), commit=True)
+            await adb.execute_query(update_query, (receipt_id,), commit=True)
             
             # Update message to show rejection
             await bot.edit_message_caption(
@@ -4373,7 +4192,7 @@ async def handle_fine_receipt_action(callback_query: types.CallbackQuery):
             )
             
             # Notify user about rejection
-            user = get_user_func(user_id)
+            user = await run_db(get_user_func, user_id)
             if user and user.get('telegram_id'):
                 await bot.send_message(
                     chat_id=user['telegram_id'],
@@ -4390,6 +4209,10 @@ async def handle_fine_receipt_action(callback_query: types.CallbackQuery):
         await callback_query.answer("❌ Xəta baş verdi. Zəhmət olmasa bir az sonra yenidən cəhd edin.", show_alert=True)
 
 if __name__ == '__main__':
+    # Bring the schema up to date before the event loop starts; handlers
+    # assume every table exists, and a failed migration stops the bot here
+    run_migrations()
+    
     # Register all handlers
     register_all_handlers()
     
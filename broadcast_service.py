@@ -0,0 +1,360 @@
+# broadcast_service.py
+
+import asyncio
+import html
+import logging
+import time
+import uuid
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from aiogram.utils.exceptions import (
+    BotBlocked, ChatNotFound, UserDeactivated, RetryAfter, NetworkError,
+    MessageNotModified, TelegramAPIError
+)
+from crypto_service import decrypt_many
+from db_async import adb, run_db
+from timer_service import timers
+from telegram_dispatcher import telegram, PRIORITY_TRANSACTIONAL
+from config import (
+    WORKER_ID, BROADCAST_BATCH_SIZE, BROADCAST_LEASE_SECONDS, BROADCAST_POLL_SECONDS,
+    BROADCAST_PROGRESS_SECONDS
+)
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+FAILURE_LABELS = {
+    "bot_blocked": "🚫 Bot bloklanıb",
+    "chat_not_found": "🔍 Chat tapılmadı",
+    "user_deactivated": "💤 İstifadəçi deaktiv",
+    "rate_limited": "⏰ Limitə düşdü",
+    "network": "🌐 Şəbəkə xətası",
+    "telegram_error": "⚠️ Telegram xətası",
+    "decrypt_error": "🔐 Şifrə problemi",
+    "unavailable": "👤 İstifadəçi artıq aktiv deyil",
+    "other": "⚠️ Digər xətalar",
+}
+
+STATUS_LABELS = {
+    "running": "⏳ Göndərilir",
+    "paused": "⏸ Dayandırılıb",
+    "cancelled": "🛑 Ləğv edilib",
+    "completed": "✅ Tamamlandı",
+    "failed": "❌ Xəta baş verdi",
+}
+
+KIND_LABELS = {
+    "admin_message": "Toplu mesaj",
+    "advertisement": "Reklam",
+}
+
+AUDIENCE_LABELS = {
+    "artisans": "usta",
+    "customers": "müştəri",
+}
+
+
+def classify_failure(error):
+    """Map a send error to a failure reason of the broadcast report"""
+    if isinstance(error, BotBlocked):
+        return "bot_blocked"
+    if isinstance(error, ChatNotFound):
+        return "chat_not_found"
+    if isinstance(error, UserDeactivated):
+        return "user_deactivated"
+    if isinstance(error, RetryAfter):
+        return "rate_limited"
+    if isinstance(error, (NetworkError, asyncio.TimeoutError)):
+        return "network"
+    if isinstance(error, TelegramAPIError):
+        return "telegram_error"
+    return "other"
+
+
+def broadcast_call(method, **kwargs):
+    """Build one Bot API call of a broadcast, stored as JSON in the job
+
+    Args:
+        method (str): Bot method name, e.g. 'send_message'
+        **kwargs: Method arguments other than chat_id; keyboards and media
+            groups are converted to their JSON form
+
+    Returns:
+        dict: {"method": str, "kwargs": dict}
+    """
+    for name in ('reply_markup', 'media'):
+        value = kwargs.get(name)
+        if value is not None and hasattr(value, 'to_python'):
+            kwargs[name] = value.to_python()
+    return {"method": method, "kwargs": kwargs}
+
+
+def format_progress(job):
+    """Render the admin progress message of a job
+
+    Returns:
+        tuple: (HTML text, InlineKeyboardMarkup or None)
+    """
+    total = job['total'] or 0
+    done = job['sent'] + job['failed']
+    percent = int(done * 100 / total) if total else 100
+    filled = percent // 10
+    rate = job['sent'] / job['active_seconds'] if job['active_seconds'] else 0.0
+
+    kind = KIND_LABELS.get(job['kind'], job['kind'])
+    audience = AUDIENCE_LABELS.get(job['audience'], job['audience'])
+
+    text = f"📨 <b>{html.escape(kind)} #{job['id']}</b>\n"
+    text += f"{STATUS_LABELS.get(job['status'], job['status'])}\n\n"
+    text += f"{'▓' * filled}{'░' * (10 - filled)} {percent}%\n\n"
+    text += f"• ✅ Göndərildi: {job['sent']}\n"
+    text += f"• ❌ Uğursuz: {job['failed']}\n"
+    text += f"• 📊 Ümumi: {total} {audience}\n"
+    text += f"• ⚡ Sürət: {rate:.1f} mesaj/san\n"
+
+    failures = {reason: count for reason, count in (job.get('failures') or {}).items() if count}
+    if failures:
+        text += "\n<b>Uğursuzluq detalları:</b>\n"
+        for reason, count in sorted(failures.items(), key=lambda item: -item[1]):
+            text += f"• {FAILURE_LABELS.get(reason, reason)}: {count}\n"
+
+    keyboard = None
+    if job['status'] in ('running', 'paused'):
+        keyboard = InlineKeyboardMarkup(row_width=2)
+        if job['status'] == 'running':
+            toggle = InlineKeyboardButton("⏸ Dayandır", callback_data=f"broadcast_pause_{job['id']}")
+        else:
+            toggle = InlineKeyboardButton("▶️ Davam et", callback_data=f"broadcast_resume_{job['id']}")
+        keyboard.add(toggle, InlineKeyboardButton("🛑 Ləğv et", callback_data=f"broadcast_cancel_{job['id']}"))
+
+    return text, keyboard
+
+
+async def update_progress_message(job):
+    """Edit the admin's progress message of a job, if it has one"""
+    if not job or not job.get('progress_chat_id') or not job.get('progress_message_id'):
+        return
+    text, keyboard = format_progress(job)
+    try:
+        await telegram.edit_message_text(
+            text, job['progress_chat_id'], job['progress_message_id'], PRIORITY_TRANSACTIONAL,
+            reply_markup=keyboard, parse_mode="HTML"
+        )
+    except MessageNotModified:
+        pass
+    except Exception as e:
+        logger.warning(f"Could not update progress of broadcast {job['id']}: {e}")
+
+
+async def start_broadcast(kind, audience, calls, priority, admin_chat_id=None, reference_id=None, sample_size=None):
+    """Create a broadcast job, post its progress message and start sending
+
+    Args:
+        kind (str): 'admin_message' or 'advertisement'
+        audience (str): 'artisans' or 'customers'
+        calls (list): broadcast_call(...) items sent to every recipient
+        priority (int): Telegram dispatcher lane
+        admin_chat_id (int, optional): Chat that receives the progress message
+        reference_id (int, optional): Related object, e.g. the advertisement ID
+        sample_size (int, optional): Send to this many random recipients only
+
+    Returns:
+        dict: The created job, or None if it could not be created
+    """
+    job = await adb.create_broadcast_job(
+        kind, audience, calls, priority,
+        created_by=admin_chat_id, reference_id=reference_id, sample_size=sample_size
+    )
+    if not job:
+        return None
+
+    if admin_chat_id:
+        text, keyboard = format_progress(job)
+        try:
+            message = await telegram.send_message(
+                admin_chat_id, text, PRIORITY_TRANSACTIONAL, reply_markup=keyboard, parse_mode="HTML"
+            )
+            await adb.set_broadcast_progress_message(job['id'], admin_chat_id, message.message_id)
+        except Exception as e:
+            logger.warning(f"Could not post progress of broadcast {job['id']}: {e}")
+
+    broadcasts.kick()
+    return job
+
+
+class BroadcastRunner:
+    """Sends broadcast jobs batch by batch
+
+    A job walks its recipient snapshot in recipient_id order. After every
+    batch the cursor, counters and failure reasons are checkpointed and the
+    lease is extended, so a restarted or crashed worker loses at most one
+    batch and another worker resumes after the cursor once the lease
+    expires. Recipients of the batch in flight may receive the message
+    twice in that case. Pausing or cancelling takes effect at the next
+    checkpoint.
+    """
+
+    def __init__(self, owner=WORKER_ID, batch_size=BROADCAST_BATCH_SIZE, poll_interval=BROADCAST_POLL_SECONDS,
+                 lease_seconds=BROADCAST_LEASE_SECONDS, progress_interval=BROADCAST_PROGRESS_SECONDS):
+        self.owner = owner
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.progress_interval = progress_interval
+        self._started = False
+        self._polling = False
+        self._current = None
+        self._stats = {"jobs": 0, "batches": 0, "sent": 0, "failed": 0, "active_seconds": 0.0, "failures": {}}
+
+    def start(self):
+        """Look for new and abandoned jobs every poll_interval seconds"""
+        if self._started:
+            return
+        self._started = True
+        timers.every("broadcast_poll", self.poll_interval, self.poll)
+        # Finished jobs drop their snapshot themselves; this catches cancelled ones
+        timers.every("broadcast_purge", 60 * 60, self.purge, exclusive=True)
+        logger.info(f"Broadcast runner started as {self.owner}")
+
+    def kick(self):
+        """Start a new job right away instead of at the next poll"""
+        if not self._polling:
+            asyncio.ensure_future(self.poll())
+
+    async def poll(self):
+        """Run claimable jobs one after another until none is left"""
+        if self._polling:
+            return
+        self._polling = True
+        try:
+            while True:
+                token = f"{self.owner}:{uuid.uuid4().hex[:12]}"
+                job = await adb.claim_broadcast_job(token, self.lease_seconds)
+                if not job:
+                    return
+                await self._run(token, job)
+        finally:
+            self._polling = False
+
+    async def purge(self):
+        deleted = await adb.purge_broadcast_recipients()
+        if deleted:
+            logger.info(f"Purged {deleted} recipients of finished broadcasts")
+
+    async def _run(self, token, job):
+        self._current = job['id']
+        self._stats["jobs"] += 1
+        logger.info(f"Broadcast {job['id']} ({job['kind']} to {job['audience']}) resumed after recipient {job['cursor_id']}")
+        last_progress = 0.0
+        try:
+            while True:
+                rows = await adb.get_broadcast_recipients(job['id'], job['audience'], job['cursor_id'], self.batch_size)
+                if not rows:
+                    await adb.finish_broadcast_job(job['id'], token, 'completed')
+                    break
+
+                started = time.monotonic()
+                reasons = await self._send_batch(job, rows)
+                elapsed = time.monotonic() - started
+
+                sent = sum(1 for reason in reasons if reason is None)
+                failed = len(reasons) - sent
+                for reason in reasons:
+                    if reason is not None:
+                        job['failures'][reason] = job['failures'].get(reason, 0) + 1
+                        self._stats["failures"][reason] = self._stats["failures"].get(reason, 0) + 1
+                self._stats["batches"] += 1
+                self._stats["sent"] += sent
+                self._stats["failed"] += failed
+                self._stats["active_seconds"] += elapsed
+
+                job['cursor_id'] = rows[-1]['recipient_id']
+                job['sent'] += sent
+                job['failed'] += failed
+                job['active_seconds'] += elapsed
+                running = await adb.checkpoint_broadcast_job(
+                    job['id'], token, job['cursor_id'], sent, failed, job['failures'], elapsed, self.lease_seconds
+                )
+                if not running:
+                    # Paused, cancelled or taken over; the job row knows which
+                    await adb.release_broadcast_job(job['id'], token)
+                    break
+
+                if time.monotonic() - last_progress >= self.progress_interval:
+                    last_progress = time.monotonic()
+                    await update_progress_message(job)
+
+                if len(rows) < self.batch_size:
+                    await adb.finish_broadcast_job(job['id'], token, 'completed')
+                    break
+        except Exception as e:
+            logger.error(f"Broadcast {job['id']} stopped: {e}", exc_info=True)
+            await adb.finish_broadcast_job(job['id'], token, 'failed')
+        finally:
+            self._current = None
+
+        job = await adb.get_broadcast_job(job['id'])
+        if job:
+            await update_progress_message(job)
+            logger.info(
+                f"Broadcast {job['id']} {job['status']}: {job['sent']} sent, {job['failed']} failed "
+                f"of {job['total']} in {job['active_seconds']:.1f}s"
+            )
+
+    async def _send_batch(self, job, rows):
+        """Send every call of the job to each recipient of the batch
+
+        Returns:
+            list: Failure reason per recipient, None where all calls succeeded
+        """
+        reasons = [None] * len(rows)
+        deliveries = []
+        # One bulk call off the event loop instead of a decrypt per recipient
+        telegram_ids = await run_db(decrypt_many, [row['telegram_id'] for row in rows])
+        for index, row in enumerate(rows):
+            if not row['telegram_id'] or not row['active']:
+                reasons[index] = "unavailable"
+                continue
+            try:
+                chat_id = int(telegram_ids[index])
+            except Exception as e:
+                logger.error(f"Cannot decrypt telegram_id of recipient {row['recipient_id']}: {e}")
+                reasons[index] = "decrypt_error"
+                continue
+            # Calls to the same chat keep their order in the dispatcher
+            futures = [
+                telegram.submit(call['method'], chat_id, job['priority'], **call['kwargs'])
+                for call in job['calls']
+            ]
+            deliveries.append((index, futures))
+
+        for index, futures in deliveries:
+            results = await asyncio.gather(*futures, return_exceptions=True)
+            errors = [result for result in results if isinstance(result, Exception)]
+            if errors:
+                reasons[index] = classify_failure(errors[0])
+                logger.warning(f"Broadcast {job['id']} to recipient {rows[index]['recipient_id']} failed: {errors[0]}")
+        return reasons
+
+    def stats(self):
+        """Get broadcast counters of this process
+
+        Returns:
+            dict: Jobs, batches, sent and failed recipients, failures per
+                  reason, throughput and the job being sent
+        """
+        active = self._stats["active_seconds"]
+        return dict(
+            self._stats,
+            failures=dict(self._stats["failures"]),
+            active_seconds=round(active, 3),
+            messages_per_second=round(self._stats["sent"] / active, 2) if active else 0.0,
+            current_job=self._current,
+            owner=self.owner,
+        )
+
+
+broadcasts = BroadcastRunner()
@@ -4,6 +4,7 @@ Configuration settings for the Artisan Booking Bot.
 """
 
 import os
+import socket
 from dotenv import load_dotenv
 
 # .env faylını yüklə
@@ -21,6 +22,16 @@ DB_CONFIG = {
     "port": int(os.getenv("DB_PORT"))
 }
 
+# Database Connection Pool Settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))  # Maximum number of open MySQL connections
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))  # seconds - How long to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 3600))  # seconds - Reopen connections older than this
+DB_POOL_HEALTH_CHECK_INTERVAL = int(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", 30))  # seconds - Ping idle connections before reuse
+
+# Async database access
+DB_ASYNC_MODE = os.getenv("DB_ASYNC_MODE", "executor")  # "executor" offloads queries to worker threads, "inline" runs them on the event loop
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", DB_POOL_SIZE))  # Worker threads for DB calls, keep <= DB_POOL_SIZE
+
 # Google Maps API for Reverse Geocoding (Optional)
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 
@@ -60,6 +71,70 @@ SUPPORT_PHONE = "+994516643082"  # Support contact phone
 # Location Settings
 DEFAULT_SEARCH_RADIUS = 10  # km - Default radius for searching nearby artisans
 MAX_SEARCH_RADIUS = 30  # km - Maximum allowed search radius
+NEARBY_ARTISANS_QUERY_LIMIT = int(os.getenv("NEARBY_ARTISANS_QUERY_LIMIT", 100))  # Maximum candidates returned by the nearby artisans query
+GEO_INDEX_ENABLED = os.getenv("GEO_INDEX_ENABLED", "true").lower() == "true"  # Serve nearby searches from the in-memory artisan index
+GEO_INDEX_CELL_SIZE = float(os.getenv("GEO_INDEX_CELL_SIZE", 0.1))  # degrees - Grid cell edge of the artisan index (~11 km)
+GEO_INDEX_RECONCILE_MINUTES = int(os.getenv("GEO_INDEX_RECONCILE_MINUTES", 10))  # Reload the artisan index from MySQL this often
+
+# Scheduler Settings
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"  # Lease owner name of this bot process
+TASK_LEASE_SECONDS = int(os.getenv("TASK_LEASE_SECONDS", 120))  # seconds - A claimed task is taken over by another worker after this long without a heartbeat
+TASK_SYNC_SECONDS = int(os.getenv("TASK_SYNC_SECONDS", 30))  # seconds - How often tasks created by other workers and expired leases are picked up
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", 3))  # Claims per task before it is marked failed (e.g. a task that keeps crashing its worker)
+
+# Outbound Telegram Settings
+TELEGRAM_SEND_CONCURRENCY = int(os.getenv("TELEGRAM_SEND_CONCURRENCY", 8))  # Parallel Bot API requests of the outbound dispatcher
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 25))  # messages/second across all chats (Telegram allows about 30)
+TELEGRAM_PER_CHAT_RATE = float(os.getenv("TELEGRAM_PER_CHAT_RATE", 1))  # messages/second to one chat
+TELEGRAM_PER_CHAT_BURST = int(os.getenv("TELEGRAM_PER_CHAT_BURST", 3))  # Messages one chat may receive back to back before the per-chat rate applies
+TELEGRAM_SEND_MAX_RETRIES = int(os.getenv("TELEGRAM_SEND_MAX_RETRIES", 5))  # Retries after flood control (429) or network errors
+NEW_ORDER_NOTIFY_CONCURRENCY = int(os.getenv("NEW_ORDER_NOTIFY_CONCURRENCY", 10))  # Artisans notified in parallel when a new order is placed
+
+# Notification Outbox Settings
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))  # Messages claimed per drain round
+OUTBOX_POLL_SECONDS = int(os.getenv("OUTBOX_POLL_SECONDS", 15))  # seconds - Drain interval for retries and messages queued by other workers
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", 120))  # seconds - A claimed batch is retaken by another worker after this long
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))  # Delivery attempts before a message becomes a dead letter
+OUTBOX_RETRY_BASE_SECONDS = int(os.getenv("OUTBOX_RETRY_BASE_SECONDS", 30))  # seconds - First retry delay, doubled after each failure
+OUTBOX_RETRY_MAX_SECONDS = int(os.getenv("OUTBOX_RETRY_MAX_SECONDS", 3600))  # seconds - Longest retry delay
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", 7))  # days - Delivered messages are kept this long
+
+# Broadcast Settings
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", 200))  # Recipients sent per batch; progress is checkpointed after each batch
+BROADCAST_LEASE_SECONDS = int(os.getenv("BROADCAST_LEASE_SECONDS", 300))  # seconds - A running job is resumed by another worker after this long without a checkpoint
+BROADCAST_POLL_SECONDS = int(os.getenv("BROADCAST_POLL_SECONDS", 30))  # seconds - How often workers look for jobs to start or resume
+BROADCAST_PROGRESS_SECONDS = int(os.getenv("BROADCAST_PROGRESS_SECONDS", 5))  # seconds - Minimum time between progress message updates
+
+# User Context Settings
+USER_CONTEXT_CACHE_SIZE = int(os.getenv("USER_CONTEXT_CACHE_SIZE", 10000))  # Most recently used user contexts kept in memory
+USER_CONTEXT_CACHE_SECONDS = int(os.getenv("USER_CONTEXT_CACHE_SECONDS", 5))  # seconds - Cached contexts are re-read from MySQL after this long; other bot processes may see a change this much later
+USER_CONTEXT_FLUSH_MS = int(os.getenv("USER_CONTEXT_FLUSH_MS", 200))  # milliseconds - Context writes within this window are saved in one batch; 0 saves every write immediately
+
+# FSM Storage Settings
+FSM_STORAGE = os.getenv("FSM_STORAGE", "mysql")  # "mysql" keeps conversation states in the fsm_states table, "memory" uses aiogram's MemoryStorage
+FSM_STATE_TTL_HOURS = int(os.getenv("FSM_STATE_TTL_HOURS", 48))  # hours - States untouched this long are treated as abandoned and purged
+FSM_CACHE_SECONDS = int(os.getenv("FSM_CACHE_SECONDS", 2))  # seconds - Reads are served from the local cache this long (enough for one update); other processes may see a state this much later. 0 reads through every time
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", 10000))  # Most recently used conversations kept in the local cache
+
+# Payment Notification Settings
+PAYMENT_RECONCILE_MINUTES = int(os.getenv("PAYMENT_RECONCILE_MINUTES", 15))  # minutes - Interval of the fallback sweep for missed payment notifications
+PAYMENT_RECONCILE_WINDOW_HOURS = int(os.getenv("PAYMENT_RECONCILE_WINDOW_HOURS", 24))  # hours - The sweep only checks payments updated this recently
+
+# Encryption Settings
+ENCRYPTION_OLD_KEYS = os.getenv("ENCRYPTION_OLD_KEYS", "")  # Comma-separated retired keys, newest first; still decrypt until key_rotation has re-encrypted everything
+REENCRYPT_ON_STARTUP = os.getenv("REENCRYPT_ON_STARTUP", "true").lower() == "true"  # Re-encrypt old values in the background when ENCRYPTION_OLD_KEYS is set
+REENCRYPT_BATCH_SIZE = int(os.getenv("REENCRYPT_BATCH_SIZE", 500))  # Rows re-encrypted per batch; progress is checkpointed after each batch
+REENCRYPT_PAUSE_MS = int(os.getenv("REENCRYPT_PAUSE_MS", 200))  # ms - Pause between batches to leave room for the bot's own queries
+REENCRYPT_LEASE_SECONDS = int(os.getenv("REENCRYPT_LEASE_SECONDS", 120))  # Only the lease holder re-encrypts; another process takes over when it expires
+DECRYPT_CACHE_SIZE = int(os.getenv("DECRYPT_CACHE_SIZE", 50000))  # Decrypted values kept in memory; 0 disables the cache
+DECRYPT_CACHE_MAX_MB = int(os.getenv("DECRYPT_CACHE_MAX_MB", 16))  # MB - Approximate memory cap of the decryption cache
+DECRYPT_POOL = os.getenv("DECRYPT_POOL", "process")  # "process", "thread" or "inline" - Where crypto_service.decrypt_many runs batches of DECRYPT_PARALLEL_THRESHOLD or more; smaller ones are always decrypted serially
+DECRYPT_WORKERS = int(os.getenv("DECRYPT_WORKERS", os.cpu_count() or 1))  # Workers of the bulk decryption pool
+DECRYPT_PARALLEL_THRESHOLD = int(os.getenv("DECRYPT_PARALLEL_THRESHOLD", 500))  # Batches with fewer uncached values are decrypted inline
+
+# Admin Search Settings
+ADMIN_SEARCH_LIMIT = int(os.getenv("ADMIN_SEARCH_LIMIT", 50))  # Maximum customers / artisans shown for one admin search
+ADMIN_STATS_FLUSH_SECONDS = int(os.getenv("ADMIN_STATS_FLUSH_SECONDS", 60))  # seconds - Admin stats buckets touched by writes are rebuilt this often, off the request path
 
 # Time Settings
 TIME_SLOTS_START_HOUR = 8  
@@ -2,12 +2,26 @@
 
 import os
 import base64
-from cryptography.fernet import Fernet
+import hashlib
+import hmac
+import atexit
+import multiprocessing
+import sys
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import unicodedata
+from collections import OrderedDict
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import logging
 from dotenv import load_dotenv
 import re
+from config import (
+    ENCRYPTION_OLD_KEYS, DECRYPT_CACHE_SIZE, DECRYPT_CACHE_MAX_MB, DECRYPT_POOL, DECRYPT_WORKERS,
+    DECRYPT_PARALLEL_THRESHOLD
+)
 
 # Load environment variables
 load_dotenv()
@@ -19,42 +33,77 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def _parse_key(key, name):
+    """Validate a Fernet key from the environment
+    
+    Raises:
+        RuntimeError: If the key is not a valid Fernet key
+    """
+    key = key.strip().encode() if isinstance(key, str) else key
+    try:
+        Fernet(key)
+    except Exception as e:
+        # A mistyped key must not be replaced: everything encrypted with the
+        # real one would become unreadable
+        raise RuntimeError(f"{name} is not a valid Fernet key: {e}")
+    return key
+
 # Get encryption key from environment variable or generate one
 def get_encryption_key():
-    """Get or generate an encryption key"""
+    """Get the primary encryption key, which encrypts every new value
+    
+    A missing key is only generated when there are no retired keys either,
+    i.e. on a fresh development setup. An invalid key is an error.
+    
+    Returns:
+        bytes: Fernet key
+    """
     key = os.getenv("ENCRYPTION_KEY")
     
     if not key:
+        if get_old_encryption_keys():
+            raise RuntimeError("ENCRYPTION_KEY is missing but ENCRYPTION_OLD_KEYS is set")
         # Generate a new key directly using Fernet.generate_key()
         key = Fernet.generate_key()
         logger.warning(f"ENCRYPTION_KEY not found in environment, generated a new one")
         logger.warning(f"Generated key: {key.decode()}. Add this to your .env file as ENCRYPTION_KEY")
         return key
     
-    try:
-        # If the key is a string, encode it
-        if isinstance(key, str):
-            key = key.encode()
-        
-        # Test if the key is valid
-        Fernet(key)
-        return key
-    except Exception as e:
-        logger.error(f"Invalid encryption key: {e}")
-        # Generate a new key if the provided one is invalid
-        new_key = Fernet.generate_key()
-        logger.warning(f"Generated new key: {new_key.decode()}. Add this to your .env file as ENCRYPTION_KEY")
-        return new_key
+    return _parse_key(key, "ENCRYPTION_KEY")
+
+def get_old_encryption_keys():
+    """Get the retired keys, newest first, that are still accepted for decryption
+    
+    Returns:
+        list: Fernet keys from ENCRYPTION_OLD_KEYS
+    """
+    return [
+        _parse_key(key, "ENCRYPTION_OLD_KEYS")
+        for key in ENCRYPTION_OLD_KEYS.split(",") if key.strip()
+    ]
 
-# Initialize Fernet cipher with our key
+def key_fingerprint(key):
+    """Short, non-secret name of a key for logs and re-encryption checkpoints"""
+    return hashlib.sha256(b"artisan-bot-key-id:" + key).hexdigest()[:16]
+
+# Key ring: new values are encrypted with the primary key, values written
+# under any retired key still decrypt. key_rotation re-encrypts the old ones.
 _key = get_encryption_key()
-try:
-    cipher = Fernet(_key)
-except Exception as e:
-    logger.error(f"Error initializing Fernet cipher: {e}")
-    # Generate a new key if there was an error
-    _key = Fernet.generate_key()
-    cipher = Fernet(_key)
+_old_keys = get_old_encryption_keys()
+_primary_cipher = Fernet(_key)
+cipher = MultiFernet([_primary_cipher] + [Fernet(key) for key in _old_keys])
+KEY_ID = key_fingerprint(_key)
+if _old_keys:
+    logger.info(f"Encryption key {KEY_ID} with {len(_old_keys)} retired keys")
+
+# Blind index key: a separate secret, so search tokens can not be used to
+# decrypt anything. Falls back to one derived from the encryption key, in
+# which case key_rotation rebuilds every user's tokens after a rotation.
+SEARCH_KEY_DERIVED = not os.getenv("SEARCH_INDEX_KEY")
+if not SEARCH_KEY_DERIVED:
+    _search_key = os.getenv("SEARCH_INDEX_KEY").encode()
+else:
+    _search_key = hmac.new(_key, b"artisan-bot-blind-index", hashlib.sha256).digest()
 
 # Encryption functions
 def encrypt_data(data):
@@ -83,6 +132,88 @@ def encrypt_data(data):
         # If encryption fails, return a special marker followed by original data
         return f"FAILED_ENC:{data}"
 
+class DecryptionCache:
+    """Bounded LRU of decrypted values, keyed by a digest of the ciphertext
+    
+    Fernet output is random, so a ciphertext maps to exactly one plaintext
+    for as long as the key stays the same; call purge() after a key change.
+    Bounded both by entry count and by the approximate memory of the cached
+    plaintexts. Thread-safe, as decrypts run on the DB worker threads.
+    """
+    
+    # Rough per-entry cost of the digest key, the tuple and the OrderedDict slot
+    ENTRY_OVERHEAD = 160
+    
+    def __init__(self, max_entries=DECRYPT_CACHE_SIZE, max_bytes=DECRYPT_CACHE_MAX_MB * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # digest -> (plaintext, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "purges": 0}
+    
+    @staticmethod
+    def _digest(ciphertext):
+        return hashlib.blake2b(ciphertext.encode('utf-8'), digest_size=16).digest()
+    
+    def get(self, ciphertext):
+        """Get the cached plaintext of a ciphertext, or None"""
+        key = self._digest(ciphertext)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+    
+    def put(self, ciphertext, plaintext):
+        if self.max_entries <= 0:
+            return
+        key = self._digest(ciphertext)
+        size = sys.getsizeof(plaintext) + self.ENTRY_OVERHEAD
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (plaintext, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["evictions"] += 1
+    
+    def purge(self):
+        """Forget every cached plaintext (key rotation, tests)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._stats["purges"] += 1
+    
+    def stats(self):
+        """Get hit rate and size counters
+        
+        Returns:
+            dict: Hits, misses, hit_rate, evictions, purges, entries and bytes
+        """
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries), bytes=self._bytes)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+_decryption_cache = DecryptionCache()
+
+def purge_decryption_cache():
+    """Drop all cached plaintexts; call after rotating or replacing the key"""
+    _decryption_cache.purge()
+
+def get_decryption_cache_stats():
+    """Get hit rate and size of the decryption cache"""
+    return _decryption_cache.stats()
+
 def decrypt_data(encrypted_data):
     if encrypted_data is None:
         return None
@@ -94,30 +225,34 @@ def decrypt_data(encrypted_data):
     # If data is not a string, return as is
     if not isinstance(encrypted_data, str):
         return encrypted_data
-        
+    
+    cached = _decryption_cache.get(encrypted_data)
+    if cached is not None:
+        return cached
+    
+    decrypted = _decrypt_uncached(encrypted_data)
+    # Failures return the input; only real plaintexts are cached
+    if decrypted is not encrypted_data:
+        _decryption_cache.put(encrypted_data, decrypted)
+    return decrypted
+
+def _decrypt_uncached(encrypted_data):
     try:
         # First, clean the string from any unsafe characters
         # Sometimes strings can have line breaks or whitespaces
         clean_data = encrypted_data.strip()
         
-        # Handle Base64 padding more robustly
-        # First try direct decode, then try with padding correction
+        # encrypt_data strips the padding; restore it up front instead of
+        # failing a first decode on almost every value
+        padding_needed = -len(clean_data) % 4
+        if padding_needed:
+            clean_data += '=' * padding_needed
+        
         try:
-            # Try direct decode first
             encrypted_bytes = base64.urlsafe_b64decode(clean_data.encode('utf-8'))
-        except Exception as direct_error:
-            logger.info(f"Direct base64 decode failed, trying with padding: {str(direct_error)}")
-            
-            # Calculate required padding
-            padding_needed = 4 - (len(clean_data) % 4) if len(clean_data) % 4 else 0
-            if padding_needed:
-                clean_data += '=' * padding_needed
-                
-            try:
-                encrypted_bytes = base64.urlsafe_b64decode(clean_data.encode('utf-8'))
-            except Exception as padding_error:
-                logger.error(f"Base64 decoding error even with padding: {str(padding_error)}")
-                return encrypted_data
+        except Exception as padding_error:
+            logger.error(f"Base64 decoding error even with padding: {str(padding_error)}")
+            return encrypted_data
         
         # Decrypt data
         try:
@@ -130,6 +265,119 @@ def decrypt_data(encrypted_data):
         logger.error(f"General decryption error: {str(e)}")
         return encrypted_data
 
+# Bulk decryption
+_decrypt_pool = None
+_decrypt_pool_lock = threading.Lock()
+_main_swap_lock = threading.Lock()
+
+class _DecryptWorkerProcess(multiprocessing.context.SpawnProcess):
+    """Spawned decryption worker that does not re-import the parent's main script
+
+    spawn makes every child import the parent's __main__ (as __mp_main__)
+    before it runs anything; under bot.py that is a second Bot, Dispatcher
+    and database pool per worker. The workers only need this module, so an
+    empty module without a file stands in for __main__ while one is started.
+    """
+
+    def start(self):
+        with _main_swap_lock:
+            main = sys.modules['__main__']
+            sys.modules['__main__'] = types.ModuleType('__mp_main__')
+            try:
+                super().start()
+            finally:
+                sys.modules['__main__'] = main
+
+class _DecryptWorkerContext(multiprocessing.context.SpawnContext):
+    Process = _DecryptWorkerProcess
+
+def _init_decrypt_worker(keys):
+    """Process pool initializer: use the parent's key ring even if its key was generated"""
+    global cipher
+    cipher = MultiFernet([Fernet(key) for key in keys])
+
+def _decrypt_chunk(values):
+    return [_decrypt_uncached(value) for value in values]
+
+def _get_decrypt_pool():
+    global _decrypt_pool
+    with _decrypt_pool_lock:
+        if _decrypt_pool is None:
+            if DECRYPT_POOL == "thread":
+                _decrypt_pool = ThreadPoolExecutor(DECRYPT_WORKERS, thread_name_prefix="decrypt")
+            else:
+                # spawn, not fork: the bot forks from a process full of threads
+                _decrypt_pool = ProcessPoolExecutor(
+                    DECRYPT_WORKERS,
+                    mp_context=_DecryptWorkerContext(),
+                    initializer=_init_decrypt_worker,
+                    initargs=([_key] + _old_keys,)
+                )
+            logger.info(f"Started {DECRYPT_POOL} decryption pool with {DECRYPT_WORKERS} workers")
+        return _decrypt_pool
+
+def shutdown_decrypt_pool():
+    """Stop the bulk decryption workers (they are restarted on demand)"""
+    global _decrypt_pool
+    with _decrypt_pool_lock:
+        pool, _decrypt_pool = _decrypt_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+atexit.register(shutdown_decrypt_pool)
+
+def decrypt_many(values, threshold=DECRYPT_PARALLEL_THRESHOLD):
+    """Decrypt a batch of values, returning the results in the same order
+    
+    Values found in the decryption cache are answered from it. When at
+    least `threshold` remain they are split into one chunk per worker and
+    decrypted on the DECRYPT_POOL pool; smaller batches are decrypted
+    inline. Like decrypt_data, a value that can not be decrypted is
+    returned unchanged. This blocks, so call it through run_db from
+    handlers.
+    
+    Args:
+        values (list): Values as stored (None and non-strings pass through)
+        threshold (int): Minimum number of cache misses worth the pool
+        
+    Returns:
+        list: Decrypted values
+    """
+    results = list(values)
+    missing = []   # (index, ciphertext)
+    for index, value in enumerate(results):
+        if not isinstance(value, str) or value.startswith("FAILED_ENC:"):
+            results[index] = decrypt_data(value)
+            continue
+        cached = _decryption_cache.get(value)
+        if cached is not None:
+            results[index] = cached
+        else:
+            missing.append((index, value))
+    
+    if not missing:
+        return results
+    
+    ciphertexts = [value for _, value in missing]
+    if DECRYPT_POOL == "inline" or DECRYPT_WORKERS <= 1 or len(ciphertexts) < threshold:
+        decrypted = _decrypt_chunk(ciphertexts)
+    else:
+        size = -(-len(ciphertexts) // DECRYPT_WORKERS)
+        chunks = [ciphertexts[i:i + size] for i in range(0, len(ciphertexts), size)]
+        try:
+            decrypted = [value for chunk in _get_decrypt_pool().map(_decrypt_chunk, chunks) for value in chunk]
+        except Exception as e:
+            logger.error(f"Bulk decryption pool failed, decrypting inline: {e}")
+            shutdown_decrypt_pool()
+            decrypted = _decrypt_chunk(ciphertexts)
+    
+    for (index, ciphertext), plaintext in zip(missing, decrypted):
+        results[index] = plaintext
+        # Failures come back unchanged and are not cached
+        if plaintext != ciphertext:
+            _decryption_cache.put(ciphertext, plaintext)
+    return results
+
 # Masking functions
 def mask_name(name):
     """Mask a name, showing only first letters
@@ -250,33 +498,165 @@ def should_encrypt_field(field_name):
     
     return field_name in sensitive_fields
 
+def _token_bytes(encrypted_data):
+    """Fernet token of an encrypt_data value (padding restored)"""
+    clean_data = encrypted_data.strip()
+    return base64.urlsafe_b64decode((clean_data + '=' * (-len(clean_data) % 4)).encode('utf-8'))
+
+def reencrypt_data(encrypted_data):
+    """Re-encrypt a stored value with the primary key if it needs it
+    
+    Values written under a retired key are re-encrypted, as are values
+    that were encrypted twice (artisans registered before the create
+    wrapper fix) and FAILED_ENC plaintexts. Values already under the
+    primary key, plaintext and None are left alone.
+    
+    Args:
+        encrypted_data (str): Value as stored
+        
+    Returns:
+        tuple: (value to store, status) where status is 'rotated',
+               'current', 'skipped' (nothing to encrypt) or 'failed'
+               (no key of the ring decrypts it)
+    """
+    if not isinstance(encrypted_data, str):
+        return encrypted_data, "skipped"
+    if encrypted_data.startswith("FAILED_ENC:"):
+        reencrypted = encrypt_data(encrypted_data[11:])
+        return reencrypted, "failed" if reencrypted.startswith("FAILED_ENC:") else "rotated"
+    if not is_encrypted(encrypted_data):
+        return encrypted_data, "skipped"
+    
+    try:
+        token = _token_bytes(encrypted_data)
+        try:
+            plaintext = _primary_cipher.decrypt(token).decode('utf-8')
+            current = True
+        except InvalidToken:
+            plaintext = cipher.decrypt(token).decode('utf-8')
+            current = False
+    except (InvalidToken, ValueError) as e:
+        logger.error(f"Cannot re-encrypt value, no key of the ring decrypts it: {e!r}")
+        return encrypted_data, "failed"
+    
+    nested = False
+    while is_encrypted(plaintext):
+        try:
+            plaintext = cipher.decrypt(_token_bytes(plaintext)).decode('utf-8')
+            nested = True
+        except (InvalidToken, ValueError):
+            break
+    
+    if current and not nested:
+        return encrypted_data, "current"
+    return encrypt_data(plaintext), "rotated"
+
 def normalize_encrypted_data(encrypted_data):
-    """Normalize encrypted data by decrypting and re-encrypting it
+    """Normalize encrypted data to a single encryption under the primary key
     
     Args:
         encrypted_data (str): Encrypted data to normalize
         
     Returns:
-        str: Re-encrypted data with consistent formatting
+        str: The value re-encrypted if it was under a retired key or encrypted
+             twice, otherwise unchanged
     """
     if encrypted_data is None:
         return None
-        
+    
     # Skip already failed data
     if isinstance(encrypted_data, str) and encrypted_data.startswith("FAILED_ENC:"):
         return encrypted_data
     
-    try:
-        # Try to decrypt the data
-        decrypted = decrypt_data(encrypted_data)
+    value, status = reencrypt_data(encrypted_data)
+    return value if status == "rotated" else encrypted_data
+
+# Every encrypt_data value starts with this (base64 of a Fernet token's version byte)
+ENCRYPTED_PREFIX = "Z0FBQUFB"
+
+def is_encrypted(value):
+    """Check whether a value looks like encrypt_data output"""
+    return isinstance(value, str) and value.startswith(ENCRYPTED_PREFIX)
+
+# Blind index functions
+def normalize_search_text(text):
+    """Fold a name for searching: lower case, no diacritics, ə -> e, ı -> i
+    
+    Args:
+        text (str): Name or search query
         
-        # Re-encrypt the data for consistency
-        if decrypted == encrypted_data:
-            # If decryption didn't actually work, return original
-            return encrypted_data
+    Returns:
+        list: Words of the folded text
+    """
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.replace('ə', 'e').replace('ı', 'i')
+    return re.findall(r'\w+', text)
+
+def normalize_phone(phone):
+    """Reduce a phone number to its 9 national digits when it is Azerbaijani
+    
+    Args:
+        phone (str): Phone number in any format (+994 50 123 45 67, 0501234567, ...)
+        
+    Returns:
+        str: Digits of the number, or "" if there are none
+    """
+    digits = re.sub(r'\D', '', str(phone))
+    if len(digits) == 12 and digits.startswith('994'):
+        return digits[3:]
+    if len(digits) == 10 and digits.startswith('0'):
+        return digits[1:]
+    return digits
+
+def _search_token(field, term):
+    message = f"{field}:{term}".encode('utf-8')
+    return hmac.new(_search_key, message, hashlib.sha256).hexdigest()[:32]
+
+def name_search_terms(name):
+    """Trigrams of every word of a name; words shorter than 3 letters are kept whole"""
+    terms = set()
+    for word in normalize_search_text(name):
+        if len(word) < 3:
+            terms.add(word)
         else:
-            # Otherwise, re-encrypt with consistent format
-            return encrypt_data(decrypted)
-    except Exception as e:
-        logger.error(f"Error normalizing encrypted data: {e}")
-        return encrypted_data
\ No newline at end of file
+            terms.update(word[i:i + 3] for i in range(len(word) - 2))
+    return terms
+
+def blind_index_tokens(field, value):
+    """Keyed tokens to store in a search side table for a sensitive value
+    
+    Names are indexed by trigrams, so any 3+ letter part of a word can be
+    found; phone numbers only as the whole normalized number. The tokens
+    are HMACs, so the table reveals neither the values nor the key.
+    
+    Args:
+        field (str): 'name' or 'phone'
+        value (str): Plaintext value
+        
+    Returns:
+        set: Hex tokens (empty for None or an empty value)
+    """
+    if value is None:
+        return set()
+    if field == 'phone':
+        digits = normalize_phone(value)
+        return {_search_token(field, digits)} if digits else set()
+    return {_search_token(field, term) for term in name_search_terms(value)}
+
+def fsm_state_key(chat_id, user_id):
+    """Keyed hash that a conversation state is stored under instead of the Telegram IDs
+    
+    An HMAC with the blind index key, so the IDs can not be recovered by
+    hashing every possible one. With a derived search key the hashes change
+    on key rotation and open conversations are lost, like after their TTL.
+    
+    Args:
+        chat_id (int): Telegram chat ID
+        user_id (int): Telegram user ID
+        
+    Returns:
+        str: 64 hex characters
+    """
+    message = f"fsm:{int(chat_id)}:{int(user_id)}".encode('utf-8')
+    return hmac.new(_search_key, message, hashlib.sha256).hexdigest()
@@ -1,16 +1,26 @@
 # db.py
 
-import mysql.connector
 from mysql.connector import Error
 from mysql.connector.cursor import MySQLCursorDict
 import math
 from datetime import datetime, timedelta
 from decimal import Decimal
 import json
+import functools
 import logging
-from config import DB_CONFIG, COMMISSION_RATES
-from crypto_service import encrypt_data
+import threading
+from config import (
+    DB_CONFIG, COMMISSION_RATES, DB_POOL_SIZE, DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE, DB_POOL_HEALTH_CHECK_INTERVAL, NEARBY_ARTISANS_QUERY_LIMIT,
+    GEO_INDEX_ENABLED, GEO_INDEX_CELL_SIZE, USER_CONTEXT_CACHE_SIZE, USER_CONTEXT_CACHE_SECONDS,
+    USER_CONTEXT_FLUSH_MS, ADMIN_SEARCH_LIMIT
+)
+from db_pool import ConnectionPool
+from geo_index import ArtisanGeoIndex, EARTH_RADIUS_KM, get_bounding_box, haversine_km
+from user_context_store import UserContextStore
+from crypto_service import encrypt_data, decrypt_data, is_encrypted, blind_index_tokens, normalize_phone, fsm_state_key
 import hashlib
+import re
 
 # Set up logging
 logging.basicConfig(
@@ -20,24 +30,62 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Get the shared MySQL connection pool, creating it on first use
+    
+    Returns:
+        ConnectionPool: Process-wide connection pool
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    {
+                        "host": DB_CONFIG["host"],
+                        "database": DB_CONFIG["database"],
+                        "user": DB_CONFIG["user"],
+                        "password": DB_CONFIG["password"],
+                        "port": DB_CONFIG.get("port", 3306),
+                        "auth_plugin": 'mysql_native_password',
+                        "use_pure": True,
+                        # Pooled connections are reused, so leftover rows must not poison the next borrower
+                        "consume_results": True
+                    },
+                    size=DB_POOL_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    recycle=DB_POOL_RECYCLE,
+                    health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL
+                )
+    return _pool
+
+
 def get_connection():
-    """Establish and return a connection to the MySQL database"""
-    try:
-        conn = mysql.connector.connect(
-            host=DB_CONFIG["host"],
-            database=DB_CONFIG["database"],
-            user=DB_CONFIG["user"],
-            password=DB_CONFIG["password"],
-            port=DB_CONFIG.get("port", 3306),
-            auth_plugin='mysql_native_password',  # Bu satırı ekleyin
-            use_pure=True  # Bu satırı ekleyin
-        )
-        return conn
+    """Borrow a connection to the MySQL database from the shared pool
+    
+    The returned connection is used exactly like a regular one; calling
+    close() hands it back to the pool instead of closing the socket.
+    """
+    try:
+        return get_pool().get_connection()
     except Error as e:
         logger.error(f"Error connecting to MySQL database: {e}")
         raise e
 
 
+def get_pool_stats():
+    """Get occupancy and wait metrics of the connection pool
+    
+    Returns:
+        dict: Pool metrics (in_use, idle, waits, timeouts, wait times, ...)
+    """
+    return get_pool().stats()
+
+
 def execute_query(query, params=None, fetchone=False, fetchall=False, commit=False, dict_cursor=False):
     """Execute a database query with error handling and connection management
     
@@ -164,7 +212,7 @@ def create_customer(telegram_id, name, phone=None, city=None):
         cursor = conn.cursor()
         cursor.execute(query, (encrypted_telegram_id, telegram_id_hash, name, phone, city))
         conn.commit()
-        return cursor.lastrowid
+        customer_id = cursor.lastrowid
     except Error as e:
         logger.error(f"Error creating customer: {e}")
         if conn:
@@ -175,6 +223,9 @@ def create_customer(telegram_id, name, phone=None, city=None):
             cursor.close()
         if conn and conn.is_connected():
             conn.close()
+    
+    refresh_admin_stats_for('customers', customer_id)
+    return customer_id
 
 
 def get_or_create_customer(telegram_id, name, phone=None, city=None):
@@ -303,6 +354,29 @@ def get_artisan_by_id(artisan_id):
     return result
 
 
+def get_artisans_by_ids(artisan_ids):
+    """Get several artisans in one query
+    
+    Args:
+        artisan_ids (list): IDs of the artisans
+        
+    Returns:
+        list: Artisan rows (id, name, service, telegram_id, active); unknown IDs are skipped
+    """
+    artisan_ids = [artisan_id for artisan_id in dict.fromkeys(artisan_ids) if artisan_id is not None]
+    if not artisan_ids:
+        return []
+    
+    placeholders = ", ".join(["%s"] * len(artisan_ids))
+    query = f"""
+        SELECT id, name, service, telegram_id, active
+        FROM artisans
+        WHERE id IN ({placeholders})
+    """
+    
+    return execute_query(query, tuple(artisan_ids), fetchall=True, dict_cursor=True) or []
+
+
 def check_artisan_exists(telegram_id=None, phone=None, exclude_id=None):
     """Check if an artisan with the given parameters exists
     
@@ -320,13 +394,20 @@ def check_artisan_exists(telegram_id=None, phone=None, exclude_id=None):
     query_parts = []
     params = []
     
+    # Both columns are encrypted, so match the telegram_id hash and the phone blind index
     if telegram_id is not None:
-        query_parts.append("telegram_id = %s")
-        params.append(telegram_id)
+        query_parts.append("telegram_id_hash = %s")
+        params.append(hash_telegram_id(telegram_id))
         
-    if phone is not None:
-        query_parts.append("phone = %s")
-        params.append(phone)
+    phone_tokens = blind_index_tokens('phone', phone)
+    if phone_tokens:
+        query_parts.append(
+            "id IN (SELECT artisan_id FROM artisan_search_tokens WHERE field = 'phone' AND token = %s)"
+        )
+        params.extend(phone_tokens)
+    
+    if not query_parts:
+        return False
         
     query = f"""
         SELECT id FROM artisans 
@@ -387,7 +468,7 @@ def create_artisan(telegram_id, name, phone, service, location=None, city=None,
         cursor = conn.cursor()
         cursor.execute(query, (encrypted_telegram_id, telegram_id_hash, name, phone, service, location, city, latitude, longitude))
         conn.commit()
-        return cursor.lastrowid
+        artisan_id = cursor.lastrowid
     except Error as e:
         logger.error(f"Error creating artisan: {e}")
         if conn:
@@ -398,6 +479,10 @@ def create_artisan(telegram_id, name, phone, service, location=None, city=None,
             cursor.close()
         if conn and conn.is_connected():
             conn.close()
+    
+    refresh_artisan_geo_index(artisan_id)
+    refresh_admin_stats_for('artisans', artisan_id)
+    return artisan_id
 
 
 def get_or_create_artisan(telegram_id, name, phone, service, location=None, city=None, latitude=None, longitude=None):
@@ -436,6 +521,7 @@ def get_or_create_artisan(telegram_id, name, phone, service, location=None, city
             (name, phone, service, location, city, latitude, longitude, artisan_id),
             commit=True
         )
+        refresh_artisan_geo_index(artisan_id)
         
     return artisan_id
 
@@ -508,6 +594,7 @@ def update_artisan_profile(artisan_id, data):
     
     try:
         execute_query(query, params, commit=True)
+        refresh_artisan_geo_index(artisan_id)
         return True
     except Exception as e:
         logger.error(f"Error updating artisan profile: {e}")
@@ -522,31 +609,11 @@ def skip_artisan_for_next_order(artisan_id):
     Returns:
         bool: True əgər əməliyyat uğurludursa, əks halda False
     """
+    conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
         
-        # Cədvəlin mövcud olub-olmadığını yoxla
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM information_schema.tables 
-            WHERE table_schema = %s AND table_name = 'artisan_skip_next_order'
-        """, (DB_CONFIG['database'],))
-        
-        table_exists = cursor.fetchone()[0] > 0
-        
-        # Cədvəl yoxdursa yarat
-        if not table_exists:
-            cursor.execute("""
-                CREATE TABLE artisan_skip_next_order (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    artisan_id INT NOT NULL,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    skipped BOOLEAN DEFAULT FALSE,
-                    FOREIGN KEY (artisan_id) REFERENCES artisans(id) ON DELETE CASCADE
-                )
-            """)
-        
         # Mövcud qeydləri yoxla
         cursor.execute(
             "SELECT id FROM artisan_skip_next_order WHERE artisan_id = %s AND skipped = FALSE",
@@ -587,22 +654,11 @@ def should_skip_artisan_for_order(artisan_id):
     Returns:
         bool: True əgər kənarlaşdırılmalıdırsa, əks halda False
     """
+    conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
         
-        # Əvvəlcə cədvəli yoxla
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM information_schema.tables 
-            WHERE table_schema = %s AND table_name = 'artisan_skip_next_order'
-        """, (DB_CONFIG['database'],))
-        
-        table_exists = cursor.fetchone()[0] > 0
-        
-        if not table_exists:
-            return False
-        
         # Kənarlaşdırılmalı olan bir sifariş varmı?
         cursor.execute(
             "SELECT id FROM artisan_skip_next_order WHERE artisan_id = %s AND skipped = FALSE",
@@ -662,6 +718,7 @@ def update_artisan_location(artisan_id, latitude, longitude, location_name=None,
     
     try:
         execute_query(query, params, commit=True)
+        refresh_artisan_geo_index(artisan_id)
         return True
     except Exception as e:
         logger.error(f"Error updating artisan location: {e}")
@@ -692,6 +749,10 @@ def toggle_artisan_active_status(artisan_id):
     
     try:
         execute_query(update_query, (new_status, artisan_id), commit=True)
+        if new_status:
+            refresh_artisan_geo_index(artisan_id)
+        else:
+            remove_from_artisan_geo_index(artisan_id)
         return True, new_status
     except Exception as e:
         logger.error(f"Error toggling artisan status: {e}")
@@ -727,7 +788,6 @@ def update_artisan_service_and_reset_prices(artisan_id, service):
         )
         
         conn.commit()
-        return True
     except Exception as e:
         if conn:
             conn.rollback()
@@ -736,6 +796,9 @@ def update_artisan_service_and_reset_prices(artisan_id, service):
     finally:
         if conn and conn.is_connected():
             conn.close()
+    
+    refresh_artisan_geo_index(artisan_id)
+    return True
 
 
 def get_artisan_blocked_status(artisan_id):
@@ -763,13 +826,14 @@ def get_artisan_blocked_status(artisan_id):
         return False, None, 0
 
 
-def block_artisan(artisan_id, reason, required_payment):
+def block_artisan(artisan_id, reason, required_payment, outbox=None):
     """Block an artisan
     
     Args:
         artisan_id (int): ID of the artisan
         reason (str): Reason for blocking
         required_payment (float): Amount needed to unblock
+        outbox (list, optional): Notification outbox messages committed together with the block
         
     Returns:
         bool: True if successful, False otherwise
@@ -791,8 +855,12 @@ def block_artisan(artisan_id, reason, required_payment):
         
         cursor.execute(update_query, (artisan_id,))
         cursor.execute(block_query, (artisan_id, reason, required_payment))
+        add_outbox_messages(cursor, outbox)
         
         conn.commit()
+        remove_from_artisan_geo_index(artisan_id)
+        if outbox:
+            _notify_outbox_enqueued()
         return True
     except Exception as e:
         if conn:
@@ -832,7 +900,6 @@ def unblock_artisan(artisan_id):
         cursor.execute(block_query, (artisan_id,))
         
         conn.commit()
-        return True
     except Exception as e:
         if conn:
             conn.rollback()
@@ -841,6 +908,9 @@ def unblock_artisan(artisan_id):
     finally:
         if conn and conn.is_connected():
             conn.close()
+    
+    refresh_artisan_geo_index(artisan_id)
+    return True
 
 
 def save_fine_receipt(artisan_id, file_id):
@@ -1021,28 +1091,216 @@ def get_artisan_by_service(service):
     return execute_query(query, (service,), fetchall=True)
 
 
-def get_nearby_artisans(latitude, longitude, radius=10, service=None, subservice=None):
+# -------------------------
+# ARTISAN GEO INDEX
+# -------------------------
+
+artisan_geo_index = ArtisanGeoIndex(cell_size=GEO_INDEX_CELL_SIZE)
+
+GEO_INDEX_COLUMNS = "id, name, phone, service, location, latitude, longitude, rating"
+
+
+def refresh_artisan_geo_index(artisan_id):
+    """Reload a single artisan into the geo index after a write
+
+    Args:
+        artisan_id (int): ID of the artisan
+    """
+    if not GEO_INDEX_ENABLED or not artisan_id:
+        return
+    try:
+        row = execute_query(
+            f"""
+            SELECT {GEO_INDEX_COLUMNS}
+            FROM artisans
+            WHERE id = %s AND active = TRUE
+            AND latitude IS NOT NULL AND longitude IS NOT NULL
+            """,
+            (artisan_id,), fetchone=True, dict_cursor=True
+        )
+        if row:
+            artisan_geo_index.upsert(row)
+        else:
+            artisan_geo_index.remove(artisan_id)
+    except Exception as e:
+        # The periodic reconcile repairs the entry
+        logger.error(f"Error refreshing geo index for artisan {artisan_id}: {e}")
+
+
+def remove_from_artisan_geo_index(artisan_id):
+    """Drop an artisan from the geo index (deactivated, blocked or deleted)"""
+    if GEO_INDEX_ENABLED and artisan_id:
+        artisan_geo_index.remove(artisan_id)
+
+
+def reconcile_artisan_geo_index():
+    """Rebuild the geo index from MySQL
+
+    Picks up writes made outside the db.py write functions (manual SQL,
+    other processes). Writes that happen while the snapshot is read are
+    replayed on top of it.
+
+    Returns:
+        dict: Added/removed/moved counts, or None if disabled or failed
+    """
+    if not GEO_INDEX_ENABLED:
+        return None
+    artisan_geo_index.begin_reconcile()
+    try:
+        rows = execute_query(
+            f"""
+            SELECT {GEO_INDEX_COLUMNS}
+            FROM artisans
+            WHERE active = TRUE AND latitude IS NOT NULL AND longitude IS NOT NULL
+            """,
+            fetchall=True, dict_cursor=True
+        ) or []
+    except Exception as e:
+        artisan_geo_index.abort_reconcile()
+        logger.error(f"Error reconciling artisan geo index: {e}")
+        return None
+
+    diff = artisan_geo_index.finish_reconcile(rows)
+    if any(diff.values()):
+        logger.info(f"Artisan geo index reconciled: {diff}")
+    return diff
+
+
+def get_artisan_geo_index_stats():
+    """Get artisan geo index size information"""
+    return artisan_geo_index.stats()
+
+
+def _recheck_geo_candidates(artisans, latitude, longitude, radius, service=None):
+    """Check the artisans found in the geo index against MySQL
+    
+    Another process may have deactivated, blocked or moved an artisan since
+    this process last reconciled. One primary key lookup of the candidates
+    drops the ones no longer available, updates moved ones and fixes the
+    local index for both.
+    
+    Args:
+        artisans (list): Rows from the geo index, closest first
+        latitude (float): Search latitude
+        longitude (float): Search longitude
+        radius (float): Search radius in kilometers
+        service (str, optional): Service filter of the search
+        
+    Returns:
+        list: The candidates that are still available, closest first
+    """
+    if not artisans:
+        return []
+    ids = [artisan['id'] for artisan in artisans]
+    placeholders = ", ".join(["%s"] * len(ids))
+    rows = execute_query(
+        f"""
+        SELECT {GEO_INDEX_COLUMNS}, active, blocked
+        FROM artisans
+        WHERE id IN ({placeholders})
+        """,
+        ids, fetchall=True, dict_cursor=True
+    ) or []
+    current = {row['id']: row for row in rows}
+    
+    checked = []
+    for artisan in artisans:
+        row = current.get(artisan['id'])
+        if not row or not row['active'] or row['blocked'] or row['latitude'] is None or row['longitude'] is None:
+            artisan_geo_index.remove(artisan['id'])
+            continue
+        row = {column: value for column, value in row.items() if column not in ('active', 'blocked')}
+        moved = (
+            float(row['latitude']) != artisan['latitude'] or float(row['longitude']) != artisan['longitude']
+            or row['service'] != artisan.get('service')
+        )
+        if not moved:
+            checked.append(artisan)
+            continue
+        artisan_geo_index.upsert(row)
+        distance = haversine_km(latitude, longitude, float(row['latitude']), float(row['longitude']))
+        if distance <= radius and (not service or row['service'] == service):
+            checked.append(dict(row, latitude=float(row['latitude']), longitude=float(row['longitude']),
+                                distance=distance))
+    checked.sort(key=lambda artisan: artisan['distance'])
+    return checked
+
+
+def _filter_artisans_by_subservice(artisans, subservice):
+    """Keep only artisans with an active price range for the subservice"""
+    if not artisans:
+        return []
+    ids = [artisan['id'] for artisan in artisans]
+    placeholders = ", ".join(["%s"] * len(ids))
+    rows = execute_query(
+        f"""
+        SELECT DISTINCT apr.artisan_id
+        FROM artisan_price_ranges apr
+        JOIN subservices s ON apr.subservice_id = s.id
+        WHERE s.name = %s AND apr.is_active = TRUE
+        AND apr.artisan_id IN ({placeholders})
+        """,
+        [subservice] + ids, fetchall=True
+    ) or []
+    allowed = {row[0] for row in rows}
+    return [artisan for artisan in artisans if artisan['id'] in allowed]
+
+
+def get_nearby_artisans(latitude, longitude, radius=10, service=None, subservice=None, limit=NEARBY_ARTISANS_QUERY_LIMIT):
     """Get artisans near the specified location within radius km
     
+    Served from the in-memory artisan geo index once it is loaded. Otherwise a
+    bounding box around the point is applied in SQL so that MySQL can range-scan
+    idx_artisans_location; exact haversine distances are computed only for the rows
+    inside the box.
+    
     Args:
         latitude (float): Customer's latitude
         longitude (float): Customer's longitude
         radius (float, optional): Search radius in kilometers (default: 10)
         service (str, optional): Filter by service type
         subservice (str, optional): Filter by subservice type
+        limit (int, optional): Maximum number of artisans to return
         
     Returns:
-        list: List of nearby artisans with distance
+        list: List of nearby artisans with distance, closest first
     """
-    # Base query to get active artisans with location info
+    if latitude is None or longitude is None:
+        return []
+
+    if GEO_INDEX_ENABLED and artisan_geo_index.is_ready():
+        artisans = artisan_geo_index.query_radius(
+            latitude, longitude, radius, service,
+            limit=None if subservice else limit
+        )
+        artisans = _recheck_geo_candidates(artisans, latitude, longitude, radius, service)
+        if subservice:
+            artisans = _filter_artisans_by_subservice(artisans, subservice)[:limit]
+        return artisans
+
+    min_lat, max_lat, min_lon, max_lon = get_bounding_box(latitude, longitude, radius)
+
+    # Same haversine formula as calculate_distance; LEAST guards ASIN against rounding above 1
     query = """
         SELECT a.id, a.name, a.phone, a.service, a.location, 
-               a.latitude, a.longitude, a.rating
+               a.latitude, a.longitude, a.rating,
+               2 * %s * ASIN(LEAST(1, SQRT(
+                   POWER(SIN(RADIANS(a.latitude - %s) / 2), 2) +
+                   COS(RADIANS(%s)) * COS(RADIANS(a.latitude)) *
+                   POWER(SIN(RADIANS(a.longitude - %s) / 2), 2)
+               ))) AS distance
         FROM artisans a
-        WHERE a.active = TRUE AND a.latitude IS NOT NULL AND a.longitude IS NOT NULL
+        WHERE a.active = TRUE
+          AND a.latitude BETWEEN %s AND %s
     """
     
-    params = []
+    params = [EARTH_RADIUS_KM, latitude, latitude, longitude, min_lat, max_lat]
+
+    if min_lon is not None:
+        query += " AND a.longitude BETWEEN %s AND %s"
+        params.extend([min_lon, max_lon])
+    else:
+        query += " AND a.longitude IS NOT NULL"
     
     # Add service filter if provided
     if service:
@@ -1059,31 +1317,175 @@ def get_nearby_artisans(latitude, longitude, radius=10, service=None, subservice
             )
         """
         params.append(subservice)
+
+    # Corners of the box are outside the circle, so filter on the exact distance
+    query += " HAVING distance <= %s ORDER BY distance LIMIT %s"
+    params.extend([radius, int(limit)])
     
     result = execute_query(query, params, fetchall=True, dict_cursor=True)
     
     if not result:
         return []
-    
-    # Filter artisans by distance and add distance information
+
     nearby_artisans = []
     for artisan in result:
-        artisan_lat = artisan['latitude']  # latitude index
-        artisan_lon = artisan['longitude']  # longitude index
+        artisan_with_distance = dict(artisan)
+        artisan_with_distance['distance'] = float(artisan['distance'])
+        nearby_artisans.append(artisan_with_distance)
+    
+    return nearby_artisans
+
+
+# -------------------------
+# ADMIN SEARCH INDEX
+# -------------------------
+
+# Side table and id column of each searchable entity
+SEARCH_TOKEN_TABLES = {
+    'customer': ('customer_search_tokens', 'customer_id'),
+    'artisan': ('artisan_search_tokens', 'artisan_id'),
+}
+
+
+def save_search_tokens(entity, entity_id, values):
+    """Replace the blind index tokens of some fields of a customer or artisan
+    
+    Args:
+        entity (str): 'customer' or 'artisan'
+        entity_id (int): ID of the customer / artisan
+        values (dict): Plaintext values by field ('name', 'phone')
         
-        if artisan_lat and artisan_lon:
-            distance = calculate_distance(latitude, longitude, artisan_lat, artisan_lon)
-            
-            if distance <= radius:
-                # Convert to list to add distance field
-                artisan_with_distance = dict(artisan)
-                artisan_with_distance['distance'] = distance
-                nearby_artisans.append(artisan_with_distance)
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    table, column = SEARCH_TOKEN_TABLES[entity]
+    fields = list(values)
+    rows = [
+        (entity_id, field, token)
+        for field, value in values.items()
+        for token in blind_index_tokens(field, value)
+    ]
+    
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        placeholders = ', '.join(['%s'] * len(fields))
+        cursor.execute(
+            f"DELETE FROM {table} WHERE {column} = %s AND field IN ({placeholders})",
+            [entity_id] + fields
+        )
+        if rows:
+            cursor.executemany(
+                f"INSERT IGNORE INTO {table} ({column}, field, token) VALUES (%s, %s, %s)",
+                rows
+            )
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Error saving search tokens of {entity} {entity_id}: {e}")
+        if conn:
+            conn.rollback()
+        return False
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def _search_conditions(entity, query):
+    """SQL conditions matching a free-text admin query against the blind index
     
-    # Sort by distance (ascending)
-    nearby_artisans.sort(key=lambda x: x['distance'])
+    A query of digits matches the ID; one that looks like a phone number
+    matches the phone token; every word of 3+ letters has to match the name
+    trigrams (shorter words must match a whole word).
     
-    return nearby_artisans
+    Returns:
+        tuple: (list of SQL conditions on the alias e, list of params)
+    """
+    table, column = SEARCH_TOKEN_TABLES[entity]
+    conditions, params = [], []
+    query = query.strip()
+    
+    if query.isdigit():
+        conditions.append("e.id = %s")
+        params.append(int(query))
+    
+    if re.fullmatch(r'[\d\s()+-]+', query) and len(normalize_phone(query)) >= 7:
+        conditions.append(
+            f"e.id IN (SELECT {column} FROM {table} WHERE field = 'phone' AND token = %s)"
+        )
+        params.extend(blind_index_tokens('phone', query))
+    
+    name_tokens = sorted(blind_index_tokens('name', query))
+    if name_tokens and re.search(r'[^\W\d_]', query):
+        placeholders = ', '.join(['%s'] * len(name_tokens))
+        conditions.append(f"""
+            e.id IN (
+                SELECT {column} FROM {table}
+                WHERE field = 'name' AND token IN ({placeholders})
+                GROUP BY {column}
+                HAVING COUNT(DISTINCT token) = %s
+            )
+        """)
+        params.extend(name_tokens)
+        params.append(len(name_tokens))
+    
+    return conditions, params
+
+
+def find_customers(query, limit=ADMIN_SEARCH_LIMIT):
+    """Search customers by ID, phone number or part of the name
+    
+    Uses the customer_search_tokens blind index, so nothing has to be
+    decrypted to find the matches.
+    
+    Args:
+        query (str): Admin search text
+        limit (int): Maximum number of customers returned
+        
+    Returns:
+        list: Matching customers, newest first
+    """
+    conditions, params = _search_conditions('customer', query)
+    if not conditions:
+        return []
+    
+    sql = f"""
+        SELECT e.id, e.name, e.phone, e.city, e.created_at, e.active
+        FROM customers e
+        WHERE {' OR '.join(conditions)}
+        ORDER BY e.id DESC
+        LIMIT %s
+    """
+    return execute_query(sql, params + [limit], fetchall=True, dict_cursor=True) or []
+
+
+def find_artisans(query, limit=ADMIN_SEARCH_LIMIT):
+    """Search artisans by ID, phone number, part of the name or service
+    
+    Args:
+        query (str): Admin search text
+        limit (int): Maximum number of artisans returned
+        
+    Returns:
+        list: Matching artisans, newest first
+    """
+    conditions, params = _search_conditions('artisan', query)
+    if query.strip():
+        # The service name is not encrypted
+        conditions.append("LOWER(e.service) LIKE LOWER(%s)")
+        params.append(f"%{query.strip()}%")
+    if not conditions:
+        return []
+    
+    sql = f"""
+        SELECT e.id, e.name, e.phone, e.city, e.service, e.rating, e.created_at, e.active
+        FROM artisans e
+        WHERE {' OR '.join(conditions)}
+        ORDER BY e.id DESC
+        LIMIT %s
+    """
+    return execute_query(sql, params + [limit], fetchall=True, dict_cursor=True) or []
 
 
 # -------------------------
@@ -1121,7 +1523,6 @@ def insert_order(customer_id, service, date_time, note, latitude, longitude, loc
         
         order_id = cursor.lastrowid
         conn.commit()
-        return order_id
         
     except Exception as e:
         logger.error(f"Error inserting order: {e}", exc_info=True)
@@ -1131,6 +1532,9 @@ def insert_order(customer_id, service, date_time, note, latitude, longitude, loc
     finally:
         if conn:
             conn.close()
+    
+    refresh_admin_stats_for('orders', order_id)
+    return order_id
 
 
 def get_order_details(order_id):
@@ -1165,12 +1569,13 @@ def get_order_details(order_id):
         return None
 
 
-def update_order_status(order_id, status):
+def update_order_status(order_id, status, outbox=None):
     """Update the status of an order
     
     Args:
         order_id (int): ID of the order
         status (str): New status ('pending', 'accepted', 'completed', 'cancelled')
+        outbox (list, optional): Notification outbox messages committed together with the status
         
     Returns:
         bool: True if successful, False otherwise
@@ -1180,25 +1585,42 @@ def update_order_status(order_id, status):
     
     query = "UPDATE orders SET status = %s WHERE id = %s"
     
+    conn = None
     try:
-        execute_query(query, (status, order_id), commit=True)
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(query, (status, order_id))
         
         # If status is 'completed', also update the completed_at timestamp
         if status == 'completed':
-            timestamp_query = "UPDATE orders SET completed_at = NOW() WHERE id = %s"
-            execute_query(timestamp_query, (order_id,), commit=True)
+            cursor.execute("UPDATE orders SET completed_at = NOW() WHERE id = %s", (order_id,))
         
         # Double check that the status was updated
-        check_query = "SELECT status FROM orders WHERE id = %s"
-        result = execute_query(check_query, (order_id,), fetchone=True)
+        cursor.execute("SELECT status FROM orders WHERE id = %s", (order_id,))
+        result = cursor.fetchone()
         if result and result[0] != status:
             logger.warning(f"Status update failed - DB returned {result[0]} instead of {status}")
+            conn.rollback()
             return False
+        
+        add_outbox_messages(cursor, outbox)
+        conn.commit()
+        if outbox:
+            _notify_outbox_enqueued()
+        
+        if status in ('completed', 'cancelled'):
+            refresh_admin_stats_for('orders', order_id)
             
         return True
     except Exception as e:
         logger.error(f"Error updating order status: {e}")
+        if conn:
+            conn.rollback()
         return False
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
 
 
 def get_artisan_active_orders(artisan_id):
@@ -1221,7 +1643,19 @@ def get_artisan_active_orders(artisan_id):
     return execute_query(query, (artisan_id,), fetchall=True, dict_cursor=True)
 
 
-def set_order_price(order_id, price, admin_fee=None, artisan_amount=None):
+def _refreshes_admin_stats(func):
+    """Mark the order's admin stats bucket for rebuilding after a successful payment write"""
+    @functools.wraps(func)
+    def wrapper(order_id, *args, **kwargs):
+        result = func(order_id, *args, **kwargs)
+        if result:
+            refresh_admin_stats_for('orders', order_id)
+        return result
+    return wrapper
+
+
+@_refreshes_admin_stats
+def set_order_price(order_id, price, admin_fee=None, artisan_amount=None, outbox=None):
     """Set the price for an order
     
     Args:
@@ -1229,6 +1663,7 @@ def set_order_price(order_id, price, admin_fee=None, artisan_amount=None):
         price (float): Total price
         admin_fee (float, optional): Admin fee portion
         artisan_amount (float, optional): Artisan portion
+        outbox (list, optional): Notification outbox messages committed together with the price
         
     Returns:
         bool: True if successful, False otherwise
@@ -1295,12 +1730,15 @@ def set_order_price(order_id, price, admin_fee=None, artisan_amount=None):
         cursor.execute("SELECT price FROM orders WHERE id = %s", (order_id,))
         verify_result = cursor.fetchone()
         
-        conn.commit()
-        
         if verify_result and verify_result[0] is not None:
+            add_outbox_messages(cursor, outbox)
+            conn.commit()
+            if outbox:
+                _notify_outbox_enqueued()
             logger.info(f"Price for order {order_id} set successfully to {price} AZN")
             return True
         else:
+            conn.commit()
             logger.error(f"Failed to verify price for order {order_id}")
             return False
             
@@ -1316,16 +1754,19 @@ def set_order_price(order_id, price, admin_fee=None, artisan_amount=None):
             conn.close()
 
 
-def update_payment_method(order_id, payment_method):
+@_refreshes_admin_stats
+def update_payment_method(order_id, payment_method, outbox=None):
     """Update payment method for an order
     
     Args:
         order_id (int): ID of the order
         payment_method (str): Payment method (card, cash, etc.)
+        outbox (list, optional): Notification outbox messages committed together with the payment method
         
     Returns:
         bool: True if successful, False otherwise
     """
+    conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
@@ -1387,7 +1828,10 @@ def update_payment_method(order_id, payment_method):
             (payment_method, order_id)
         )
         
+        add_outbox_messages(cursor, outbox)
         conn.commit()
+        if outbox:
+            _notify_outbox_enqueued()
         return True
         
     except Exception as e:
@@ -1400,6 +1844,7 @@ def update_payment_method(order_id, payment_method):
             conn.close()
 
 
+@_refreshes_admin_stats
 def save_payment_receipt(order_id, file_id):
     """Save payment receipt for an order"""
     try:
@@ -1541,11 +1986,104 @@ def confirm_payment(order_id, is_verified=True):
 # -------------------------
 # USER CONTEXT FUNCTIONS
 # -------------------------
-from crypto_service import encrypt_data, decrypt_data
+
+def _load_user_context(telegram_id_str):
+    """Read the stored context JSON of a user (UserContextStore loader)"""
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT context_data FROM user_context WHERE telegram_id = %s",
+            (telegram_id_str,)
+        )
+        row = cursor.fetchone()
+        if not row or row[0] is None:
+            return None
+        value = row[0]
+        if isinstance(value, (bytes, bytearray)):
+            value = value.decode('utf-8')
+        return value if isinstance(value, str) else json.dumps(value)
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def _save_user_contexts(upserts, deletes):
+    """Persist buffered context writes in one transaction (UserContextStore saver)
+    
+    Args:
+        upserts (dict): telegram_id string -> context JSON
+        deletes (list): telegram_id strings whose context is cleared
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        if upserts:
+            # telegram_id is UNIQUE, so one statement replaces the old DELETE + INSERT
+            cursor.executemany(
+                """
+                INSERT INTO user_context (telegram_id, context_data, created_at, updated_at)
+                VALUES (%s, %s, NOW(), NOW())
+                ON DUPLICATE KEY UPDATE context_data = VALUES(context_data), updated_at = NOW()
+                """,
+                list(upserts.items())
+            )
+        if deletes:
+            placeholders = ", ".join(["%s"] * len(deletes))
+            cursor.execute(f"DELETE FROM user_context WHERE telegram_id IN ({placeholders})", tuple(deletes))
+        conn.commit()
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+user_context_store = UserContextStore(
+    _load_user_context, _save_user_contexts,
+    max_entries=USER_CONTEXT_CACHE_SIZE,
+    ttl_seconds=USER_CONTEXT_CACHE_SECONDS,
+    flush_delay=USER_CONTEXT_FLUSH_MS / 1000
+)
+
+
+def _context_json(context_data):
+    """Serialize context data the way it is stored in user_context"""
+    if isinstance(context_data, dict):
+        # Convert datetime and decimal objects to strings
+        cleaned_data = {}
+        for key, value in context_data.items():
+            if isinstance(value, datetime):
+                cleaned_data[key] = value.strftime("%Y-%m-%d %H:%M:%S")
+            elif isinstance(value, Decimal):
+                # Convert Decimal to float for JSON serialization
+                cleaned_data[key] = float(value)
+            else:
+                cleaned_data[key] = value
+        return json.dumps(cleaned_data)
+    
+    if isinstance(context_data, str):
+        # If it's already a string, ensure it's valid JSON or wrap it
+        try:
+            json.loads(context_data)  # Test if it's valid JSON
+            return context_data
+        except json.JSONDecodeError:
+            return json.dumps({"value": context_data})
+    
+    # For any other type, convert to string then wrap in JSON
+    return json.dumps({"value": str(context_data)})
+
 
 def set_user_context(telegram_id, context_data):
     """Set context data for a user
     
+    The write goes to the in-process store and is persisted with the other
+    writes of the next USER_CONTEXT_FLUSH_MS window.
+    
     Args:
         telegram_id (int or str): Telegram user ID (can be encrypted)
         context_data (dict or str): Context data to store
@@ -1555,133 +2093,37 @@ def set_user_context(telegram_id, context_data):
     """
     try:
         # Always convert telegram_id to string to avoid database type issues
-        telegram_id_str = str(telegram_id)
-        
-        # Ensure we're storing JSON in the database
-        context_json = None
-        
-        if isinstance(context_data, dict):
-            # Convert datetime and decimal objects to strings
-            cleaned_data = {}
-            for key, value in context_data.items():
-                if isinstance(value, datetime):
-                    cleaned_data[key] = value.strftime("%Y-%m-%d %H:%M:%S")
-                elif isinstance(value, Decimal):
-                    # Convert Decimal to float for JSON serialization
-                    cleaned_data[key] = float(value)
-                else:
-                    cleaned_data[key] = value
-            
-            context_json = json.dumps(cleaned_data)
-            
-        elif isinstance(context_data, str):
-            # If it's already a string, ensure it's valid JSON or wrap it
-            try:
-                json.loads(context_data)  # Test if it's valid JSON
-                context_json = context_data
-            except json.JSONDecodeError:
-                context_json = json.dumps({"value": context_data})
-                
-        else:
-            # For any other type, convert to string then wrap in JSON
-            context_json = json.dumps({"value": str(context_data)})
+        return user_context_store.set(str(telegram_id), _context_json(context_data))
         
-        # Verify we have a valid JSON string before proceeding
-        if not context_json:
-            raise ValueError("Failed to convert context data to JSON")
-        
-        conn = None
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            # Delete any existing records for this telegram_id - always use string
-            cursor.execute("DELETE FROM user_context WHERE telegram_id = %s", (telegram_id_str,))
-            
-            # Insert new context - always as string
-            cursor.execute(
-                """
-                INSERT INTO user_context (telegram_id, context_data, created_at, updated_at)
-                VALUES (%s, %s, NOW(), NOW())
-                """,
-                (telegram_id_str, context_json)
-            )
-            
-            conn.commit()
-            return True
-        except Exception as db_error:
-            if conn:
-                conn.rollback()
-            logger.error(f"Database error in set_user_context: {db_error}", exc_info=True)
-            return False
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
-                
-    except Exception as e:
-        logger.error(f"Error setting user context: {e}", exc_info=True)
-        return False
-
-
-def get_user_context(telegram_id):
-    """Get context data for a user
-    
-    Args:
-        telegram_id (int or str): Telegram user ID (can be encrypted)
+    except Exception as e:
+        logger.error(f"Error setting user context: {e}", exc_info=True)
+        return False
+
+
+def get_user_context(telegram_id):
+    """Get context data for a user
+    
+    Args:
+        telegram_id (int or str): Telegram user ID (can be encrypted)
         
     Returns:
         dict: Context data or empty dict if not found
     """
-    conn = None
     try:
-        # Always convert telegram_id to string
-        telegram_id_str = str(telegram_id)
-        
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Check if table exists
-        cursor.execute("""
-            SELECT COUNT(*) as count
-            FROM information_schema.tables 
-            WHERE table_schema = %s 
-            AND table_name = 'user_context'
-        """, (DB_CONFIG['database'],))
-        
-        table_exists = cursor.fetchone()['count'] > 0
-        
-        if not table_exists:
-            return {}
-        
         # Always query with the string version
-        cursor.execute(
-            "SELECT context_data FROM user_context WHERE telegram_id = %s",
-            (telegram_id_str,)
-        )
-        result = cursor.fetchone()
-        
-        if result and result['context_data']:
-            # MySQL returns JSON data already parsed
-            context_data = result['context_data']
-            
-            if isinstance(context_data, dict):
-                return context_data
-            elif isinstance(context_data, str):
-                try:
-                    return json.loads(context_data)
-                except json.JSONDecodeError:
-                    return {"value": context_data}
-            else:
-                return {"value": str(context_data)}
-        else:
+        context_data = user_context_store.get(str(telegram_id))
+        if not context_data:
             return {}
+        
+        try:
+            context = json.loads(context_data)
+        except json.JSONDecodeError:
+            return {"value": context_data}
+        return context if isinstance(context, dict) else {"value": str(context)}
             
     except Exception as e:
         logger.error(f"Error getting user context: {e}", exc_info=True)
         return {}
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
 
 
 def clear_user_context(telegram_id):
@@ -1693,43 +2135,17 @@ def clear_user_context(telegram_id):
     Returns:
         bool: True if successful, False otherwise
     """
-    conn = None
     try:
-        # Always convert telegram_id to string
-        telegram_id_str = str(telegram_id)
-        
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        # Check if table exists
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM information_schema.tables 
-            WHERE table_schema = %s 
-            AND table_name = 'user_context'
-        """, (DB_CONFIG['database'],))
-        
-        table_exists = cursor.fetchone()[0] > 0
-        
-        if not table_exists:
-            return True  # No table means nothing to clear
-        
         # Always use string version
-        cursor.execute(
-            "DELETE FROM user_context WHERE telegram_id = %s",
-            (telegram_id_str,)
-        )
-        
-        conn.commit()
-        return True
+        return user_context_store.set(str(telegram_id), None)
     except Exception as e:
         logger.error(f"Error clearing user context: {e}", exc_info=True)
-        if conn:
-            conn.rollback()
         return False
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
+
+
+def get_user_context_stats():
+    """Get cache, coalescing and latency counters of the user context store"""
+    return user_context_store.stats()
 
 
 # -------------------------
@@ -1781,7 +2197,6 @@ def add_review(order_id, customer_id, artisan_id, rating, comment=None):
         )
         
         conn.commit()
-        return review_id
     except Exception as e:
         logger.error(f"Error adding review: {e}")
         if conn:
@@ -1792,6 +2207,9 @@ def add_review(order_id, customer_id, artisan_id, rating, comment=None):
             cursor.close()
         if conn and conn.is_connected():
             conn.close()
+    
+    refresh_artisan_geo_index(artisan_id)
+    return review_id
 
 
 def has_customer_reviewed_order(order_id, customer_id):
@@ -1869,113 +2287,67 @@ def get_artisan_statistics(artisan_id):
         dict: Statistics dict or None if error
     """
     try:
-        # Get total customers
-        customers_query = """
-            SELECT COUNT(DISTINCT customer_id) 
-            FROM orders 
-            WHERE artisan_id = %s
-        """
-        total_customers = execute_query(customers_query, (artisan_id,), fetchone=True)[0]
-        
-        # Get completed orders count
-        completed_query = """
-            SELECT COUNT(*) 
-            FROM orders 
-            WHERE artisan_id = %s AND status = 'completed'
-        """
-        completed_orders = execute_query(completed_query, (artisan_id,), fetchone=True)[0]
-        
-        # Get cancelled orders count
-        cancelled_query = """
-            SELECT COUNT(*) 
-            FROM orders 
-            WHERE artisan_id = %s AND status = 'cancelled'
-        """
-        cancelled_orders = execute_query(cancelled_query, (artisan_id,), fetchone=True)[0]
-        
-        # Get average rating
-        rating_query = "SELECT rating FROM artisans WHERE id = %s"
-        avg_rating_result = execute_query(rating_query, (artisan_id,), fetchone=True)
-        avg_rating = avg_rating_result[0] if avg_rating_result and avg_rating_result[0] is not None else 0
-        
-        # Get total earnings
-        earnings_query = """
-            SELECT COALESCE(SUM(artisan_amount), 0) 
-            FROM order_payments op
-            JOIN orders o ON op.order_id = o.id
-            WHERE o.artisan_id = %s AND o.status = 'completed'
-        """
-        total_earnings = execute_query(earnings_query, (artisan_id,), fetchone=True)[0]
-        
-        # Get monthly earnings (last 30 days)
-        monthly_earnings_query = """
-            SELECT COALESCE(SUM(artisan_amount), 0) 
-            FROM order_payments op
-            JOIN orders o ON op.order_id = o.id
-            WHERE o.artisan_id = %s 
-            AND o.status = 'completed'
-            AND o.completed_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)
-        """
-        monthly_earnings = execute_query(monthly_earnings_query, (artisan_id,), fetchone=True)[0]
-        
-        # Get orders from last 7 days
-        last_week_query = """
-            SELECT COUNT(*) 
-            FROM orders 
-            WHERE artisan_id = %s
-            AND created_at >= DATE_SUB(NOW(), INTERVAL 7 DAY)
-        """
-        last_week_orders = execute_query(last_week_query, (artisan_id,), fetchone=True)[0]
-        
-        # Get orders from last 30 days
-        last_month_query = """
-            SELECT COUNT(*) 
-            FROM orders 
-            WHERE artisan_id = %s
-            AND created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)
+        # Everything is computed in one statement (one round trip). Payments are
+        # summed per order first so that several payment rows can not inflate
+        # the order counts.
+        query = """
+            SELECT
+                COUNT(DISTINCT o.customer_id) AS total_customers,
+                COUNT(CASE WHEN o.status = 'completed' THEN 1 END) AS completed_orders,
+                COUNT(CASE WHEN o.status = 'cancelled' THEN 1 END) AS cancelled_orders,
+                COALESCE(SUM(CASE WHEN o.status = 'completed' THEN p.amount END), 0) AS total_earnings,
+                COALESCE(SUM(CASE WHEN o.status = 'completed'
+                                   AND o.completed_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)
+                                  THEN p.amount END), 0) AS monthly_earnings,
+                COUNT(CASE WHEN o.created_at >= DATE_SUB(NOW(), INTERVAL 7 DAY) THEN 1 END) AS last_week_orders,
+                COUNT(CASE WHEN o.created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY) THEN 1 END) AS last_month_orders,
+                COUNT(CASE WHEN o.created_at >= DATE_SUB(NOW(), INTERVAL 60 DAY)
+                            AND o.created_at < DATE_SUB(NOW(), INTERVAL 30 DAY) THEN 1 END) AS prev_month_orders,
+                (SELECT rating FROM artisans WHERE id = %s) AS avg_rating,
+                (SELECT subservice
+                 FROM orders
+                 WHERE artisan_id = %s AND subservice IS NOT NULL
+                 GROUP BY subservice
+                 ORDER BY COUNT(*) DESC
+                 LIMIT 1) AS top_service,
+                (SELECT o2.subservice
+                 FROM orders o2
+                 JOIN order_payments op2 ON o2.id = op2.order_id
+                 WHERE o2.artisan_id = %s AND o2.subservice IS NOT NULL
+                 GROUP BY o2.subservice
+                 ORDER BY SUM(op2.artisan_amount) DESC
+                 LIMIT 1) AS most_profitable_service
+            FROM orders o
+            LEFT JOIN (
+                SELECT op.order_id, SUM(op.artisan_amount) AS amount
+                FROM order_payments op
+                JOIN orders po ON po.id = op.order_id
+                WHERE po.artisan_id = %s
+                GROUP BY op.order_id
+            ) p ON p.order_id = o.id
+            WHERE o.artisan_id = %s
         """
-        last_month_orders = execute_query(last_month_query, (artisan_id,), fetchone=True)[0]
+        row = execute_query(query, (artisan_id,) * 5, fetchone=True, dict_cursor=True)
+        if not row:
+            return None
         
-        # Get orders from previous 30 days (for growth calculation)
-        prev_month_query = """
-            SELECT COUNT(*) 
-            FROM orders 
-            WHERE artisan_id = %s
-            AND created_at >= DATE_SUB(NOW(), INTERVAL 60 DAY)
-            AND created_at < DATE_SUB(NOW(), INTERVAL 30 DAY)
-        """
-        prev_month_orders = execute_query(prev_month_query, (artisan_id,), fetchone=True)[0]
+        total_customers = row['total_customers']
+        completed_orders = row['completed_orders']
+        cancelled_orders = row['cancelled_orders']
+        avg_rating = row['avg_rating'] if row['avg_rating'] is not None else 0
+        total_earnings = row['total_earnings']
+        monthly_earnings = row['monthly_earnings']
+        last_week_orders = row['last_week_orders']
+        last_month_orders = row['last_month_orders']
+        prev_month_orders = row['prev_month_orders']
+        top_service = row['top_service'] or "N/A"
+        most_profitable_service = row['most_profitable_service'] or "N/A"
         
         # Calculate order growth rate
         order_growth = 0
         if prev_month_orders > 0:
             order_growth = round(((last_month_orders - prev_month_orders) / prev_month_orders) * 100)
         
-        # Get most requested subservice
-        top_service_query = """
-            SELECT subservice, COUNT(*) as count
-            FROM orders
-            WHERE artisan_id = %s AND subservice IS NOT NULL
-            GROUP BY subservice
-            ORDER BY count DESC
-            LIMIT 1
-        """
-        top_service_result = execute_query(top_service_query, (artisan_id,), fetchone=True)
-        top_service = top_service_result[0] if top_service_result else "N/A"
-        
-        # Get most profitable subservice
-        profitable_service_query = """
-            SELECT o.subservice, SUM(op.artisan_amount) as amount
-            FROM orders o
-            JOIN order_payments op ON o.id = op.order_id
-            WHERE o.artisan_id = %s AND o.subservice IS NOT NULL
-            GROUP BY o.subservice
-            ORDER BY amount DESC
-            LIMIT 1
-        """
-        profitable_result = execute_query(profitable_service_query, (artisan_id,), fetchone=True)
-        most_profitable_service = profitable_result[0] if profitable_result else "N/A"
-        
         # Determine activity status based on orders in last 30 days
         activity_status = "Qeyri-aktiv"
         if last_month_orders >= 10:
@@ -2007,6 +2379,304 @@ def get_artisan_statistics(artisan_id):
         return None
 
 
+# -------------------------
+# ADMIN STATISTICS ROLLUPS
+# -------------------------
+
+# Order metrics are attributed to the hour and service in which the order was
+# created; customers and artisans to the hour they registered. Any bucket can
+# therefore be rebuilt from the base tables, which is what both the flush of
+# buckets marked by writes and the backfill do.
+ADMIN_STATS_BUCKET_SQL = "TIMESTAMP(DATE({col}), MAKETIME(HOUR({col}), 0, 0))"
+ADMIN_STATS_ORDER_FIELDS = ('orders_created', 'orders_completed', 'orders_cancelled', 'commission_revenue')
+ADMIN_STATS_TABLES = ('orders', 'customers', 'artisans')
+
+# Rows whose buckets changed since the last flush_admin_stats, as (table, id)
+_admin_stats_dirty = set()
+_admin_stats_dirty_lock = threading.Lock()
+
+
+def _hour_start(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _rebuild_admin_stats(cursor, start, end):
+    """Recompute admin_stats_hourly buckets in [start, end) on the caller's transaction"""
+    cursor.execute(
+        "DELETE FROM admin_stats_hourly WHERE bucket_start >= %s AND bucket_start < %s",
+        (start, end)
+    )
+    
+    # Orders and commission (payments summed per order so counts stay exact)
+    order_bucket = ADMIN_STATS_BUCKET_SQL.format(col="o.created_at")
+    cursor.execute(
+        f"""
+        INSERT INTO admin_stats_hourly
+            (bucket_start, service, orders_created, orders_completed, orders_cancelled, commission_revenue)
+        SELECT {order_bucket}, LEFT(COALESCE(o.service, ''), 100),
+               COUNT(*),
+               COUNT(CASE WHEN o.status = 'completed' THEN 1 END),
+               COUNT(CASE WHEN o.status = 'cancelled' THEN 1 END),
+               COALESCE(SUM(p.admin_fee), 0)
+        FROM orders o
+        LEFT JOIN (
+            SELECT op.order_id, SUM(op.admin_fee) AS admin_fee
+            FROM order_payments op
+            JOIN orders po ON po.id = op.order_id
+            WHERE po.created_at >= %s AND po.created_at < %s
+            GROUP BY op.order_id
+        ) p ON p.order_id = o.id
+        WHERE o.created_at >= %s AND o.created_at < %s
+        GROUP BY 1, 2
+        """,
+        (start, end, start, end)
+    )
+    
+    # New artisans, per service
+    created_bucket = ADMIN_STATS_BUCKET_SQL.format(col="created_at")
+    cursor.execute(
+        f"""
+        INSERT INTO admin_stats_hourly (bucket_start, service, new_artisans)
+        SELECT {created_bucket}, LEFT(COALESCE(service, ''), 100), COUNT(*)
+        FROM artisans
+        WHERE created_at >= %s AND created_at < %s
+        GROUP BY 1, 2
+        ON DUPLICATE KEY UPDATE new_artisans = VALUES(new_artisans)
+        """,
+        (start, end)
+    )
+    
+    # New customers (not service specific)
+    cursor.execute(
+        f"""
+        INSERT INTO admin_stats_hourly (bucket_start, service, new_customers)
+        SELECT {created_bucket}, '', COUNT(*)
+        FROM customers
+        WHERE created_at >= %s AND created_at < %s
+        GROUP BY 1
+        ON DUPLICATE KEY UPDATE new_customers = VALUES(new_customers)
+        """,
+        (start, end)
+    )
+
+
+def rebuild_admin_stats(start, end):
+    """Recompute admin_stats_hourly buckets in [start, end)
+
+    Args:
+        start (datetime): First hour to rebuild (rounded down to the hour)
+        end (datetime): End of the range, exclusive
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    start = _hour_start(start)
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        _rebuild_admin_stats(cursor, start, end)
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Error rebuilding admin stats from {start} to {end}: {e}")
+        if conn:
+            conn.rollback()
+        return False
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def refresh_admin_stats_for(table, row_id):
+    """Mark the admin stats bucket that a created/changed row belongs to
+
+    Called after order and payment state transitions and after registrations.
+    Only remembers the row; flush_admin_stats rebuilds its bucket from a
+    timer, so writes do not wait for the rebuild.
+    
+    Args:
+        table (str): 'orders', 'customers' or 'artisans'
+        row_id (int): ID of the row in that table
+    """
+    if table not in ADMIN_STATS_TABLES or not row_id:
+        return
+    with _admin_stats_dirty_lock:
+        _admin_stats_dirty.add((table, row_id))
+
+
+def flush_admin_stats():
+    """Periodic job: rebuild the buckets marked by refresh_admin_stats_for
+
+    Each hour is rebuilt once, however many of its rows changed. Marks are
+    kept in memory; buckets missed by a restart are repaired by
+    refresh_admin_stats_rollup.
+
+    Returns:
+        int: Number of buckets rebuilt
+    """
+    with _admin_stats_dirty_lock:
+        dirty = list(_admin_stats_dirty)
+        _admin_stats_dirty.clear()
+    if not dirty:
+        return 0
+    
+    hours = set()
+    try:
+        for table in ADMIN_STATS_TABLES:
+            row_ids = [row_id for dirty_table, row_id in dirty if dirty_table == table]
+            if not row_ids:
+                continue
+            placeholders = ", ".join(["%s"] * len(row_ids))
+            rows = execute_query(
+                f"SELECT DISTINCT {ADMIN_STATS_BUCKET_SQL.format(col='created_at')} FROM {table} "
+                f"WHERE id IN ({placeholders}) AND created_at IS NOT NULL",
+                tuple(row_ids),
+                fetchall=True
+            ) or []
+            hours.update(row[0] for row in rows)
+    except Exception as e:
+        logger.error(f"Error reading admin stats buckets to rebuild: {e}")
+        with _admin_stats_dirty_lock:
+            _admin_stats_dirty.update(dirty)
+        return 0
+    
+    rebuilt = 0
+    for hour in sorted(hours):
+        if rebuild_admin_stats(hour, hour + timedelta(hours=1)):
+            rebuilt += 1
+    return rebuilt
+
+
+def backfill_admin_stats(start=None, end=None, chunk_days=7):
+    """Rebuild admin_stats_hourly for a date range, one chunk per transaction
+
+    Args:
+        start (datetime, optional): First hour; defaults to the oldest order, customer or artisan
+        end (datetime, optional): End of the range; defaults to now
+        chunk_days (int): Days rebuilt per transaction
+
+    Returns:
+        int: Number of chunks rebuilt successfully
+    """
+    # Use the database clock, created_at values are written with NOW()
+    now, oldest = execute_query(
+        """
+        SELECT NOW(), LEAST(
+            COALESCE((SELECT MIN(created_at) FROM orders), NOW()),
+            COALESCE((SELECT MIN(created_at) FROM customers), NOW()),
+            COALESCE((SELECT MIN(created_at) FROM artisans), NOW())
+        )
+        """,
+        fetchone=True
+    )
+    end = end or (_hour_start(now) + timedelta(hours=1))
+    start = _hour_start(start or oldest)
+    rebuilt = 0
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days), end)
+        if rebuild_admin_stats(chunk_start, chunk_end):
+            rebuilt += 1
+        chunk_start = chunk_end
+    
+    logger.info(f"Admin stats backfilled from {start} to {end} ({rebuilt} chunks)")
+    return rebuilt
+
+
+def refresh_admin_stats_rollup(hours=48):
+    """Periodic job: full backfill on an empty rollup table, otherwise rebuild the last `hours`
+
+    Picks up changes made outside the db.py write functions (manual SQL, deletions).
+    """
+    try:
+        result = execute_query("SELECT 1 FROM admin_stats_hourly LIMIT 1", fetchone=True)
+        if not result:
+            return backfill_admin_stats()
+        now = execute_query("SELECT NOW()", fetchone=True)[0]
+        return backfill_admin_stats(start=now - timedelta(hours=hours), chunk_days=1)
+    except Exception as e:
+        logger.error(f"Error refreshing admin stats rollup: {e}")
+        return 0
+
+
+def get_admin_stats(start=None, end=None):
+    """Get admin dashboard totals from the hourly rollups
+
+    Args:
+        start (datetime, optional): Range start; all time when omitted
+        end (datetime, optional): Range end (exclusive); now when omitted
+
+    Returns:
+        dict: Totals plus the top services by order count, or None if error
+    """
+    where = "WHERE bucket_start >= %s AND bucket_start < %s"
+    params = (start or datetime(1970, 1, 1), end or datetime(9999, 1, 1))
+    try:
+        totals = execute_query(
+            f"""
+            SELECT COALESCE(SUM(new_customers), 0) AS customers,
+                   COALESCE(SUM(new_artisans), 0) AS artisans,
+                   COALESCE(SUM(orders_created), 0) AS orders,
+                   COALESCE(SUM(orders_completed), 0) AS completed_orders,
+                   COALESCE(SUM(orders_cancelled), 0) AS cancelled_orders,
+                   COALESCE(SUM(commission_revenue), 0) AS revenue
+            FROM admin_stats_hourly
+            {where}
+            """,
+            params, fetchone=True, dict_cursor=True
+        )
+        top_services = execute_query(
+            f"""
+            SELECT service, SUM(orders_created) AS count
+            FROM admin_stats_hourly
+            {where} AND service <> ''
+            GROUP BY service
+            HAVING count > 0
+            ORDER BY count DESC
+            LIMIT 5
+            """,
+            params, fetchall=True
+        )
+        stats = {key: int(value) if key != 'revenue' else value for key, value in totals.items()}
+        stats['top_services'] = [(service, int(count)) for service, count in top_services or []]
+        return stats
+    except Exception as e:
+        logger.error(f"Error getting admin stats: {e}")
+        return None
+
+
+def get_admin_daily_stats(start, end):
+    """Get per-day admin totals from the hourly rollups
+
+    Args:
+        start (datetime): Range start
+        end (datetime): Range end (exclusive)
+
+    Returns:
+        list: Dicts with day, customers, artisans, orders, completed_orders,
+              cancelled_orders and revenue, oldest day first
+    """
+    query = """
+        SELECT DATE(bucket_start) AS day,
+               SUM(new_customers) AS customers,
+               SUM(new_artisans) AS artisans,
+               SUM(orders_created) AS orders,
+               SUM(orders_completed) AS completed_orders,
+               SUM(orders_cancelled) AS cancelled_orders,
+               SUM(commission_revenue) AS revenue
+        FROM admin_stats_hourly
+        WHERE bucket_start >= %s AND bucket_start < %s
+        GROUP BY DATE(bucket_start)
+        ORDER BY day
+    """
+    try:
+        return execute_query(query, (start, end), fetchall=True, dict_cursor=True) or []
+    except Exception as e:
+        logger.error(f"Error getting admin daily stats: {e}")
+        return []
+
+
 def calculate_distance(lat1, lon1, lat2, lon2):
     """Calculate distance between two points in kilometers using the haversine formula
     
@@ -2098,7 +2768,7 @@ def check_receipt_verification_status(order_id):
         return None
 
 
-def block_customer(customer_id, reason, required_payment, block_hours=24):
+def block_customer(customer_id, reason, required_payment, block_hours=24, outbox=None):
     """Block a customer
     
     Args:
@@ -2106,6 +2776,7 @@ def block_customer(customer_id, reason, required_payment, block_hours=24):
         reason (str): Reason for blocking
         required_payment (float): Amount needed to unblock
         block_hours (int): Hours for which to block
+        outbox (list, optional): Notification outbox messages committed together with the block
         
     Returns:
         bool: True if successful, False otherwise
@@ -2137,8 +2808,11 @@ def block_customer(customer_id, reason, required_payment, block_hours=24):
             """,
             (customer_id, reason, required_payment, block_hours)
         )
+        add_outbox_messages(cursor, outbox)
         
         conn.commit()
+        if outbox:
+            _notify_outbox_enqueued()
         logger.info(f"Successfully blocked customer {customer_id} for reason: {reason}")
         return True
     except Exception as e:
@@ -2160,26 +2834,11 @@ def get_customer_blocked_status(customer_id):
     Returns:
         tuple: (bool is_blocked, str reason, float required_payment, datetime block_until)
     """
+    conn = None
     try:
-        # First check if the table exists
-        check_table_query = """
-            SELECT COUNT(*) 
-            FROM information_schema.tables 
-            WHERE table_schema = %s AND table_name = 'customer_blocks'
-        """
-        
         conn = get_connection()
         cursor = conn.cursor()
         
-        # Use string value instead of dict key directly in tuple
-        database_name = DB_CONFIG['database']
-        cursor.execute(check_table_query, (database_name,))
-        table_exists = cursor.fetchone()[0] > 0
-        
-        if not table_exists:
-            # Table doesn't exist, customer can't be blocked
-            return False, None, 0, None
-        
         query = """
             SELECT is_blocked, block_reason, required_payment, block_until
             FROM customer_blocks
@@ -2213,6 +2872,7 @@ def update_receipt_verification_status(order_id, is_verified):
     Returns:
         bool: True if successful, False otherwise
     """
+    conn = None
     try:
         # Different query based on verification status
         if is_verified is True:
@@ -2272,10 +2932,27 @@ def update_receipt_verification_status(order_id, is_verified):
                 (order_id,)
             )
         
+        # Check if any rows were affected
+        updated = cursor.rowcount > 0
+        
+        # Queue the notifications of the new state in the same transaction
+        events = []
+        if updated and is_verified is False:
+            cursor.execute(
+                "SELECT payment_method, receipt_file_id FROM order_payments WHERE order_id = %s",
+                (order_id,)
+            )
+            payment = cursor.fetchone()
+            if payment and payment[0] != 'cash' and payment[1] is not None:
+                events.append(('invalid_receipt', order_id))
+        elif updated and is_verified is True:
+            events.append(('payment_transfer', order_id))
+        tasks = _add_payment_events(cursor, events)
+        
         conn.commit()
+        _announce_payment_events(tasks)
         
-        # Check if any rows were affected
-        return cursor.rowcount > 0
+        return updated
     except Exception as e:
         logger.error(f"Error updating receipt verification status: {e}")
         return False
@@ -2294,6 +2971,7 @@ def set_admin_payment_completed(order_id, is_completed):
     Returns:
         bool: True if successful, False otherwise
     """
+    conn = None
     try:
         query = """
             UPDATE order_payments
@@ -2306,10 +2984,17 @@ def set_admin_payment_completed(order_id, is_completed):
         cursor = conn.cursor()
         
         cursor.execute(query, (is_completed, order_id))
-        conn.commit()
         
         # Check if any rows were affected
-        return cursor.rowcount > 0
+        updated = cursor.rowcount > 0
+        
+        # The artisan is told about the transfer in the same transaction
+        tasks = _add_payment_events(cursor, [('payment_transfer', order_id)] if updated and is_completed else [])
+        
+        conn.commit()
+        _announce_payment_events(tasks)
+        
+        return updated
     except Exception as e:
         logger.error(f"Error setting admin payment completed: {e}")
         return False
@@ -2352,35 +3037,11 @@ def save_customer_fine_receipt(customer_id, file_id):
     Returns:
         int|bool: Receipt ID if successful, False otherwise
     """
+    conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
         
-        # Check if table exists
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM information_schema.tables 
-            WHERE table_schema = %s 
-            AND table_name = 'customer_fine_receipts'
-        """, (DB_CONFIG['database'],))
-        
-        table_exists = cursor.fetchone()[0] > 0
-        
-        # Create table if it doesn't exist
-        if not table_exists:
-            cursor.execute("""
-                CREATE TABLE customer_fine_receipts (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    customer_id INT NOT NULL,
-                    file_id VARCHAR(255) NOT NULL,
-                    status VARCHAR(20) DEFAULT 'pending',
-                    verified_by INT,
-                    verified_at DATETIME,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE
-                )
-            """)
-        
         # Insert receipt record
         cursor.execute("""
             INSERT INTO customer_fine_receipts 
@@ -2449,37 +3110,11 @@ def create_refund_request(order_id, amount, reason):
     Returns:
         int: ID of the created refund request or None if failed
     """
+    conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
         
-        # Check if table exists
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM information_schema.tables 
-            WHERE table_schema = %s 
-            AND table_name = 'refund_requests'
-        """, (DB_CONFIG['database'],))
-        
-        table_exists = cursor.fetchone()[0] > 0
-        
-        # Create table if it doesn't exist
-        if not table_exists:
-            cursor.execute("""
-                CREATE TABLE refund_requests (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    order_id INT NOT NULL,
-                    amount DECIMAL(10, 2) NOT NULL,
-                    reason TEXT NOT NULL,
-                    status VARCHAR(20) DEFAULT 'pending',
-                    card_number VARCHAR(50),
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    completed_by INT,
-                    completed_at DATETIME,
-                    FOREIGN KEY (order_id) REFERENCES orders(id)
-                )
-            """)
-        
         # Insert refund request
         cursor.execute("""
             INSERT INTO refund_requests 
@@ -2570,6 +3205,7 @@ def mark_admin_payment_completed(order_id):
     Returns:
         bool: True if successful, False otherwise
     """
+    conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
@@ -2578,7 +3214,12 @@ def mark_admin_payment_completed(order_id):
             SET admin_payment_completed = TRUE
             WHERE order_id = %s
         """, (order_id,))
+        
+        # The artisan is told about the transfer in the same transaction
+        tasks = _add_payment_events(cursor, [('payment_transfer', order_id)] if cursor.rowcount > 0 else [])
+        
         conn.commit()
+        _announce_payment_events(tasks)
         return True
     except Exception as e:
         logger.error(f"DB error in mark_admin_payment_completed: {e}")
@@ -2587,24 +3228,192 @@ def mark_admin_payment_completed(order_id):
         if conn and conn.is_connected():
             conn.close()
 
-# Encryption wrappers
-from db_encryption_wrapper import (
-    wrap_create_customer, wrap_create_artisan, wrap_get_dict_function,
-    wrap_get_list_function, wrap_update_customer_profile, wrap_update_artisan_profile
-)
+def get_artisan_registration_info(artisan_id):
+    """Get when an artisan registered and their stored card number
+    
+    Args:
+        artisan_id (int): ID of the artisan
+        
+    Returns:
+        tuple: (created_at, payment_card_number) or None if not found
+    """
+    return execute_query(
+        "SELECT created_at, payment_card_number FROM artisans WHERE id = %s",
+        (artisan_id,),
+        fetchone=True
+    )
 
-# Normal (şifresi çözülmüş ama maskelenmemiş) versiyonlar - kendi verilerini görüntülemek için
-get_customer_by_telegram_id = wrap_get_dict_function(get_customer_by_telegram_id, decrypt=True, mask=False)
-get_customer_by_id = wrap_get_dict_function(get_customer_by_id, decrypt=True, mask=False)
-create_customer = wrap_create_customer(create_customer)
-update_customer_profile = wrap_update_customer_profile(update_customer_profile)
-get_customer_orders = wrap_get_list_function(get_customer_orders, decrypt=True, mask=False)
-get_artisan_by_id = wrap_get_dict_function(get_artisan_by_id, decrypt=True, mask=False)
-create_artisan = wrap_create_artisan(create_artisan)
-update_artisan_profile = wrap_update_artisan_profile(update_artisan_profile)
-get_artisan_active_orders = wrap_get_list_function(get_artisan_active_orders, decrypt=True, mask=False)
-get_order_details = wrap_get_dict_function(get_order_details, decrypt=True, mask=False)
+def save_admin_payment_receipt(order_id, file_id):
+    """Save the receipt of an artisan's commission payment to the admin
+    
+    The payment is marked completed and admin_payment_completed goes back
+    to NULL until an admin checks the receipt.
+    
+    Args:
+        order_id (int): ID of the order
+        file_id (str): Telegram file ID of the receipt photo
+        
+    Returns:
+        bool: True if the order's payment record was updated
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            UPDATE order_payments 
+            SET receipt_file_id = %s,
+                receipt_uploaded_at = CURRENT_TIMESTAMP,
+                payment_status = 'completed',
+                payment_date = CURRENT_TIMESTAMP,
+                admin_payment_completed = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE order_id = %s
+            """,
+            (file_id, order_id)
+        )
+        updated = cursor.rowcount > 0
+        conn.commit()
+        
+        if not updated:
+            logger.error(f"No payment record to save the admin payment receipt of order {order_id}")
+        return updated
+    except Exception as e:
+        logger.error(f"Error saving admin payment receipt for order {order_id}: {e}")
+        if conn:
+            conn.rollback()
+        return False
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+def complete_payment_receipt(order_id, file_id, reset_admin_payment=False):
+    """Store a receipt and mark the payment completed, without the checks of save_payment_receipt
+    
+    Args:
+        order_id (int): ID of the order
+        file_id (str): Telegram file ID of the receipt photo
+        reset_admin_payment (bool): Also set admin_payment_completed back to NULL
+        
+    Returns:
+        bool: True if the order's payment record was updated
+    """
+    admin_payment = ", admin_payment_completed = NULL" if reset_admin_payment else ""
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            UPDATE order_payments 
+            SET receipt_file_id = %s,
+                receipt_uploaded_at = CURRENT_TIMESTAMP,
+                payment_status = 'completed',
+                payment_date = CURRENT_TIMESTAMP{admin_payment}
+            WHERE order_id = %s
+            """,
+            (file_id, order_id)
+        )
+        updated = cursor.rowcount > 0
+        conn.commit()
+        return updated
+    except Exception as e:
+        logger.error(f"Error completing payment receipt for order {order_id}: {e}")
+        return False
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+def resubmit_commission_receipt(order_id, file_id):
+    """Save a new commission receipt after the previous one was rejected
+    
+    The receipt goes back to pending, a new verification attempt is
+    recorded and the 'commission_resubmitted' log entry stops the
+    scheduled block, all in one transaction.
+    
+    Args:
+        order_id (int): ID of the order
+        file_id (str): Telegram file ID of the receipt photo
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            UPDATE order_payments 
+            SET receipt_file_id = %s,
+                receipt_uploaded_at = CURRENT_TIMESTAMP,
+                receipt_verified = FALSE, 
+                payment_status = 'pending',
+                updated_at = CURRENT_TIMESTAMP
+            WHERE order_id = %s
+            """,
+            (file_id, order_id)
+        )
+        if cursor.rowcount == 0:
+            conn.rollback()
+            return False
+        
+        cursor.execute(
+            "SELECT COALESCE(MAX(attempt_number), 0) + 1 FROM receipt_verification_history WHERE order_id = %s",
+            (order_id,)
+        )
+        attempt_number = cursor.fetchone()[0]
+        cursor.execute(
+            """
+            INSERT INTO receipt_verification_history 
+            (order_id, is_verified, attempt_number, verified_at)
+            VALUES (%s, NULL, %s, CURRENT_TIMESTAMP)
+            """,
+            (order_id, attempt_number)
+        )
+        
+        # Clear scheduled block if any (by updating notification_log)
+        cursor.execute(
+            """
+            INSERT INTO notification_log (notification_type, target_id, created_at)
+            VALUES ('commission_resubmitted', %s, CURRENT_TIMESTAMP)
+            """,
+            (order_id,)
+        )
+        
+        conn.commit()
+        return True
+    except Exception as e:
+        logger.error(f"Error saving resubmitted commission receipt for order {order_id}: {e}")
+        if conn:
+            conn.rollback()
+        return False
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+# Encryption wrappers
+from db_encryption_wrapper import (
+    wrap_create_customer, wrap_create_artisan, wrap_get_dict_function,
+    wrap_get_list_function, wrap_update_customer_profile, wrap_update_artisan_profile
+)
+
+# Normal (şifresi çözülmüş ama maskelenmemiş) versiyonlar - kendi verilerini görüntülemek için
+get_customer_by_telegram_id = wrap_get_dict_function(get_customer_by_telegram_id, decrypt=True, mask=False)
+get_customer_by_id = wrap_get_dict_function(get_customer_by_id, decrypt=True, mask=False)
+create_customer = wrap_create_customer(create_customer)
+update_customer_profile = wrap_update_customer_profile(update_customer_profile)
+get_customer_orders = wrap_get_list_function(get_customer_orders, decrypt=True, mask=False)
+get_artisan_by_id = wrap_get_dict_function(get_artisan_by_id, decrypt=True, mask=False)
+get_artisans_by_ids = wrap_get_list_function(get_artisans_by_ids, decrypt=True, mask=False)
+create_artisan = wrap_create_artisan(create_artisan)
+update_artisan_profile = wrap_update_artisan_profile(update_artisan_profile)
+get_artisan_active_orders = wrap_get_list_function(get_artisan_active_orders, decrypt=True, mask=False)
+get_order_details = wrap_get_dict_function(get_order_details, decrypt=True, mask=False)
 debug_order_payment = wrap_get_dict_function(debug_order_payment, decrypt=True, mask=False)
+find_customers = wrap_get_list_function(find_customers, decrypt=True, mask=False)
+find_artisans = wrap_get_list_function(find_artisans, decrypt=True, mask=False)
 
 # Ekstra: Hassas veri döndüren diğer fonksiyonlar için de wrapper ekle
 get_artisan_by_service = wrap_get_list_function(get_artisan_by_service)
@@ -2668,6 +3477,42 @@ def get_admin_artisan_active_orders(artisan_id):
 # DELAY REMINDER FUNCTIONS  
 # -------------------------
 
+# Callbacks told about every committed scheduled_tasks insert, so an
+# in-process scheduler can wake up early instead of polling the table
+_scheduled_task_listeners = []
+
+
+def add_scheduled_task_listener(callback):
+    """Call `callback(task)` after each scheduled task insert
+    
+    The callback runs on the inserting thread (usually a DB worker) and gets
+    a dict with id, task_type, reference_id, execution_time and data.
+    """
+    if callback not in _scheduled_task_listeners:
+        _scheduled_task_listeners.append(callback)
+
+
+def remove_scheduled_task_listener(callback):
+    """Stop calling a callback registered with add_scheduled_task_listener"""
+    if callback in _scheduled_task_listeners:
+        _scheduled_task_listeners.remove(callback)
+
+
+def _notify_scheduled_task_created(task_id, task_type, reference_id, execution_time, data):
+    task = {
+        "id": task_id,
+        "task_type": task_type,
+        "reference_id": reference_id,
+        "execution_time": execution_time,
+        "data": data,
+    }
+    for callback in list(_scheduled_task_listeners):
+        try:
+            callback(task)
+        except Exception as e:
+            logger.error(f"Scheduled task listener failed: {e}")
+
+
 def create_delay_reminder(order_id, execution_time):
     """Create a delay reminder task in the database
     
@@ -2695,6 +3540,7 @@ def create_delay_reminder(order_id, execution_time):
         task_id = cursor.lastrowid
         conn.commit()
         logger.info(f"Created delay reminder task {task_id} for order {order_id}")
+        _notify_scheduled_task_created(task_id, 'delay_reminder', order_id, execution_time, {"type": "delay_reminder"})
         return task_id
         
     except Exception as e:
@@ -2746,157 +3592,1549 @@ def cancel_delay_reminder(order_id):
         if conn and conn.is_connected():
             conn.close()
 
-def get_due_delay_reminders():
-    """Get all delay reminders that are due for execution
+# -------------------------
+# DURABLE TIMER FUNCTIONS
+# -------------------------
+
+def _decode_task_data(value):
+    """Decode the additional_data JSON column into a dict"""
+    if value is None:
+        return {}
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode('utf-8')
+    if isinstance(value, str):
+        value = json.loads(value) if value else {}
+    return value if isinstance(value, dict) else {}
+
+
+def create_scheduled_task(task_type, reference_id, execution_time, data=None):
+    """Persist a timer in scheduled_tasks
     
+    Args:
+        task_type (str): Registered timer type
+        reference_id (int): ID of the object the timer belongs to (usually an order)
+        execution_time (datetime): When the timer should fire
+        data (dict, optional): JSON-serialisable handler arguments
+        
     Returns:
-        list: List of tuples (task_id, order_id) that are due
+        int: ID of the created task or None if failed
     """
+    conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
         
-        # Get pending delay reminders that are due
         cursor.execute(
             """
-            SELECT id, reference_id 
-            FROM scheduled_tasks 
-            WHERE task_type = 'delay_reminder' 
-            AND status = 'pending' 
-            AND execution_time <= NOW()
+            INSERT INTO scheduled_tasks 
+            (task_type, reference_id, execution_time, status, additional_data, created_at)
+            VALUES (%s, %s, %s, 'pending', %s, NOW())
+            """,
+            (task_type, reference_id, execution_time, json.dumps(data or {}))
+        )
+        
+        task_id = cursor.lastrowid
+        conn.commit()
+        _notify_scheduled_task_created(task_id, task_type, reference_id, execution_time, data or {})
+        return task_id
+        
+    except Exception as e:
+        logger.error(f"Error creating scheduled task {task_type} for {reference_id}: {e}")
+        return None
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def get_claimable_scheduled_tasks(task_types, max_attempts, horizon_seconds=None):
+    """Get timers this worker may claim, earliest first
+    
+    These are pending timers, plus running ones whose lease expired because
+    their worker stopped sending heartbeats.
+    
+    Args:
+        task_types (list): Timer types to load
+        max_attempts (int): Skip tasks that have been claimed this many times
+        horizon_seconds (int, optional): Only pending timers due within this many seconds
+        
+    Returns:
+        list: Dicts with id, task_type, reference_id, execution_time and data
+    """
+    if not task_types:
+        return []
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor(dictionary=True)
+        
+        placeholders = ", ".join(["%s"] * len(task_types))
+        params = list(task_types) + [max_attempts]
+        horizon_sql = ""
+        if horizon_seconds is not None:
+            horizon_sql = "AND execution_time <= NOW() + INTERVAL %s SECOND"
+            params.append(int(horizon_seconds))
+        cursor.execute(
+            f"""
+            SELECT id, task_type, reference_id, execution_time, additional_data
+            FROM scheduled_tasks
+            WHERE task_type IN ({placeholders})
+            AND attempts < %s
+            AND (
+                (status = 'pending' {horizon_sql})
+                OR (status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < NOW()))
+            )
             ORDER BY execution_time ASC
-            """
+            """,
+            tuple(params)
         )
         
-        results = cursor.fetchall()
-        return results
+        tasks = []
+        for row in cursor.fetchall():
+            row['data'] = _decode_task_data(row.pop('additional_data'))
+            tasks.append(row)
+        return tasks
         
     except Exception as e:
-        logger.error(f"Error getting due delay reminders: {e}")
+        logger.error(f"Error getting claimable scheduled tasks: {e}")
         return []
     finally:
         if conn and conn.is_connected():
             conn.close()
 
-def mark_delay_reminder_completed(task_id):
-    """Mark a delay reminder task as completed
+
+def fail_abandoned_scheduled_tasks(max_attempts):
+    """Mark expired tasks that used up their attempts as failed
     
     Args:
-        task_id (int): ID of the task
+        max_attempts (int): Claims allowed per task
         
     Returns:
-        bool: True if successful, False otherwise
+        int: Number of tasks marked failed
     """
+    conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute(
             """
-            UPDATE scheduled_tasks 
-            SET status = 'completed', completed_at = NOW()
-            WHERE id = %s
+            UPDATE scheduled_tasks
+            SET status = 'failed', completed_at = NOW(), lease_owner = NULL, lease_expires_at = NULL
+            WHERE status = 'running'
+            AND attempts >= %s
+            AND (lease_expires_at IS NULL OR lease_expires_at < NOW())
             """,
-            (task_id,)
+            (max_attempts,)
         )
         
+        failed = cursor.rowcount
         conn.commit()
-        return cursor.rowcount > 0
+        return failed
         
     except Exception as e:
-        logger.error(f"Error marking delay reminder completed: {e}")
-        return False
+        logger.error(f"Error failing abandoned scheduled tasks: {e}")
+        return 0
     finally:
         if conn and conn.is_connected():
             conn.close()
 
-def mark_delay_reminder_failed(task_id):
-    """Mark a delay reminder task as failed
+
+def claim_scheduled_task(task_id, owner, lease_seconds, max_attempts):
+    """Atomically take a timer for this worker
+    
+    Succeeds for pending timers and for running ones whose lease expired,
+    so at most one worker runs a task at a time.
     
     Args:
         task_id (int): ID of the task
+        owner (str): Worker ID
+        lease_seconds (int): How long the claim is valid without a heartbeat
+        max_attempts (int): Refuse tasks that have been claimed this many times
         
     Returns:
-        bool: True if successful, False otherwise
+        bool: True if this worker now owns the task
     """
+    conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute(
             """
-            UPDATE scheduled_tasks 
-            SET status = 'failed', completed_at = NOW()
+            UPDATE scheduled_tasks
+            SET status = 'running', lease_owner = %s,
+                lease_expires_at = NOW() + INTERVAL %s SECOND,
+                started_at = NOW(), attempts = attempts + 1
             WHERE id = %s
+            AND attempts < %s
+            AND (
+                status = 'pending'
+                OR (status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < NOW()))
+            )
             """,
-            (task_id,)
+            (owner, int(lease_seconds), task_id, max_attempts)
         )
         
+        claimed = cursor.rowcount > 0
         conn.commit()
-        return cursor.rowcount > 0
+        return claimed
         
     except Exception as e:
-        logger.error(f"Error marking delay reminder failed: {e}")
+        logger.error(f"Error claiming scheduled task {task_id}: {e}")
         return False
     finally:
         if conn and conn.is_connected():
             conn.close()
 
-def delete_user_completely(user_type, user_id):
-    """
-    Completely delete a user and all related data from the database
+
+def renew_scheduled_task_lease(task_id, owner, lease_seconds):
+    """Extend the lease of a running timer (heartbeat)
     
     Args:
-        user_type (str): 'artisan' or 'customer'
-        user_id (int): ID of the user to delete
+        task_id (int): ID of the task
+        owner (str): Worker ID that claimed it
+        lease_seconds (int): New lease length from now
         
     Returns:
-        bool: True if successful, False otherwise
+        bool: False if the lease was lost to another worker
     """
     conn = None
-    cursor = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            """
+            UPDATE scheduled_tasks
+            SET lease_expires_at = NOW() + INTERVAL %s SECOND
+            WHERE id = %s AND lease_owner = %s AND status = 'running'
+            """,
+            (int(lease_seconds), task_id, owner)
+        )
+        
+        # rowcount is 0 for a matched row whose value did not change, so
+        # re-check ownership instead of trusting it
+        renewed = cursor.rowcount > 0
+        if not renewed:
+            cursor.execute(
+                "SELECT 1 FROM scheduled_tasks WHERE id = %s AND lease_owner = %s AND status = 'running'",
+                (task_id, owner)
+            )
+            renewed = cursor.fetchone() is not None
+        conn.commit()
+        return renewed
+        
+    except Exception as e:
+        logger.error(f"Error renewing lease of scheduled task {task_id}: {e}")
+        # A failed heartbeat is not proof that the lease was lost
+        return True
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def finish_scheduled_task(task_id, owner, status='completed'):
+    """Record the outcome of a timer run and release its lease
     
+    Args:
+        task_id (int): ID of the task
+        owner (str): Worker ID that claimed it
+        status (str): 'completed' or 'failed'
+        
+    Returns:
+        bool: True if this worker still owned the task
+    """
+    conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
         
-        # Start transaction
-        conn.autocommit = False
+        cursor.execute(
+            """
+            UPDATE scheduled_tasks
+            SET status = %s, completed_at = NOW(), lease_expires_at = NULL
+            WHERE id = %s AND lease_owner = %s AND status = 'running'
+            """,
+            (status, task_id, owner)
+        )
         
-        # Get telegram_id before deletion for user_context cleanup
-        telegram_id_encrypted = None
-        if user_type == "artisan":
-            cursor.execute("SELECT telegram_id FROM artisans WHERE id = %s", (user_id,))
-        else:
-            cursor.execute("SELECT telegram_id FROM customers WHERE id = %s", (user_id,))
-            
-        result = cursor.fetchone()
-        if result:
-            telegram_id_encrypted = result[0]
+        conn.commit()
+        return cursor.rowcount > 0
         
-        # Initialize order_ids list
-        order_ids = []
+    except Exception as e:
+        logger.error(f"Error finishing scheduled task {task_id}: {e}")
+        return False
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def acquire_job_lease(name, owner, lease_seconds):
+    """Take or renew the cluster-wide lease of a recurring job
+    
+    Args:
+        name (str): Job name
+        owner (str): Worker ID
+        lease_seconds (int): Lease length from now
         
-        if user_type == "artisan":
-            # Get orders associated with this artisan
-            cursor.execute("SELECT id FROM orders WHERE artisan_id = %s", (user_id,))
-            order_ids = [row[0] for row in cursor.fetchall()]
-            
-            # Delete from artisan-specific tables first
-            cursor.execute("DELETE FROM artisan_services WHERE artisan_id = %s", (user_id,))
-            cursor.execute("DELETE FROM artisan_price_ranges WHERE artisan_id = %s", (user_id,))
-            cursor.execute("DELETE FROM artisan_blocks WHERE artisan_id = %s", (user_id,))
-            cursor.execute("DELETE FROM fine_receipts WHERE artisan_id = %s", (user_id,))
-            
-            # Delete reviews where this artisan is the provider
-            cursor.execute("DELETE FROM reviews WHERE artisan_id = %s", (user_id,))
-            
+    Returns:
+        bool: True if this worker holds the lease
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        # owner is assigned first, so the second IF already sees the new owner
+        cursor.execute(
+            """
+            INSERT INTO job_leases (name, owner, lease_expires_at)
+            VALUES (%s, %s, NOW() + INTERVAL %s SECOND)
+            ON DUPLICATE KEY UPDATE
+                owner = IF(owner = VALUES(owner) OR lease_expires_at < NOW(), VALUES(owner), owner),
+                lease_expires_at = IF(owner = VALUES(owner), VALUES(lease_expires_at), lease_expires_at)
+            """,
+            (name, owner, int(lease_seconds))
+        )
+        cursor.execute("SELECT owner FROM job_leases WHERE name = %s", (name,))
+        row = cursor.fetchone()
+        conn.commit()
+        return bool(row and row[0] == owner)
+        
+    except Exception as e:
+        logger.error(f"Error acquiring job lease {name}: {e}")
+        return False
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def cancel_scheduled_tasks(task_types, reference_id):
+    """Cancel pending timers of the given types for an object
+    
+    Args:
+        task_types (list): Timer types to cancel
+        reference_id (int): ID the timers belong to
+        
+    Returns:
+        list: IDs of the cancelled tasks (None if failed)
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        placeholders = ", ".join(["%s"] * len(task_types))
+        params = (reference_id,) + tuple(task_types)
+        cursor.execute(
+            f"""
+            SELECT id FROM scheduled_tasks
+            WHERE reference_id = %s AND status = 'pending'
+            AND task_type IN ({placeholders})
+            FOR UPDATE
+            """,
+            params
+        )
+        task_ids = [row[0] for row in cursor.fetchall()]
+        
+        if task_ids:
+            id_placeholders = ", ".join(["%s"] * len(task_ids))
+            cursor.execute(
+                f"""
+                UPDATE scheduled_tasks
+                SET status = 'cancelled', completed_at = NOW()
+                WHERE id IN ({id_placeholders}) AND status = 'pending'
+                """,
+                tuple(task_ids)
+            )
+        
+        conn.commit()
+        return task_ids
+        
+    except Exception as e:
+        logger.error(f"Error cancelling scheduled tasks for {reference_id}: {e}")
+        return None
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+# -------------------------
+# ORDER NOTIFICATION REGISTRY
+# -------------------------
+
+def record_order_notifications(order_id, notifications):
+    """Remember which artisans were offered an order and with which message
+    
+    Args:
+        order_id (int): ID of the order
+        notifications (list): (artisan_id, chat_id, message_id) tuples
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    if not notifications:
+        return True
+    
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        cursor.executemany(
+            """
+            INSERT INTO order_notifications (order_id, artisan_id, chat_id, message_id, status)
+            VALUES (%s, %s, %s, %s, 'sent')
+            ON DUPLICATE KEY UPDATE
+                chat_id = VALUES(chat_id), message_id = VALUES(message_id), status = 'sent'
+            """,
+            [(order_id, artisan_id, encrypt_data(str(chat_id)), message_id)
+             for artisan_id, chat_id, message_id in notifications]
+        )
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error recording notifications for order {order_id}: {e}")
+        return False
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def get_order_notifications(order_id, exclude_artisan_id=None, status='sent'):
+    """Get the offer messages sent for an order
+    
+    Args:
+        order_id (int): ID of the order
+        exclude_artisan_id (int, optional): Skip this artisan (e.g. the one who accepted)
+        status (str, optional): Only notifications in this status; None for all
+        
+    Returns:
+        list: Rows with artisan_id, chat_id (encrypted), message_id and status
+    """
+    query = """
+        SELECT artisan_id, chat_id, message_id, status
+        FROM order_notifications
+        WHERE order_id = %s
+    """
+    params = [order_id]
+    
+    if exclude_artisan_id is not None:
+        query += " AND artisan_id != %s"
+        params.append(exclude_artisan_id)
+    if status is not None:
+        query += " AND status = %s"
+        params.append(status)
+    
+    return execute_query(query, tuple(params), fetchall=True, dict_cursor=True) or []
+
+
+def mark_order_notifications(order_id, artisan_ids, status):
+    """Set the status of offer messages, e.g. 'withdrawn' once the order is taken
+    
+    Args:
+        order_id (int): ID of the order
+        artisan_ids (list): Artisans whose notifications change
+        status (str): New status
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    if not artisan_ids:
+        return True
+    
+    placeholders = ", ".join(["%s"] * len(artisan_ids))
+    query = f"""
+        UPDATE order_notifications
+        SET status = %s
+        WHERE order_id = %s AND artisan_id IN ({placeholders})
+    """
+    
+    try:
+        execute_query(query, (status, order_id) + tuple(artisan_ids), commit=True)
+        return True
+    except Exception as e:
+        logger.error(f"Error marking notifications of order {order_id} as {status}: {e}")
+        return False
+
+
+# -------------------------
+# FSM STORAGE
+# -------------------------
+
+def get_fsm_record(chat_id, user_id):
+    """Get the stored conversation state of a user
+    
+    Args:
+        chat_id (int): Telegram chat ID
+        user_id (int): Telegram user ID
+        
+    Returns:
+        tuple: (state, data, bucket) with data and bucket as stored
+               (encrypted JSON), or None if there is no live record
+    """
+    return execute_query(
+        """
+        SELECT state, data, bucket FROM fsm_states
+        WHERE state_key = %s AND expires_at > NOW()
+        """,
+        (fsm_state_key(chat_id, user_id),),
+        fetchone=True
+    )
+
+
+def save_fsm_record(chat_id, user_id, state, data, bucket, ttl_seconds):
+    """Insert or replace the conversation state of a user
+    
+    Args:
+        chat_id (int): Telegram chat ID
+        user_id (int): Telegram user ID
+        state (str): State name or None
+        data (str): Encrypted JSON of the state data, None when empty
+        bucket (str): Encrypted JSON of the bucket, None when empty
+        ttl_seconds (int): The record is treated as abandoned after this long
+    """
+    state_key = fsm_state_key(chat_id, user_id)
+    if state is None and data is None and bucket is None:
+        execute_query(
+            "DELETE FROM fsm_states WHERE state_key = %s",
+            (state_key,),
+            commit=True
+        )
+        return
+    
+    execute_query(
+        """
+        INSERT INTO fsm_states (state_key, state, data, bucket, expires_at)
+        VALUES (%s, %s, %s, %s, NOW() + INTERVAL %s SECOND)
+        ON DUPLICATE KEY UPDATE
+            state = VALUES(state),
+            data = VALUES(data),
+            bucket = VALUES(bucket),
+            expires_at = VALUES(expires_at)
+        """,
+        (state_key, state, data, bucket, int(ttl_seconds)),
+        commit=True
+    )
+
+
+def purge_expired_fsm_records(batch_size=5000):
+    """Delete abandoned conversation states
+    
+    Args:
+        batch_size (int): Rows deleted per statement
+        
+    Returns:
+        int: Number of deleted rows
+    """
+    deleted = 0
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        while True:
+            cursor.execute(
+                "DELETE FROM fsm_states WHERE expires_at <= NOW() LIMIT %s",
+                (int(batch_size),)
+            )
+            conn.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return deleted
+    except Exception as e:
+        logger.error(f"Error purging expired FSM states: {e}")
+        return deleted
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+# -------------------------
+# PAYMENT EVENTS
+# -------------------------
+
+# notification_log type -> timer type whose handler sends the notification
+PAYMENT_EVENT_TASKS = {
+    'invalid_receipt': 'payment_invalid_receipt',
+    'payment_transfer': 'payment_transfer',
+}
+
+
+def _add_payment_events(cursor, events):
+    """Queue payment notifications in the caller's transaction
+    
+    Each event is logged once per order in notification_log, the way the
+    old status poller deduplicated them, and gets an immediate
+    scheduled_tasks row that the timer service hands to the notification
+    handler. Events that are already logged are skipped.
+    
+    Args:
+        cursor: Cursor of the open transaction
+        events (list): (notification_type, order_id) tuples
+        
+    Returns:
+        list: Created tasks; pass them to _announce_payment_events after commit
+    """
+    if not events:
+        return []
+    
+    pending = []
+    for notification_type, order_id in events:
+        cursor.execute(
+            "SELECT 1 FROM notification_log WHERE notification_type = %s AND target_id = %s LIMIT 1",
+            (notification_type, order_id)
+        )
+        if cursor.fetchone() is None:
+            pending.append((notification_type, order_id))
+    if not pending:
+        return []
+    
+    cursor.executemany(
+        "INSERT INTO notification_log (notification_type, target_id, created_at) VALUES (%s, %s, CURRENT_TIMESTAMP)",
+        pending
+    )
+    
+    tasks = []
+    execution_time = datetime.now()
+    for notification_type, order_id in pending:
+        task_type = PAYMENT_EVENT_TASKS[notification_type]
+        cursor.execute(
+            """
+            INSERT INTO scheduled_tasks 
+            (task_type, reference_id, execution_time, status, additional_data, created_at)
+            VALUES (%s, %s, %s, 'pending', '{}', NOW())
+            """,
+            (task_type, order_id, execution_time)
+        )
+        tasks.append((cursor.lastrowid, task_type, order_id, execution_time))
+    return tasks
+
+
+def _announce_payment_events(tasks):
+    """Wake the timer service for payment events that were just committed"""
+    for task_id, task_type, order_id, execution_time in tasks:
+        _notify_scheduled_task_created(task_id, task_type, order_id, execution_time, {})
+
+
+def has_notification_log(notification_type, target_id):
+    """Check whether a notification was already logged for a target
+    
+    Args:
+        notification_type (str): Type, e.g. 'invalid_receipt'
+        target_id (int): Usually the order ID
+        
+    Returns:
+        bool: True if a notification_log row exists
+    """
+    try:
+        result = execute_query(
+            "SELECT 1 FROM notification_log WHERE notification_type = %s AND target_id = %s LIMIT 1",
+            (notification_type, target_id),
+            fetchone=True
+        )
+        return result is not None
+    except Exception as e:
+        logger.error(f"Error checking notification log: {e}")
+        return False
+
+
+def reconcile_payment_events(window_hours):
+    """Queue payment notifications that were missed by the write path
+    
+    Payment writes queue their own events, so this only catches rows
+    changed some other way (manual SQL, older code). Only payments updated
+    within the window are checked, through idx_order_payments_updated_at,
+    and each candidate is matched against idx_notification_log_target.
+    
+    Args:
+        window_hours (int): How far back to look at order_payments.updated_at
+        
+    Returns:
+        int: Number of events queued
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        # A row can match both conditions, each is its own event
+        cursor.execute(
+            """
+            SELECT 'payment_transfer', op.order_id
+            FROM order_payments op
+            WHERE op.updated_at >= NOW() - INTERVAL %s HOUR
+            AND op.admin_payment_completed = TRUE
+            UNION ALL
+            SELECT 'invalid_receipt', op.order_id
+            FROM order_payments op
+            WHERE op.updated_at >= NOW() - INTERVAL %s HOUR
+            AND op.receipt_verified = 0 AND op.payment_method != 'cash' AND op.receipt_file_id IS NOT NULL
+            """,
+            (int(window_hours), int(window_hours))
+        )
+        candidates = [(notification_type, order_id) for notification_type, order_id in cursor.fetchall()]
+        
+        tasks = _add_payment_events(cursor, candidates)
+        conn.commit()
+        _announce_payment_events(tasks)
+        return len(tasks)
+        
+    except Exception as e:
+        logger.error(f"Error reconciling payment events: {e}")
+        return 0
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+# -------------------------
+# NOTIFICATION OUTBOX
+# -------------------------
+
+_outbox_listeners = []
+
+
+def add_outbox_listener(callback):
+    """Call `callback()` after outbox messages are committed
+    
+    The callback runs on the committing thread (usually a DB worker).
+    """
+    if callback not in _outbox_listeners:
+        _outbox_listeners.append(callback)
+
+
+def remove_outbox_listener(callback):
+    """Stop calling a callback registered with add_outbox_listener"""
+    if callback in _outbox_listeners:
+        _outbox_listeners.remove(callback)
+
+
+def _notify_outbox_enqueued():
+    for callback in list(_outbox_listeners):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Outbox listener failed: {e}")
+
+
+def add_outbox_messages(cursor, messages):
+    """Queue outbox messages on the caller's cursor, inside its transaction
+    
+    The messages are only visible to the outbox worker once the caller
+    commits, so a notification is never sent for a rolled back change and
+    never lost for a committed one. Call _notify_outbox_enqueued() after the
+    commit to wake the worker.
+    
+    Args:
+        cursor: Cursor of the open transaction
+        messages (list): Dicts with idempotency_key, chat_id, method and payload
+        
+    Returns:
+        int: Number of new messages (repeated idempotency keys are skipped)
+    """
+    if not messages:
+        return 0
+    
+    cursor.executemany(
+        """
+        INSERT INTO notification_outbox (idempotency_key, chat_id, method, payload)
+        VALUES (%s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE id = id
+        """,
+        [
+            # Texts carry names and phone numbers; both are stored encrypted
+            (message['idempotency_key'], encrypt_data(str(message['chat_id'])), message.get('method', 'send_message'),
+             encrypt_data(json.dumps(message.get('payload') or {}, ensure_ascii=False)))
+            for message in messages
+        ]
+    )
+    return cursor.rowcount
+
+
+def _decrypt_outbox_message(message):
+    """Decrypt the chat_id and payload of an outbox row read as a dict
+
+    A row that does not decrypt (unknown key) gets chat_id None.
+    """
+    chat_id = decrypt_data(message['chat_id'])
+    payload = decrypt_data(message['payload'])
+    if not str(chat_id).lstrip('-').isdigit() or is_encrypted(payload):
+        message['chat_id'], message['payload'] = None, {}
+        return message
+    message['chat_id'] = int(chat_id)
+    message['payload'] = _decode_task_data(payload)
+    return message
+
+
+def enqueue_outbox_messages(messages):
+    """Queue outbox messages in their own transaction
+    
+    Args:
+        messages (list): Dicts with idempotency_key, chat_id, method and payload
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    if not messages:
+        return True
+    
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        add_outbox_messages(cursor, messages)
+        conn.commit()
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error queueing outbox messages: {e}")
+        return False
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+    
+    _notify_outbox_enqueued()
+    return True
+
+
+def claim_outbox_messages(token, limit, lease_seconds):
+    """Claim due outbox messages for delivery
+    
+    Pending messages whose next attempt is due are claimed, as are messages
+    whose sender died mid-delivery (expired lease). Each claim counts as an
+    attempt.
+    
+    Args:
+        token (str): Unique claim token of this batch
+        limit (int): Maximum number of messages
+        lease_seconds (int): Time the batch may take before others retake it
+        
+    Returns:
+        list: Claimed messages with id, idempotency_key, chat_id, method, payload and attempts
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor(dictionary=True)
+        
+        cursor.execute(
+            """
+            UPDATE notification_outbox
+            SET status = 'sending',
+                lease_owner = %s,
+                lease_expires_at = NOW() + INTERVAL %s SECOND,
+                attempts = attempts + 1
+            WHERE (status = 'pending' AND next_attempt_at <= NOW())
+            OR (status = 'sending' AND lease_expires_at < NOW())
+            ORDER BY next_attempt_at, id
+            LIMIT %s
+            """,
+            (token, int(lease_seconds), int(limit))
+        )
+        conn.commit()
+        if cursor.rowcount == 0:
+            return []
+        
+        cursor.execute(
+            """
+            SELECT id, idempotency_key, chat_id, method, payload, attempts
+            FROM notification_outbox
+            WHERE lease_owner = %s AND status = 'sending'
+            ORDER BY id
+            """,
+            (token,)
+        )
+        messages = [_decrypt_outbox_message(message) for message in cursor.fetchall()]
+        unreadable = [message['id'] for message in messages if message['chat_id'] is None]
+        if unreadable:
+            # Retrying will not bring the key back; keep them for the admin
+            logger.error(f"Outbox messages {unreadable} can not be decrypted, moving them to the dead letters")
+            placeholders = ", ".join(["%s"] * len(unreadable))
+            cursor.execute(
+                f"""
+                UPDATE notification_outbox
+                SET status = 'dead', last_error = 'decryption failed', lease_owner = NULL, lease_expires_at = NULL
+                WHERE id IN ({placeholders})
+                """,
+                tuple(unreadable)
+            )
+            conn.commit()
+        return [message for message in messages if message['chat_id'] is not None]
+        
+    except Exception as e:
+        logger.error(f"Error claiming outbox messages: {e}")
+        return []
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def complete_outbox_messages(message_ids, token):
+    """Mark delivered outbox messages as sent
+    
+    Args:
+        message_ids (list): IDs of the delivered messages
+        token (str): Claim token the messages were claimed with
+        
+    Returns:
+        int: Number of messages marked sent
+    """
+    if not message_ids:
+        return 0
+    
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        placeholders = ", ".join(["%s"] * len(message_ids))
+        cursor.execute(
+            f"""
+            UPDATE notification_outbox
+            SET status = 'sent', sent_at = NOW(), last_error = NULL,
+                lease_owner = NULL, lease_expires_at = NULL
+            WHERE id IN ({placeholders}) AND lease_owner = %s
+            """,
+            tuple(message_ids) + (token,)
+        )
+        conn.commit()
+        return cursor.rowcount
+        
+    except Exception as e:
+        logger.error(f"Error completing outbox messages: {e}")
+        return 0
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def fail_outbox_message(message_id, token, error, retry_in=None):
+    """Record a failed delivery
+    
+    Args:
+        message_id (int): ID of the message
+        token (str): Claim token the message was claimed with
+        error (str): Error to keep for the admin
+        retry_in (float, optional): Seconds until the next attempt; None moves
+            the message to the dead letters
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        if retry_in is None:
+            cursor.execute(
+                """
+                UPDATE notification_outbox
+                SET status = 'dead', last_error = %s,
+                    lease_owner = NULL, lease_expires_at = NULL
+                WHERE id = %s AND lease_owner = %s
+                """,
+                (str(error)[:1000], message_id, token)
+            )
+        else:
+            cursor.execute(
+                """
+                UPDATE notification_outbox
+                SET status = 'pending', last_error = %s,
+                    next_attempt_at = NOW() + INTERVAL %s SECOND,
+                    lease_owner = NULL, lease_expires_at = NULL
+                WHERE id = %s AND lease_owner = %s
+                """,
+                (str(error)[:1000], int(retry_in), message_id, token)
+            )
+        conn.commit()
+        return True
+        
+    except Exception as e:
+        logger.error(f"Error recording outbox failure for message {message_id}: {e}")
+        return False
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def get_outbox_summary():
+    """Count outbox messages per status
+    
+    Returns:
+        dict: status -> {"count": int, "oldest": datetime}
+    """
+    query = """
+        SELECT status, COUNT(*) AS count, MIN(created_at) AS oldest
+        FROM notification_outbox
+        GROUP BY status
+    """
+    
+    try:
+        rows = execute_query(query, fetchall=True, dict_cursor=True) or []
+        return {row['status']: {"count": row['count'], "oldest": row['oldest']} for row in rows}
+    except Exception as e:
+        logger.error(f"Error getting outbox summary: {e}")
+        return {}
+
+
+def get_dead_outbox_messages(limit=10):
+    """Get the most recent dead-letter messages
+    
+    Args:
+        limit (int): Maximum number of messages
+        
+    Returns:
+        list: Messages with id, idempotency_key, chat_id, method, payload, attempts, last_error and dates
+    """
+    query = """
+        SELECT id, idempotency_key, chat_id, method, payload, attempts, last_error, created_at, updated_at
+        FROM notification_outbox
+        WHERE status = 'dead'
+        ORDER BY updated_at DESC
+        LIMIT %s
+    """
+    
+    try:
+        messages = execute_query(query, (int(limit),), fetchall=True, dict_cursor=True) or []
+        return [_decrypt_outbox_message(message) for message in messages]
+    except Exception as e:
+        logger.error(f"Error getting dead outbox messages: {e}")
+        return []
+
+
+def requeue_dead_outbox_messages(message_ids=None):
+    """Give dead-letter messages a fresh set of attempts
+    
+    Args:
+        message_ids (list, optional): Messages to requeue; None requeues all
+        
+    Returns:
+        int: Number of requeued messages
+    """
+    query = """
+        UPDATE notification_outbox
+        SET status = 'pending', attempts = 0, next_attempt_at = NOW()
+        WHERE status = 'dead'
+    """
+    params = ()
+    if message_ids:
+        query += f" AND id IN ({', '.join(['%s'] * len(message_ids))})"
+        params = tuple(message_ids)
+    
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        conn.commit()
+        requeued = cursor.rowcount
+    except Exception as e:
+        logger.error(f"Error requeueing dead outbox messages: {e}")
+        return 0
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+    
+    if requeued:
+        _notify_outbox_enqueued()
+    return requeued
+
+
+def delete_dead_outbox_message(message_id):
+    """Drop a dead-letter message the admin decided not to resend
+    
+    Args:
+        message_id (int): ID of the message
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        execute_query(
+            "DELETE FROM notification_outbox WHERE id = %s AND status = 'dead'",
+            (message_id,),
+            commit=True
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Error deleting dead outbox message {message_id}: {e}")
+        return False
+
+
+def purge_sent_outbox_messages(retention_days, batch_size=5000):
+    """Delete delivered outbox messages older than the retention period
+    
+    Args:
+        retention_days (int): Days to keep sent messages
+        batch_size (int): Rows deleted per statement
+        
+    Returns:
+        int: Number of deleted messages
+    """
+    conn = None
+    deleted = 0
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        while True:
+            cursor.execute(
+                """
+                DELETE FROM notification_outbox
+                WHERE status = 'sent' AND sent_at < NOW() - INTERVAL %s DAY
+                LIMIT %s
+                """,
+                (int(retention_days), int(batch_size))
+            )
+            conn.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return deleted
+    except Exception as e:
+        logger.error(f"Error purging sent outbox messages: {e}")
+        return deleted
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+# -------------------------
+# BROADCAST JOBS
+# -------------------------
+
+# Recipients of each broadcast audience
+BROADCAST_AUDIENCES = {
+    "artisans": "artisans",
+    "customers": "customers",
+}
+
+
+def _decode_broadcast_job(job):
+    if job:
+        calls = job['calls']
+        if isinstance(calls, (bytes, bytearray)):
+            calls = calls.decode('utf-8')
+        job['calls'] = json.loads(calls) if isinstance(calls, str) else calls
+        job['failures'] = _decode_task_data(job.get('failures')) or {}
+    return job
+
+
+def create_broadcast_job(kind, audience, calls, priority, created_by=None, reference_id=None, sample_size=None):
+    """Create a broadcast and snapshot its recipients
+    
+    Args:
+        kind (str): What is broadcast, e.g. 'admin_message' or 'advertisement'
+        audience (str): 'artisans' or 'customers' (active users with a Telegram ID)
+        calls (list): Bot API calls sent to each recipient: {"method": str, "kwargs": dict}
+        priority (int): Telegram dispatcher lane
+        created_by (int, optional): Telegram ID of the admin who started it
+        reference_id (int, optional): Related object, e.g. the advertisement ID
+        sample_size (int, optional): Send to this many random recipients instead of all
+        
+    Returns:
+        dict: The created job, or None if failed
+    """
+    table = BROADCAST_AUDIENCES[audience]
+    
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            """
+            INSERT INTO broadcast_jobs (kind, audience, reference_id, calls, priority, created_by, failures)
+            VALUES (%s, %s, %s, %s, %s, %s, '{}')
+            """,
+            (kind, audience, reference_id, json.dumps(calls, ensure_ascii=False), priority, created_by)
+        )
+        job_id = cursor.lastrowid
+        
+        select_query = f"""
+            INSERT INTO broadcast_recipients (job_id, recipient_id)
+            SELECT %s, id FROM {table}
+            WHERE active = TRUE AND telegram_id IS NOT NULL
+        """
+        params = [job_id]
+        if sample_size:
+            select_query += " ORDER BY RAND() LIMIT %s"
+            params.append(int(sample_size))
+        cursor.execute(select_query, tuple(params))
+        total = cursor.rowcount
+        
+        cursor.execute("UPDATE broadcast_jobs SET total = %s WHERE id = %s", (total, job_id))
+        conn.commit()
+        
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        logger.error(f"Error creating broadcast job: {e}")
+        return None
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+    
+    return get_broadcast_job(job_id)
+
+
+def get_broadcast_job(job_id):
+    """Get a broadcast job
+    
+    Args:
+        job_id (int): ID of the job
+        
+    Returns:
+        dict: Job with decoded calls and failures, or None
+    """
+    try:
+        job = execute_query("SELECT * FROM broadcast_jobs WHERE id = %s", (job_id,), fetchone=True, dict_cursor=True)
+        return _decode_broadcast_job(job)
+    except Exception as e:
+        logger.error(f"Error getting broadcast job {job_id}: {e}")
+        return None
+
+
+def set_broadcast_progress_message(job_id, chat_id, message_id):
+    """Remember the admin message that shows a job's progress"""
+    try:
+        execute_query(
+            "UPDATE broadcast_jobs SET progress_chat_id = %s, progress_message_id = %s WHERE id = %s",
+            (chat_id, message_id, job_id),
+            commit=True
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Error saving progress message of broadcast {job_id}: {e}")
+        return False
+
+
+def claim_broadcast_job(token, lease_seconds):
+    """Claim the oldest running broadcast nobody is working on
+    
+    Jobs whose worker stopped checkpointing (crash, restart) are claimed
+    again once their lease expires and resume after their cursor.
+    
+    Args:
+        token (str): Unique claim token of this worker run
+        lease_seconds (int): Lease length from now
+        
+    Returns:
+        dict: The claimed job, or None
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor(dictionary=True)
+        
+        cursor.execute(
+            """
+            UPDATE broadcast_jobs
+            SET lease_owner = %s,
+                lease_expires_at = NOW() + INTERVAL %s SECOND,
+                started_at = COALESCE(started_at, NOW())
+            WHERE status = 'running'
+            AND (lease_owner IS NULL OR lease_expires_at < NOW())
+            ORDER BY id
+            LIMIT 1
+            """,
+            (token, int(lease_seconds))
+        )
+        conn.commit()
+        if cursor.rowcount == 0:
+            return None
+        
+        cursor.execute(
+            "SELECT * FROM broadcast_jobs WHERE lease_owner = %s AND status = 'running' LIMIT 1",
+            (token,)
+        )
+        return _decode_broadcast_job(cursor.fetchone())
+        
+    except Exception as e:
+        logger.error(f"Error claiming broadcast job: {e}")
+        return None
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def get_broadcast_recipients(job_id, audience, after_id, limit):
+    """Get the next page of a broadcast's recipients
+    
+    Args:
+        job_id (int): ID of the job
+        audience (str): 'artisans' or 'customers'
+        after_id (int): Cursor; only recipients with a larger ID are returned
+        limit (int): Page size
+        
+    Returns:
+        list: Rows with recipient_id, telegram_id (encrypted, None if the user
+              is gone) and active
+    """
+    table = BROADCAST_AUDIENCES[audience]
+    query = f"""
+        SELECT r.recipient_id, u.telegram_id, u.active
+        FROM broadcast_recipients r
+        LEFT JOIN {table} u ON u.id = r.recipient_id
+        WHERE r.job_id = %s AND r.recipient_id > %s
+        ORDER BY r.recipient_id
+        LIMIT %s
+    """
+    
+    return execute_query(query, (job_id, after_id, int(limit)), fetchall=True, dict_cursor=True) or []
+
+
+def checkpoint_broadcast_job(job_id, owner, cursor_id, sent, failed, failures, active_seconds, lease_seconds):
+    """Save progress after a batch and extend the lease
+    
+    Args:
+        job_id (int): ID of the job
+        owner (str): Claim token holding the lease
+        cursor_id (int): Last recipient handled
+        sent (int): Messages delivered in this batch
+        failed (int): Recipients that failed in this batch
+        failures (dict): Failure counts per reason for the whole job
+        active_seconds (float): Sending time of this batch
+        lease_seconds (int): New lease length from now
+        
+    Returns:
+        bool: True if the job is still running and owned by this worker
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute(
+            """
+            UPDATE broadcast_jobs
+            SET cursor_id = %s, sent = sent + %s, failed = failed + %s, failures = %s,
+                active_seconds = active_seconds + %s,
+                lease_expires_at = NOW() + INTERVAL %s SECOND
+            WHERE id = %s AND lease_owner = %s
+            """,
+            (cursor_id, sent, failed, json.dumps(failures), active_seconds, int(lease_seconds), job_id, owner)
+        )
+        saved = cursor.rowcount > 0
+        
+        cursor.execute("SELECT status FROM broadcast_jobs WHERE id = %s", (job_id,))
+        row = cursor.fetchone()
+        conn.commit()
+        return saved and bool(row) and row[0] == 'running'
+        
+    except Exception as e:
+        logger.error(f"Error checkpointing broadcast job {job_id}: {e}")
+        return False
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def finish_broadcast_job(job_id, owner, status='completed'):
+    """Mark a broadcast finished and release its lease
+    
+    Args:
+        job_id (int): ID of the job
+        owner (str): Claim token holding the lease
+        status (str): 'completed' or 'failed'
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    try:
+        execute_query(
+            """
+            UPDATE broadcast_jobs
+            SET status = %s, finished_at = NOW(), lease_owner = NULL, lease_expires_at = NULL
+            WHERE id = %s AND lease_owner = %s AND status = 'running'
+            """,
+            (status, job_id, owner),
+            commit=True
+        )
+    except Exception as e:
+        logger.error(f"Error finishing broadcast job {job_id}: {e}")
+        return False
+    
+    # The snapshot is only walked while the job runs
+    purge_broadcast_recipients(job_id)
+    return True
+
+
+def release_broadcast_job(job_id, owner):
+    """Give up the lease of a job (paused, cancelled or worker stopping)"""
+    try:
+        execute_query(
+            "UPDATE broadcast_jobs SET lease_owner = NULL, lease_expires_at = NULL WHERE id = %s AND lease_owner = %s",
+            (job_id, owner),
+            commit=True
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Error releasing broadcast job {job_id}: {e}")
+        return False
+
+
+def set_broadcast_job_status(job_id, status, from_statuses):
+    """Pause, resume or cancel a broadcast
+    
+    Args:
+        job_id (int): ID of the job
+        status (str): New status
+        from_statuses (list): Statuses the job may currently be in
+        
+    Returns:
+        bool: True if the status changed
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        placeholders = ", ".join(["%s"] * len(from_statuses))
+        finished = ", finished_at = NOW()" if status == 'cancelled' else ""
+        cursor.execute(
+            f"""
+            UPDATE broadcast_jobs
+            SET status = %s{finished}
+            WHERE id = %s AND status IN ({placeholders})
+            """,
+            (status, job_id) + tuple(from_statuses)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+        
+    except Exception as e:
+        logger.error(f"Error setting broadcast job {job_id} to {status}: {e}")
+        return False
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def purge_broadcast_recipients(job_id=None, batch_size=5000):
+    """Delete the recipient snapshots of completed, failed and cancelled broadcasts
+    
+    Args:
+        job_id (int, optional): Only purge this job (if it is finished)
+        batch_size (int): Rows deleted per statement
+        
+    Returns:
+        int: Number of deleted recipient rows
+    """
+    conn = None
+    deleted = 0
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        job_filter = "AND j.id = %s" if job_id is not None else ""
+        cursor.execute(
+            f"""
+            SELECT j.id FROM broadcast_jobs j
+            WHERE j.status IN ('completed', 'failed', 'cancelled') {job_filter}
+            AND EXISTS (SELECT 1 FROM broadcast_recipients r WHERE r.job_id = j.id)
+            """,
+            (job_id,) if job_id is not None else ()
+        )
+        job_ids = [row[0] for row in cursor.fetchall()]
+        
+        for finished_job_id in job_ids:
+            while True:
+                cursor.execute(
+                    "DELETE FROM broadcast_recipients WHERE job_id = %s LIMIT %s",
+                    (finished_job_id, int(batch_size))
+                )
+                conn.commit()
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    break
+        return deleted
+    except Exception as e:
+        logger.error(f"Error purging broadcast recipients: {e}")
+        return deleted
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def get_recent_broadcast_jobs(limit=10):
+    """Get the latest broadcasts, newest first"""
+    query = """
+        SELECT id, kind, audience, status, total, sent, failed, active_seconds, created_at, finished_at
+        FROM broadcast_jobs
+        ORDER BY id DESC
+        LIMIT %s
+    """
+    
+    try:
+        return execute_query(query, (int(limit),), fetchall=True, dict_cursor=True) or []
+    except Exception as e:
+        logger.error(f"Error getting recent broadcast jobs: {e}")
+        return []
+
+
+def delete_user_completely(user_type, user_id):
+    """
+    Completely delete a user and all related data from the database
+    
+    Args:
+        user_type (str): 'artisan' or 'customer'
+        user_id (int): ID of the user to delete
+        
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    conn = None
+    cursor = None
+    
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        # Start transaction
+        conn.autocommit = False
+        
+        # Get telegram_id before deletion for user_context cleanup
+        telegram_id_encrypted = None
+        if user_type == "artisan":
+            cursor.execute("SELECT telegram_id, created_at FROM artisans WHERE id = %s", (user_id,))
+        else:
+            cursor.execute("SELECT telegram_id, created_at FROM customers WHERE id = %s", (user_id,))
+            
+        # Admin stats buckets that count this user or their orders
+        stats_hours = set()
+        result = cursor.fetchone()
+        if result:
+            telegram_id_encrypted = result[0]
+            if result[1]:
+                stats_hours.add(_hour_start(result[1]))
+        
+        # Initialize order_ids list
+        order_ids = []
+        
+        if user_type == "artisan":
+            # Get orders associated with this artisan
+            cursor.execute("SELECT id, created_at FROM orders WHERE artisan_id = %s", (user_id,))
+            orders = cursor.fetchall()
+            order_ids = [row[0] for row in orders]
+            stats_hours.update(_hour_start(row[1]) for row in orders if row[1])
+            
+            # Delete from artisan-specific tables first
+            cursor.execute("DELETE FROM artisan_services WHERE artisan_id = %s", (user_id,))
+            cursor.execute("DELETE FROM artisan_price_ranges WHERE artisan_id = %s", (user_id,))
+            cursor.execute("DELETE FROM artisan_blocks WHERE artisan_id = %s", (user_id,))
+            cursor.execute("DELETE FROM fine_receipts WHERE artisan_id = %s", (user_id,))
+            cursor.execute("DELETE FROM order_notifications WHERE artisan_id = %s", (user_id,))
+            
+            # Delete reviews where this artisan is the provider
+            cursor.execute("DELETE FROM reviews WHERE artisan_id = %s", (user_id,))
+            
             # Delete order-related data for orders with this artisan
             for order_id in order_ids:
                 cursor.execute("DELETE FROM order_payments WHERE order_id = %s", (order_id,))
                 cursor.execute("DELETE FROM order_subservices WHERE order_id = %s", (order_id,))
                 cursor.execute("DELETE FROM receipt_verification_history WHERE order_id = %s", (order_id,))
                 cursor.execute("DELETE FROM reviews WHERE order_id = %s", (order_id,))
+                cursor.execute("DELETE FROM order_notifications WHERE order_id = %s", (order_id,))
                 
             # Delete orders
             cursor.execute("DELETE FROM orders WHERE artisan_id = %s", (user_id,))
@@ -2906,8 +5144,10 @@ def delete_user_completely(user_type, user_id):
             
         elif user_type == "customer":
             # Get orders associated with this customer
-            cursor.execute("SELECT id FROM orders WHERE customer_id = %s", (user_id,))
-            order_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT id, created_at FROM orders WHERE customer_id = %s", (user_id,))
+            orders = cursor.fetchall()
+            order_ids = [row[0] for row in orders]
+            stats_hours.update(_hour_start(row[1]) for row in orders if row[1])
             
             # Delete from customer-specific tables first
             cursor.execute("DELETE FROM customer_blocks WHERE customer_id = %s", (user_id,))
@@ -2921,6 +5161,7 @@ def delete_user_completely(user_type, user_id):
                 cursor.execute("DELETE FROM order_subservices WHERE order_id = %s", (order_id,))
                 cursor.execute("DELETE FROM receipt_verification_history WHERE order_id = %s", (order_id,))
                 cursor.execute("DELETE FROM reviews WHERE order_id = %s", (order_id,))
+                cursor.execute("DELETE FROM order_notifications WHERE order_id = %s", (order_id,))
                 
             # Delete orders
             cursor.execute("DELETE FROM orders WHERE customer_id = %s", (user_id,))
@@ -2932,9 +5173,15 @@ def delete_user_completely(user_type, user_id):
             logger.error(f"Invalid user_type: {user_type}")
             return False
         
-        # Delete from user_context table using telegram_id we got earlier
+        # Delete from user_context table using telegram_id we got earlier.
+        # Handlers key the context by the plain Telegram ID; buffered writes
+        # are dropped first so a later flush cannot bring the row back
+        context_keys = set()
         if telegram_id_encrypted:
-            cursor.execute("DELETE FROM user_context WHERE telegram_id = %s", (telegram_id_encrypted,))
+            context_keys = {str(telegram_id_encrypted), str(decrypt_data(telegram_id_encrypted))}
+        for key in context_keys:
+            user_context_store.discard(key)
+            cursor.execute("DELETE FROM user_context WHERE telegram_id = %s", (key,))
         
         # Delete any scheduled tasks related to this user's orders
         for order_id in order_ids:
@@ -2943,9 +5190,18 @@ def delete_user_completely(user_type, user_id):
         # Delete any notification logs related to this user
         cursor.execute("DELETE FROM notification_log WHERE target_id = %s", (user_id,))
         
+        # Take the deleted rows out of the admin statistics in the same transaction
+        for hour in sorted(stats_hours):
+            _rebuild_admin_stats(cursor, hour, hour + timedelta(hours=1))
+        
         # Commit transaction
         conn.commit()
         
+        if user_type == "artisan":
+            remove_from_artisan_geo_index(user_id)
+        for key in context_keys:
+            user_context_store.invalidate(key)
+        
         logger.info(f"Successfully deleted {user_type} with ID {user_id} and all related data")
         return True
         
@@ -2961,6 +5217,191 @@ def delete_user_completely(user_type, user_id):
         if conn and conn.is_connected():
             conn.close()
 
+# -------------------------
+# KEY ROTATION
+# -------------------------
+
+def start_reencryption(table, fingerprint, restart=False):
+    """Get the re-encryption checkpoint of a table for the current key
+    
+    A checkpoint left by an earlier primary key is reset, so every table is
+    walked again after each rotation.
+    
+    Args:
+        table (str): Table being re-encrypted
+        fingerprint (str): key_fingerprint of the primary key
+        restart (bool): Start over even if the table was already walked
+        
+    Returns:
+        dict: Checkpoint with last_key (list or None), counters and
+              finished_at, or None on error
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor(dictionary=True)
+        
+        if restart:
+            cursor.execute("DELETE FROM reencryption_progress WHERE table_name = %s", (table,))
+        # key_fingerprint is assigned last, so every IF still sees the old one
+        cursor.execute(
+            """
+            INSERT INTO reencryption_progress (table_name, key_fingerprint)
+            VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE
+                last_key = IF(key_fingerprint = VALUES(key_fingerprint), last_key, NULL),
+                scanned = IF(key_fingerprint = VALUES(key_fingerprint), scanned, 0),
+                rotated = IF(key_fingerprint = VALUES(key_fingerprint), rotated, 0),
+                failed = IF(key_fingerprint = VALUES(key_fingerprint), failed, 0),
+                active_seconds = IF(key_fingerprint = VALUES(key_fingerprint), active_seconds, 0),
+                started_at = IF(key_fingerprint = VALUES(key_fingerprint), started_at, NOW()),
+                finished_at = IF(key_fingerprint = VALUES(key_fingerprint), finished_at, NULL),
+                key_fingerprint = VALUES(key_fingerprint)
+            """,
+            (table, fingerprint)
+        )
+        cursor.execute("SELECT * FROM reencryption_progress WHERE table_name = %s", (table,))
+        progress = cursor.fetchone()
+        conn.commit()
+        
+        if progress and progress['last_key']:
+            progress['last_key'] = json.loads(progress['last_key'])
+        return progress
+        
+    except Exception as e:
+        logger.error(f"Error starting re-encryption of {table}: {e}")
+        return None
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def get_reencryption_batch(table, key_columns, columns, after_key, limit):
+    """Read the next rows to re-encrypt in key order (keyset pagination)
+    
+    Args:
+        table (str): Table name
+        key_columns (tuple): Primary key columns
+        columns (tuple): Encrypted columns
+        after_key (list): Key of the last row already handled, None to start
+        limit (int): Batch size
+        
+    Returns:
+        list: Tuples of the key columns followed by the encrypted columns
+        
+    Raises:
+        Error: On database errors, so a failed read is not taken for the end of the table
+    """
+    keys = ', '.join(key_columns)
+    params = []
+    where = ""
+    if after_key:
+        where = f"WHERE ({keys}) > ({', '.join(['%s'] * len(key_columns))})"
+        params.extend(after_key)
+    params.append(int(limit))
+    
+    query = f"SELECT {keys}, {', '.join(columns)} FROM {table} {where} ORDER BY {keys} LIMIT %s"
+    return execute_query(query, params, fetchall=True) or []
+
+
+def save_reencryption_batch(table, key_columns, updates, fingerprint, last_key, counts, active_seconds,
+                            search_entity=None, search_values=None):
+    """Write re-encrypted values and checkpoint the batch in one transaction
+    
+    Each value is only replaced if it still holds the ciphertext that was
+    read, so a write made by the bot in the meantime is kept.
+    
+    Args:
+        table (str): Table name
+        key_columns (tuple): Primary key columns
+        updates (list): (column, key values, old value, new value)
+        fingerprint (str): key_fingerprint of the primary key
+        last_key (list): Key of the last row of the batch
+        counts (dict): scanned, rotated and failed of this batch
+        active_seconds (float): Time spent on the batch
+        search_entity (str, optional): 'customer' / 'artisan' to rebuild the blind index
+        search_values (list, optional): (entity_id, {field: plaintext}) to reindex
+        
+    Returns:
+        int: Values written, or None on error
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        
+        written = 0
+        match = ' AND '.join(f"{column} = %s" for column in key_columns)
+        for column, key, old, new in updates:
+            cursor.execute(f"UPDATE {table} SET {column} = %s WHERE {match} AND {column} = %s", (new, *key, old))
+            written += cursor.rowcount
+        
+        if search_entity and search_values:
+            token_table, id_column = SEARCH_TOKEN_TABLES[search_entity]
+            ids = [entity_id for entity_id, _ in search_values]
+            cursor.execute(
+                f"DELETE FROM {token_table} WHERE {id_column} IN ({', '.join(['%s'] * len(ids))})",
+                ids
+            )
+            tokens = [
+                (entity_id, field, token)
+                for entity_id, values in search_values
+                for field, value in values.items()
+                for token in blind_index_tokens(field, value)
+            ]
+            if tokens:
+                cursor.executemany(
+                    f"INSERT IGNORE INTO {token_table} ({id_column}, field, token) VALUES (%s, %s, %s)",
+                    tokens
+                )
+        
+        cursor.execute(
+            """
+            UPDATE reencryption_progress
+            SET last_key = %s, scanned = scanned + %s, rotated = rotated + %s, failed = failed + %s,
+                active_seconds = active_seconds + %s
+            WHERE table_name = %s AND key_fingerprint = %s
+            """,
+            (json.dumps(list(last_key), default=str), counts['scanned'], counts['rotated'], counts['failed'],
+             active_seconds, table, fingerprint)
+        )
+        conn.commit()
+        return written
+        
+    except Exception as e:
+        logger.error(f"Error saving re-encrypted batch of {table}: {e}")
+        if conn:
+            conn.rollback()
+        return None
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+def finish_reencryption(table, fingerprint):
+    """Mark a table as fully re-encrypted under the current key"""
+    query = """
+        UPDATE reencryption_progress SET finished_at = NOW()
+        WHERE table_name = %s AND key_fingerprint = %s
+    """
+    try:
+        execute_query(query, (table, fingerprint), commit=True)
+        return True
+    except Exception as e:
+        logger.error(f"Error finishing re-encryption of {table}: {e}")
+        return False
+
+
+def get_reencryption_progress():
+    """Get the re-encryption checkpoints of every table
+    
+    Returns:
+        list: Checkpoint rows ordered by table name
+    """
+    query = "SELECT * FROM reencryption_progress ORDER BY table_name"
+    return execute_query(query, fetchall=True, dict_cursor=True) or []
+
+
 # =============================================================================
 # ADVERTISEMENT SYSTEM FUNCTIONS
 # =============================================================================
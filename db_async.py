@@ -0,0 +1,153 @@
+# db_async.py
+
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import db
+from config import DB_ASYNC_MODE, DB_EXECUTOR_WORKERS
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Supported values of DB_ASYNC_MODE
+MODE_EXECUTOR = "executor"  # Run queries on a bounded thread pool, the event loop stays free
+MODE_INLINE = "inline"      # Run queries directly on the event loop (legacy behaviour, for benchmarking)
+
+_executor = None
+_executor_lock = threading.Lock()
+_mode = DB_ASYNC_MODE if DB_ASYNC_MODE in (MODE_EXECUTOR, MODE_INLINE) else MODE_EXECUTOR
+
+# Per-mode call metrics
+_stats_lock = threading.Lock()
+_stats = {
+    MODE_EXECUTOR: {"calls": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0},
+    MODE_INLINE: {"calls": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0},
+}
+
+
+def _get_executor():
+    """Get the shared DB executor, creating it on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=DB_EXECUTOR_WORKERS,
+                    thread_name_prefix="db-worker"
+                )
+    return _executor
+
+
+def get_mode():
+    """Get the active async DB mode ('executor' or 'inline')"""
+    return _mode
+
+
+def set_mode(mode):
+    """Switch between executor offload and inline execution
+
+    Args:
+        mode (str): 'executor' or 'inline'
+    """
+    global _mode
+    if mode not in (MODE_EXECUTOR, MODE_INLINE):
+        raise ValueError(f"Unknown DB async mode: {mode}")
+    _mode = mode
+    logger.info(f"Async DB mode set to {mode}")
+
+
+def _record(mode, elapsed, failed):
+    with _stats_lock:
+        stats = _stats[mode]
+        stats["calls"] += 1
+        stats["total_seconds"] += elapsed
+        stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+        if failed:
+            stats["errors"] += 1
+
+
+def _timed_call(mode, func, args, kwargs):
+    started = time.perf_counter()
+    failed = False
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        failed = True
+        raise
+    finally:
+        _record(mode, time.perf_counter() - started, failed)
+
+
+async def run_db(func, *args, **kwargs):
+    """Await a blocking database function without stalling the event loop
+
+    Args:
+        func (callable): Synchronous function from db.py (or a wrapped variant)
+        *args: Positional arguments for func
+        **kwargs: Keyword arguments for func
+
+    Returns:
+        Mixed: Whatever func returns
+    """
+    mode = _mode
+    if mode == MODE_INLINE:
+        return _timed_call(mode, func, args, kwargs)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_executor(),
+        functools.partial(_timed_call, mode, func, args, kwargs)
+    )
+
+
+class _AsyncDB:
+    """Exposes every db.py function as an awaitable: `await adb.get_order_details(order_id)`"""
+
+    def __getattr__(self, name):
+        func = getattr(db, name)
+        if not callable(func):
+            raise AttributeError(f"db.{name} is not callable")
+
+        @functools.wraps(func)
+        async def call(*args, **kwargs):
+            return await run_db(func, *args, **kwargs)
+
+        # Cache so later lookups skip __getattr__
+        setattr(self, name, call)
+        return call
+
+
+adb = _AsyncDB()
+
+
+def get_async_db_stats():
+    """Get call counts and latency for both async DB modes
+
+    Returns:
+        dict: Metrics keyed by mode, plus the active mode
+    """
+    with _stats_lock:
+        result = {"mode": _mode}
+        for mode, stats in _stats.items():
+            calls = stats["calls"]
+            result[mode] = {
+                "calls": calls,
+                "errors": stats["errors"],
+                "avg_ms": round(stats["total_seconds"] / calls * 1000, 3) if calls else 0.0,
+                "max_ms": round(stats["max_seconds"] * 1000, 3),
+            }
+        return result
+
+
+def reset_async_db_stats():
+    """Reset the per-mode metrics, e.g. between benchmark runs"""
+    with _stats_lock:
+        for stats in _stats.values():
+            stats.update({"calls": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0})
@@ -1,7 +1,7 @@
 # db_encryption_wrapper.py
 
 from crypto_service import (
-    encrypt_data, decrypt_data, mask_name, mask_phone,
+    encrypt_data, decrypt_data, decrypt_many, mask_name, mask_phone,
     mask_card_number, mask_telegram_id, should_encrypt_field
 )
 import logging
@@ -37,9 +37,176 @@ def encrypt_dict_data(data_dict):
             
     return encrypted_dict
 
+def _decrypt_field(key, value, mask=False, decrypt=True):
+    """Decrypt (and optionally mask) one sensitive value
+    
+    Args:
+        key (str): Column name, decides the masking
+        value: Encrypted value
+        mask (bool): Whether to mask the value after decryption
+        decrypt (bool): False when the value is already plaintext and only needs masking
+        
+    Returns:
+        The decrypted value, or the original value if decryption fails
+    """
+    try:
+        # Try to decrypt the value
+        decrypted_value = decrypt_data(value) if decrypt else value
+    except Exception as e:
+        logger.error(f"Error decrypting field {key}: {e}")
+        # Handle different error cases
+        if isinstance(value, str):
+            if len(value) % 4 == 1:
+                logger.warning(f"Likely Base64 padding issue with field {key}. Length: {len(value)}")
+            elif "=" in value:
+                logger.warning(f"Field {key} has padding characters which should be stripped")
+        
+        # If decryption fails, keep the original value
+        return value
+    
+    # Apply masking if requested
+    if not mask:
+        return decrypted_value
+    try:
+        if key == 'name' or key.endswith('_name'):
+            return mask_name(decrypted_value)
+        elif key == 'phone' or key.endswith('_phone'):
+            return mask_phone(decrypted_value)
+        elif key == 'card_number':
+            return mask_card_number(decrypted_value)
+        elif key == 'telegram_id':
+            return mask_telegram_id(decrypted_value)
+        return decrypted_value
+    except Exception as mask_error:
+        # If masking fails, just use the decrypted value
+        logger.error(f"Error masking field {key}: {mask_error}")
+        return decrypted_value
+
+
+class DecryptedRow(dict):
+    """Row dict whose sensitive columns are decrypted on first access
+    
+    Holds the ciphertexts as returned by the query and replaces each one
+    with its decrypted (and, with mask=True, masked) value the first time it
+    is read, so callers that only look at id or status never pay for the
+    rest. It is a real dict: item access, get, items, values, dict(row),
+    {**row}, json.dumps and copies all see decrypted values.
+    """
+    
+    __slots__ = ('_pending', '_mask', '_decrypt')
+    
+    def __init__(self, data=(), mask=False, decrypt=True):
+        dict.__init__(self, data)
+        self._mask = mask
+        self._decrypt = decrypt
+        self._pending = {
+            key for key, value in dict.items(self)
+            if value is not None and should_encrypt_field(key)
+        }
+    
+    @property
+    def masked(self):
+        return self._mask
+    
+    def _resolve(self, key):
+        if key in self._pending:
+            self._pending.discard(key)
+            value = _decrypt_field(key, dict.__getitem__(self, key), self._mask, self._decrypt)
+            dict.__setitem__(self, key, value)
+    
+    def _resolve_all(self):
+        for key in list(self._pending):
+            self._resolve(key)
+    
+    def __getitem__(self, key):
+        self._resolve(key)
+        return dict.__getitem__(self, key)
+    
+    def get(self, key, default=None):
+        self._resolve(key)
+        return dict.get(self, key, default)
+    
+    def __setitem__(self, key, value):
+        # Values set by the caller are plaintext
+        self._pending.discard(key)
+        dict.__setitem__(self, key, value)
+    
+    def __delitem__(self, key):
+        self._pending.discard(key)
+        dict.__delitem__(self, key)
+    
+    # Overriding __iter__ makes dict(row) and {**row} go through keys() and
+    # __getitem__ instead of copying the raw storage
+    def __iter__(self):
+        return dict.__iter__(self)
+    
+    def items(self):
+        self._resolve_all()
+        return dict.items(self)
+    
+    def values(self):
+        self._resolve_all()
+        return dict.values(self)
+    
+    def pop(self, key, *default):
+        self._resolve(key)
+        return dict.pop(self, key, *default)
+    
+    def popitem(self):
+        self._resolve_all()
+        return dict.popitem(self)
+    
+    def setdefault(self, key, default=None):
+        self._resolve(key)
+        return dict.setdefault(self, key, default)
+    
+    def update(self, *args, **kwargs):
+        # Built once, so an iterator argument is not consumed twice
+        other = dict(*args, **kwargs)
+        for key in other:
+            self._pending.discard(key)
+        dict.update(self, other)
+    
+    def clear(self):
+        self._pending.clear()
+        dict.clear(self)
+    
+    def copy(self):
+        return dict(self.items())
+    
+    def __or__(self, other):
+        return dict(self.items()) | other
+    
+    def __ior__(self, other):
+        # dict.__ior__ would write over pending ciphertexts without dropping them
+        self.update(other)
+        return self
+    
+    def __eq__(self, other):
+        self._resolve_all()
+        return dict.__eq__(self, other)
+    
+    def __ne__(self, other):
+        self._resolve_all()
+        return dict.__ne__(self, other)
+    
+    __hash__ = None
+    
+    def __repr__(self):
+        self._resolve_all()
+        return dict.__repr__(self)
+    
+    def __reduce_ex__(self, protocol):
+        # copy / deepcopy / pickle produce a plain, fully decrypted dict
+        return (dict, (dict(self.items()),))
+
+
 def decrypt_dict_data(data_dict, mask=False):
     """Decrypt sensitive fields in a dictionary
     
+    Decryption is lazy: the returned DecryptedRow decrypts each sensitive
+    field the first time it is read.
+    
     Args:
         data_dict (dict): Dictionary with encrypted data
         mask (bool): Whether to mask sensitive data after decryption
@@ -49,49 +216,14 @@ def decrypt_dict_data(data_dict, mask=False):
     """
     if not isinstance(data_dict, dict):
         return data_dict
-        
-    decrypted_dict = {}
     
-    for key, value in data_dict.items():
-        if should_encrypt_field(key) and value is not None:
-            try:
-                # Try to decrypt the value
-                decrypted_value = decrypt_data(value)
-                
-                # Apply masking if requested
-                if mask:
-                    try:
-                        if key == 'name' or key.endswith('_name'):
-                            decrypted_dict[key] = mask_name(decrypted_value)
-                        elif key == 'phone' or key.endswith('_phone'):
-                            decrypted_dict[key] = mask_phone(decrypted_value)
-                        elif key == 'card_number':
-                            decrypted_dict[key] = mask_card_number(decrypted_value)
-                        elif key == 'telegram_id':
-                            decrypted_dict[key] = mask_telegram_id(decrypted_value)
-                        else:
-                            decrypted_dict[key] = decrypted_value
-                    except Exception as mask_error:
-                        # If masking fails, just use the decrypted value
-                        logger.error(f"Error masking field {key}: {mask_error}")
-                        decrypted_dict[key] = decrypted_value
-                else:
-                    decrypted_dict[key] = decrypted_value
-            except Exception as e:
-                logger.error(f"Error decrypting field {key}: {e}")
-                # Handle different error cases
-                if isinstance(value, str):
-                    if len(value) % 4 == 1:
-                        logger.warning(f"Likely Base64 padding issue with field {key}. Length: {len(value)}")
-                    elif "=" in value:
-                        logger.warning(f"Field {key} has padding characters which should be stripped")
-                
-                # If decryption fails, keep the original value
-                decrypted_dict[key] = value
-        else:
-            decrypted_dict[key] = value
-            
-    return decrypted_dict
+    if isinstance(data_dict, DecryptedRow):
+        # Already decrypted on access; never decrypt plaintext a second time
+        if data_dict.masked or not mask:
+            return data_dict
+        return DecryptedRow(data_dict.items(), mask=True, decrypt=False)
+    
+    return DecryptedRow(data_dict, mask)
 
 def decrypt_list_data(data_list, mask=False):
     """Decrypt sensitive data in a list of dictionaries
@@ -108,24 +240,71 @@ def decrypt_list_data(data_list, mask=False):
         
     return [decrypt_dict_data(item, mask) for item in data_list]
 
+def decrypt_list_bulk(data_list, mask=False):
+    """Decrypt every sensitive field of a list of dictionaries up front
+    
+    For screens that show all rows anyway: the ciphertexts of the whole list
+    go to crypto_service.decrypt_many in one call, which spreads large lists
+    over the decryption pool, instead of being decrypted one at a time as
+    they are read. Blocking; call it through run_db from handlers.
+    
+    Args:
+        data_list (list): List of dictionaries with encrypted data
+        mask (bool): Whether to mask sensitive data after decryption
+        
+    Returns:
+        list: List of DecryptedRow with every field already decrypted
+    """
+    rows = decrypt_list_data(data_list, mask)
+    if not isinstance(rows, list):
+        return rows
+    
+    pending = [
+        (row, key) for row in rows
+        if isinstance(row, DecryptedRow) and row._decrypt
+        for key in row._pending
+    ]
+    plaintexts = decrypt_many([dict.__getitem__(row, key) for row, key in pending])
+    for (row, key), plaintext in zip(pending, plaintexts):
+        row._pending.discard(key)
+        dict.__setitem__(row, key, _decrypt_field(key, plaintext, row._mask, decrypt=False))
+    return rows
+
 # Wrapper functions for database operations
 
+# Fields kept in the admin search blind index
+SEARCH_INDEX_FIELDS = ('name', 'phone')
+
+def index_search_fields(entity, entity_id, data):
+    """Refresh the blind index tokens of the searchable values in data
+    
+    Args:
+        entity (str): 'customer' or 'artisan'
+        entity_id (int): ID of the customer / artisan
+        data (dict): Plaintext values; fields that are missing or None are left alone
+    """
+    values = {key: data[key] for key in SEARCH_INDEX_FIELDS if data.get(key) is not None}
+    if not entity_id or not values:
+        return
+    from db import save_search_tokens
+    save_search_tokens(entity, entity_id, values)
+
 def wrap_create_customer(original_func):
-    """Wrap create_customer function to encrypt sensitive data"""
+    """Wrap create_customer function to index the plaintext name and phone"""
     def wrapper(telegram_id, name, phone=None, city=None):
         # Artıq db.py-də encrypt olunur, burada birbaşa orijinal funksiyanı çağır
-        return original_func(telegram_id, name, phone, city)
+        customer_id = original_func(telegram_id, name, phone, city)
+        index_search_fields('customer', customer_id, {'name': name, 'phone': phone})
+        return customer_id
     return wrapper
 
 def wrap_create_artisan(original_func):
-    """Wrap create_artisan function to encrypt sensitive data"""
+    """Wrap create_artisan function to index the plaintext name and phone"""
     def wrapper(telegram_id, name, phone, service, location=None, city=None, latitude=None, longitude=None):
-        # Encrypt sensitive data
-        encrypted_name = encrypt_data(name)
-        encrypted_phone = encrypt_data(phone)
-        
-        # Call original function with encrypted data
-        return original_func(telegram_id, encrypted_name, encrypted_phone, service, location, city, latitude, longitude)
+        # Artıq db.py-də encrypt olunur, burada birbaşa orijinal funksiyanı çağır
+        artisan_id = original_func(telegram_id, name, phone, service, location, city, latitude, longitude)
+        index_search_fields('artisan', artisan_id, {'name': name, 'phone': phone})
+        return artisan_id
     return wrapper
 
 def wrap_get_dict_function(original_func, decrypt=True, mask=False):
@@ -169,7 +348,13 @@ def wrap_update_customer_profile(original_func):
         encrypted_data = encrypt_dict_data(data)
         
         # Call original function with encrypted data
-        return original_func(telegram_id, encrypted_data)
+        success = original_func(telegram_id, encrypted_data)
+        if success and any(data.get(key) is not None for key in SEARCH_INDEX_FIELDS):
+            from db import get_customer_by_telegram_id
+            customer = get_customer_by_telegram_id(telegram_id)
+            if customer:
+                index_search_fields('customer', customer['id'], data)
+        return success
     return wrapper
 
 def wrap_update_artisan_profile(original_func):
@@ -179,7 +364,10 @@ def wrap_update_artisan_profile(original_func):
         encrypted_data = encrypt_dict_data(data)
         
         # Call original function with encrypted data
-        return original_func(artisan_id, encrypted_data)
+        success = original_func(artisan_id, encrypted_data)
+        if success:
+            index_search_fields('artisan', artisan_id, data)
+        return success
     return wrapper
 
 def wrap_save_payment_receipt(original_func):
@@ -0,0 +1,307 @@
+# db_pool.py
+
+import threading
+import time
+import logging
+import mysql.connector
+from mysql.connector import errors
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(errors.PoolError):
+    """Raised when no pooled connection becomes free within the wait timeout"""
+
+
+class _PoolEntry:
+    """Book-keeping for a physical connection owned by the pool"""
+
+    __slots__ = ('conn', 'created_at', 'last_used_at', 'autocommit_changed')
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used_at = now
+        self.autocommit_changed = False
+
+
+class PooledConnection:
+    """Connection handed out by ConnectionPool
+
+    Behaves like a regular mysql.connector connection, except that close()
+    returns the underlying connection to the pool instead of closing the socket.
+    """
+
+    def __init__(self, pool, entry):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_entry', entry)
+
+    def close(self):
+        """Return the connection to the pool"""
+        entry = self._entry
+        if entry is None:
+            return
+        object.__setattr__(self, '_entry', None)
+        self._pool._release(entry)
+
+    def is_connected(self):
+        """Whether this handle is still checked out
+
+        The pool validates connections on checkout, so unlike
+        MySQLConnection.is_connected() this does not ping the server.
+        """
+        return self._entry is not None
+
+    def __getattr__(self, name):
+        entry = object.__getattribute__(self, '_entry')
+        if entry is None:
+            raise errors.OperationalError("Connection has already been returned to the pool")
+        return getattr(entry.conn, name)
+
+    def __setattr__(self, name, value):
+        # Forward attribute writes such as `conn.autocommit = False`
+        entry = self._entry
+        if entry is None:
+            raise errors.OperationalError("Connection has already been returned to the pool")
+        if name == 'autocommit':
+            entry.autocommit_changed = True
+        setattr(entry.conn, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # Safety net for code paths that forget to close the connection
+        try:
+            if self._entry is not None:
+                logger.warning("Pooled connection was garbage collected without close(), returning it to the pool")
+                self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Thread-safe MySQL connection pool
+
+    Connections are opened lazily up to `size`. Callers that find the pool
+    exhausted wait up to `timeout` seconds for a connection to be returned.
+    Idle connections are pinged before reuse once they have been idle longer
+    than `health_check_interval`, and connections older than `recycle`
+    seconds are replaced with fresh ones.
+    """
+
+    def __init__(self, connect_kwargs, size=10, timeout=10.0, recycle=3600, health_check_interval=30):
+        """
+        Args:
+            connect_kwargs (dict): Arguments passed to mysql.connector.connect
+            size (int): Maximum number of open connections
+            timeout (float): Seconds to wait for a free connection before failing
+            recycle (int): Maximum connection age in seconds (0 disables recycling)
+            health_check_interval (int): Idle seconds after which a connection is pinged before reuse
+        """
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+
+        self._connect_kwargs = dict(connect_kwargs)
+        self._default_autocommit = bool(self._connect_kwargs.get('autocommit', False))
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.health_check_interval = health_check_interval
+
+        self._idle = []
+        self._in_use = 0
+        self._opening = 0
+        self._cond = threading.Condition(threading.Lock())
+
+        # Metrics
+        self._checkouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._failed_health_checks = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._total_wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._peak_in_use = 0
+
+    # -------------------------
+    # CHECKOUT / RETURN
+    # -------------------------
+
+    def get_connection(self):
+        """Borrow a connection from the pool
+
+        Returns:
+            PooledConnection: Connection whose close() returns it to the pool
+
+        Raises:
+            PoolTimeoutError: If no connection became free within the timeout
+            mysql.connector.Error: If a new connection could not be opened
+        """
+        entry = None
+
+        with self._cond:
+            deadline = None
+            wait_started = None
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if len(self._idle) + self._in_use + self._opening < self.size:
+                    # Reserve the slot, the socket is opened outside the lock
+                    self._opening += 1
+                    break
+
+                if deadline is None:
+                    wait_started = time.monotonic()
+                    deadline = wait_started + self.timeout
+                    self._waits += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._record_wait(time.monotonic() - wait_started)
+                    raise PoolTimeoutError(
+                        f"Timed out after {self.timeout}s waiting for a database connection "
+                        f"(pool size {self.size})"
+                    )
+                self._cond.wait(remaining)
+
+            if wait_started is not None:
+                self._record_wait(time.monotonic() - wait_started)
+
+            if entry is not None:
+                # Count the slot as busy while the connection is validated
+                self._in_use += 1
+
+        if entry is None:
+            try:
+                entry = _PoolEntry(self._connect())
+            finally:
+                with self._cond:
+                    self._opening -= 1
+                    self._cond.notify()
+            with self._cond:
+                self._in_use += 1
+        else:
+            try:
+                entry = self._validate(entry)
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+
+        with self._cond:
+            self._checkouts += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+
+        return PooledConnection(self, entry)
+
+    def _release(self, entry):
+        """Reset a returned connection and put it back on the idle list"""
+        conn = entry.conn
+        try:
+            # Never hand an open transaction or stale snapshot to the next borrower
+            if conn.in_transaction:
+                conn.rollback()
+            if entry.autocommit_changed:
+                conn.autocommit = self._default_autocommit
+                entry.autocommit_changed = False
+        except Exception as e:
+            logger.warning(f"Discarding pooled connection after failed reset: {e}")
+            self._close_quietly(conn)
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            return
+
+        entry.last_used_at = time.monotonic()
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append(entry)
+            self._cond.notify()
+
+    def _validate(self, entry):
+        """Recycle or health-check an idle connection before handing it out"""
+        now = time.monotonic()
+
+        if self.recycle and now - entry.created_at > self.recycle:
+            self._close_quietly(entry.conn)
+            with self._cond:
+                self._recycled += 1
+            return _PoolEntry(self._connect())
+
+        if now - entry.last_used_at > self.health_check_interval:
+            try:
+                entry.conn.ping(reconnect=False)
+            except Exception as e:
+                logger.warning(f"Pooled connection failed health check, reconnecting: {e}")
+                self._close_quietly(entry.conn)
+                with self._cond:
+                    self._failed_health_checks += 1
+                return _PoolEntry(self._connect())
+
+        return entry
+
+    def _connect(self):
+        conn = mysql.connector.connect(**self._connect_kwargs)
+        with self._cond:
+            self._created += 1
+        return conn
+
+    def _record_wait(self, waited):
+        self._total_wait_time += waited
+        self._max_wait_time = max(self._max_wait_time, waited)
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    # -------------------------
+    # MAINTENANCE AND METRICS
+    # -------------------------
+
+    def close_idle(self):
+        """Close every idle connection (checked-out ones stay open until returned)"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for entry in idle:
+            self._close_quietly(entry.conn)
+
+    def stats(self):
+        """Get pool occupancy and wait metrics
+
+        Returns:
+            dict: Snapshot of pool counters
+        """
+        with self._cond:
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "peak_in_use": self._peak_in_use,
+                "occupancy": round(self._in_use / self.size, 3),
+                "checkouts": self._checkouts,
+                "connections_created": self._created,
+                "connections_recycled": self._recycled,
+                "failed_health_checks": self._failed_health_checks,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "total_wait_seconds": round(self._total_wait_time, 4),
+                "avg_wait_seconds": round(self._total_wait_time / self._waits, 4) if self._waits else 0.0,
+                "max_wait_seconds": round(self._max_wait_time, 4),
+            }
@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 """
-Database setup script for Artisan Booking Bot.
-This script creates or updates the database schema for MySQL.
+Database schema for Artisan Booking Bot.
+The functions below are the steps of the versioned migrations in
+migrations.py; run this script (or migrations.py) to bring a MySQL
+database up to date.
 """
-import mysql.connector
 import logging
 from mysql.connector import Error
 from config import DB_CONFIG
@@ -15,565 +16,1026 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 def setup_database():
-    """Set up the database schema for MySQL"""
-    conn = None
-    try:
-        # Connect to the database
-        print("Connecting to MySQL database...")
-        conn = mysql.connector.connect(
-            host=DB_CONFIG["host"],
-            user=DB_CONFIG["user"],
-            password=DB_CONFIG["password"],
-            database=DB_CONFIG["database"],
-            port=DB_CONFIG.get("port", 3306)
-        )
-        
-        # Enable autocommit
-        conn.autocommit = True
-        cursor = conn.cursor()
-        
-        # Create tables if they don't exist
-        print("Creating tables if they don't exist...")
-        
-        # Customers table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS customers (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                telegram_id VARCHAR(255) UNIQUE,
-                name VARCHAR(500) NOT NULL,
-                phone TEXT,
-                city TEXT,
-                email TEXT,
-                address TEXT,
-                profile_complete TINYINT(1) DEFAULT 0,
-                active TINYINT(1) DEFAULT 1,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
-        
-        # Services table (main service categories)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS services (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                name VARCHAR(500) NOT NULL UNIQUE,
-                description TEXT,
-                icon TEXT,
-                active TINYINT(1) DEFAULT 1,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
-        
-        # Subservices table (specific services under categories)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS subservices (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                service_id INT NOT NULL,
-                name VARCHAR(500) NOT NULL,
-                description TEXT,
-                active TINYINT(1) DEFAULT 1,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE KEY unique_service_name (service_id, name),
-                FOREIGN KEY (service_id) REFERENCES services(id) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
-        
-        # Artisans table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS artisans (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                telegram_id VARCHAR(255) UNIQUE,
-                telegram_id_hash VARCHAR(255) UNIQUE,
-                name VARCHAR(500) NOT NULL,
-                phone TEXT NOT NULL,
-                service TEXT NOT NULL,
-                location TEXT,
-                city TEXT,
-                address TEXT,
-                latitude DOUBLE,
-                longitude DOUBLE,
-                rating DECIMAL(2,1) DEFAULT 0,
-                active TINYINT(1) DEFAULT 1,
-                blocked TINYINT(1) DEFAULT 0,
-                block_reason TEXT,
-                block_time DATETIME,
-                payment_card_number TEXT,
-                payment_card_holder TEXT,
-                profile_complete TINYINT(1) DEFAULT 0,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
-        
-        # Orders table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS orders (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                customer_id INT NOT NULL,
-                artisan_id INT,
-                service TEXT NOT NULL,
-                subservice TEXT,
-                date_time DATETIME NOT NULL,
-                note TEXT,
-                latitude DOUBLE,
-                longitude DOUBLE,
-                location_name TEXT,
-                price DECIMAL(10,2),
-                status VARCHAR(500) DEFAULT 'pending',
-                payment_method TEXT,
-                payment_status VARCHAR(500) DEFAULT 'unpaid',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                completed_at DATETIME,
-                FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE,
-                FOREIGN KEY (artisan_id) REFERENCES artisans(id) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
+    """Set up the database schema for MySQL
 
-        # Artisan blocks table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS artisan_blocks (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                artisan_id INT NOT NULL,
-                is_blocked TINYINT(1) DEFAULT 1,
-                block_reason TEXT,
-                required_payment DECIMAL(10,2) DEFAULT 0,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                unblocked_at DATETIME,
-                FOREIGN KEY (artisan_id) REFERENCES artisans(id) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
+    Applies the migrations this database has not seen yet; see migrations.py.
+    """
+    from migrations import run_migrations
+    return run_migrations()
 
-        # Scheduled tasks table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS scheduled_tasks (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                task_type TEXT NOT NULL,
-                reference_id INT NOT NULL,
-                execution_time DATETIME NOT NULL,
-                status VARCHAR(500) DEFAULT 'pending',
-                additional_data JSON,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                started_at DATETIME,
-                completed_at DATETIME
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
 
-        # Receipt verification history table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS receipt_verification_history (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                order_id INT NOT NULL,
-                is_verified TINYINT(1) NOT NULL,
-                attempt_number INT DEFAULT 1,
-                verified_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (order_id) REFERENCES orders(id)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
-        
-        # Artisan services table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS artisan_services (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                artisan_id INT NOT NULL,
-                subservice_id INT NOT NULL,
-                is_active TINYINT(1) DEFAULT 1,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE KEY unique_artisan_subservice (artisan_id, subservice_id),
-                FOREIGN KEY (artisan_id) REFERENCES artisans(id) ON DELETE CASCADE,
-                FOREIGN KEY (subservice_id) REFERENCES subservices(id) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
-        
-        # Artisan price ranges table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS artisan_price_ranges (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                artisan_id INT NOT NULL,
-                subservice_id INT NOT NULL,
-                min_price DECIMAL(10,2) NOT NULL,
-                max_price DECIMAL(10,2) NOT NULL,
-                is_active TINYINT(1) DEFAULT 1,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                UNIQUE KEY unique_artisan_subservice_price (artisan_id, subservice_id),
-                FOREIGN KEY (artisan_id) REFERENCES artisans(id) ON DELETE CASCADE,
-                FOREIGN KEY (subservice_id) REFERENCES subservices(id) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
-        
-        # Notification log table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS notification_log (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                notification_type TEXT NOT NULL,
-                target_id INT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
+def create_tables(cursor):
+    """Create the tables of the baseline schema"""
+    print("Creating tables if they don't exist...")
+    
+    # Customers table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS customers (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            telegram_id VARCHAR(255) UNIQUE,
+            name VARCHAR(500) NOT NULL,
+            phone TEXT,
+            city TEXT,
+            email TEXT,
+            address TEXT,
+            profile_complete TINYINT(1) DEFAULT 0,
+            active TINYINT(1) DEFAULT 1,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # Services table (main service categories)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS services (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(500) NOT NULL UNIQUE,
+            description TEXT,
+            icon TEXT,
+            active TINYINT(1) DEFAULT 1,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # Subservices table (specific services under categories)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS subservices (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            service_id INT NOT NULL,
+            name VARCHAR(500) NOT NULL,
+            description TEXT,
+            active TINYINT(1) DEFAULT 1,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY unique_service_name (service_id, name),
+            FOREIGN KEY (service_id) REFERENCES services(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # Artisans table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS artisans (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            telegram_id VARCHAR(255) UNIQUE,
+            telegram_id_hash VARCHAR(255) UNIQUE,
+            name VARCHAR(500) NOT NULL,
+            phone TEXT NOT NULL,
+            service TEXT NOT NULL,
+            location TEXT,
+            city TEXT,
+            address TEXT,
+            latitude DOUBLE,
+            longitude DOUBLE,
+            rating DECIMAL(2,1) DEFAULT 0,
+            active TINYINT(1) DEFAULT 1,
+            blocked TINYINT(1) DEFAULT 0,
+            block_reason TEXT,
+            block_time DATETIME,
+            payment_card_number TEXT,
+            payment_card_holder TEXT,
+            profile_complete TINYINT(1) DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # Orders table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            customer_id INT NOT NULL,
+            artisan_id INT,
+            service TEXT NOT NULL,
+            subservice TEXT,
+            date_time DATETIME NOT NULL,
+            note TEXT,
+            latitude DOUBLE,
+            longitude DOUBLE,
+            location_name TEXT,
+            price DECIMAL(10,2),
+            status VARCHAR(500) DEFAULT 'pending',
+            payment_method TEXT,
+            payment_status VARCHAR(500) DEFAULT 'unpaid',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            completed_at DATETIME,
+            FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE,
+            FOREIGN KEY (artisan_id) REFERENCES artisans(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
 
-        # Customer blocks table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS customer_blocks (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                customer_id INT NOT NULL,
-                is_blocked TINYINT(1) DEFAULT 1,
-                block_reason TEXT,
-                required_payment DECIMAL(10,2) DEFAULT 0,
-                block_until DATETIME,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                unblocked_at DATETIME,
-                FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
-        
-        # Order subservices table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS order_subservices (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                order_id INT NOT NULL,
-                subservice_id INT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE KEY unique_order_subservice (order_id, subservice_id),
-                FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
-                FOREIGN KEY (subservice_id) REFERENCES subservices(id) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
-        
-        # Order payments table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS order_payments (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                order_id INT NOT NULL UNIQUE,
-                amount DECIMAL(10,2) NOT NULL,
-                admin_fee DECIMAL(10,2) NOT NULL,
-                artisan_amount DECIMAL(10,2) NOT NULL,
-                payment_status TEXT,
-                payment_method TEXT,
-                payment_date DATETIME,
-                receipt_file_id TEXT,
-                receipt_uploaded_at DATETIME,
-                receipt_verified TINYINT(1) DEFAULT NULL,
-                admin_payment_deadline DATETIME,
-                admin_payment_completed TINYINT(1) DEFAULT 0,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
-        
-        # Fine receipts table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS fine_receipts (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                artisan_id INT NOT NULL,
-                file_id TEXT NOT NULL,
-                status VARCHAR(500) DEFAULT 'pending',
-                verified_by INT,
-                verified_at DATETIME,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (artisan_id) REFERENCES artisans(id) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
-        
-        # Reviews table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS reviews (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                order_id INT NOT NULL,
-                customer_id INT NOT NULL,
-                artisan_id INT NOT NULL,
-                rating INT NOT NULL CHECK (rating BETWEEN 1 AND 5),
-                comment TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
-                FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE,
-                FOREIGN KEY (artisan_id) REFERENCES artisans(id) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
-        
-        # User context table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_context (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                telegram_id VARCHAR(255) UNIQUE,
-                context_data JSON,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
-        
-        # Artisan advertisements table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS artisan_advertisements (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                artisan_id INT NOT NULL,
-                package_type ENUM('bronze', 'silver', 'gold') NOT NULL,
-                payment_amount DECIMAL(10,2) NOT NULL,
-                receipt_photo_id TEXT,
-                advertisement_photos JSON,
-                receipt_status ENUM('pending', 'accepted', 'rejected') DEFAULT 'pending',
-                advertisement_status ENUM('pending', 'accepted', 'rejected') DEFAULT 'pending',
-                photos_status ENUM('pending', 'accepted', 'rejected') DEFAULT 'pending',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                FOREIGN KEY (artisan_id) REFERENCES artisans(id) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        ''')
-        
-        # Create indexes for better performance
-        print("Creating indexes...")
-        
-        # Customer indexes
-        try:
-            # Customer indexes
-            cursor.execute('CREATE INDEX idx_customers_telegram ON customers (telegram_id)')
-            cursor.execute('CREATE INDEX idx_customers_phone ON customers (phone(20))')  # burada uzunluq təyin edilib
-            cursor.execute('CREATE INDEX idx_customers_city ON customers (city(20))')    # burada uzunluq təyin edilib
-        except Error as e:
-            logger.error(f"Error creating customer indexes: {e}")
-        
+    # Artisan blocks table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS artisan_blocks (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            artisan_id INT NOT NULL,
+            is_blocked TINYINT(1) DEFAULT 1,
+            block_reason TEXT,
+            required_payment DECIMAL(10,2) DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            unblocked_at DATETIME,
+            FOREIGN KEY (artisan_id) REFERENCES artisans(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+
+    # Scheduled tasks table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scheduled_tasks (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            task_type TEXT NOT NULL,
+            reference_id INT NOT NULL,
+            execution_time DATETIME NOT NULL,
+            status VARCHAR(500) DEFAULT 'pending',
+            additional_data JSON,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            started_at DATETIME,
+            completed_at DATETIME,
+            lease_owner VARCHAR(100),
+            lease_expires_at DATETIME,
+            attempts INT NOT NULL DEFAULT 0
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+
+    # Cluster-wide leases of recurring jobs that must run on one worker at a time
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_leases (
+            name VARCHAR(100) PRIMARY KEY,
+            owner VARCHAR(100) NOT NULL,
+            lease_expires_at DATETIME NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+
+    # New-order offers sent to artisans, so they can be withdrawn in place later
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_notifications (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            order_id INT NOT NULL,
+            artisan_id INT NOT NULL,
+            chat_id BIGINT NOT NULL,
+            message_id BIGINT NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'sent',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            UNIQUE KEY unique_order_artisan (order_id, artisan_id),
+            INDEX idx_order_notifications_artisan (artisan_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+
+    # Transactional outbox of user notifications, drained by outbox_service
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            idempotency_key VARCHAR(191) NOT NULL,
+            chat_id BIGINT NOT NULL,
+            method VARCHAR(50) NOT NULL DEFAULT 'send_message',
+            payload JSON NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            attempts INT NOT NULL DEFAULT 0,
+            next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            lease_owner VARCHAR(150),
+            lease_expires_at DATETIME,
+            last_error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            sent_at DATETIME,
+            UNIQUE KEY unique_outbox_idempotency_key (idempotency_key),
+            INDEX idx_outbox_due (status, next_attempt_at),
+            INDEX idx_outbox_lease (status, lease_expires_at),
+            INDEX idx_outbox_owner (lease_owner)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+
+    # Resumable broadcasts: one row per job, progress is checkpointed after every batch
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            kind VARCHAR(50) NOT NULL,
+            audience VARCHAR(20) NOT NULL,
+            reference_id INT,
+            calls JSON NOT NULL,
+            priority TINYINT NOT NULL DEFAULT 1,
+            status VARCHAR(20) NOT NULL DEFAULT 'running',
+            total INT NOT NULL DEFAULT 0,
+            cursor_id INT NOT NULL DEFAULT 0,
+            sent INT NOT NULL DEFAULT 0,
+            failed INT NOT NULL DEFAULT 0,
+            failures JSON,
+            active_seconds DOUBLE NOT NULL DEFAULT 0,
+            created_by BIGINT,
+            progress_chat_id BIGINT,
+            progress_message_id BIGINT,
+            lease_owner VARCHAR(100),
+            lease_expires_at DATETIME,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            started_at DATETIME,
+            finished_at DATETIME,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_broadcast_jobs_status (status, lease_expires_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+
+    # Audience snapshot of each broadcast, walked in recipient_id order
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            job_id INT NOT NULL,
+            recipient_id INT NOT NULL,
+            PRIMARY KEY (job_id, recipient_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+
+    # Conversation (FSM) states; data and bucket are encrypted JSON
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            chat_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            state VARCHAR(255),
+            data MEDIUMTEXT,
+            bucket TEXT,
+            expires_at DATETIME NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (chat_id, user_id),
+            INDEX idx_fsm_states_expires (expires_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+
+    # Receipt verification history table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS receipt_verification_history (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            order_id INT NOT NULL,
+            is_verified TINYINT(1) NOT NULL,
+            attempt_number INT DEFAULT 1,
+            verified_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (order_id) REFERENCES orders(id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # Artisan services table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS artisan_services (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            artisan_id INT NOT NULL,
+            subservice_id INT NOT NULL,
+            is_active TINYINT(1) DEFAULT 1,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY unique_artisan_subservice (artisan_id, subservice_id),
+            FOREIGN KEY (artisan_id) REFERENCES artisans(id) ON DELETE CASCADE,
+            FOREIGN KEY (subservice_id) REFERENCES subservices(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # Artisan price ranges table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS artisan_price_ranges (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            artisan_id INT NOT NULL,
+            subservice_id INT NOT NULL,
+            min_price DECIMAL(10,2) NOT NULL,
+            max_price DECIMAL(10,2) NOT NULL,
+            is_active TINYINT(1) DEFAULT 1,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            UNIQUE KEY unique_artisan_subservice_price (artisan_id, subservice_id),
+            FOREIGN KEY (artisan_id) REFERENCES artisans(id) ON DELETE CASCADE,
+            FOREIGN KEY (subservice_id) REFERENCES subservices(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # Notification log table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notification_log (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            notification_type TEXT NOT NULL,
+            target_id INT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+
+    # Customer blocks table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS customer_blocks (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            customer_id INT NOT NULL,
+            is_blocked TINYINT(1) DEFAULT 1,
+            block_reason TEXT,
+            required_payment DECIMAL(10,2) DEFAULT 0,
+            block_until DATETIME,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            unblocked_at DATETIME,
+            FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # Order subservices table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_subservices (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            order_id INT NOT NULL,
+            subservice_id INT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY unique_order_subservice (order_id, subservice_id),
+            FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+            FOREIGN KEY (subservice_id) REFERENCES subservices(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # Order payments table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_payments (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            order_id INT NOT NULL UNIQUE,
+            amount DECIMAL(10,2) NOT NULL,
+            admin_fee DECIMAL(10,2) NOT NULL,
+            artisan_amount DECIMAL(10,2) NOT NULL,
+            payment_status TEXT,
+            payment_method TEXT,
+            payment_date DATETIME,
+            receipt_file_id TEXT,
+            receipt_uploaded_at DATETIME,
+            receipt_verified TINYINT(1) DEFAULT NULL,
+            admin_payment_deadline DATETIME,
+            admin_payment_completed TINYINT(1) DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # Fine receipts table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fine_receipts (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            artisan_id INT NOT NULL,
+            file_id TEXT NOT NULL,
+            status VARCHAR(500) DEFAULT 'pending',
+            verified_by INT,
+            verified_at DATETIME,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (artisan_id) REFERENCES artisans(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # Reviews table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            order_id INT NOT NULL,
+            customer_id INT NOT NULL,
+            artisan_id INT NOT NULL,
+            rating INT NOT NULL CHECK (rating BETWEEN 1 AND 5),
+            comment TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+            FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE,
+            FOREIGN KEY (artisan_id) REFERENCES artisans(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # User context table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_context (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            telegram_id VARCHAR(255) UNIQUE,
+            context_data JSON,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # Artisan advertisements table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS artisan_advertisements (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            artisan_id INT NOT NULL,
+            package_type ENUM('bronze', 'silver', 'gold') NOT NULL,
+            payment_amount DECIMAL(10,2) NOT NULL,
+            receipt_photo_id TEXT,
+            advertisement_photos JSON,
+            receipt_status ENUM('pending', 'accepted', 'rejected') DEFAULT 'pending',
+            advertisement_status ENUM('pending', 'accepted', 'rejected') DEFAULT 'pending',
+            photos_status ENUM('pending', 'accepted', 'rejected') DEFAULT 'pending',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            FOREIGN KEY (artisan_id) REFERENCES artisans(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # Admin dashboard rollups (one row per hour and service, '' = not service specific)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS admin_stats_hourly (
+            bucket_start DATETIME NOT NULL,
+            service VARCHAR(100) NOT NULL DEFAULT '',
+            new_customers INT NOT NULL DEFAULT 0,
+            new_artisans INT NOT NULL DEFAULT 0,
+            orders_created INT NOT NULL DEFAULT 0,
+            orders_completed INT NOT NULL DEFAULT 0,
+            orders_cancelled INT NOT NULL DEFAULT 0,
+            commission_revenue DECIMAL(12,2) NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (bucket_start, service)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+
+
+def create_request_path_tables(cursor):
+    """Create the tables that handlers used to create on first use"""
+    # Artisan skip next order table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS artisan_skip_next_order (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            artisan_id INT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            skipped BOOLEAN DEFAULT FALSE,
+            FOREIGN KEY (artisan_id) REFERENCES artisans(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # Customer fine receipts table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS customer_fine_receipts (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            customer_id INT NOT NULL,
+            file_id VARCHAR(255) NOT NULL,
+            status VARCHAR(20) DEFAULT 'pending',
+            verified_by INT,
+            verified_at DATETIME,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # Refund requests table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS refund_requests (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            order_id INT NOT NULL,
+            amount DECIMAL(10, 2) NOT NULL,
+            reason TEXT NOT NULL,
+            status VARCHAR(20) DEFAULT 'pending',
+            card_number VARCHAR(50),
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            completed_by INT,
+            completed_at DATETIME,
+            FOREIGN KEY (order_id) REFERENCES orders(id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    # Payment card details table (card data is stored encrypted)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payment_card_details (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            order_id INT NOT NULL,
+            card_number TEXT NOT NULL,
+            card_holder TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    
+    ensure_index(cursor, 'artisan_skip_next_order', 'idx_artisan_skip_next_order_artisan', 'artisan_id, skipped')
+
+
+def create_indexes(cursor):
+    """Create the baseline indexes that are missing
+
+    The original setup created these with plain CREATE INDEX and stopped at
+    the first one that already existed, so older databases may lack some.
+    """
+    print("Creating indexes...")
+    
+    # Customer indexes
+    ensure_column(cursor, 'customers', 'telegram_id_hash', 'VARCHAR(255)')
+    ensure_index(cursor, 'customers', 'idx_customers_telegram', 'telegram_id')
+    ensure_index(cursor, 'customers', 'idx_customers_phone', 'phone(20)')  # burada uzunluq təyin edilib
+    ensure_index(cursor, 'customers', 'idx_customers_city', 'city(20)')    # burada uzunluq təyin edilib
+    
+    # Artisan indexes
+    ensure_index(cursor, 'artisans', 'idx_artisans_telegram', 'telegram_id')
+    ensure_index(cursor, 'artisans', 'idx_artisans_phone', 'phone(20)')     # burada uzunluq təyin edilib
+    ensure_index(cursor, 'artisans', 'idx_artisans_city', 'city(20)')       # burada uzunluq təyin edilib
+    ensure_index(cursor, 'artisans', 'idx_artisans_service', 'service(20)') # burada uzunluq təyin edilib
+    ensure_index(cursor, 'artisans', 'idx_artisans_blocked', 'blocked')
+    
+    # Services indexes
+    ensure_index(cursor, 'services', 'idx_services_active', 'active')
+    ensure_index(cursor, 'subservices', 'idx_subservices_service', 'service_id')
+    ensure_index(cursor, 'subservices', 'idx_subservices_active', 'active')
+    
+    # Order indexes - TEXT sütunlar üçün açar uzunluğu əlavə et
+    ensure_index(cursor, 'orders', 'idx_orders_customer', 'customer_id')
+    ensure_index(cursor, 'orders', 'idx_orders_artisan', 'artisan_id')
+    ensure_index(cursor, 'orders', 'idx_orders_status', 'status(20)')
+    ensure_index(cursor, 'orders', 'idx_orders_datetime', 'date_time')
+    ensure_index(cursor, 'orders', 'idx_orders_payment_status', 'payment_status(20)')
+    ensure_index(cursor, 'orders', 'idx_orders_payment_method', 'payment_method(20)')
+    
+    # Payment indexes
+    ensure_index(cursor, 'order_payments', 'idx_order_payments_status', 'payment_status(20)')
+    ensure_index(cursor, 'order_payments', 'idx_order_payments_method', 'payment_method(20)')
+    ensure_index(cursor, 'fine_receipts', 'idx_fine_receipts_artisan', 'artisan_id')
+    ensure_index(cursor, 'fine_receipts', 'idx_fine_receipts_status', 'status(20)')
+    
+    # Advertisement indexes
+    ensure_index(cursor, 'artisan_advertisements', 'idx_artisan_advertisements_artisan', 'artisan_id')
+    ensure_index(cursor, 'artisan_advertisements', 'idx_artisan_advertisements_package', 'package_type')
+    ensure_index(cursor, 'artisan_advertisements', 'idx_artisan_advertisements_receipt_status', 'receipt_status')
+    ensure_index(cursor, 'artisan_advertisements', 'idx_artisan_advertisements_status', 'advertisement_status')
+    ensure_index(cursor, 'artisan_advertisements', 'idx_artisan_advertisements_photos_status', 'photos_status')
+
+
+def backfill_order_statuses(cursor):
+    """Give orders created before the status columns had defaults a status"""
+    cursor.execute("UPDATE orders SET status = 'pending' WHERE status IS NULL")
+    cursor.execute("UPDATE orders SET payment_status = 'unpaid' WHERE payment_status IS NULL")
+
+
+def seed_services(cursor):
+    """Insert the sample services and subservices that are missing"""
+    print("Adding sample services if they don't exist...")
+    service_data = [
+        ('Santexnik', 'Su və kanalizasiya sistemləri ilə bağlı xidmətlər'),
+        ('Elektrik', 'Elektrik sistemləri ilə bağlı xidmətlər'),
+        ('Kombi ustası', 'İstilik sistemləri ilə bağlı xidmətlər'),
+        ('Kondisioner ustası', 'Kondisioner sistemləri ilə bağlı xidmətlər'),
+        ('Mebel ustası', 'Mebel quraşdırılması və təmiri xidmətləri'),
+        ('Qapı-pəncərə ustası', 'Qapı və pəncərə sistemləri ilə bağlı xidmətlər'),
+        ('Təmir-bərpa ustası', 'Ev təmiri və bərpası xidmətləri'),
+        ('Bağban', 'Bağ və həyət işləri ilə bağlı xidmətlər')
+    ]
+    
+    for service_name, service_desc in service_data:
         try:
-            # Artisan indexes
-            cursor.execute('CREATE INDEX idx_artisans_telegram ON artisans (telegram_id)')
-            cursor.execute('CREATE INDEX idx_artisans_phone ON artisans (phone(20))')     # burada uzunluq təyin edilib
-            cursor.execute('CREATE INDEX idx_artisans_city ON artisans (city(20))')       # burada uzunluq təyin edilib
-            cursor.execute('CREATE INDEX idx_artisans_service ON artisans (service(20))') # burada uzunluq təyin edilib
-            cursor.execute('CREATE INDEX idx_artisans_location ON artisans (latitude, longitude)')
-            cursor.execute('CREATE INDEX idx_artisans_blocked ON artisans (blocked)')
+            cursor.execute(
+                "INSERT IGNORE INTO services (name, description) VALUES (%s, %s)",
+                (service_name, service_desc)
+            )
         except Error as e:
-            logger.error(f"Error creating artisan indexes: {e}")
-        
-        # Services indexes - TEXT sütunlar üçün açar uzunluğu əlavə et
-        cursor.execute('CREATE INDEX idx_services_active ON services (active)')
-        cursor.execute('CREATE INDEX idx_subservices_service ON subservices (service_id)')
-        cursor.execute('CREATE INDEX idx_subservices_active ON subservices (active)')
-        
-        # Order indexes - TEXT sütunlar üçün açar uzunluğu əlavə et
-        cursor.execute('CREATE INDEX idx_orders_customer ON orders (customer_id)')
-        cursor.execute('CREATE INDEX idx_orders_artisan ON orders (artisan_id)')
-        cursor.execute('CREATE INDEX idx_orders_status ON orders (status(20))')  # TEXT sütunu üçün uzunluq əlavə edildi
-        cursor.execute('CREATE INDEX idx_orders_datetime ON orders (date_time)')
-        cursor.execute('CREATE INDEX idx_orders_payment_status ON orders (payment_status(20))')  # TEXT sütunu üçün uzunluq əlavə edildi
-        cursor.execute('CREATE INDEX idx_orders_payment_method ON orders (payment_method(20))')  # TEXT sütunu üçün uzunluq əlavə edildi
-        
-        # Payment indexes - TEXT sütunlar üçün açar uzunluğu əlavə et
-        cursor.execute('CREATE INDEX idx_order_payments_status ON order_payments (payment_status(20))')  # TEXT sütunu üçün uzunluq əlavə edildi
-        cursor.execute('CREATE INDEX idx_order_payments_method ON order_payments (payment_method(20))')  # TEXT sütunu üçün uzunluq əlavə edildi
-        cursor.execute('CREATE INDEX idx_fine_receipts_artisan ON fine_receipts (artisan_id)')
-        cursor.execute('CREATE INDEX idx_fine_receipts_status ON fine_receipts (status(20))')  # TEXT sütunu üçün uzunluq əlavə edildi
-        
-        # Advertisement indexes
-        cursor.execute('CREATE INDEX idx_artisan_advertisements_artisan ON artisan_advertisements (artisan_id)')
-        cursor.execute('CREATE INDEX idx_artisan_advertisements_package ON artisan_advertisements (package_type)')
-        cursor.execute('CREATE INDEX idx_artisan_advertisements_receipt_status ON artisan_advertisements (receipt_status)')
-        cursor.execute('CREATE INDEX idx_artisan_advertisements_status ON artisan_advertisements (advertisement_status)')
-        cursor.execute('CREATE INDEX idx_artisan_advertisements_photos_status ON artisan_advertisements (photos_status)')
-        
-        # Update existing orders status if needed
-        cursor.execute("UPDATE orders SET status = 'pending' WHERE status IS NULL")
-        cursor.execute("UPDATE orders SET payment_status = 'unpaid' WHERE payment_status IS NULL")
-        
-        # Insert sample services if they don't exist
-        print("Adding sample services if they don't exist...")
-        service_data = [
-            ('Santexnik', 'Su və kanalizasiya sistemləri ilə bağlı xidmətlər'),
-            ('Elektrik', 'Elektrik sistemləri ilə bağlı xidmətlər'),
-            ('Kombi ustası', 'İstilik sistemləri ilə bağlı xidmətlər'),
-            ('Kondisioner ustası', 'Kondisioner sistemləri ilə bağlı xidmətlər'),
-            ('Mebel ustası', 'Mebel quraşdırılması və təmiri xidmətləri'),
-            ('Qapı-pəncərə ustası', 'Qapı və pəncərə sistemləri ilə bağlı xidmətlər'),
-            ('Təmir-bərpa ustası', 'Ev təmiri və bərpası xidmətləri'),
-            ('Bağban', 'Bağ və həyət işləri ilə bağlı xidmətlər')
+            print(f"Error inserting service {service_name}: {e}")
+    
+    # Get service IDs
+    cursor.execute("SELECT id, name FROM services")
+    service_ids = {name: id for id, name in cursor.fetchall()}
+    
+    # Insert sample subservices
+    print("Adding sample subservices if they don't exist...")
+    
+    # Santexnik subservices
+    if 'Santexnik' in service_ids:
+        santexnik_subservices = [
+            ('Su borusu təmiri', 'Su borularının təmiri və dəyişdirilməsi'),
+            ('Kanalizasiya təmizlənməsi', 'Kanalizasiya boruları və sistemlərinin təmizlənməsi'),
+            ('Krant quraşdırma', 'Krant və şlanqların quraşdırılması və təmiri'),
+            ('Unitaz təmiri', 'Unitazların quraşdırılması və təmiri'),
+            ('Hamam aksessuarlarının montajı', 'Hamam dəsti və aksessuarlarının quraşdırılması')
         ]
         
-        for service_name, service_desc in service_data:
+        for name, desc in santexnik_subservices:
             try:
                 cursor.execute(
-                    "INSERT IGNORE INTO services (name, description) VALUES (%s, %s)",
-                    (service_name, service_desc)
+                    "INSERT IGNORE INTO subservices (service_id, name, description) VALUES (%s, %s, %s)",
+                    (service_ids['Santexnik'], name, desc)
                 )
             except Error as e:
-                print(f"Error inserting service {service_name}: {e}")
-        
-        # Get service IDs
-        cursor.execute("SELECT id, name FROM services")
-        service_ids = {name: id for id, name in cursor.fetchall()}
-        
-        # Insert sample subservices
-        print("Adding sample subservices if they don't exist...")
-        
-        # Santexnik subservices
-        if 'Santexnik' in service_ids:
-            santexnik_subservices = [
-                ('Su borusu təmiri', 'Su borularının təmiri və dəyişdirilməsi'),
-                ('Kanalizasiya təmizlənməsi', 'Kanalizasiya boruları və sistemlərinin təmizlənməsi'),
-                ('Krant quraşdırma', 'Krant və şlanqların quraşdırılması və təmiri'),
-                ('Unitaz təmiri', 'Unitazların quraşdırılması və təmiri'),
-                ('Hamam aksessuarlarının montajı', 'Hamam dəsti və aksessuarlarının quraşdırılması')
-            ]
-            
-            for name, desc in santexnik_subservices:
-                try:
-                    cursor.execute(
-                        "INSERT IGNORE INTO subservices (service_id, name, description) VALUES (%s, %s, %s)",
-                        (service_ids['Santexnik'], name, desc)
-                    )
-                except Error as e:
-                    print(f"Error inserting subservice {name}: {e}")
+                print(f"Error inserting subservice {name}: {e}")
+    
+    # Elektrik subservices
+    if 'Elektrik' in service_ids:
+        elektrik_subservices = [
+            ('Elektrik xəttinin çəkilişi', 'Elektrik xətlərinin çəkilişi və yenilənməsi'),
+            ('Razetka və açar təmiri', 'Razetka və açarların quraşdırılması və təmiri'),
+            ('İşıqlandırma quraşdırılması', 'Lampalar və işıqlandırma sistemlərinin quraşdırılması'),
+            ('Elektrik avadanlıqlarının montajı', 'Elektrik avadanlıqlarının montajı və təmiri')
+        ]
         
-        # Elektrik subservices
-        if 'Elektrik' in service_ids:
-            elektrik_subservices = [
-                ('Elektrik xəttinin çəkilişi', 'Elektrik xətlərinin çəkilişi və yenilənməsi'),
-                ('Razetka və açar təmiri', 'Razetka və açarların quraşdırılması və təmiri'),
-                ('İşıqlandırma quraşdırılması', 'Lampalar və işıqlandırma sistemlərinin quraşdırılması'),
-                ('Elektrik avadanlıqlarının montajı', 'Elektrik avadanlıqlarının montajı və təmiri')
-            ]
-            
-            for name, desc in elektrik_subservices:
-                try:
-                    cursor.execute(
-                        "INSERT IGNORE INTO subservices (service_id, name, description) VALUES (%s, %s, %s)",
-                        (service_ids['Elektrik'], name, desc)
-                    )
-                except Error as e:
-                    print(f"Error inserting subservice {name}: {e}")
+        for name, desc in elektrik_subservices:
+            try:
+                cursor.execute(
+                    "INSERT IGNORE INTO subservices (service_id, name, description) VALUES (%s, %s, %s)",
+                    (service_ids['Elektrik'], name, desc)
+                )
+            except Error as e:
+                print(f"Error inserting subservice {name}: {e}")
+    
+    # Kombi ustası subservices
+    if 'Kombi ustası' in service_ids:
+        kombi_subservices = [
+            ('Kombi quraşdırılması', 'Kombilərin quraşdırılması və işə salınması'),
+            ('Kombi təmiri', 'Kombilərin təmiri və ehtiyat hissələrinin dəyişdirilməsi'),
+            ('Kombi təmizlənməsi və servis', 'Kombilərin təmizlənməsi və dövri servis xidməti'),
+            ('Qaz xəttinə qoşulma', 'Qaz xəttinə qoşulma və təhlükəsizlik tədbirləri')
+        ]
         
-        # Kombi ustası subservices
-        if 'Kombi ustası' in service_ids:
-            kombi_subservices = [
-                ('Kombi quraşdırılması', 'Kombilərin quraşdırılması və işə salınması'),
-                ('Kombi təmiri', 'Kombilərin təmiri və ehtiyat hissələrinin dəyişdirilməsi'),
-                ('Kombi təmizlənməsi və servis', 'Kombilərin təmizlənməsi və dövri servis xidməti'),
-                ('Qaz xəttinə qoşulma', 'Qaz xəttinə qoşulma və təhlükəsizlik tədbirləri')
-            ]
-            
-            for name, desc in kombi_subservices:
-                try:
-                    cursor.execute(
-                        "INSERT IGNORE INTO subservices (service_id, name, description) VALUES (%s, %s, %s)",
-                        (service_ids['Kombi ustası'], name, desc)
-                    )
-                except Error as e:
-                    print(f"Error inserting subservice {name}: {e}")
+        for name, desc in kombi_subservices:
+            try:
+                cursor.execute(
+                    "INSERT IGNORE INTO subservices (service_id, name, description) VALUES (%s, %s, %s)",
+                    (service_ids['Kombi ustası'], name, desc)
+                )
+            except Error as e:
+                print(f"Error inserting subservice {name}: {e}")
+    
+    # Kondisioner ustası subservices
+    if 'Kondisioner ustası' in service_ids:
+        kondisioner_subservices = [
+            ('Kondisioner quraşdırılması', 'Kondisionerlərin quraşdırılması və işə salınması'),
+            ('Kondisioner təmiri', 'Kondisionerlərin təmiri və nasazlıqların aradan qaldırılması'),
+            ('Kondisioner yuyulması (servis)', 'Kondisionerlərin təmizlənməsi və dövri servis xidməti')
+        ]
         
-        # Kondisioner ustası subservices
-        if 'Kondisioner ustası' in service_ids:
-            kondisioner_subservices = [
-                ('Kondisioner quraşdırılması', 'Kondisionerlərin quraşdırılması və işə salınması'),
-                ('Kondisioner təmiri', 'Kondisionerlərin təmiri və nasazlıqların aradan qaldırılması'),
-                ('Kondisioner yuyulması (servis)', 'Kondisionerlərin təmizlənməsi və dövri servis xidməti')
-            ]
-            
-            for name, desc in kondisioner_subservices:
-                try:
-                    cursor.execute(
-                        "INSERT IGNORE INTO subservices (service_id, name, description) VALUES (%s, %s, %s)",
-                        (service_ids['Kondisioner ustası'], name, desc)
-                    )
-                except Error as e:
-                    print(f"Error inserting subservice {name}: {e}")
+        for name, desc in kondisioner_subservices:
+            try:
+                cursor.execute(
+                    "INSERT IGNORE INTO subservices (service_id, name, description) VALUES (%s, %s, %s)",
+                    (service_ids['Kondisioner ustası'], name, desc)
+                )
+            except Error as e:
+                print(f"Error inserting subservice {name}: {e}")
+    
+    # Mebel ustası subservices
+    if 'Mebel ustası' in service_ids:
+        mebel_subservices = [
+            ('Mebel təmiri', 'Mövcud mebellərin təmiri və bərpası'),
+            ('Yeni mebel yığılması', 'Yeni mebellərin yığılması və quraşdırılması'),
+            ('Sökülüb-yığılması (daşınma üçün)', 'Köçmə zamanı mebellərin sökülüb yenidən yığılması'),
+            ('Mətbəx mebeli quraşdırılması', 'Mətbəx mebelinin ölçülərə uyğun quraşdırılması')
+        ]
         
-        # Mebel ustası subservices
-        if 'Mebel ustası' in service_ids:
-            mebel_subservices = [
-                ('Mebel təmiri', 'Mövcud mebellərin təmiri və bərpası'),
-                ('Yeni mebel yığılması', 'Yeni mebellərin yığılması və quraşdırılması'),
-                ('Sökülüb-yığılması (daşınma üçün)', 'Köçmə zamanı mebellərin sökülüb yenidən yığılması'),
-                ('Mətbəx mebeli quraşdırılması', 'Mətbəx mebelinin ölçülərə uyğun quraşdırılması')
-            ]
-            
-            for name, desc in mebel_subservices:
-                try:
-                    cursor.execute(
-                        "INSERT IGNORE INTO subservices (service_id, name, description) VALUES (%s, %s, %s)",
-                        (service_ids['Mebel ustası'], name, desc)
-                    )
-                except Error as e:
-                    print(f"Error inserting subservice {name}: {e}")
+        for name, desc in mebel_subservices:
+            try:
+                cursor.execute(
+                    "INSERT IGNORE INTO subservices (service_id, name, description) VALUES (%s, %s, %s)",
+                    (service_ids['Mebel ustası'], name, desc)
+                )
+            except Error as e:
+                print(f"Error inserting subservice {name}: {e}")
+    
+    # Qapı-pəncərə ustası subservices
+    if 'Qapı-pəncərə ustası' in service_ids:
+        qapi_pencere_subservices = [
+            ('PVC pəncərə quraşdırılması', 'PVC pəncərələrin quraşdırılması və nizamlanması'),
+            ('Qapı təmiri', 'Qapıların təmiri və bərpası'),
+            ('Alüminium sistemlər', 'Alüminium qapı və pəncərələrin quraşdırılması'),
+            ('Kilid və mexanizmlərin təmiri', 'Qapı kilidləri və mexanizmlərinin təmiri və dəyişdirilməsi')
+        ]
         
-        # Qapı-pəncərə ustası subservices
-        if 'Qapı-pəncərə ustası' in service_ids:
-            qapi_pencere_subservices = [
-                ('PVC pəncərə quraşdırılması', 'PVC pəncərələrin quraşdırılması və nizamlanması'),
-                ('Qapı təmiri', 'Qapıların təmiri və bərpası'),
-                ('Alüminium sistemlər', 'Alüminium qapı və pəncərələrin quraşdırılması'),
-                ('Kilid və mexanizmlərin təmiri', 'Qapı kilidləri və mexanizmlərinin təmiri və dəyişdirilməsi')
-            ]
-            
-            for name, desc in qapi_pencere_subservices:
-                try:
-                    cursor.execute(
-                        "INSERT IGNORE INTO subservices (service_id, name, description) VALUES (%s, %s, %s)",
-                        (service_ids['Qapı-pəncərə ustası'], name, desc)
-                    )
-                except Error as e:
-                    print(f"Error inserting subservice {name}: {e}")
+        for name, desc in qapi_pencere_subservices:
+            try:
+                cursor.execute(
+                    "INSERT IGNORE INTO subservices (service_id, name, description) VALUES (%s, %s, %s)",
+                    (service_ids['Qapı-pəncərə ustası'], name, desc)
+                )
+            except Error as e:
+                print(f"Error inserting subservice {name}: {e}")
+    
+    # Bərpa ustası subservices
+    if 'Təmir-bərpa ustası' in service_ids:
+        berpa_subservices = [
+            ('Ev təmiri', 'Evlərin ümumi təmiri və yenilənməsi'),
+            ('Divar kağızı (oboy) vurulması', 'Divar kağızlarının vurulması və hazırlıq işləri'),
+            ('Rəngsaz işləri', 'Divar, tavan və fasadların rənglənməsi'),
+            ('Alçıpan montajı', 'Alçıpan konstruksiyalarının quraşdırılması'),
+            ('Döşəmə və laminat', 'Döşəmə və laminatların (parketlərin) quraşdırılması')
+        ]
         
-        # Bərpa ustası subservices
-        if 'Təmir-bərpa ustası' in service_ids:
-            berpa_subservices = [
-                ('Ev təmiri', 'Evlərin ümumi təmiri və yenilənməsi'),
-                ('Divar kağızı (oboy) vurulması', 'Divar kağızlarının vurulması və hazırlıq işləri'),
-                ('Rəngsaz işləri', 'Divar, tavan və fasadların rənglənməsi'),
-                ('Alçıpan montajı', 'Alçıpan konstruksiyalarının quraşdırılması'),
-                ('Döşəmə və laminat', 'Döşəmə və laminatların (parketlərin) quraşdırılması')
-            ]
-            
-            for name, desc in berpa_subservices:
-                try:
-                    cursor.execute(
-                        "INSERT IGNORE INTO subservices (service_id, name, description) VALUES (%s, %s, %s)",
-                        (service_ids['Təmir-bərpa ustası'], name, desc)
-                    )
-                except Error as e:
-                    print(f"Error inserting subservice {name}: {e}")
+        for name, desc in berpa_subservices:
+            try:
+                cursor.execute(
+                    "INSERT IGNORE INTO subservices (service_id, name, description) VALUES (%s, %s, %s)",
+                    (service_ids['Təmir-bərpa ustası'], name, desc)
+                )
+            except Error as e:
+                print(f"Error inserting subservice {name}: {e}")
+    
+    # Bağban subservices
+    if 'Bağban' in service_ids:
+        bagban_subservices = [
+            ('Bağ sahəsinin təmizlənməsi', 'Bağ və həyət sahələrinin təmizlənməsi və hazırlanması'),
+            ('Ağac budama', 'Ağacların budanması və baxımı'),
+            ('Bağ suvarma sistemi qurulması', 'Avtomatik və ya manual suvarma sistemlərinin quraşdırılması'),
+            ('Çəmən toxumu əkilməsi', 'Çəmən toxumunun səpilməsi və baxımı')
+        ]
         
-        # Bağban subservices
-        if 'Bağban' in service_ids:
-            bagban_subservices = [
-                ('Bağ sahəsinin təmizlənməsi', 'Bağ və həyət sahələrinin təmizlənməsi və hazırlanması'),
-                ('Ağac budama', 'Ağacların budanması və baxımı'),
-                ('Bağ suvarma sistemi qurulması', 'Avtomatik və ya manual suvarma sistemlərinin quraşdırılması'),
-                ('Çəmən toxumu əkilməsi', 'Çəmən toxumunun səpilməsi və baxımı')
-            ]
-            
-            for name, desc in bagban_subservices:
-                try:
-                    cursor.execute(
-                        "INSERT IGNORE INTO subservices (service_id, name, description) VALUES (%s, %s, %s)",
-                        (service_ids['Bağban'], name, desc)
+        for name, desc in bagban_subservices:
+            try:
+                cursor.execute(
+                    "INSERT IGNORE INTO subservices (service_id, name, description) VALUES (%s, %s, %s)",
+                    (service_ids['Bağban'], name, desc)
+                )
+            except Error as e:
+                print(f"Error inserting subservice {name}: {e}")
+
+
+def create_search_index(cursor):
+    """Create the admin search blind index tables and index existing users
+
+    Every customer and artisan is decrypted once here; after that the
+    create / profile update wrappers keep the tokens in sync.
+    """
+    from crypto_service import decrypt_data, is_encrypted, blind_index_tokens
+
+    for entity, table in (('customer', 'customers'), ('artisan', 'artisans')):
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {entity}_search_tokens (
+                {entity}_id INT NOT NULL,
+                field VARCHAR(10) NOT NULL,
+                token CHAR(32) NOT NULL,
+                PRIMARY KEY ({entity}_id, field, token),
+                INDEX idx_{entity}_search_tokens_lookup (field, token),
+                FOREIGN KEY ({entity}_id) REFERENCES {table}(id) ON DELETE CASCADE
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        ''')
+
+        print(f"Indexing {table} for admin search...")
+        last_id = 0
+        while True:
+            cursor.execute(
+                f"SELECT id, name, phone FROM {table} WHERE id > %s ORDER BY id LIMIT 500",
+                (last_id,)
+            )
+            batch = cursor.fetchall()
+            if not batch:
+                break
+            rows = []
+            for entity_id, name, phone in batch:
+                for field, value in (('name', name), ('phone', phone)):
+                    value = decrypt_data(value)
+                    # Artisans registered before the create wrapper fix were encrypted twice
+                    if is_encrypted(value):
+                        value = decrypt_data(value)
+                    rows.extend((entity_id, field, token) for token in blind_index_tokens(field, value))
+            if rows:
+                cursor.executemany(
+                    f"INSERT IGNORE INTO {entity}_search_tokens ({entity}_id, field, token) VALUES (%s, %s, %s)",
+                    rows
+                )
+            last_id = batch[-1][0]
+
+
+def create_reencryption_progress(cursor):
+    """Create the checkpoint table of the key rotation re-encryption job
+
+    One row per table: the key of the last re-encrypted row and counters,
+    for the primary key named by key_fingerprint. A new primary key starts
+    every table over.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reencryption_progress (
+            table_name VARCHAR(64) PRIMARY KEY,
+            key_fingerprint CHAR(16) NOT NULL,
+            last_key VARCHAR(255),
+            scanned INT NOT NULL DEFAULT 0,
+            rotated INT NOT NULL DEFAULT 0,
+            failed INT NOT NULL DEFAULT 0,
+            active_seconds DOUBLE NOT NULL DEFAULT 0,
+            started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            finished_at DATETIME,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+
+
+def repair_double_encrypted_artisans(cursor):
+    """Decrypt the artisan names and phones the old create wrapper encrypted twice
+
+    Before the admin search blind index, create_artisan received values
+    the wrapper had already encrypted and encrypted them again, so readers
+    got ciphertext back. Such values are stored encrypted once with the
+    current key and their search tokens are rebuilt.
+    """
+    from crypto_service import encrypt_data, decrypt_data, is_encrypted, blind_index_tokens
+
+    print("Repairing double-encrypted artisan names and phones...")
+    repaired = 0
+    last_id = 0
+    while True:
+        cursor.execute(
+            "SELECT id, name, phone FROM artisans WHERE id > %s ORDER BY id LIMIT 500",
+            (last_id,)
+        )
+        batch = cursor.fetchall()
+        if not batch:
+            break
+        for artisan_id, name, phone in batch:
+            for field, value in (('name', name), ('phone', phone)):
+                inner = decrypt_data(value)
+                if not is_encrypted(inner):
+                    continue
+                plaintext = decrypt_data(inner)
+                if is_encrypted(plaintext):
+                    logger.error(f"Could not decrypt {field} of artisan {artisan_id}, left as is")
+                    continue
+                cursor.execute(
+                    f"UPDATE artisans SET {field} = %s WHERE id = %s",
+                    (encrypt_data(plaintext), artisan_id)
+                )
+                cursor.execute(
+                    "DELETE FROM artisan_search_tokens WHERE artisan_id = %s AND field = %s",
+                    (artisan_id, field)
+                )
+                tokens = blind_index_tokens(field, plaintext)
+                if tokens:
+                    cursor.executemany(
+                        "INSERT IGNORE INTO artisan_search_tokens (artisan_id, field, token) VALUES (%s, %s, %s)",
+                        [(artisan_id, field, token) for token in tokens]
                     )
-                except Error as e:
-                    print(f"Error inserting subservice {name}: {e}")
-        
-        print("Database setup completed successfully!")
-        
-    except Error as error:
-        print(f"Error: {error}")
-    finally:
-        if conn is not None and conn.is_connected():
-            cursor.close()
-            conn.close()
-            print("Database connection closed.")
-
-    # Ensure telegram_id_hash column exists in customers
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS 
-            WHERE table_name = 'customers' AND column_name = 'telegram_id_hash'
-        """)
-        if cursor.fetchone()[0] == 0:
-            cursor.execute("ALTER TABLE customers ADD COLUMN telegram_id_hash VARCHAR(255)")
-            conn.commit()
-    except Exception as e:
-        print(f"Error ensuring telegram_id_hash column: {e}")
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
+                repaired += 1
+        last_id = batch[-1][0]
+    print(f"Repaired {repaired} artisan values")
+
+
+def encrypt_notification_outbox(cursor):
+    """Store outbox chat IDs and payloads encrypted
+
+    Message texts carry names and phone numbers and rows are kept for
+    OUTBOX_RETENTION_DAYS (dead letters until an admin drops them), so
+    both columns become encrypt_data text like the user tables. Rows
+    queued before this migration are encrypted in place.
+    """
+    from crypto_service import encrypt_data, is_encrypted
+
+    cursor.execute('ALTER TABLE notification_outbox MODIFY chat_id VARCHAR(255) NOT NULL, MODIFY payload MEDIUMTEXT NOT NULL')
+
+    print("Encrypting queued outbox messages...")
+    last_id = 0
+    while True:
+        cursor.execute(
+            "SELECT id, chat_id, payload FROM notification_outbox WHERE id > %s ORDER BY id LIMIT 500",
+            (last_id,)
+        )
+        batch = cursor.fetchall()
+        if not batch:
+            break
+        updates = [
+            (encrypt_data(chat_id), encrypt_data(payload), message_id)
+            for message_id, chat_id, payload in batch
+            if not is_encrypted(chat_id)
+        ]
+        if updates:
+            cursor.executemany("UPDATE notification_outbox SET chat_id = %s, payload = %s WHERE id = %s", updates)
+        last_id = batch[-1][0]
+
+
+def hash_fsm_state_keys(cursor):
+    """Key fsm_states on an HMAC of the chat and user instead of their IDs
+
+    The plaintext Telegram IDs in the primary key tied every encrypted
+    conversation to a user. Rows get state_key (crypto_service.fsm_state_key),
+    which becomes the primary key, and the ID columns are dropped.
+    """
+    from crypto_service import fsm_state_key
+
+    ensure_column(cursor, 'fsm_states', 'state_key', 'CHAR(64)')
+    cursor.execute("""
+        SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE table_schema = %s AND table_name = 'fsm_states' AND column_name = 'chat_id'
+    """, (DB_CONFIG["database"],))
+    if cursor.fetchone()[0]:
+        print("Hashing FSM state keys...")
+        while True:
+            cursor.execute("SELECT chat_id, user_id FROM fsm_states WHERE state_key IS NULL LIMIT 500")
+            batch = cursor.fetchall()
+            if not batch:
+                break
+            cursor.executemany(
+                "UPDATE fsm_states SET state_key = %s WHERE chat_id = %s AND user_id = %s",
+                [(fsm_state_key(chat_id, user_id), chat_id, user_id) for chat_id, user_id in batch]
+            )
+        cursor.execute('''
+            ALTER TABLE fsm_states
+                DROP PRIMARY KEY,
+                DROP COLUMN chat_id,
+                DROP COLUMN user_id,
+                MODIFY state_key CHAR(64) NOT NULL,
+                ADD PRIMARY KEY (state_key)
+        ''')
+    # The re-encryption checkpoint of the table holds the old key columns
+    cursor.execute("DELETE FROM reencryption_progress WHERE table_name = 'fsm_states'")
+
+
+def encrypt_order_notification_chats(cursor):
+    """Store the chat IDs of new-order offers encrypted
+
+    order_notifications.chat_id is an artisan's Telegram ID, encrypted
+    everywhere else. Rows written before this migration are encrypted in place.
+    """
+    from crypto_service import encrypt_data, is_encrypted
+
+    cursor.execute('ALTER TABLE order_notifications MODIFY chat_id VARCHAR(255) NOT NULL')
+
+    print("Encrypting order notification chats...")
+    last_id = 0
+    while True:
+        cursor.execute(
+            "SELECT id, chat_id FROM order_notifications WHERE id > %s ORDER BY id LIMIT 500",
+            (last_id,)
+        )
+        batch = cursor.fetchall()
+        if not batch:
+            break
+        updates = [
+            (encrypt_data(chat_id), notification_id)
+            for notification_id, chat_id in batch
+            if not is_encrypted(chat_id)
+        ]
+        if updates:
+            cursor.executemany("UPDATE order_notifications SET chat_id = %s WHERE id = %s", updates)
+        last_id = batch[-1][0]
+
+
+def ensure_index(cursor, table, index_name, columns):
+    """Create an index unless it already exists
+
+    Args:
+        cursor: Open cursor
+        table (str): Table name
+        index_name (str): Index name
+        columns (str): Column list, e.g. 'latitude, longitude'
+    """
+    cursor.execute("""
+        SELECT COUNT(*) FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE table_schema = %s AND table_name = %s AND index_name = %s
+    """, (DB_CONFIG["database"], table, index_name))
+    if cursor.fetchone()[0] == 0:
+        print(f"Creating {index_name}...")
+        cursor.execute(f'CREATE INDEX {index_name} ON {table} ({columns})')
+
+
+def migrate_admin_stats_rollup(cursor):
+    """Index the created_at columns that admin_stats_hourly buckets are rebuilt from"""
+    ensure_index(cursor, 'orders', 'idx_orders_created_at', 'created_at')
+    ensure_index(cursor, 'customers', 'idx_customers_created_at', 'created_at')
+    ensure_index(cursor, 'artisans', 'idx_artisans_created_at', 'created_at')
+    ensure_index(cursor, 'admin_stats_hourly', 'idx_admin_stats_service', 'service, bucket_start')
+
+
+def ensure_column(cursor, table, column, definition):
+    """Add a column unless it already exists
+
+    Args:
+        cursor: Open cursor
+        table (str): Table name
+        column (str): Column name
+        definition (str): Column type and options, e.g. 'INT NOT NULL DEFAULT 0'
+    """
+    cursor.execute("""
+        SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE table_schema = %s AND table_name = %s AND column_name = %s
+    """, (DB_CONFIG["database"], table, column))
+    if cursor.fetchone()[0] == 0:
+        print(f"Adding {table}.{column}...")
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def migrate_scheduled_tasks(cursor):
+    """Add lease columns and indexes that timer workers claim scheduled_tasks with"""
+    ensure_column(cursor, 'scheduled_tasks', 'lease_owner', 'VARCHAR(100)')
+    ensure_column(cursor, 'scheduled_tasks', 'lease_expires_at', 'DATETIME')
+    ensure_column(cursor, 'scheduled_tasks', 'attempts', 'INT NOT NULL DEFAULT 0')
+    ensure_index(cursor, 'scheduled_tasks', 'idx_scheduled_tasks_due', 'status(20), execution_time')
+    ensure_index(cursor, 'scheduled_tasks', 'idx_scheduled_tasks_reference', 'reference_id, status(20)')
+
+
+def migrate_payment_events(cursor):
+    """Index the columns the payment notification reconciliation sweep reads"""
+    ensure_index(cursor, 'notification_log', 'idx_notification_log_target', 'target_id, notification_type(32)')
+    ensure_index(cursor, 'order_payments', 'idx_order_payments_updated_at', 'updated_at')
+
+
+def migrate_artisan_location_index(cursor):
+    """Prepare artisan coordinates for bounding-box searches
+
+    get_nearby_artisans range-scans idx_artisans_location, so existing rows are
+    backfilled first: placeholder (0, 0) and out-of-range coordinates are reset
+    to NULL so they never fall inside a search box. The index itself is created
+    here when missing, because on existing databases the old index block in
+    setup_database() stopped at the first index that already existed.
+    """
+    cursor.execute("""
+        UPDATE artisans
+        SET latitude = NULL, longitude = NULL
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+        AND (
+            (latitude = 0 AND longitude = 0)
+            OR latitude NOT BETWEEN -90 AND 90
+            OR longitude NOT BETWEEN -180 AND 180
+        )
+    """)
+    if cursor.rowcount:
+        print(f"Cleared invalid coordinates for {cursor.rowcount} artisans")
+
+    # A half-set coordinate pair can not be used for distance calculation
+    cursor.execute("""
+        UPDATE artisans
+        SET latitude = NULL, longitude = NULL
+        WHERE (latitude IS NULL) <> (longitude IS NULL)
+    """)
+
+    ensure_index(cursor, 'artisans', 'idx_artisans_location', 'latitude, longitude')
+
+    # Refresh index statistics so the optimizer picks the range scan
+    cursor.execute("ANALYZE TABLE artisans")
+    cursor.fetchall()
+
 
 if __name__ == "__main__":
     setup_database()
\ No newline at end of file
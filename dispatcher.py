@@ -4,10 +4,9 @@ This module initializes the Telegram bot and dispatcher.
 """
 
 from aiogram import Bot, Dispatcher
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from config import BOT_TOKEN
+from fsm_storage import storage
 
 # Initialize bot and dispatcher
 bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
 dp = Dispatcher(bot, storage=storage)
\ No newline at end of file
@@ -0,0 +1,245 @@
+# fsm_storage.py
+
+import copy
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.storage import BaseStorage
+from crypto_service import encrypt_data, decrypt_data
+from db_async import adb
+from config import FSM_STORAGE, FSM_STATE_TTL_HOURS, FSM_CACHE_SECONDS, FSM_CACHE_SIZE
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value):
+    """Encode the non-JSON values handlers keep in state data"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _dump(value):
+    """Encrypt a data or bucket dict; empty dicts are stored as NULL"""
+    if not value:
+        return None
+    return encrypt_data(json.dumps(value, ensure_ascii=False, default=_json_default))
+
+
+def _load(value):
+    if not value:
+        return {}
+    return json.loads(decrypt_data(value))
+
+
+class _Record:
+    __slots__ = ('state', 'data', 'bucket', 'cached_until')
+
+    def __init__(self, state=None, data=None, bucket=None, cached_until=0.0):
+        self.state = state
+        self.data = data or {}
+        self.bucket = bucket or {}
+        self.cached_until = cached_until
+
+
+class MySQLStorage(BaseStorage):
+    """FSM storage kept in the fsm_states table
+
+    Every write goes to MySQL before the handler continues (write-through)
+    and a failed read or write raises, so conversations survive restarts,
+    any bot process can pick them up and a state that could not be read is
+    never overwritten.
+    Records are also kept in a bounded LRU cache and reads are answered from
+    it for `cache_seconds`; with several processes serving the same users,
+    keep that short or 0. State data often holds names, phones and card
+    numbers, so data and bucket are stored encrypted. A record untouched for
+    `ttl_hours` is treated as abandoned: reads ignore it and purge_expired()
+    deletes it.
+    """
+
+    def __init__(self, ttl_hours=FSM_STATE_TTL_HOURS, cache_seconds=FSM_CACHE_SECONDS, cache_size=FSM_CACHE_SIZE):
+        self.ttl_seconds = int(ttl_hours * 60 * 60)
+        self.cache_seconds = cache_seconds
+        self.cache_size = cache_size
+        self._cache = OrderedDict()   # (chat, user) -> _Record
+        self._stats = {
+            "cache_hits": 0, "cache_misses": 0, "reads": 0, "writes": 0,
+            "read_seconds": 0.0, "write_seconds": 0.0, "errors": 0, "purged": 0,
+        }
+
+    async def close(self):
+        self._cache.clear()
+
+    async def wait_closed(self):
+        pass
+
+    # -------------------------
+    # CACHE AND PERSISTENCE
+    # -------------------------
+
+    def _key(self, chat, user):
+        chat, user = self.check_address(chat=chat, user=user)
+        return int(chat), int(user)
+
+    def _remember(self, key, record):
+        record.cached_until = time.monotonic() + self.cache_seconds
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _get(self, chat, user):
+        key = self._key(chat, user)
+        record = self._cache.get(key)
+        if record is not None and record.cached_until > time.monotonic():
+            self._stats["cache_hits"] += 1
+            self._cache.move_to_end(key)
+            return key, record
+
+        self._stats["cache_misses"] += 1
+        started = time.perf_counter()
+        try:
+            row = await adb.get_fsm_record(*key)
+            record = _Record(row[0], _load(row[1]), _load(row[2])) if row else _Record()
+        except Exception as e:
+            # An empty or stale record would be taken for the stored one and
+            # the handler's next write would overwrite the real state with it
+            self._stats["errors"] += 1
+            self._cache.pop(key, None)
+            logger.error(f"Could not read FSM state of {key}: {e}")
+            raise
+        finally:
+            self._stats["reads"] += 1
+            self._stats["read_seconds"] += time.perf_counter() - started
+
+        self._remember(key, record)
+        return key, record
+
+    async def _put(self, key, record):
+        started = time.perf_counter()
+        try:
+            await adb.save_fsm_record(
+                key[0], key[1], record.state, _dump(record.data), _dump(record.bucket), self.ttl_seconds
+            )
+        except Exception as e:
+            # The handler must not carry on as if the state had moved; the
+            # next read goes back to MySQL instead of a record never stored
+            self._stats["errors"] += 1
+            self._cache.pop(key, None)
+            logger.error(f"Could not save FSM state of {key}: {e}")
+            raise
+        finally:
+            self._stats["writes"] += 1
+            self._stats["write_seconds"] += time.perf_counter() - started
+        self._remember(key, record)
+
+    # -------------------------
+    # STATE AND DATA
+    # -------------------------
+
+    async def get_state(self, *, chat=None, user=None, default=None):
+        _, record = await self._get(chat, user)
+        return record.state if record.state is not None else self.resolve_state(default)
+
+    async def get_data(self, *, chat=None, user=None, default=None):
+        _, record = await self._get(chat, user)
+        return copy.deepcopy(record.data)
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        key, record = await self._get(chat, user)
+        state = self.resolve_state(state)
+        if state == record.state:
+            return
+        await self._put(key, _Record(state, record.data, record.bucket))
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        key, record = await self._get(chat, user)
+        await self._put(key, _Record(record.state, copy.deepcopy(data or {}), record.bucket))
+
+    async def update_data(self, *, chat=None, user=None, data=None, **kwargs):
+        key, record = await self._get(chat, user)
+        merged = copy.deepcopy(record.data)
+        merged.update(data or {}, **kwargs)
+        await self._put(key, _Record(record.state, merged, record.bucket))
+
+    async def reset_state(self, *, chat=None, user=None, with_data=True):
+        # One write instead of set_state + set_data
+        key, record = await self._get(chat, user)
+        data = {} if with_data else record.data
+        if record.state is None and data == record.data:
+            return
+        await self._put(key, _Record(None, data, record.bucket))
+
+    # -------------------------
+    # BUCKET
+    # -------------------------
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *, chat=None, user=None, default=None):
+        _, record = await self._get(chat, user)
+        return copy.deepcopy(record.bucket)
+
+    async def set_bucket(self, *, chat=None, user=None, bucket=None):
+        key, record = await self._get(chat, user)
+        await self._put(key, _Record(record.state, record.data, copy.deepcopy(bucket or {})))
+
+    async def update_bucket(self, *, chat=None, user=None, bucket=None, **kwargs):
+        key, record = await self._get(chat, user)
+        merged = copy.deepcopy(record.bucket)
+        merged.update(bucket or {}, **kwargs)
+        await self._put(key, _Record(record.state, record.data, merged))
+
+    # -------------------------
+    # MAINTENANCE
+    # -------------------------
+
+    async def purge_expired(self):
+        """Delete abandoned states from MySQL and the local cache"""
+        deleted = await adb.purge_expired_fsm_records()
+        self._cache.clear()
+        self._stats["purged"] += deleted
+        if deleted:
+            logger.info(f"Purged {deleted} abandoned FSM states")
+        return deleted
+
+    def stats(self):
+        """Get cache and latency counters of this process
+
+        Returns:
+            dict: Cache hits/misses, MySQL reads/writes with average latency
+                  in milliseconds, errors and cached records
+        """
+        reads, writes = self._stats["reads"], self._stats["writes"]
+        return dict(
+            self._stats,
+            read_seconds=round(self._stats["read_seconds"], 3),
+            write_seconds=round(self._stats["write_seconds"], 3),
+            avg_read_ms=round(self._stats["read_seconds"] * 1000 / reads, 3) if reads else 0.0,
+            avg_write_ms=round(self._stats["write_seconds"] * 1000 / writes, 3) if writes else 0.0,
+            cached=len(self._cache),
+        )
+
+
+def create_storage():
+    """Build the FSM storage selected by FSM_STORAGE"""
+    if FSM_STORAGE == "memory":
+        logger.warning("FSM_STORAGE=memory: conversation states are lost on restart")
+        return MemoryStorage()
+    return MySQLStorage()
+
+
+# Shared by every Dispatcher of the process
+storage = create_storage()
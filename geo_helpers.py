@@ -9,6 +9,11 @@ import asyncio
 from config import GOOGLE_MAPS_API_KEY  # Google API key for reverse geocoding
 from db import get_connection, execute_query, get_nearby_artisans
 
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, calculate_distances falls back to pure Python
+    np = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -53,6 +58,56 @@ def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     
     return distance
 
+def calculate_distances(
+    latitude: float,
+    longitude: float,
+    latitudes,
+    longitudes,
+    radius: float = None
+) -> Tuple[Any, Any]:
+    """
+    Calculate Haversine distances from one origin to many points in a single call.
+    
+    Uses NumPy when it is installed, otherwise a plain Python loop with the same results.
+    Candidates with missing coordinates get an infinite distance and never match the radius.
+    
+    Args:
+        latitude (float): Latitude of the origin in degrees
+        longitude (float): Longitude of the origin in degrees
+        latitudes (Sequence[float]): Candidate latitudes in degrees (None allowed)
+        longitudes (Sequence[float]): Candidate longitudes in degrees (None allowed)
+        radius (float, optional): Radius in kilometers for the mask; without it every
+            finite distance matches
+        
+    Returns:
+        Tuple: (distances in kilometers, boolean mask of candidates within radius),
+            as NumPy arrays when NumPy is available, otherwise as lists
+    """
+    if np is None:
+        distances = [
+            calculate_distance(latitude, longitude, lat, lon) if lat is not None and lon is not None else float('inf')
+            for lat, lon in zip(latitudes, longitudes)
+        ]
+        limit = float('inf') if radius is None else radius
+        mask = [d <= limit and d != float('inf') for d in distances]
+        return distances, mask
+
+    lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon2 = np.radians(np.asarray(longitudes, dtype=np.float64))
+    lat1 = math.radians(latitude)
+    lon1 = math.radians(longitude)
+    
+    # Haversine formula, vectorised over the candidates
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    distances = 2 * 6371.0 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    
+    # None coordinates become NaN
+    distances = np.where(np.isnan(distances), np.inf, distances)
+    mask = np.isfinite(distances)
+    if radius is not None:
+        mask &= distances <= radius
+    return distances, mask
+
 def format_distance(distance: float) -> str:
     """
     Format a distance value for user-friendly display.
@@ -227,7 +282,7 @@ def find_nearby_artisans(
     
     try:
         # Use the get_nearby_artisans function from db.py
-        nearby_artisans = get_nearby_artisans(latitude, longitude, radius, service, subservice)
+        nearby_artisans = get_nearby_artisans(latitude, longitude, radius, service, subservice, limit)
         
         # Process results to add formatted distance
         artisans_with_formatted_distance = []
@@ -295,30 +350,27 @@ def find_available_artisans_by_service(
         # Execute the query using the db.py function
         results = execute_query(query, params, fetchall=True, dict_cursor=True)
         
-        artisans_list = []
+        artisans_list = [dict(artisan) for artisan in results or []]
         
-        # Process results and calculate distance if coordinates provided
-        for artisan in results:
-            artisan_data = dict(artisan)
+        # Calculate all distances in one batch if coordinates provided
+        if latitude is not None and longitude is not None and artisans_list:
+            distances, has_distance = calculate_distances(
+                latitude, longitude,
+                [artisan['latitude'] for artisan in artisans_list],
+                [artisan['longitude'] for artisan in artisans_list]
+            )
             
-            # Calculate distance if coordinates provided
-            if latitude is not None and longitude is not None:
-                artisan_lat = artisan['latitude']
-                artisan_lon = artisan['longitude']
-                
-                if artisan_lat is not None and artisan_lon is not None:
-                    distance = calculate_distance(latitude, longitude, artisan_lat, artisan_lon)
-                    artisan_data['distance'] = round(distance, 2)
-                    artisan_data['distance_text'] = format_distance(distance)
+            for artisan_data, distance, known in zip(artisans_list, distances, has_distance):
+                if known:
+                    artisan_data['distance'] = round(float(distance), 2)
+                    artisan_data['distance_text'] = format_distance(float(distance))
                 else:
                     artisan_data['distance'] = None
                     artisan_data['distance_text'] = "Naməlum məsafə"
-            
-            artisans_list.append(artisan_data)
         
         # Sort by distance if available, otherwise by rating
         if latitude is not None and longitude is not None:
-            artisans_list.sort(key=lambda x: x.get('distance', float('inf')))
+            artisans_list.sort(key=lambda x: x['distance'] if x.get('distance') is not None else float('inf'))
         else:
             artisans_list.sort(key=lambda x: x.get('rating', 0), reverse=True)
         
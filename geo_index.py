@@ -0,0 +1,281 @@
+# geo_index.py
+
+import math
+import threading
+import logging
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371
+HALF_EARTH_CIRCUMFERENCE_KM = math.pi * EARTH_RADIUS_KM
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometers (same formula as db.calculate_distance)"""
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    dlat = lat2_rad - lat1_rad
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def get_bounding_box(latitude, longitude, radius):
+    """Get a lat/lon box that fully contains the circle of `radius` km
+
+    Args:
+        latitude (float): Center latitude
+        longitude (float): Center longitude
+        radius (float): Radius in kilometers
+
+    Returns:
+        tuple: (min_lat, max_lat, min_lon, max_lon); longitude bounds are None
+               when the circle reaches a pole or crosses the antimeridian
+    """
+    angular_radius = radius / EARTH_RADIUS_KM
+    lat_delta = math.degrees(angular_radius)
+    min_lat = latitude - lat_delta
+    max_lat = latitude + lat_delta
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return max(min_lat, -90.0), min(max_lat, 90.0), None, None
+
+    # Widest longitude span of a spherical cap centred at this latitude
+    lon_delta = math.degrees(math.asin(math.sin(angular_radius) / math.cos(math.radians(latitude))))
+    min_lon = longitude - lon_delta
+    max_lon = longitude + lon_delta
+    if min_lon < -180.0 or max_lon > 180.0:
+        return min_lat, max_lat, None, None
+
+    return min_lat, max_lat, min_lon, max_lon
+
+
+class ArtisanGeoIndex:
+    """Process-local grid index of active artisans, partitioned by service
+
+    Rows are bucketed into square lat/lon cells of `cell_size` degrees per
+    service, so radius queries only touch the cells overlapping the search
+    box. Rows are stored as returned by MySQL (sensitive fields stay
+    encrypted) and must contain id, service, latitude and longitude.
+    """
+
+    def __init__(self, cell_size=0.1):
+        """
+        Args:
+            cell_size (float): Cell edge in degrees (0.1 is roughly 11 km)
+        """
+        if cell_size <= 0:
+            raise ValueError("Cell size must be positive")
+        self.cell_size = cell_size
+        self._lock = threading.RLock()
+        self._cells = {}   # service -> {(lat_idx, lon_idx): {artisan_id: row}}
+        self._by_id = {}   # artisan_id -> (service, cell)
+        self._ready = False
+        # Writes applied while a reconcile snapshot is being read: artisan_id -> row or None
+        self._pending = None
+
+    def is_ready(self):
+        """Whether the index has been loaded at least once"""
+        return self._ready
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def _cell_of(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size))
+
+    # -------------------------
+    # WRITES
+    # -------------------------
+
+    def upsert(self, row):
+        """Insert or move an artisan; rows without coordinates are removed"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending[row['id']] = row
+            self._put(self._cells, self._by_id, row)
+
+    def remove(self, artisan_id):
+        """Drop an artisan from the index (inactive, blocked or deleted)"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending[artisan_id] = None
+            self._drop(self._cells, self._by_id, artisan_id)
+
+    def _put(self, cells, by_id, row):
+        artisan_id = row['id']
+        self._drop(cells, by_id, artisan_id)
+        latitude, longitude = row.get('latitude'), row.get('longitude')
+        if latitude is None or longitude is None:
+            return
+        row = dict(row, latitude=float(latitude), longitude=float(longitude))
+        service = row.get('service')
+        cell = self._cell_of(row['latitude'], row['longitude'])
+        cells.setdefault(service, {}).setdefault(cell, {})[artisan_id] = row
+        by_id[artisan_id] = (service, cell)
+
+    @staticmethod
+    def _drop(cells, by_id, artisan_id):
+        location = by_id.pop(artisan_id, None)
+        if location is None:
+            return
+        service, cell = location
+        service_cells = cells.get(service)
+        if not service_cells:
+            return
+        bucket = service_cells.get(cell)
+        if bucket is not None:
+            bucket.pop(artisan_id, None)
+            if not bucket:
+                del service_cells[cell]
+        if not service_cells:
+            del cells[service]
+
+    # -------------------------
+    # RECONCILE
+    # -------------------------
+
+    def begin_reconcile(self):
+        """Start recording writes that race with a snapshot read"""
+        with self._lock:
+            self._pending = {}
+
+    def finish_reconcile(self, rows):
+        """Replace the index contents with a fresh snapshot
+
+        Writes applied since begin_reconcile() are newer than the snapshot
+        and are replayed on top of it.
+
+        Returns:
+            dict: Number of artisans added, removed and moved compared to the old index
+        """
+        cells, by_id = {}, {}
+        for row in rows:
+            self._put(cells, by_id, row)
+
+        with self._lock:
+            pending, self._pending = self._pending or {}, None
+            for artisan_id, row in pending.items():
+                if row is None:
+                    self._drop(cells, by_id, artisan_id)
+                else:
+                    self._put(cells, by_id, row)
+
+            old_by_id = self._by_id
+            diff = {
+                "added": len(by_id.keys() - old_by_id.keys()),
+                "removed": len(old_by_id.keys() - by_id.keys()),
+                "moved": sum(1 for k, v in by_id.items() if k in old_by_id and old_by_id[k] != v),
+            }
+            self._cells, self._by_id = cells, by_id
+            self._ready = True
+        return diff
+
+    def abort_reconcile(self):
+        """Stop recording writes after a failed snapshot read"""
+        with self._lock:
+            self._pending = None
+
+    # -------------------------
+    # QUERIES
+    # -------------------------
+
+    def _candidate_buckets(self, service_cells, min_lat, max_lat, min_lon, max_lon):
+        lat_lo, lat_hi = math.floor(min_lat / self.cell_size), math.floor(max_lat / self.cell_size)
+        if min_lon is None:
+            return [b for (lat_idx, _), b in service_cells.items() if lat_lo <= lat_idx <= lat_hi]
+
+        lon_lo, lon_hi = math.floor(min_lon / self.cell_size), math.floor(max_lon / self.cell_size)
+        # Scanning the occupied cells is cheaper than probing a very large box
+        if (lat_hi - lat_lo + 1) * (lon_hi - lon_lo + 1) > len(service_cells):
+            return [
+                b for (lat_idx, lon_idx), b in service_cells.items()
+                if lat_lo <= lat_idx <= lat_hi and lon_lo <= lon_idx <= lon_hi
+            ]
+        buckets = []
+        for lat_idx in range(lat_lo, lat_hi + 1):
+            for lon_idx in range(lon_lo, lon_hi + 1):
+                bucket = service_cells.get((lat_idx, lon_idx))
+                if bucket:
+                    buckets.append(bucket)
+        return buckets
+
+    def query_radius(self, latitude, longitude, radius, service=None, limit=None):
+        """Get artisans within `radius` km, closest first
+
+        Args:
+            latitude (float): Search center latitude
+            longitude (float): Search center longitude
+            radius (float): Radius in kilometers
+            service (str, optional): Only artisans providing this service
+            limit (int, optional): Maximum number of results
+
+        Returns:
+            list: Copies of the stored rows with a 'distance' key added
+        """
+        min_lat, max_lat, min_lon, max_lon = get_bounding_box(latitude, longitude, radius)
+        matches = []
+        with self._lock:
+            if service is not None:
+                services = [self._cells.get(service)]
+            else:
+                services = list(self._cells.values())
+            for service_cells in services:
+                if not service_cells:
+                    continue
+                for bucket in self._candidate_buckets(service_cells, min_lat, max_lat, min_lon, max_lon):
+                    for row in bucket.values():
+                        distance = haversine_km(latitude, longitude, row['latitude'], row['longitude'])
+                        if distance <= radius:
+                            matches.append((distance, row))
+
+        matches.sort(key=lambda item: item[0])
+        if limit is not None:
+            matches = matches[:limit]
+        return [dict(row, distance=distance) for distance, row in matches]
+
+    def query_nearest(self, latitude, longitude, k, service=None, max_radius=None):
+        """Get the k closest artisans
+
+        The search radius starts at one cell and doubles until k artisans are
+        found; everything outside the radius is farther than anything inside,
+        so the first k results of that radius are the true k nearest.
+
+        Args:
+            latitude (float): Search center latitude
+            longitude (float): Search center longitude
+            k (int): Number of artisans to return
+            service (str, optional): Only artisans providing this service
+            max_radius (float, optional): Do not look further than this many km
+
+        Returns:
+            list: Up to k rows with a 'distance' key, closest first
+        """
+        if k <= 0:
+            return []
+        limit_radius = min(max_radius or HALF_EARTH_CIRCUMFERENCE_KM, HALF_EARTH_CIRCUMFERENCE_KM)
+        radius = min(self.cell_size * 111.0, limit_radius)
+        while True:
+            result = self.query_radius(latitude, longitude, radius, service, limit=k)
+            if len(result) >= k or radius >= limit_radius:
+                return result
+            radius = min(radius * 2, limit_radius)
+
+    def stats(self):
+        """Get index size information
+
+        Returns:
+            dict: Artisan, service and cell counts
+        """
+        with self._lock:
+            return {
+                "ready": self._ready,
+                "artisans": len(self._by_id),
+                "services": len(self._cells),
+                "cells": sum(len(c) for c in self._cells.values()),
+                "cell_size": self.cell_size,
+            }
@@ -10,6 +10,10 @@ sys.path.append(str(Path(__file__).parent.parent))  # Ana qovluğu əlavə et
 from dispatcher import bot, dp
 from db import *
 from db import set_order_price as db_set_order_price
+from db_async import adb, run_db
+from timer_service import (
+    timers, TASK_ORDER_ACCEPTANCE, TASK_DIRECT_ORDER_ACCEPTANCE, TASK_PRICE_REMINDER, TASK_FINAL_PRICE_WARNING
+)
 from datetime_helpers import format_datetime
 from geo_helpers import calculate_distance, format_distance, get_location_name
 import logging
@@ -19,7 +23,6 @@ from config import *
 from notification_service import *
 import random
 import hashlib
-import db
 
 
 
@@ -126,11 +129,11 @@ def register_handlers(dp):
         try:
             # Check if artisan is already registered
             telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if artisan_id:
                 # Check if artisan is blocked
-                is_blocked, reason, required_payment = get_artisan_blocked_status(artisan_id)
+                is_blocked, reason, required_payment = await adb.get_artisan_blocked_status(artisan_id)
                 
                 if is_blocked:
                     # Show blocked message with reason and payment requirements
@@ -430,7 +433,7 @@ def register_handlers(dp):
                 phone = "+" + phone
             
             # Check if phone number is already registered
-            if check_artisan_exists(phone=phone):
+            if await adb.check_artisan_exists(phone=phone):
                 await message.answer(
                     "❌ Bu telefon nömrəsi artıq qeydiyyatdan keçib. Zəhmət olmasa, başqa nömrə daxil edin."
                 )
@@ -479,7 +482,7 @@ def register_handlers(dp):
                 data['city'] = city
             
             # Get available services
-            services = get_services()
+            services = await adb.get_services()
             
             # Create inline keyboard with service buttons
             keyboard = InlineKeyboardMarkup(row_width=2)
@@ -643,14 +646,14 @@ def register_handlers(dp):
             await state.finish()
             
             # Check if already registered with this telegram_id
-            existing_artisan_id = get_artisan_by_telegram_id(telegram_id)
+            existing_artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if existing_artisan_id:
                 # If already registered, use existing ID
                 artisan_id = existing_artisan_id
                 
                 # Update profile info
-                update_artisan_profile(artisan_id, {
+                await adb.update_artisan_profile(artisan_id, {
                     'name': name,
                     'phone': phone,
                     'city': city,
@@ -660,9 +663,7 @@ def register_handlers(dp):
                 })
                 
                 # Add default card info (to avoid nulls)
-                conn = get_connection()
-                cursor = conn.cursor()
-                cursor.execute(
+                await adb.execute_query(
                     """
                     UPDATE artisans 
                     SET payment_card_number = %s, 
@@ -671,14 +672,13 @@ def register_handlers(dp):
                         profile_complete = TRUE
                     WHERE id = %s
                     """,
-                    (default_card_number, default_card_holder, default_address, artisan_id)
+                    (default_card_number, default_card_holder, default_address, artisan_id),
+                    commit=True
                 )
-                conn.commit()
-                conn.close()
                 
                 # Update location info
                 if latitude and longitude:
-                    update_artisan_location(
+                    await adb.update_artisan_location(
                         artisan_id=artisan_id,
                         latitude=latitude,
                         longitude=longitude,
@@ -686,7 +686,7 @@ def register_handlers(dp):
                     )
             else:
                 # Create new registration
-                artisan_id = get_or_create_artisan(
+                artisan_id = await adb.get_or_create_artisan(
                     telegram_id=telegram_id,
                     name=name,
                     phone=phone,
@@ -698,9 +698,7 @@ def register_handlers(dp):
                 )
                 
                 # Update additional info
-                conn = get_connection()
-                cursor = conn.cursor()
-                cursor.execute(
+                await adb.execute_query(
                     """
                     UPDATE artisans 
                     SET payment_card_number = %s, 
@@ -709,14 +707,13 @@ def register_handlers(dp):
                         profile_complete = TRUE
                     WHERE id = %s
                     """,
-                    (default_card_number, default_card_holder, default_address, artisan_id)
+                    (default_card_number, default_card_holder, default_address, artisan_id),
+                    commit=True
                 )
-                conn.commit()
-                conn.close()
             
             if artisan_id:
                 try:
-                    set_user_context(telegram_id, {"is_initial_registration": "true"})
+                    await adb.set_user_context(telegram_id, {"is_initial_registration": "true"})
                 except Exception as e:
                     logger.error(f"Error setting initial context: {e}")
                 
@@ -731,9 +728,9 @@ def register_handlers(dp):
                 
                 # IMPORTANT CHANGE: Directly prompt to set up price ranges immediately
                 # Get artisan service and its subservices
-                artisan = get_artisan_by_id(artisan_id)
+                artisan = await adb.get_artisan_by_id(artisan_id)
                 service = artisan['service']
-                subservices = get_subservices(service)
+                subservices = await adb.get_subservices(service)
                 
                 if subservices:
                     # Create keyboard with subservice options
@@ -822,7 +819,7 @@ def register_handlers(dp):
         try:
             # Get artisan ID to check registration
             telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 # If not registered, show role selection menu
@@ -867,7 +864,7 @@ def register_handlers(dp):
         try:
             # Get artisan ID
             telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 await message.answer(
@@ -876,7 +873,7 @@ def register_handlers(dp):
                 return
             
             # Check if artisan is blocked
-            is_blocked, reason, amount = get_artisan_blocked_status(artisan_id)
+            is_blocked, reason, amount = await adb.get_artisan_blocked_status(artisan_id)
             if is_blocked:
                 await message.answer(
                     f"⛔ Hesabınız bloklanıb. Sifarişlərinizi görmək üçün əvvəlcə bloku açın.\n"
@@ -887,7 +884,7 @@ def register_handlers(dp):
                 return
             
             # Get active orders
-            orders = get_artisan_active_orders(artisan_id)
+            orders = await adb.get_artisan_active_orders(artisan_id)
             
             if not orders:
                 await message.answer(
@@ -1008,7 +1005,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 await callback_query.message.answer(
@@ -1027,8 +1024,8 @@ def register_handlers(dp):
             # Get price range for this subservice (if exists)
             price_range = None
             if order.get('subservice'):
-                artisan_id = get_artisan_by_telegram_id(callback_query.from_user.id)
-                price_range = get_artisan_price_ranges(artisan_id, order['subservice'])
+                artisan_id = await adb.get_artisan_by_telegram_id(callback_query.from_user.id)
+                price_range = await adb.get_artisan_price_ranges(artisan_id, order['subservice'])
             
             price_info = ""
             if price_range:
@@ -1087,20 +1084,19 @@ def register_handlers(dp):
             if subservice:
                 # Ustanın bu alt servis için belirlediği fiyat aralığını kontrol et
                 telegram_id = message.from_user.id
-                artisan_id = get_artisan_by_telegram_id(telegram_id)
+                artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
                 
                 logger.info(f"Bulunan artisan ID: {artisan_id}")
                 
                 if artisan_id:
                     # Önce normal sorgu dene
-                    price_range = get_artisan_price_ranges(artisan_id, subservice)
+                    price_range = await adb.get_artisan_price_ranges(artisan_id, subservice)
                     logger.info(f"Fiyat aralığı sorgu sonucu: {price_range}")
                     
                     # Eğer bulamazsa case insensitive dene
                     if not price_range:
                         logger.info("Normal sorgu sonuç vermedi, case insensitive deneniyor...")
                         try:
-                            from db import execute_query
                             case_insensitive_query = """
                                 SELECT apr.min_price, apr.max_price, s.name as subservice
                                 FROM artisan_price_ranges apr
@@ -1108,7 +1104,7 @@ def register_handlers(dp):
                                 WHERE apr.artisan_id = %s AND LOWER(s.name) = LOWER(%s)
                                 AND apr.is_active = TRUE
                             """
-                            price_range = execute_query(case_insensitive_query, (artisan_id, subservice), fetchone=True, dict_cursor=True)
+                            price_range = await adb.execute_query(case_insensitive_query, (artisan_id, subservice), fetchone=True, dict_cursor=True)
                             logger.info(f"Case insensitive sorgu sonucu: {price_range}")
                         except Exception as e:
                             logger.error(f"Case insensitive sorgu hatası: {e}")
@@ -1123,7 +1119,7 @@ def register_handlers(dp):
                                 JOIN subservices s ON apr.subservice_id = s.id
                                 WHERE apr.artisan_id = %s AND apr.is_active = TRUE
                             """
-                            existing_ranges = execute_query(list_query, (artisan_id,), fetchall=True, dict_cursor=True)
+                            existing_ranges = await adb.execute_query(list_query, (artisan_id,), fetchall=True, dict_cursor=True)
                             logger.info(f"Bu ustanın mevcut fiyat aralıkları: {existing_ranges}")
                             logger.info(f"Aranan subservice: '{subservice}' (Tip: {type(subservice)})")
                         except Exception as e:
@@ -1174,25 +1170,36 @@ def register_handlers(dp):
             artisan_amount = price - admin_fee
             
             # First update the price directly in the orders table
-            conn = get_connection()
-            cursor = conn.cursor()
             try:
                 # Update orders table first
-                cursor.execute(
+                await adb.execute_query(
                     "UPDATE orders SET price = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
-                    (price, order_id)
+                    (price, order_id),
+                    commit=True
                 )
-                conn.commit()
                 logger.info(f"Updated price in orders table for order {order_id}: {price}")
             except Exception as e:
                 logger.error(f"Error updating price in orders table: {e}")
-            finally:
-                conn.close()
+            
+            # Build the customer's price offer, it is committed together with the price
+            notices = []
+            try:
+                # Import at function level to avoid circular imports
+                from payment_service import notify_customer_about_price
+                
+                # Use the service function that handles encryption correctly
+                if not await notify_customer_about_price(order_id, price, outbox=notices):
+                    logger.warning(f"Failed to notify customer for order {order_id}, but continuing process")
+            except Exception as e:
+                # Log error but don't break the flow
+                logger.error(f"Error notifying customer about price: {e}", exc_info=True)
             
             # Save price to order in database using the main function
-            success = set_order_price(order_id, price, admin_fee, artisan_amount)
+            success = await adb.set_order_price(order_id, price, admin_fee, artisan_amount, outbox=notices)
             
             if success:
+                await timers.cancel([TASK_PRICE_REMINDER, TASK_FINAL_PRICE_WARNING], order_id)
+                
                 # Show payment options to artisan
                 keyboard = InlineKeyboardMarkup(row_width=1)
                 keyboard.add(
@@ -1206,22 +1213,8 @@ def register_handlers(dp):
                     f"İndi müştəriyə ödəniş üsulunu seçməyi təklif edin:",
                     reply_markup=keyboard
                 )
-                
-                # Notify customer about the price using the payment_service module
-                try:
-                    # Import at function level to avoid circular imports
-                    from payment_service import notify_customer_about_price
-                    
-                    # Use the service function that handles encryption correctly
-                    notify_result = await notify_customer_about_price(order_id, price)
-                    if notify_result:
-                        logger.info(f"Price notification sent to customer for order {order_id}")
-                    else:
-                        logger.warning(f"Failed to notify customer for order {order_id}, but continuing process")
-                except Exception as e:
-                    # Log error but don't break the flow
-                    logger.error(f"Error notifying customer about price: {e}", exc_info=True)
-                    # We'll continue even if notification fails
+                if notices:
+                    logger.info(f"Price notification queued for customer of order {order_id}")
             else:
                 await message.answer(
                     "❌ Qiymət təyin edilərkən xəta baş verdi. Zəhmət olmasa bir az sonra yenidən cəhd edin."
@@ -1245,7 +1238,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details including price
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order or not order.get('price'):
                 await callback_query.message.answer(
@@ -1255,8 +1248,8 @@ def register_handlers(dp):
                 return
             
             # Get artisan info
-            artisan_id = get_artisan_by_telegram_id(callback_query.from_user.id)
-            artisan = get_artisan_by_id(artisan_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(callback_query.from_user.id)
+            artisan = await adb.get_artisan_by_id(artisan_id)
             
             if not artisan:
                 await callback_query.message.answer("❌ Usta məlumatları tapılmadı.")
@@ -1264,8 +1257,7 @@ def register_handlers(dp):
                 return
             
             # Update payment method in database
-            from db import update_payment_method
-            success = update_payment_method(order_id, "card")
+            success = await adb.update_payment_method(order_id, "card")
             
             if success:
                 # Inform artisan about the process
@@ -1309,7 +1301,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details including price
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order or not order.get('price'):
                 await callback_query.message.answer(
@@ -1319,8 +1311,7 @@ def register_handlers(dp):
                 return
             
             # Update payment method in database
-            from db import update_payment_method
-            success = update_payment_method(order_id, "cash")
+            success = await adb.update_payment_method(order_id, "cash")
             
             if success:
                 # Calculate admin fee
@@ -1361,7 +1352,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order or not order.get('latitude') or not order.get('longitude'):
                 await callback_query.message.answer(
@@ -1405,7 +1396,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Check if price has been set
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             if not order.get('price'):
                 await callback_query.message.answer(
                     "❌ Sifarişi tamamlamaq üçün əvvəlcə qiymət təyin etməlisiniz. "
@@ -1452,7 +1443,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Update order status in database
-            success = update_order_status(order_id, "completed")
+            success = await adb.update_order_status(order_id, "completed")
             
             if success:
                 await callback_query.message.answer(
@@ -1462,11 +1453,11 @@ def register_handlers(dp):
                 )
                 
                 # Get order details for notification
-                order = get_order_details(order_id)
+                order = await adb.get_order_details(order_id)
                 
                 if order and order.get('customer_id'):
                     # Notify customer that order is completed
-                    customer = get_customer_by_id(order['customer_id'])
+                    customer = await adb.get_customer_by_id(order['customer_id'])
                     if customer and customer.get('telegram_id'):
                         await bot.send_message(
                             chat_id=customer['telegram_id'],
@@ -1565,7 +1556,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Update order status in database
-            success = update_order_status(order_id, "cancelled")
+            success = await adb.update_order_status(order_id, "cancelled")
             
             if success:
                 await callback_query.message.answer(
@@ -1574,7 +1565,7 @@ def register_handlers(dp):
                 )
                 
                 # Get order details for notification
-                order = get_order_details(order_id)
+                order = await adb.get_order_details(order_id)
                 
                 # Here you would normally send a notification to the customer
                 # This would be implemented through a customer notification system
@@ -1625,7 +1616,7 @@ def register_handlers(dp):
         try:
             # Get artisan ID
             telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 await message.answer(
@@ -1634,7 +1625,7 @@ def register_handlers(dp):
                 return
             
             # Check if artisan is blocked
-            is_blocked, reason, amount = get_artisan_blocked_status(artisan_id)
+            is_blocked, reason, amount = await adb.get_artisan_blocked_status(artisan_id)
             if is_blocked:
                 await message.answer(
                     f"⛔ Hesabınız bloklanıb. Rəylərinizi görmək üçün əvvəlcə bloku açın.\n"
@@ -1645,7 +1636,7 @@ def register_handlers(dp):
                 return
             
             # Get reviews
-            reviews = get_artisan_reviews(artisan_id)
+            reviews = await adb.get_artisan_reviews(artisan_id)
             
             if not reviews:
                 await message.answer(
@@ -1694,7 +1685,7 @@ def register_handlers(dp):
                     parse_mode="Markdown"
                 )
             
-            avg_rating = get_artisan_average_rating(artisan_id)
+            avg_rating = await adb.get_artisan_average_rating(artisan_id)
         
             if avg_rating:
                 avg_stars = "⭐" * round(avg_rating)
@@ -1718,7 +1709,7 @@ def register_handlers(dp):
         try:
             # Get artisan ID
             telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 await message.answer(
@@ -1727,7 +1718,7 @@ def register_handlers(dp):
                 return
             
             # Check if artisan is blocked
-            is_blocked, reason, amount = get_artisan_blocked_status(artisan_id)
+            is_blocked, reason, amount = await adb.get_artisan_blocked_status(artisan_id)
             if is_blocked:
                 await message.answer(
                     f"⛔ Hesabınız bloklanıb. Statistikanızı görmək üçün əvvəlcə bloku açın.\n"
@@ -1738,8 +1729,7 @@ def register_handlers(dp):
                 return
             
             # Get artisan statistics from database
-            from db import get_artisan_statistics
-            stats = get_artisan_statistics(artisan_id)
+            stats = await adb.get_artisan_statistics(artisan_id)
             
             if stats:
                 # Display the statistics
@@ -1790,7 +1780,7 @@ def register_handlers(dp):
                 
             # Get artisan ID
             telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 await message.answer(
@@ -1799,7 +1789,7 @@ def register_handlers(dp):
                 return
             
             # Get artisan details
-            artisan = get_artisan_by_id(artisan_id)
+            artisan = await adb.get_artisan_by_id(artisan_id)
             
             if not artisan:
                 await message.answer(
@@ -1824,7 +1814,7 @@ def register_handlers(dp):
                 logger.error(f"Əlavə deşifrələmə prosesində xəta: {e}")
 
             # Check if artisan is blocked
-            is_blocked, reason, amount = get_artisan_blocked_status(artisan_id)
+            is_blocked, reason, amount = await adb.get_artisan_blocked_status(artisan_id)
             if is_blocked:
                 blocked_info = (
                     f"\n\n⛔ *Hesabınız bloklanıb*\n"
@@ -1929,9 +1919,9 @@ def register_handlers(dp):
             
             # Update name in database
             telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
-            success = update_artisan_profile(artisan_id, {'name': name})
+            success = await adb.update_artisan_profile(artisan_id, {'name': name})
             
             if success:
                 await message.answer(
@@ -2001,9 +1991,9 @@ def register_handlers(dp):
             
             # Check if phone is already used by another artisan
             telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
-            if check_artisan_exists(phone=phone, exclude_id=artisan_id):
+            if await adb.check_artisan_exists(phone=phone, exclude_id=artisan_id):
                 await message.answer(
                     "❌ Bu telefon nömrəsi artıq başqa usta tərəfindən istifadə olunur. "
                     "Zəhmət olmasa, başqa nömrə daxil edin:"
@@ -2011,7 +2001,7 @@ def register_handlers(dp):
                 return
             
             # Update phone in database
-            success = update_artisan_profile(artisan_id, {'phone': phone})
+            success = await adb.update_artisan_profile(artisan_id, {'phone': phone})
             
             if success:
                 await message.answer(
@@ -2072,9 +2062,9 @@ def register_handlers(dp):
             
             # Update city in database
             telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
-            success = update_artisan_profile(artisan_id, {'city': city})
+            success = await adb.update_artisan_profile(artisan_id, {'city': city})
             
             if success:
                 await message.answer(
@@ -2107,7 +2097,7 @@ def register_handlers(dp):
         try:
             # Get artisan ID and current service
             telegram_id = callback_query.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 await callback_query.message.answer(
@@ -2118,11 +2108,11 @@ def register_handlers(dp):
                 return
                 
             # Get current service
-            artisan = get_artisan_by_id(artisan_id)
+            artisan = await adb.get_artisan_by_id(artisan_id)
             current_service = artisan['service']
             
             # Get available services
-            services = get_services()
+            services = await adb.get_services()
             
             # Filter out current service
             available_services = [s for s in services if s != current_service]
@@ -2168,11 +2158,10 @@ def register_handlers(dp):
             
             # Update service in database
             telegram_id = callback_query.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             # Update service and reset price ranges
-            from db import update_artisan_service_and_reset_prices
-            success = update_artisan_service_and_reset_prices(artisan_id, selected_service)
+            success = await adb.update_artisan_service_and_reset_prices(artisan_id, selected_service)
             
             if success:
                 await callback_query.message.answer(
@@ -2221,7 +2210,7 @@ def register_handlers(dp):
         try:
             # Get artisan ID
             telegram_id = callback_query.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 await callback_query.message.answer(
@@ -2276,7 +2265,7 @@ def register_handlers(dp):
             if not artisan_id:
                 # If not found in state, try to get from telegram_id
                 telegram_id = message.from_user.id
-                artisan_id = get_artisan_by_telegram_id(telegram_id)
+                artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
                     
             if not artisan_id:
                 await message.answer(
@@ -2298,7 +2287,7 @@ def register_handlers(dp):
                 city = location_name  # Use location name as city if available
             
             # Get current artisan info for confirmation
-            artisan = get_artisan_by_id(artisan_id)
+            artisan = await adb.get_artisan_by_id(artisan_id)
             
             # Store location in state for confirmation
             async with state.proxy() as data:
@@ -2354,7 +2343,7 @@ def register_handlers(dp):
             if not artisan_id:
                 # Try to get from telegram_id
                 telegram_id = callback_query.from_user.id
-                artisan_id = get_artisan_by_telegram_id(telegram_id)
+                artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
                 
             if not artisan_id or not latitude or not longitude:
                 await callback_query.message.answer(
@@ -2365,7 +2354,7 @@ def register_handlers(dp):
                 return
                 
             # Update location in database with correct parameter passing
-            success = update_artisan_location(
+            success = await adb.update_artisan_location(
                 artisan_id=artisan_id,
                 latitude=latitude,
                 longitude=longitude,
@@ -2384,7 +2373,7 @@ def register_handlers(dp):
                 )
                 
                 # Get updated artisan info
-                artisan = get_artisan_by_id(artisan_id)
+                artisan = await adb.get_artisan_by_id(artisan_id)
                 
                 # Display updated profile info
                 if artisan:
@@ -2479,7 +2468,7 @@ def register_handlers(dp):
         try:
             # Get artisan ID and current status
             telegram_id = callback_query.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 await callback_query.message.answer(
@@ -2490,7 +2479,7 @@ def register_handlers(dp):
                 return
             
             # Toggle active status in database
-            success, new_status = toggle_artisan_active_status(artisan_id)
+            success, new_status = await adb.toggle_artisan_active_status(artisan_id)
             
             if success:
                 status_text = "aktiv" if new_status else "qeyri-aktiv"
@@ -2575,7 +2564,7 @@ def register_handlers(dp):
         try:
             # Get artisan ID
             telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 await message.answer(
@@ -2584,7 +2573,7 @@ def register_handlers(dp):
                 return
             
             # Check if artisan is blocked
-            is_blocked, reason, amount = get_artisan_blocked_status(artisan_id)
+            is_blocked, reason, amount = await adb.get_artisan_blocked_status(artisan_id)
             if is_blocked:
                 await message.answer(
                     f"⛔ Hesabınız bloklanıb. Qiymət ayarlarınızı dəyişmək üçün əvvəlcə bloku açın.\n"
@@ -2599,12 +2588,12 @@ def register_handlers(dp):
             reply_keyboard.add(KeyboardButton("🔙🔙🔙 Geri"))
             
             # Get artisan price ranges
-            price_ranges = get_artisan_price_ranges(artisan_id)
+            price_ranges = await adb.get_artisan_price_ranges(artisan_id)
             
             # Get artisan service and its subservices
-            artisan = get_artisan_by_id(artisan_id)
+            artisan = await adb.get_artisan_by_id(artisan_id)
             service = artisan['service']
-            subservices = get_subservices(service)
+            subservices = await adb.get_subservices(service)
             
             if not subservices:
                 await message.answer(
@@ -2671,7 +2660,7 @@ def register_handlers(dp):
         try:
             # Get artisan ID
             telegram_id = callback_query.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 await callback_query.message.answer(
@@ -2681,9 +2670,9 @@ def register_handlers(dp):
                 return
             
             # Get artisan service and its subservices
-            artisan = get_artisan_by_id(artisan_id)
+            artisan = await adb.get_artisan_by_id(artisan_id)
             service = artisan['service']
-            subservices = get_subservices(service)
+            subservices = await adb.get_subservices(service)
             
             if not subservices:
                 await callback_query.message.answer(
@@ -2744,8 +2733,8 @@ def register_handlers(dp):
                 data['subservice'] = selected_subservice
             
             # Check if price range already exists
-            artisan_id = get_artisan_by_telegram_id(callback_query.from_user.id)
-            existing_range = get_artisan_price_ranges(artisan_id, selected_subservice)
+            artisan_id = await adb.get_artisan_by_telegram_id(callback_query.from_user.id)
+            existing_range = await adb.get_artisan_price_ranges(artisan_id, selected_subservice)
             
             info_text = ""
             if existing_range:
@@ -2826,7 +2815,7 @@ def register_handlers(dp):
             
             # Get artisan ID and subservice from state
             telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             data = await state.get_data()
             subservice = data.get('subservice')
@@ -2837,7 +2826,7 @@ def register_handlers(dp):
                 return
             
             # Update price range in database
-            success = update_artisan_price_range(
+            success = await adb.update_artisan_price_range(
                 artisan_id=artisan_id,
                 subservice=subservice,
                 min_price=min_price,
@@ -2853,14 +2842,14 @@ def register_handlers(dp):
                 )
                 
                 # Ask if user wants to set more price ranges
-                artisan = get_artisan_by_id(artisan_id)
+                artisan = await adb.get_artisan_by_id(artisan_id)
                 service = artisan['service']
                 
                 # Get all subservices for this service
-                all_subservices = get_subservices(service)
+                all_subservices = await adb.get_subservices(service)
                 
                 # Get all subservices that already have prices set
-                price_ranges = get_artisan_price_ranges(artisan_id)
+                price_ranges = await adb.get_artisan_price_ranges(artisan_id)
                 already_set_subservices = [pr['subservice'] for pr in price_ranges]
                 
                 # Reset state first, then set to price range selection state
@@ -2927,7 +2916,7 @@ def register_handlers(dp):
             
             # Get artisan ID
             telegram_id = callback_query.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 logger.error(f"Artisan ID not found for telegram_id: {telegram_id}")
@@ -2937,21 +2926,9 @@ def register_handlers(dp):
                 return
             
             # Check if this is a new registration based on timestamp
-            conn = None
             try:
-                conn = get_connection()
-                cursor = conn.cursor()
-                
                 # Check when the artisan was created - if recent, consider it initial registration
-                cursor.execute(
-                    """
-                    SELECT created_at, payment_card_number 
-                    FROM artisans 
-                    WHERE id = %s
-                    """,
-                    (artisan_id,)
-                )
-                result = cursor.fetchone()
+                result = await adb.get_artisan_registration_info(artisan_id)
                 
                 if not result:
                     raise Exception("Artisan not found in database")
@@ -2972,9 +2949,6 @@ def register_handlers(dp):
                 # Default fallback values
                 is_initial_registration = False
                 has_payment_info = True
-            finally:
-                if conn:
-                    conn.close()
             
             # COMMENTED OUT: For initial registration without payment info, redirect to payment setup
             # if is_initial_registration and not has_payment_info:
@@ -3056,69 +3030,8 @@ def register_handlers(dp):
             photo = message.photo[-1]
             file_id = photo.file_id
             
-            # Direct database update
-            conn = None
-            success = False
-            
-            try:
-                conn = get_connection()
-                cursor = conn.cursor()
-                
-                # Update order_payments table
-                cursor.execute(
-                    """
-                    UPDATE order_payments 
-                    SET receipt_file_id = %s,
-                        receipt_uploaded_at = CURRENT_TIMESTAMP,
-                        payment_status = 'completed',
-                        payment_date = CURRENT_TIMESTAMP,
-                        admin_payment_completed = NULL,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE order_id = %s
-                    RETURNING id
-                    """,
-                    (file_id, order_id)
-                )
-                
-                result = cursor.fetchone()
-                if result:
-                    logger.info(f"Successfully updated order_payments for order {order_id}")
-                    success = True
-                else:
-                    # No existing record, try insert
-                    cursor.execute(
-                        """
-                        INSERT INTO order_payments 
-                        (order_id, receipt_file_id, receipt_uploaded_at, payment_status, 
-                        payment_date, admin_payment_completed, created_at)
-                        VALUES (%s, %s, CURRENT_TIMESTAMP, 'completed', 
-                                CURRENT_TIMESTAMP, NULL, CURRENT_TIMESTAMP) /* Değişen satır: TRUE -> NULL */
-                        ON CONFLICT (order_id) DO UPDATE 
-                        SET receipt_file_id = EXCLUDED.receipt_file_id,
-                            receipt_uploaded_at = EXCLUDED.receipt_uploaded_at,
-                            payment_status = EXCLUDED.payment_status,
-                            payment_date = EXCLUDED.payment_date,
-                            admin_payment_completed = EXCLUDED.admin_payment_completed
-                        RETURNING id
-                        """,
-                        (order_id, file_id)
-                    )
-                    
-                    result = cursor.fetchone()
-                    if result:
-                        logger.info(f"Successfully inserted/updated order_payments for order {order_id}")
-                        success = True
-                    else:
-                        logger.error(f"Failed to update or insert payment record for order {order_id}")
-                    
-                conn.commit()
-            except Exception as db_error:
-                logger.error(f"Database error: {db_error}", exc_info=True)
-                if conn:
-                    conn.rollback()
-            finally:
-                if conn:
-                    conn.close()
+            # Save the receipt
+            success = await adb.save_admin_payment_receipt(order_id, file_id)
             
             # Send confirmation message
             if success:
@@ -3169,7 +3082,7 @@ def register_handlers(dp):
             telegram_id = message.from_user.id
             
             # Get user context
-            context = get_user_context(telegram_id)
+            context = await adb.get_user_context(telegram_id)
             
             if not context or not context.get('action'):
                 # No context requiring photo, ignore
@@ -3197,76 +3110,19 @@ def register_handlers(dp):
                 file_id = photo.file_id
                 
                 # Get artisan ID
-                artisan_id = get_artisan_by_telegram_id(telegram_id)
+                artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
                 if not artisan_id:
                     await message.answer("❌ Usta məlumatları tapılmadı.")
                     return
                 
                 # Get current order details
-                order = get_order_details(order_id)
+                order = await adb.get_order_details(order_id)
                 if not order:
                     await message.answer("❌ Sifariş məlumatları tapılmadı.")
                     return
                 
                 # Update receipt in database
-                conn = None
-                success = False
-                
-                try:
-                    conn = get_connection()
-                    cursor = conn.cursor()
-                    
-                    # Update order_payments record with new receipt
-                    cursor.execute(
-                        """
-                        UPDATE order_payments 
-                        SET receipt_file_id = %s,
-                            receipt_uploaded_at = CURRENT_TIMESTAMP,
-                            receipt_verified = FALSE, 
-                            payment_status = 'pending',
-                            updated_at = CURRENT_TIMESTAMP
-                        WHERE order_id = %s
-                        RETURNING id
-                        """,
-                        (file_id, order_id)
-                    )
-                    
-                    result = cursor.fetchone()
-                    
-                    if result:
-                        # Add entry to receipt_verification_history 
-                        cursor.execute(
-                            """
-                            INSERT INTO receipt_verification_history 
-                            (order_id, is_verified, attempt_number, verified_at)
-                            VALUES (%s, NULL, (
-                                SELECT COALESCE(MAX(attempt_number), 0) + 1 
-                                FROM receipt_verification_history 
-                                WHERE order_id = %s
-                            ), CURRENT_TIMESTAMP)
-                            """,
-                            (order_id, order_id)
-                        )
-                        
-                        # Clear scheduled block if any (by updating notification_log)
-                        cursor.execute(
-                            """
-                            INSERT INTO notification_log (notification_type, target_id, created_at)
-                            VALUES ('commission_resubmitted', %s, CURRENT_TIMESTAMP)
-                            """,
-                            (order_id,)
-                        )
-                        
-                        success = True
-                    
-                    conn.commit()
-                except Exception as db_error:
-                    logger.error(f"Database error in handle_receipt_photo: {db_error}")
-                    if conn:
-                        conn.rollback()
-                finally:
-                    if conn:
-                        conn.close()
+                success = await adb.resubmit_commission_receipt(order_id, file_id)
                 
                 if success:
                     # Send confirmation to artisan
@@ -3300,7 +3156,7 @@ def register_handlers(dp):
                             logger.error(f"Error notifying admin {admin_id}: {admin_error}")
                     
                     # Clear user context
-                    clear_user_context(telegram_id)
+                    await adb.clear_user_context(telegram_id)
                 else:
                     await message.answer(
                         "❌ Qəbz göndərilərkən xəta baş verdi. Zəhmət olmasa bir az sonra yenidən cəhd edin."
@@ -3322,22 +3178,16 @@ def register_handlers(dp):
                 file_id = photo.file_id
                 
                 # Save receipt to database with error checking
-                success = save_payment_receipt(order_id, file_id)
+                success = await adb.save_payment_receipt(order_id, file_id)
                 
                 if success:
                     # Verify receipt was actually saved
-                    conn = get_connection()
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT receipt_file_id FROM order_payments WHERE order_id = %s", (order_id,))
-                    receipt_check = cursor.fetchone()
-                    conn.close()
+                    receipt_check = await adb.execute_query("SELECT receipt_file_id FROM order_payments WHERE order_id = %s", (order_id,), fetchone=True)
                     
                     if not receipt_check or not receipt_check[0]:
                         logger.error(f"Receipt appears to be saved but not found in database for order {order_id}")
                         # Try alternative update method
-                        conn = get_connection()
-                        cursor = conn.cursor()
-                        cursor.execute(
+                        await adb.execute_query(
                             """
                             UPDATE order_payments 
                             SET receipt_file_id = %s,
@@ -3348,26 +3198,22 @@ def register_handlers(dp):
                                 updated_at = CURRENT_TIMESTAMP
                             WHERE order_id = %s
                             """,
-                            (file_id, order_id)
+                            (file_id, order_id),
+                            commit=True
                         )
-                        conn.commit()
-                        conn.close()
                     
                     # Clear user context
-                    clear_user_context(telegram_id)
+                    await adb.clear_user_context(telegram_id)
                     
                     # Mark order as completed
-                    update_order_status(order_id, "completed")
+                    await adb.update_order_status(order_id, "completed")
                     
                     # Final verification
-                    conn = get_connection()
-                    cursor = conn.cursor()
-                    cursor.execute(
+                    final_check = await adb.execute_query(
                         "SELECT receipt_file_id FROM order_payments WHERE order_id = %s", 
-                        (order_id,)
+                        (order_id,),
+                        fetchone=True
                     )
-                    final_check = cursor.fetchone()
-                    conn.close()
                     
                     if final_check and final_check[0]:
                         await message.answer(
@@ -3380,14 +3226,11 @@ def register_handlers(dp):
                         await show_artisan_menu(message)
                     else:
                         # If verification failed, attempt direct update one last time
-                        conn = get_connection()
-                        cursor = conn.cursor()
-                        cursor.execute(
+                        await adb.execute_query(
                             "UPDATE order_payments SET receipt_file_id = %s, receipt_uploaded_at = CURRENT_TIMESTAMP WHERE order_id = %s",
-                            (file_id, order_id)
+                            (file_id, order_id),
+                            commit=True
                         )
-                        conn.commit()
-                        conn.close()
                         
                         await message.answer(
                             "⚠️ Qəbzin yüklənməsi zamanı bəzi problemlər yarandı, lakin biz qeyd etdik.\n"
@@ -3417,24 +3260,7 @@ def register_handlers(dp):
                     
                     # Try a direct database update as last resort
                     try:
-                        conn = get_connection()
-                        cursor = conn.cursor()
-                        cursor.execute(
-                            """
-                            UPDATE order_payments 
-                            SET receipt_file_id = %s,
-                                receipt_uploaded_at = CURRENT_TIMESTAMP,
-                                payment_status = 'completed',
-                                payment_date = CURRENT_TIMESTAMP,
-                                admin_payment_completed = NULL
-                            WHERE order_id = %s
-                            """,
-                            (file_id, order_id)
-                        )
-                        rows_updated = cursor.rowcount
-                        conn.commit()
-                        
-                        if rows_updated > 0:
+                        if await adb.complete_payment_receipt(order_id, file_id, reset_admin_payment=True):
                             logger.info(f"Direct update succeeded for order {order_id}")
                             await message.answer(
                                 "✅ Qəbz yükləndi!\n\n"
@@ -3442,7 +3268,7 @@ def register_handlers(dp):
                                 reply_markup=types.ReplyKeyboardRemove()
                             )
                             # Clear context and restore menu
-                            clear_user_context(telegram_id)
+                            await adb.clear_user_context(telegram_id)
                             await show_artisan_menu(message)
                             return
                     except Exception as db_error:
@@ -3466,14 +3292,14 @@ def register_handlers(dp):
                 file_id = photo.file_id
                 
                 # Save receipt to database
-                success = save_payment_receipt(order_id, file_id)
+                success = await adb.save_payment_receipt(order_id, file_id)
                 
                 if success:
                     # Clear user context
-                    clear_user_context(telegram_id)
+                    await adb.clear_user_context(telegram_id)
                     
                     # Mark order as completed
-                    update_order_status(order_id, "completed")
+                    await adb.update_order_status(order_id, "completed")
                     
                     await message.answer(
                         "✅ Ödəniş qəbzi uğurla yükləndi!\n\n"
@@ -3482,9 +3308,9 @@ def register_handlers(dp):
                     )
                     
                     # Notify artisan
-                    order = get_order_details(order_id)
+                    order = await adb.get_order_details(order_id)
                     if order:
-                        artisan = get_artisan_by_id(order['artisan_id'])
+                        artisan = await adb.get_artisan_by_id(order['artisan_id'])
                         if artisan and artisan.get('telegram_id'):
                             # Send notification to artisan with receipt
                             await bot.send_photo(
@@ -3497,29 +3323,14 @@ def register_handlers(dp):
                             )
                 else:
                     # Try a direct update
-                    conn = get_connection()
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        """
-                        UPDATE order_payments 
-                        SET receipt_file_id = %s,
-                            receipt_uploaded_at = CURRENT_TIMESTAMP,
-                            payment_status = 'completed',
-                            payment_date = CURRENT_TIMESTAMP
-                        WHERE order_id = %s
-                        """,
-                        (file_id, order_id)
-                    )
-                    direct_success = cursor.rowcount > 0
-                    conn.commit()
-                    conn.close()
+                    direct_success = await adb.complete_payment_receipt(order_id, file_id)
                     
                     if direct_success:
                         # Clear user context
-                        clear_user_context(telegram_id)
+                        await adb.clear_user_context(telegram_id)
                         
                         # Mark order as completed
-                        update_order_status(order_id, "completed")
+                        await adb.update_order_status(order_id, "completed")
                         
                         await message.answer(
                             "✅ Ödəniş qəbzi uğurla yükləndi!\n\n"
@@ -3554,7 +3365,7 @@ def register_handlers(dp):
         """Handle the pay_fine command for blocked artisans"""
         try:
             telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 await message.answer(
@@ -3563,7 +3374,7 @@ def register_handlers(dp):
                 return
                 
             # Check if artisan is blocked
-            is_blocked, reason, amount = get_artisan_blocked_status(artisan_id)
+            is_blocked, reason, amount = await adb.get_artisan_blocked_status(artisan_id)
             
             if not is_blocked:
                 await message.answer(
@@ -3610,14 +3421,13 @@ def register_handlers(dp):
             telegram_id = callback_query.from_user.id
             
             # Check if artisan exists and is blocked
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             if not artisan_id:
                 await callback_query.answer("❌ Usta məlumatları tapılmadı.", show_alert=True)
                 return
             
             # Check block status
-            from db import get_artisan_blocked_status
-            is_blocked, reason, amount = get_artisan_blocked_status(artisan_id)
+            is_blocked, reason, amount = await adb.get_artisan_blocked_status(artisan_id)
             
             if not is_blocked:
                 await callback_query.answer("✅ Hesabınızda heç bir blok yoxdur.", show_alert=True)
@@ -3632,7 +3442,7 @@ def register_handlers(dp):
                 "amount": amount
             }
             
-            set_user_context(telegram_id, context_data)
+            await adb.set_user_context(telegram_id, context_data)
             
             await callback_query.message.answer(
                 f"💰 <b>Cərimə Ödənişi</b>\n\n"
@@ -3693,31 +3503,6 @@ def register_handlers(dp):
             await state.finish()
             await show_artisan_menu(callback_query.message)
 
-    async def show_customer_menu(message: types.Message):
-        """Show the main customer menu"""
-        try:
-            keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
-            keyboard.add(KeyboardButton("✅ Yeni sifariş ver"))
-            keyboard.add(KeyboardButton("📜 Əvvəlki sifarişlərə bax"))
-            keyboard.add(KeyboardButton("🌍 Yaxınlıqdakı ustaları göstər"))
-            keyboard.add(KeyboardButton("👤 Profilim"), KeyboardButton("🔍 Xidmətlər"))
-            keyboard.add(KeyboardButton("ℹ️ Əmr bələdçisi"))
-            keyboard.add(KeyboardButton("🏠 Əsas menyuya qayıt"))
-            
-            await message.answer(
-                "👤 *Müştəri menyusu*\n\n"
-                "Aşağıdakı əməliyyatlardan birini seçin:",
-                reply_markup=keyboard,
-                parse_mode="Markdown"
-            )
-            
-        except Exception as e:
-            logger.error(f"Error in show_customer_menu: {e}")
-            await message.answer(
-                "❌ Xəta baş verdi. Zəhmət olmasa bir az sonra yenidən cəhd edin."
-            )
-            await show_role_selection(message)
-
     # Handler for returning to menu
     @dp.callback_query_handler(lambda c: c.data == "back_to_menu", state="*")
     async def back_to_menu_handler(callback_query: types.CallbackQuery, state: FSMContext):
@@ -3729,7 +3514,7 @@ def register_handlers(dp):
             
             # İstifadəçinin rolunu yoxlayırıq - artisan_id varsa, usta menyusuna qayıt
             telegram_id = callback_query.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if artisan_id:
                 # Usta kimi qeydiyyatlıdır, usta menyusuna qayıt
@@ -3859,7 +3644,7 @@ def register_handlers(dp):
             
             # Get artisan ID
             telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 await message.answer(
@@ -3872,19 +3657,16 @@ def register_handlers(dp):
             encrypted_card_number = encrypt_data(card_number)
             encrypted_card_holder = encrypt_data(card_holder)
 
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute(
+            await adb.execute_query(
                 """
                 UPDATE artisans 
                 SET payment_card_number = %s, 
                     payment_card_holder = %s
                 WHERE id = %s
                 """,
-                (encrypted_card_number, encrypted_card_holder, artisan_id)
+                (encrypted_card_number, encrypted_card_holder, artisan_id),
+                commit=True
             )
-            conn.commit()
-            conn.close()
             
             await message.answer(
                 "✅ Ödəniş məlumatlarınız uğurla qeydə alındı!\n\n"
@@ -3906,218 +3688,6 @@ def register_handlers(dp):
             await show_artisan_menu(message)
 
 
-    # Handler for "Reviews" button
-    @dp.message_handler(lambda message: message.text == "⭐ Rəylər")
-    async def view_reviews(message: types.Message):
-        """Show reviews for the artisan"""
-        try:
-            # Get artisan ID
-            telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
-            
-            if not artisan_id:
-                await message.answer(
-                    "❌ Siz hələ usta kimi qeydiyyatdan keçməmisiniz."
-                )
-                return
-            
-            # Check if artisan is blocked
-            is_blocked, reason, amount = get_artisan_blocked_status(artisan_id)
-            if is_blocked:
-                await message.answer(
-                    f"⛔ Hesabınız bloklanıb. Rəylərinizi görmək üçün əvvəlcə bloku açın.\n"
-                    f"Səbəb: {reason}\n"
-                    f"Ödəniş məbləği: {amount} AZN\n"
-                    f"Ödəniş etmək üçün: /pay_fine"
-                )
-                return
-            
-            # Get reviews
-            reviews = get_artisan_reviews(artisan_id)
-            
-            if not reviews:
-                await message.answer(
-                    "📭 Hal-hazırda heç bir rəyiniz yoxdur.\n\n"
-                    "Rəylər sifarişlər tamamlandıqdan sonra müştərilər tərəfindən verilir. "
-                    "Xidmətinizi yaxşılaşdırmaq üçün müştəriləri rəy verməyə həvəsləndirin."
-                )
-                return
-            
-            await message.answer(
-                f"⭐ *Rəylər ({len(reviews)}):*",
-                parse_mode="Markdown"
-            )
-            
-            # Display each review
-            for review in reviews:
-                # Ensure review is a dictionary
-                if isinstance(review, dict):
-                    review_id = review.get('id')
-                    rating = review.get('rating')
-                    comment = review.get('comment')
-                    customer_name = review.get('customer_name')
-                    service = review.get('service')
-                else:
-                    # If it's a tuple (old implementation), extract values
-                    review_id = review[0]
-                    rating = review[4]
-                    comment = review[5]
-                    customer_name = review[7] 
-                    service = review[8]
-                
-                # Create star rating display
-                stars = "⭐" * rating if rating else ""
-                
-                review_text = (
-                    f"📝 *Rəy #{review_id}*\n"
-                    f"👤 *Müştəri:* Anonim\n"
-                    f"⭐ *Qiymətləndirmə:* {stars} ({rating}/5)\n"
-                )
-                
-                if comment:
-                    review_text += f"💬 *Şərh:* {comment}\n"
-                
-                await message.answer(
-                    review_text,
-                    parse_mode="Markdown"
-                )
-            
-            avg_rating = get_artisan_average_rating(artisan_id)
-        
-            if avg_rating:
-                avg_stars = "⭐" * round(avg_rating)
-                await message.answer(
-                    f"📊 *Ümumi qiymətləndirməniz:* {avg_stars} ({avg_rating:.1f}/5)\n\n"
-                    f"Yaxşı rəylər müştərilərin sizi seçməsinə kömək edir. Xidmətinizi yüksək səviyyədə "
-                    f"saxlayın və müştəriləri rəy verməyə həvəsləndirin!",
-                    parse_mode="Markdown"
-                )
-        
-        except Exception as e:
-            logger.error(f"Error in view_reviews: {e}")
-            await message.answer(
-                "❌ Rəylər yüklənərkən xəta baş verdi. Zəhmət olmasa bir az sonra yenidən cəhd edin."
-            )
-
-
-    # Handler for "Active Orders" button
-    @dp.message_handler(lambda message: message.text == "📋 Aktiv sifarişlər")
-    async def view_active_orders(message: types.Message):
-        """Show active orders for the artisan"""
-        try:
-            # Get artisan ID
-            telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
-            
-            if not artisan_id:
-                await message.answer(
-                    "❌ Siz hələ usta kimi qeydiyyatdan keçməmisiniz."
-                )
-                return
-            
-            # Check if artisan is blocked
-            is_blocked, reason, amount = get_artisan_blocked_status(artisan_id)
-            if is_blocked:
-                await message.answer(
-                    f"⛔ Hesabınız bloklanıb. Sifarişlərinizi görmək üçün əvvəlcə bloku açın.\n"
-                    f"Səbəb: {reason}\n"
-                    f"Ödəniş məbləği: {amount} AZN\n"
-                    f"Ödəniş etmək üçün: /pay_fine"
-                )
-                return
-            
-            # Get active orders
-            orders = get_artisan_active_orders(artisan_id)
-            
-            if not orders:
-                await message.answer(
-                    "📭 Hal-hazırda heç bir aktiv sifarişiniz yoxdur."
-                )
-                return
-            
-            await message.answer(
-                f"📋 *Aktiv sifarişlər ({len(orders)}):*",
-                parse_mode="Markdown"
-            )
-            
-            # Display each order
-            for order in orders:
-                # Ensure order is a dictionary
-                if isinstance(order, dict):
-                    order_id = order.get('id')
-                    service = order.get('service')
-                    subservice = order.get('subservice', '')
-                    date_time = order.get('date_time')
-                    note = order.get('note')
-                    latitude = order.get('latitude')
-                    longitude = order.get('longitude')
-                    # Müşteri bilgilerini maskelenmiş olarak al
-                    customer_id = order.get('customer_id')
-                    customer = get_masked_customer_by_id(customer_id)
-                    customer_name = customer.get('name', 'Bilinmiyor')
-                    customer_phone = customer.get('phone', 'Bilinmiyor')
-                    
-                else:
-                    # If it's a tuple (old implementation), extract values
-                    order_id = order[0]
-                    customer_id = order[1]
-                    service = order[3]
-                    subservice = order.get('subservice', '')
-                    date_time = order[4]
-                    note = order[5]
-                    latitude = order[6]
-                    longitude = order[7]
-                    customer_name = order[8]
-                    customer_phone = order[9]
-                
-                # Format date and time
-                try:
-                    import datetime
-                    dt_obj = datetime.datetime.strptime(str(date_time), "%Y-%m-%d %H:%M:%S")
-                    formatted_date = dt_obj.strftime("%d.%m.%Y")
-                    formatted_time = dt_obj.strftime("%H:%M")
-                except Exception as e:
-                    logger.error(f"Error formatting date: {e}")
-                    formatted_date = str(date_time).split(" ")[0]
-                    formatted_time = str(date_time).split(" ")[1] if " " in str(date_time) else ""
-                
-                # Build service text with subservice if available
-                service_text = service
-                if subservice:
-                    service_text += f" ({subservice})"
-                
-                order_text = (
-                    f"🔹 *Sifariş #{order_id}*\n"
-                    f"👤 *Müştəri:* {customer_name}\n"
-                    f"📞 *Əlaqə:* {customer_phone}\n"
-                    f"🛠 *Xidmət:* {service_text}\n"
-                    f"📅 *Tarix:* {formatted_date}\n"
-                    f"🕒 *Saat:* {formatted_time}\n"
-                    f"📝 *Qeyd:* {note}\n"
-                )
-                
-                # Add action buttons
-                keyboard = InlineKeyboardMarkup(row_width=1)
-                keyboard.add(
-                    InlineKeyboardButton("📍 Yeri göstər", callback_data=f"show_location_{order_id}"),
-                    InlineKeyboardButton("💰 Qiymət təyin et", callback_data=f"set_price_{order_id}"),
-                    InlineKeyboardButton("✅ Sifarişi tamamla", callback_data=f"complete_order_{order_id}"),
-                    InlineKeyboardButton("❌ Sifarişi ləğv et", callback_data=f"cancel_order_{order_id}")
-                )
-                
-                await message.answer(
-                    order_text,
-                    reply_markup=keyboard,
-                    parse_mode="Markdown"
-                )
-            
-        except Exception as e:
-            logger.error(f"Error in view_active_orders: {e}")
-            await message.answer(
-                "❌ Sifarişlər yüklənərkən xəta baş verdi. Zəhmət olmasa bir az sonra yenidən cəhd edin."
-            )
-
-
     # Və "Rol seçiminə qayıt" düyməsi üçün handler əlavə edirik
     @dp.message_handler(lambda message: message.text == "🔄 Rol seçiminə qayıt")
     async def return_to_role_selection(message: types.Message, state: FSMContext):
@@ -4171,7 +3741,7 @@ def register_handlers(dp):
             
             # Usta bilgilerini al - Sadece ID geliyor
             telegram_id = callback_query.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 logger.error(f"Artisan not found for telegram ID {telegram_id}")
@@ -4181,7 +3751,7 @@ def register_handlers(dp):
             logger.info(f"Found artisan ID {artisan_id} for telegram ID {telegram_id}")
             
             # Siparişi kontrol et
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             if not order:
                 logger.error(f"Order {order_id} not found")
                 await callback_query.answer("❌ Bu sipariş artık mevcut değil", show_alert=True)
@@ -4196,20 +3766,28 @@ def register_handlers(dp):
                 return
                 
             # Siparişi bu ustaya ata
-            from db import update_artisan_for_order
-            success = update_artisan_for_order(order_id, artisan_id)
+            success = await adb.update_artisan_for_order(order_id, artisan_id)
             
             if not success:
                 logger.error(f"Failed to update artisan for order {order_id}")
                 await callback_query.answer("❌ Sipariş atama hatası", show_alert=True)
                 return
                 
+            # Müşteri bildirimi durum değişikliği ile aynı transaction'da outbox'a yazılır
+            from notification_service import notify_customer_about_order_status
+            notices = []
+            notification_result = await notify_customer_about_order_status(order_id, "accepted", outbox=notices)
+            logger.info(f"Customer notification result: {notification_result}")
+            
             # Sipariş durumunu "accepted" yap
-            status_updated = update_order_status(order_id, "accepted") 
+            status_updated = await adb.update_order_status(order_id, "accepted", outbox=notices)
             logger.info(f"Order status update result: {status_updated}")
             
+            # The order is taken, its acceptance timeout no longer applies
+            await timers.cancel([TASK_ORDER_ACCEPTANCE, TASK_DIRECT_ORDER_ACCEPTANCE], order_id)
+            
             # Usta bilgilerini tam olarak al (mesajlar için)
-            artisan = get_artisan_by_id(artisan_id)
+            artisan = await adb.get_artisan_by_id(artisan_id)
             
             # Ustaya bildir
             await callback_query.message.edit_text(
@@ -4222,11 +3800,6 @@ def register_handlers(dp):
                 parse_mode="Markdown"
             )
             
-            # Müşteriye bildir
-            from notification_service import notify_customer_about_order_status
-            notification_result = await notify_customer_about_order_status(order_id, "accepted")
-            logger.info(f"Customer notification result: {notification_result}")
-            
             # Cancel order notifications for other artisans
             from notification_service import cancel_order_notifications_for_other_artisans
             await cancel_order_notifications_for_other_artisans(order_id, artisan_id)
@@ -4278,14 +3851,14 @@ def register_handlers(dp):
     async def find_and_assign_new_artisan(order_id):
         try:
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 logger.error(f"Order not found for reassignment: {order_id}")
                 return False
             
             # Get customer information
-            customer = get_customer_by_id(order['customer_id'])
+            customer = await adb.get_customer_by_id(order['customer_id'])
             customer_telegram_id = customer.get('telegram_id')
             
             if not customer_telegram_id:
@@ -4293,7 +3866,7 @@ def register_handlers(dp):
                 return False
             
             # Find available artisans for this service
-            artisans = get_nearby_artisans(
+            artisans = await adb.get_nearby_artisans(
                 latitude=order['latitude'], 
                 longitude=order['longitude'],
                 radius=10, 
@@ -4317,8 +3890,7 @@ def register_handlers(dp):
                 artisan_id = get_artisan_id(artisan)
                 if artisan_id is not None and artisan_id != previous_artisan_id:
                     # Check if this artisan should be skipped
-                    from db import should_skip_artisan_for_order
-                    should_skip = should_skip_artisan_for_order(artisan_id)
+                    should_skip = await adb.should_skip_artisan_for_order(artisan_id)
                     
                     if not should_skip:
                         filtered_artisans.append(artisan)
@@ -4327,7 +3899,7 @@ def register_handlers(dp):
             
             if not artisans:
                 # No artisans found, increase search radius
-                artisans = get_nearby_artisans(
+                artisans = await adb.get_nearby_artisans(
                     latitude=order['latitude'], 
                     longitude=order['longitude'],
                     radius=25,  # Increased radius
@@ -4341,8 +3913,7 @@ def register_handlers(dp):
                     artisan_id = get_artisan_id(artisan)
                     if artisan_id is not None and artisan_id != previous_artisan_id:
                         # Check if this artisan should be skipped
-                        from db import should_skip_artisan_for_order
-                        should_skip = should_skip_artisan_for_order(artisan_id)
+                        should_skip = await adb.should_skip_artisan_for_order(artisan_id)
                         
                         if not should_skip:
                             filtered_artisans.append(artisan)
@@ -4357,39 +3928,29 @@ def register_handlers(dp):
             
             # Find the nearest artisan
             nearest_artisan = None
-            min_distance = float('inf')
             
-            for artisan in artisans:
-                # Extract artisan details safely
-                artisan_id = None
-                artisan_latitude = None
-                artisan_longitude = None
-                
+            def get_artisan_coordinates(artisan):
                 if isinstance(artisan, dict):
-                    artisan_id = artisan.get('id')
-                    artisan_latitude = artisan.get('latitude')
-                    artisan_longitude = artisan.get('longitude')
-                elif isinstance(artisan, (list, tuple)):
-                    if len(artisan) > 0:
-                        artisan_id = artisan[0]
-                    if len(artisan) > 5:
-                        artisan_latitude = artisan[5]
-                    if len(artisan) > 6:
-                        artisan_longitude = artisan[6]
-                
-                if artisan_id and artisan_latitude and artisan_longitude:
-                    from geo_helpers import calculate_distance
-                    try:
-                        distance = calculate_distance(
-                            order['latitude'], order['longitude'], 
-                            artisan_latitude, artisan_longitude
-                        )
-                        
-                        if distance < min_distance:
-                            min_distance = distance
-                            nearest_artisan = artisan
-                    except Exception as calc_error:
-                        logger.error(f"Error calculating distance: {calc_error}")
+                    return artisan.get('latitude'), artisan.get('longitude')
+                elif isinstance(artisan, (list, tuple)) and len(artisan) > 6:
+                    return artisan[5], artisan[6]
+                return None, None
+            
+            candidates = [a for a in artisans if get_artisan_id(a)]
+            if candidates:
+                from geo_helpers import calculate_distances
+                try:
+                    coordinates = [get_artisan_coordinates(a) for a in candidates]
+                    distances, has_distance = calculate_distances(
+                        order['latitude'], order['longitude'],
+                        [lat for lat, _ in coordinates],
+                        [lon for _, lon in coordinates]
+                    )
+                    known = [(float(d), i) for i, (d, ok) in enumerate(zip(distances, has_distance)) if ok]
+                    if known:
+                        nearest_artisan = candidates[min(known)[1]]
+                except Exception as calc_error:
+                    logger.error(f"Error calculating distance: {calc_error}")
             
             # If no nearest found, just take the first one
             if not nearest_artisan and artisans:
@@ -4405,14 +3966,11 @@ def register_handlers(dp):
                 
                 if artisan_id:
                     # Update order with new artisan
-                    conn = get_connection()
-                    cursor = conn.cursor()
-                    cursor.execute(
+                    await adb.execute_query(
                         "UPDATE orders SET artisan_id = %s, status = 'pending' WHERE id = %s",
-                        (artisan_id, order_id)
+                        (artisan_id, order_id),
+                        commit=True
                     )
-                    conn.commit()
-                    conn.close()
                     
                     # Notify the new artisan
                     from notification_service import notify_artisan_about_new_order
@@ -4439,7 +3997,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 await callback_query.message.answer(
@@ -4450,7 +4008,7 @@ def register_handlers(dp):
             
             # Get artisan ID
             telegram_id = callback_query.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 await callback_query.message.answer(
@@ -4468,8 +4026,7 @@ def register_handlers(dp):
                 return
             
             # Cancel any pending delay reminders for this order
-            from db import cancel_delay_reminder
-            cancel_delay_reminder(order_id)
+            await adb.cancel_delay_reminder(order_id)
             
             # Import notification service
             from order_status_service import notify_customer_about_arrival
@@ -4500,7 +4057,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 await callback_query.message.answer(
@@ -4511,7 +4068,7 @@ def register_handlers(dp):
             
             # Get artisan ID
             telegram_id = callback_query.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 await callback_query.message.answer(
@@ -4565,7 +4122,7 @@ def register_handlers(dp):
                 callback_query.message.text + "\n\n❌ Bu sifarişə gedə bilmədiyiniz üçün sifariş ləğv edildi.",
                 parse_mode="Markdown"
             )
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             if not order:
                 logger.error(f"Error: Order not found. Order ID: {order_id}")
                 return False
@@ -4577,16 +4134,16 @@ def register_handlers(dp):
             
             # db.py-dəki get_artisan_by_id funksiyası artıq deşifrə edilmiş versiya qaytarır,
             # amma bəzən ola bilər ki, deşifrələmə tam işləməsin
-            artisan = get_artisan_by_id(artisan_id)
+            artisan = await adb.get_artisan_by_id(artisan_id)
             
             # Əlavə təhlükəsizlik üçün əl ilə də deşifrə edirik
             artisan_decrypted = decrypt_dict_data(artisan, mask=False)
             artisan_name = artisan_decrypted.get('name', 'Usta')
             artisan_phone = artisan_decrypted.get('phone', 'Telefon')
             # Müşteri ve usta bilgilerini al
-            customer = wrap_get_dict_function(get_customer_by_id)(order.get('customer_id'))
+            customer = await run_db(wrap_get_dict_function(get_customer_by_id), order.get('customer_id'))
             # Sipariş durumunu "searching" yap
-            status_updated = update_order_status(order_id, "searching") 
+            status_updated = await adb.update_order_status(order_id, "searching") 
             logger.info(f"Order status update result: {status_updated}")
             telegram_id = customer.get('telegram_id')
             if not telegram_id:
@@ -4616,7 +4173,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 await callback_query.message.answer(
@@ -4638,7 +4195,7 @@ def register_handlers(dp):
             artisan_amount = price - admin_fee
             
             # Notify customer
-            customer = get_customer_by_id(order['customer_id'])
+            customer = await adb.get_customer_by_id(order['customer_id'])
             if customer and customer.get('telegram_id'):
                 await bot.send_message(
                     chat_id=customer['telegram_id'],
@@ -4649,7 +4206,7 @@ def register_handlers(dp):
                 )
             
             # Update order status to completed immediately
-            update_order_status(order_id, "completed")
+            await adb.update_order_status(order_id, "completed")
 
             # Send review request to customer
             try:
@@ -4685,7 +4242,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 await callback_query.message.answer(
@@ -4695,7 +4252,7 @@ def register_handlers(dp):
                 return
             
             # Notify customer
-            customer = get_customer_by_id(order['customer_id'])
+            customer = await adb.get_customer_by_id(order['customer_id'])
             if customer and customer.get('telegram_id'):
                 keyboard = InlineKeyboardMarkup()
                 keyboard.add(InlineKeyboardButton(
@@ -4749,8 +4306,7 @@ def register_handlers(dp):
                 return
                 
             # Get payment details
-            from db import debug_order_payment
-            payment_details = debug_order_payment(order_id)
+            payment_details = await adb.debug_order_payment(order_id)
             
             if not payment_details:
                 await message.answer(f"Sifariş #{order_id} üçün ödəniş məlumatları tapılmadı")
@@ -4822,18 +4378,17 @@ def register_handlers(dp):
                 return  # Let specific handlers handle these
             
             # Get user context
-            from db import get_user_context
-            context = get_user_context(telegram_id)
+            context = await adb.get_user_context(telegram_id)
             
             if not context:
                 # For other texts without context, show appropriate menu
                 logger.info("No context found, showing appropriate menu")
                 
                 # Check if user is an artisan
-                artisan_id = get_artisan_by_telegram_id(telegram_id)
+                artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
                 if artisan_id:
                     # Check if artisan is blocked
-                    is_blocked, reason, amount = get_artisan_blocked_status(artisan_id)
+                    is_blocked, reason, amount = await adb.get_artisan_blocked_status(artisan_id)
                     
                     if is_blocked:
                         await message.answer(
@@ -4850,10 +4405,10 @@ def register_handlers(dp):
                     return
                 else:
                     # Check if user is a customer
-                    customer_id = get_customer_by_telegram_id(telegram_id)
+                    customer_id = await adb.get_customer_by_telegram_id(telegram_id)
                     if customer_id:
                         # Check if customer is blocked
-                        is_blocked, reason, amount, block_until = get_customer_blocked_status(customer_id)
+                        is_blocked, reason, amount, block_until = await adb.get_customer_blocked_status(customer_id)
                         
                         if is_blocked:
                             # Create payment button for blocked customer
@@ -4904,7 +4459,7 @@ def register_handlers(dp):
                     return
                 
                 # Get order details
-                order = get_order_details(order_id)
+                order = await adb.get_order_details(order_id)
                 
                 if not order:
                     await message.answer("❌ Sifariş tapılmadı. Silinmiş və ya ləğv edilmiş ola bilər.")
@@ -4914,20 +4469,19 @@ def register_handlers(dp):
                 subservice = order.get('subservice')
                 if subservice:
                     # Ustanın bu alt servis için belirlediği fiyat aralığını kontrol et
-                    artisan_id = get_artisan_by_telegram_id(telegram_id)
+                    artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
                     
                     logger.info(f"[handle_text_input] Qiymət aralığı yoxlaması başlayır - Order: {order_id}, Subservice: {subservice}, Price: {price}, Artisan: {artisan_id}")
                     
                     if artisan_id:
                         # Fiyat aralığı kontrolü
-                        price_range = get_artisan_price_ranges(artisan_id, subservice)
+                        price_range = await adb.get_artisan_price_ranges(artisan_id, subservice)
                         logger.info(f"[handle_text_input] Fiyat aralığı sorgu sonucu: {price_range}")
                         
                         # Eğer bulamazsa case insensitive dene
                         if not price_range:
                             logger.info("[handle_text_input] Normal sorgu sonuç vermedi, case insensitive deneniyor...")
                             try:
-                                from db import execute_query
                                 case_insensitive_query = """
                                     SELECT apr.min_price, apr.max_price, s.name as subservice
                                     FROM artisan_price_ranges apr
@@ -4935,7 +4489,7 @@ def register_handlers(dp):
                                     WHERE apr.artisan_id = %s AND LOWER(s.name) = LOWER(%s)
                                     AND apr.is_active = TRUE
                                 """
-                                price_range = execute_query(case_insensitive_query, (artisan_id, subservice), fetchone=True, dict_cursor=True)
+                                price_range = await adb.execute_query(case_insensitive_query, (artisan_id, subservice), fetchone=True, dict_cursor=True)
                                 logger.info(f"[handle_text_input] Case insensitive sorgu sonucu: {price_range}")
                             except Exception as e:
                                 logger.error(f"[handle_text_input] Case insensitive sorgu hatası: {e}")
@@ -4981,13 +4535,19 @@ def register_handlers(dp):
                 admin_fee = price * commission_rate
                 artisan_amount = price - admin_fee
                 
+                # Customer's price offer, committed together with the price
+                from payment_service import notify_customer_about_price
+                notices = []
+                await notify_customer_about_price(order_id, price, outbox=notices)
+                
                 # Save price to order in database
-                success = db.set_order_price(order_id, price, admin_fee, artisan_amount)
+                success = await adb.set_order_price(order_id, price, admin_fee, artisan_amount, outbox=notices)
                 
                 if success:
+                    await timers.cancel([TASK_PRICE_REMINDER, TASK_FINAL_PRICE_WARNING], order_id)
+                    
                     # Clear context
-                    from db import clear_user_context
-                    clear_user_context(telegram_id)
+                    await adb.clear_user_context(telegram_id)
                     
                     # Show confirmation to artisan
                     await message.answer(
@@ -4996,10 +4556,6 @@ def register_handlers(dp):
                         f"Müştəriyə qiymət təklifi göndərildi. Qəbul edildiyi zaman sizə bildiriş gələcək."
                     )
                     
-                    # Notify customer about the price
-                    from payment_service import notify_customer_about_price
-                    await notify_customer_about_price(order_id, price)
-                    
                 else:
                     await message.answer(
                         "❌ Qiymət təyin edilərkən xəta baş verdi. Zəhmət olmasa bir az sonra yenidən cəhd edin."
@@ -5109,7 +4665,7 @@ def register_handlers(dp):
             
             # Get artisan ID
             telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             logger.info(f"Artisan ID: {artisan_id}")
             
@@ -5121,7 +4677,7 @@ def register_handlers(dp):
                 return
             
             # Check if artisan is blocked
-            is_blocked, reason, amount = get_artisan_blocked_status(artisan_id)
+            is_blocked, reason, amount = await adb.get_artisan_blocked_status(artisan_id)
             logger.info(f"Artisan blocked status: {is_blocked}")
             
             if is_blocked:
@@ -5270,11 +4826,11 @@ def register_handlers(dp):
             state_data = await state.get_data()
             
             # Create advertisement request in database
-            artisan_id = get_artisan_by_telegram_id(callback_query.from_user.id)
+            artisan_id = await adb.get_artisan_by_telegram_id(callback_query.from_user.id)
             payment_amount = state_data.get('package_price', 0)
             
             # Create advertisement request
-            advertisement_id = create_advertisement_request(artisan_id, package_type, payment_amount)
+            advertisement_id = await adb.create_advertisement_request(artisan_id, package_type, payment_amount)
             
             if advertisement_id:
                 # Save advertisement ID to state
@@ -5339,7 +4895,7 @@ def register_handlers(dp):
             receipt_photo_id = message.photo[-1].file_id
             
             # Update advertisement with receipt photo
-            update_advertisement_receipt(advertisement_id, receipt_photo_id)
+            await adb.update_advertisement_receipt(advertisement_id, receipt_photo_id)
             
             # Clear state
             await state.finish()
@@ -5468,7 +5024,7 @@ def register_handlers(dp):
                 return
             
             # Save photos to database
-            update_advertisement_photos(advertisement_id, uploaded_photos)
+            await adb.update_advertisement_photos(advertisement_id, uploaded_photos)
             
             # Clear state
             await state.finish()
@@ -6,6 +6,7 @@ from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from dispatcher import bot, dp
 from db import *
+from db_async import adb, run_db
 from datetime_helpers import (
     get_date_keyboard, get_time_slots_keyboard, format_datetime
 )
@@ -17,6 +18,7 @@ import asyncio
 from config import *
 import random
 from order_status_service import check_order_acceptance
+from timer_service import timers, TASK_ORDER_ACCEPTANCE, TASK_DIRECT_ORDER_ACCEPTANCE, TASK_ARRIVAL_WARNING
 from db_encryption_wrapper import wrap_get_dict_function
 
 
@@ -117,11 +119,11 @@ def register_handlers(dp):
         try:
             # Check if the customer is already registered
             telegram_id = message.from_user.id
-            customer = get_customer_by_telegram_id(telegram_id)
+            customer = await adb.get_customer_by_telegram_id(telegram_id)
             
             if customer:
                 # Check if customer is blocked
-                is_blocked, reason, amount, block_until = get_customer_blocked_status(customer['id'])
+                is_blocked, reason, amount, block_until = await adb.get_customer_blocked_status(customer['id'])
                 
                 if is_blocked:
                     # Show blocked message with payment instructions
@@ -529,7 +531,7 @@ def register_handlers(dp):
             
             # Register customer in database
             telegram_id = callback_query.from_user.id
-            customer_id = get_or_create_customer(
+            customer_id = await adb.get_or_create_customer(
                 telegram_id=telegram_id,
                 name=name,
                 phone=phone,
@@ -630,7 +632,7 @@ def register_handlers(dp):
         try:
             # Make sure customer is registered
             telegram_id = message.from_user.id
-            customer = get_customer_by_telegram_id(telegram_id)
+            customer = await adb.get_customer_by_telegram_id(telegram_id)
             
             if not customer or not customer.get('phone'):
                 await message.answer(
@@ -640,7 +642,7 @@ def register_handlers(dp):
                 return
             
             # Check if customer is blocked
-            is_blocked, reason, amount, block_until = get_customer_blocked_status(customer['id'])
+            is_blocked, reason, amount, block_until = await adb.get_customer_blocked_status(customer['id'])
             if is_blocked:
                 # Show blocked message with payment instructions
                 block_text = (
@@ -659,7 +661,7 @@ def register_handlers(dp):
                 await message.answer(block_text, reply_markup=kb, parse_mode="Markdown")
                 return
             # Get available services from the database
-            services = get_services()
+            services = await adb.get_services()
             
             # Create inline keyboard with service buttons
             keyboard = InlineKeyboardMarkup(row_width=2)
@@ -709,7 +711,7 @@ def register_handlers(dp):
             
 
             # Get subservices for this service
-            subservices = get_subservices(selected_service)
+            subservices = await adb.get_subservices(selected_service)
             
             if subservices:
                 # Create keyboard with subservice options
@@ -763,7 +765,7 @@ def register_handlers(dp):
         """Go back to service selection"""
         try:
             # Get available services from the database
-            services = get_services()
+            services = await adb.get_services()
             
             # Create inline keyboard with service buttons
             keyboard = InlineKeyboardMarkup(row_width=2)
@@ -1104,7 +1106,7 @@ def register_handlers(dp):
             data = await state.get_data()
             
             # Get customer information
-            customer_id = get_or_create_customer(
+            customer_id = await adb.get_or_create_customer(
                 callback_query.from_user.id,
                 callback_query.from_user.full_name
             )
@@ -1113,7 +1115,7 @@ def register_handlers(dp):
             service = data['service']
             
             # Find available artisans for this service
-            artisans = get_nearby_artisans(
+            artisans = await adb.get_nearby_artisans(
                 latitude=data['latitude'], 
                 longitude=data['longitude'],
                 radius=25, 
@@ -1160,7 +1162,7 @@ def register_handlers(dp):
             try:
                 location_name = await get_location_name(data['latitude'], data['longitude']) if 'latitude' in data and 'longitude' in data else "Bilinməyən yer"
 
-                order_id = insert_order(
+                order_id = await adb.insert_order(
                     customer_id=customer_id,
                     artisan_id=None,  # Henüz bir ustaya atanmadı - 0'ı geçici ID olarak kullan
                     service=service,
@@ -1184,38 +1186,26 @@ def register_handlers(dp):
                     await show_customer_menu(callback_query.message)
                     return
                 
-                # Ustalara toplu bildirim gönder - En az birkaç ustaya bildirim gönderebildiğimizi loglayalım
-                notification_sent = 0
-
-                # Use the notification_service instead of direct messages
-                from notification_service import notify_artisan_about_new_order
+                # Ustalara toplu bildirim gönder - sipariş bir kez yüklenir, mesajlar paralel gider
+                from notification_service import notify_artisans_about_new_order
                 
-                for artisan in artisans:
-                    # Ustanın tipini ve bilgilerini doğru şekilde çıkart
-                    if isinstance(artisan, dict):
-                        artisan_id = artisan.get('id')
-                        
-                    else:  # It's a tuple
-                        artisan_id = artisan[0]
-                        
-                    
-                    if artisan_id:
-                        try:
-                            # Use notification service function instead of direct message
-                            success = await notify_artisan_about_new_order(order_id, artisan_id)
-                            if success:
-                                notification_sent += 1
-                                logger.info(f"Notification sent to artisan {artisan_id} for order {order_id}")
-                            else:
-                                logger.error(f"Failed to notify artisan {artisan_id}")
-                        except Exception as e:
-                            logger.error(f"Failed to notify artisan {artisan_id}: {e}")
+                artisan_ids = [
+                    artisan.get('id') if isinstance(artisan, dict) else artisan[0]
+                    for artisan in artisans
+                ]
+                results = await notify_artisans_about_new_order(order_id, artisan_ids)
+                
+                for artisan_id, success in results.items():
+                    if success:
+                        logger.info(f"Notification sent to artisan {artisan_id} for order {order_id}")
+                    else:
+                        logger.error(f"Failed to notify artisan {artisan_id}")
+                notification_sent = sum(1 for success in results.values() if success)
                 
                 logger.info(f"Total {notification_sent} notifications sent for order {order_id}")
                 
                 # Schedule a check after 60 seconds
-                from order_status_service import check_order_acceptance
-                asyncio.create_task(check_order_acceptance(order_id, customer_id, 60))
+                await timers.schedule(TASK_ORDER_ACCEPTANCE, order_id, delay=60, data={"customer_id": customer_id})
                     
             except Exception as e:
                 logger.error(f"Database error when inserting order: {e}", exc_info=True)
@@ -1294,7 +1284,7 @@ def register_handlers(dp):
             data = await state.get_data()
             
             # Get customer information
-            customer_id = get_or_create_customer(
+            customer_id = await adb.get_or_create_customer(
                 callback_query.from_user.id,
                 callback_query.from_user.full_name
             )
@@ -1316,7 +1306,7 @@ def register_handlers(dp):
             try:
                 location_name = await get_location_name(data['latitude'], data['longitude']) if 'latitude' in data and 'longitude' in data else "Bilinməyən yer"
 
-                order_id = insert_order(
+                order_id = await adb.insert_order(
                     customer_id=customer_id,
                     artisan_id=None,  # Will be assigned after artisan accepts
                     service=service,
@@ -1353,8 +1343,10 @@ def register_handlers(dp):
                     logger.error(f"Failed to notify artisan {artisan_id} for direct order: {e}")
                 
                 # Schedule a check after 60 seconds with special handling for direct orders
-                from order_status_service import check_direct_order_acceptance
-                asyncio.create_task(check_direct_order_acceptance(order_id, customer_id, artisan_id, 60))
+                await timers.schedule(
+                    TASK_DIRECT_ORDER_ACCEPTANCE, order_id, delay=60,
+                    data={"customer_id": customer_id, "artisan_id": artisan_id}
+                )
                     
             except Exception as e:
                 logger.error(f"Database error when inserting direct order: {e}", exc_info=True)
@@ -1406,7 +1398,7 @@ def register_handlers(dp):
         try:
             # Müşteri bilgilerini al
             telegram_id = message.from_user.id
-            customer = get_customer_by_telegram_id(telegram_id)
+            customer = await adb.get_customer_by_telegram_id(telegram_id)
             
             if not customer:
                 await message.answer(
@@ -1417,7 +1409,7 @@ def register_handlers(dp):
             customer_id = customer.get('id')
             
             # Müşteri siparişlerini al
-            orders = get_customer_orders(customer_id)
+            orders = await adb.get_customer_orders(customer_id)
             
             if not orders:
                 # Sipariş yoksa mesaj göster
@@ -1443,7 +1435,7 @@ def register_handlers(dp):
                 # Usta bilgilerini maskelenmiş olarak al
                 artisan_id = order.get('artisan_id')
                 if artisan_id:
-                    artisan = wrap_get_dict_function(get_artisan_by_id)(artisan_id)
+                    artisan = await run_db(wrap_get_dict_function(get_artisan_by_id), artisan_id)
                     artisan_name = artisan.get('name', 'Usta')
                     artisan_phone = artisan.get('phone', 'Təyin edilməyib')
                 else:
@@ -1521,7 +1513,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Update order status in database
-            success = update_order_status(order_id, "cancelled")
+            success = await adb.update_order_status(order_id, "cancelled")
             
             if success:
                 await callback_query.message.answer(
@@ -1586,7 +1578,7 @@ def register_handlers(dp):
                 data['location_name'] = location_name
             
             # Get service filter options
-            services = get_services()
+            services = await adb.get_services()
             
             # Create keyboard for selecting services or viewing all
             keyboard = InlineKeyboardMarkup(row_width=2)
@@ -1635,14 +1627,14 @@ def register_handlers(dp):
             if len(filter_data) == 3 and filter_data[1] == "service":
                 service = filter_data[2]
                 # Find nearby artisans with service filter
-                artisans = get_nearby_artisans(latitude, longitude, radius=25, service=service)
+                artisans = await adb.get_nearby_artisans(latitude, longitude, radius=25, service=service)
                 await callback_query.message.answer(
                     f"🔍 *{service}* xidməti göstərən yaxınlıqdakı ustalar axtarılır...",
                     parse_mode="Markdown"
                 )
             else:
                 # Find all nearby artisans
-                artisans = get_nearby_artisans(latitude, longitude, radius=25)
+                artisans = await adb.get_nearby_artisans(latitude, longitude, radius=25)
                 await callback_query.message.answer(
                     "🔍 Yaxınlıqdakı bütün ustalar axtarılır..."
                 )
@@ -1676,7 +1668,7 @@ def register_handlers(dp):
                     
                     # Maskalanmış usta məlumatlarını əldə edirik
                     try:
-                        masked_artisan = get_masked_artisan_by_id(artisan_id)
+                        masked_artisan = await adb.get_masked_artisan_by_id(artisan_id)
                         if not masked_artisan:
                             logger.warning(f"get_masked_artisan_by_id boş nəticə verdi, ID: {artisan_id}")
                     except Exception as e:
@@ -1752,7 +1744,7 @@ def register_handlers(dp):
         try:
             # Get customer information
             telegram_id = message.from_user.id
-            customer = get_customer_by_telegram_id(telegram_id)
+            customer = await adb.get_customer_by_telegram_id(telegram_id)
             
             if not customer:
                 await message.answer(
@@ -1840,7 +1832,7 @@ def register_handlers(dp):
             
             # Bugün yaratan kodu əvəz edirik
             # update_customer_profile funksiyasını telegram_id ilə çağırırıq, tam obyektlə deyil
-            success = update_customer_profile(telegram_id, {'name': name})
+            success = await adb.update_customer_profile(telegram_id, {'name': name})
             
             if success:
                 await message.answer(
@@ -1910,7 +1902,7 @@ def register_handlers(dp):
             
             # Update customer phone in database
             telegram_id = message.from_user.id
-            success = update_customer_profile(telegram_id, {'phone': phone})
+            success = await adb.update_customer_profile(telegram_id, {'phone': phone})
             
             if success:
                 await message.answer(
@@ -1966,7 +1958,7 @@ def register_handlers(dp):
             
             # Update customer city in database
             telegram_id = message.from_user.id
-            success = update_customer_profile(telegram_id, {'city': city})
+            success = await adb.update_customer_profile(telegram_id, {'city': city})
             
             if success:
                 await message.answer(
@@ -2017,7 +2009,7 @@ def register_handlers(dp):
         """Show available services"""
         try:
             # Get available services
-            services = get_services()
+            services = await adb.get_services()
             
             if not services:
                 await message.answer("❌ Təəssüf ki, hal-hazırda heç bir xidmət mövcud deyil.")
@@ -2030,7 +2022,7 @@ def register_handlers(dp):
                 services_text += f"{i}. {service}\n"
                 
                 # Get subservices for this service
-                subservices = get_subservices(service)
+                subservices = await adb.get_subservices(service)
                 if subservices:
                     for j, subservice in enumerate(subservices, 1):
                         services_text += f"   {i}.{j}. {subservice}\n"
@@ -2077,7 +2069,7 @@ def register_handlers(dp):
             artisan_id = int(callback_query.data.split('_')[-1])
             
             # Get artisan info
-            artisan = get_artisan_by_id(artisan_id)
+            artisan = await adb.get_artisan_by_id(artisan_id)
             
             if not artisan:
                 await callback_query.message.answer(
@@ -2098,12 +2090,11 @@ def register_handlers(dp):
                 data['is_direct_order'] = True  # Flag to indicate this is a direct order
             
             # Get subservices that this specific artisan offers
-            from db import get_artisan_subservices
-            artisan_subservices = get_artisan_subservices(artisan_id)
+            artisan_subservices = await adb.get_artisan_subservices(artisan_id)
             
             # Maskalanmış usta məlumatlarını əldə edirik
             try:
-                masked_artisan = get_masked_artisan_by_id(artisan_id)
+                masked_artisan = await adb.get_masked_artisan_by_id(artisan_id)
                 if not masked_artisan:
                     logger.warning(f"get_masked_artisan_by_id boş nəticə verdi, ID: {artisan_id}")
             except Exception as e:
@@ -2217,7 +2208,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 await callback_query.message.answer(
@@ -2237,7 +2228,7 @@ def register_handlers(dp):
             
             # Get customer ID
             telegram_id = callback_query.from_user.id
-            customer = get_customer_by_telegram_id(telegram_id)
+            customer = await adb.get_customer_by_telegram_id(telegram_id)
             
             if not customer:
                 await callback_query.message.answer(
@@ -2284,7 +2275,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 await callback_query.message.answer(
@@ -2293,11 +2284,8 @@ def register_handlers(dp):
                 await callback_query.answer()
                 return
             
-            # Import warning function
-            from order_status_service import handle_arrival_warning
-            
             # Schedule arrival warning
-            asyncio.create_task(handle_arrival_warning(order_id))
+            await timers.schedule(TASK_ARRIVAL_WARNING, order_id, delay=5 * 60)
             
             await callback_query.message.answer(
                 f"⚠️ Ustanın məkanda olmadığı bildirildi.\n\n"
@@ -2323,7 +2311,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 await callback_query.message.answer(
@@ -2367,7 +2355,7 @@ def register_handlers(dp):
             logger.info(f"Price acceptance callback received for order {order_id}")
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 logger.error(f"Order {order_id} not found")
@@ -2391,11 +2379,7 @@ def register_handlers(dp):
             logger.info(f"Order details for order {order_id}: {order}")
             
             # Check if price exists in orders table directly
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT price FROM orders WHERE id = %s", (order_id,))
-            direct_price = cursor.fetchone()
-            conn.close()
+            direct_price = await adb.execute_query("SELECT price FROM orders WHERE id = %s", (order_id,), fetchone=True)
             
             logger.info(f"Direct price query for order {order_id}: {direct_price}")
             
@@ -2462,7 +2446,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 await callback_query.message.answer(
@@ -2481,11 +2465,11 @@ def register_handlers(dp):
                 return
             
             # Update order status to cancelled
-            success = update_order_status(order_id, "cancelled")
+            success = await adb.update_order_status(order_id, "cancelled")
             
             if success:
                 # Notify artisan about rejection
-                artisan = get_artisan_by_id(order['artisan_id'])
+                artisan = await adb.get_artisan_by_id(order['artisan_id'])
                 if artisan and artisan.get('telegram_id'):
                     await bot.send_message(
                         chat_id=artisan['telegram_id'],
@@ -2528,7 +2512,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 await callback_query.message.answer(
@@ -2549,11 +2533,14 @@ def register_handlers(dp):
             # Import payment functions
             from payment_service import notify_artisan_about_payment_method, notify_customer_about_card_payment
             
-            # Notify artisan about payment method
-            artisan_notified = await notify_artisan_about_payment_method(order_id, "card")
-            
             # Notify customer about card payment details
-            customer_notified = await notify_customer_about_card_payment(order_id)
+            notices = []
+            customer_notified = await notify_customer_about_card_payment(order_id, outbox=notices)
+            
+            # Save the payment method and notify artisan; both notices commit with it
+            artisan_notified = customer_notified and await notify_artisan_about_payment_method(
+                order_id, "card", outbox=notices
+            )
             
             if not artisan_notified or not customer_notified:
                 await callback_query.message.answer(
@@ -2578,7 +2565,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 await callback_query.message.answer(
@@ -2599,11 +2586,14 @@ def register_handlers(dp):
             # Import payment functions
             from payment_service import notify_artisan_about_payment_method, notify_customer_about_cash_payment
             
-            # Notify artisan about payment method
-            artisan_notified = await notify_artisan_about_payment_method(order_id, "cash")
-            
             # Notify customer about cash payment
-            customer_notified = await notify_customer_about_cash_payment(order_id)
+            notices = []
+            customer_notified = await notify_customer_about_cash_payment(order_id, outbox=notices)
+            
+            # Save the payment method and notify artisan; both notices commit with it
+            artisan_notified = customer_notified and await notify_artisan_about_payment_method(
+                order_id, "cash", outbox=notices
+            )
             
             if not artisan_notified or not customer_notified:
                 await callback_query.message.answer(
@@ -2628,7 +2618,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Önce sipariş detaylarını kontrol et
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             if not order:
                 await callback_query.message.answer(
                     "❌ Sifariş tapılmadı. Ləğv edilmiş ola bilər."
@@ -2649,7 +2639,7 @@ def register_handlers(dp):
             
             # Önce mevcut context'i temizle - eski sipariş ID'lerini kaldır
             try:
-                clear_user_context(telegram_id)
+                await adb.clear_user_context(telegram_id)
             except Exception as e:
                 logger.error(f"Error clearing context: {e}")
                 # Hata olsa bile devam et
@@ -2662,7 +2652,7 @@ def register_handlers(dp):
             
             # Set context for receipt upload with the current order ID - Her zaman string olarak kaydet
             try:
-                set_user_context(str(telegram_id), {
+                await adb.set_user_context(str(telegram_id), {
                     "action": "card_payment_receipt",
                     "order_id": str(order_id),
                     "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -2692,7 +2682,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 await callback_query.message.answer(
@@ -2711,7 +2701,7 @@ def register_handlers(dp):
                 return
             
             # Notify artisan
-            artisan = get_artisan_by_id(order['artisan_id'])
+            artisan = await adb.get_artisan_by_id(order['artisan_id'])
             if artisan and artisan.get('telegram_id'):
                 await bot.send_message(
                     chat_id=artisan['telegram_id'],
@@ -2726,7 +2716,7 @@ def register_handlers(dp):
             
             
             # Mark order as completed
-            update_order_status(order_id, "completed")
+            await adb.update_order_status(order_id, "completed")
             
             # Log the action
             logger.info(f"Cash payment completed and order marked as completed: {order_id}")
@@ -2760,7 +2750,7 @@ def register_handlers(dp):
         try:
             # Get artisan ID to check registration
             telegram_id = message.from_user.id
-            artisan_id = get_artisan_by_telegram_id(telegram_id)
+            artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
             
             if not artisan_id:
                 # If not registered, show role selection menu
@@ -2800,7 +2790,7 @@ def register_handlers(dp):
                 # Try to get artisan_id from context first, then fallback to telegram_id lookup
                 artisan_id = context.get('artisan_id')
                 if not artisan_id:
-                    artisan_id = get_artisan_by_telegram_id(telegram_id)
+                    artisan_id = await adb.get_artisan_by_telegram_id(telegram_id)
                 
                 if not artisan_id:
                     await message.answer("❌ Usta məlumatları tapılmadı.")
@@ -2814,12 +2804,11 @@ def register_handlers(dp):
                 file_id = photo.file_id
                 
                 # Save fine receipt for artisan
-                from db import save_fine_receipt
-                receipt_id = save_fine_receipt(artisan_id, file_id)
+                receipt_id = await adb.save_fine_receipt(artisan_id, file_id)
 
                 if receipt_id:
                     # Clear user context
-                    clear_user_context(telegram_id)
+                    await adb.clear_user_context(telegram_id)
                     
                     await message.answer(
                         "✅ Çərimə ödənişi qəbzi uğurla yükləndi!\n\n"
@@ -2842,7 +2831,7 @@ def register_handlers(dp):
                         )
                         
                         # Get artisan blocked status for better info
-                        is_blocked, reason, amount = get_artisan_blocked_status(artisan_id)
+                        is_blocked, reason, amount = await adb.get_artisan_blocked_status(artisan_id)
                         
                         for admin_id in admin_list:
                             await bot.send_photo(
@@ -2893,7 +2882,7 @@ def register_handlers(dp):
             telegram_id = message.from_user.id
             
             # Get user context
-            context = get_user_context(telegram_id)
+            context = await adb.get_user_context(telegram_id)
             
             if not context or not context.get('action'):
                 # No context requiring photo, ignore
@@ -2924,22 +2913,21 @@ def register_handlers(dp):
                 # Eğer context'teki order_id ile ilgili sipariş bulunamazsa veya sorun varsa
                 # kullanıcının en son aktif siparişini bulalım
                 if order_id:
-                    order = get_order_details(order_id)
+                    order = await adb.get_order_details(order_id)
                 else:
                     order = None
                     
                 if not order or order.get('status') == 'cancelled' or order.get('status') == 'completed':
                     # Müşterinin aktif siparişlerini getir
-                    from db import execute_query
                     query = """
                         SELECT id FROM orders 
                         WHERE customer_id = (SELECT id FROM customers WHERE telegram_id = %s)
                         AND status IN ('accepted', 'pending')
                         ORDER BY created_at DESC LIMIT 1
                     """
-                    customer = get_customer_by_telegram_id(telegram_id)
+                    customer = await adb.get_customer_by_telegram_id(telegram_id)
                     if customer:
-                        result = execute_query(query, (str(telegram_id),), fetchone=True)
+                        result = await adb.execute_query(query, (str(telegram_id),), fetchone=True)
                         if result:
                             order_id = result[0]
                             logger.info(f"Found active order {order_id} for user {telegram_id} instead of {context.get('order_id')}")
@@ -2948,7 +2936,7 @@ def register_handlers(dp):
                     await message.answer("❌ Aktif sifariş tapılmadı. Zəhmət olmasa yenidən sifariş verin.")
                     # Emin olmak için context'i temizleyelim
                     try:
-                        clear_user_context(telegram_id)
+                        await adb.clear_user_context(telegram_id)
                     except Exception as e:
                         logger.error(f"Error clearing context: {e}")
                     return
@@ -2960,17 +2948,17 @@ def register_handlers(dp):
                 logger.info(f"Attempting to save payment receipt for order {order_id} (from user context or active orders)")
                 
                 # Save receipt to database
-                success = save_payment_receipt(order_id, file_id)
+                success = await adb.save_payment_receipt(order_id, file_id)
                 
                 if success:
                     # Clear user context
                     try:
-                        clear_user_context(telegram_id)
+                        await adb.clear_user_context(telegram_id)
                     except Exception as e:
                         logger.error(f"Error clearing context after successful payment: {e}")
                     
                     # Mark order as completed
-                    update_order_status(order_id, "completed")
+                    await adb.update_order_status(order_id, "completed")
                     
                     await message.answer(
                         f"✅ Ödəniş qəbzi uğurla yükləndi!\n\n"
@@ -2979,9 +2967,9 @@ def register_handlers(dp):
                     )
                     
                     # Notify artisan
-                    order = get_order_details(order_id)
+                    order = await adb.get_order_details(order_id)
                     if order:
-                        artisan = get_artisan_by_id(order['artisan_id'])
+                        artisan = await adb.get_artisan_by_id(order['artisan_id'])
                         if artisan and artisan.get('telegram_id'):
                             # Send text notification to artisan
                             await bot.send_message(
@@ -3012,15 +3000,14 @@ def register_handlers(dp):
                 file_id = photo.file_id
                 
                 # Save receipt to database
-                success = save_payment_receipt(order_id, file_id)
+                success = await adb.save_payment_receipt(order_id, file_id)
 
                 if success:
                     # Clear user context
-                    clear_user_context(telegram_id)
+                    await adb.clear_user_context(telegram_id)
                     
                     # Reset receipt verification status to pending
-                    from db import update_receipt_verification_status
-                    update_receipt_verification_status(order_id, False)
+                    await adb.update_receipt_verification_status(order_id, False)
                     
                     await message.answer(
                         "✅ Ödəniş qəbzi uğurla yükləndi!\n\n"
@@ -3039,7 +3026,7 @@ def register_handlers(dp):
                 # Try to get customer_id from context first, then fallback to telegram_id lookup
                 customer_id = context.get('customer_id')
                 if not customer_id:
-                    customer = get_customer_by_telegram_id(telegram_id)
+                    customer = await adb.get_customer_by_telegram_id(telegram_id)
                     if customer:
                         customer_id = customer['id']
                 
@@ -3055,12 +3042,11 @@ def register_handlers(dp):
                 file_id = photo.file_id
                 
                 # Save fine receipt for customer
-                from db import save_customer_fine_receipt
-                receipt_id = save_customer_fine_receipt(customer_id, file_id)
+                receipt_id = await adb.save_customer_fine_receipt(customer_id, file_id)
 
                 if receipt_id:
                     # Clear user context
-                    clear_user_context(telegram_id)
+                    await adb.clear_user_context(telegram_id)
                     
                     await message.answer(
                         "✅ Cərimə ödənişinin qəbzi uğurla yükləndi!\n\n"
@@ -3074,7 +3060,7 @@ def register_handlers(dp):
                         from config import BOT_ADMINS
                         from dispatcher import bot
                         from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-                        customer_info = get_customer_by_id(customer_id)
+                        customer_info = await adb.get_customer_by_id(customer_id)
                         customer_name = customer_info.get('name', 'Naməlum') if customer_info else 'Naməlum'
                         
                         # Create verification buttons for admin
@@ -3106,7 +3092,7 @@ def register_handlers(dp):
             
             elif action == 'customer_fine_receipt':
                 # Get customer info
-                customer = get_customer_by_telegram_id(telegram_id)
+                customer = await adb.get_customer_by_telegram_id(telegram_id)
                 if not customer:
                     await message.answer("❌ Müştəri məlumatları tapılmadı.")
                     return True  # Handler processed, stop further processing
@@ -3116,12 +3102,11 @@ def register_handlers(dp):
                 file_id = photo.file_id
                 
                 # Save fine receipt for customer
-                from db import save_customer_fine_receipt
-                receipt_id = save_customer_fine_receipt(customer['id'], file_id)
+                receipt_id = await adb.save_customer_fine_receipt(customer['id'], file_id)
 
                 if receipt_id:
                     # Clear user context
-                    clear_user_context(telegram_id)
+                    await adb.clear_user_context(telegram_id)
                     
                     await message.answer(
                         "✅ Cərimə ödənişinin qəbzi uğurla yükləndi!\n\n"
@@ -3192,7 +3177,7 @@ def register_handlers(dp):
                 return
                 
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 await message.answer(f"Sifariş #{order_id} tapılmadı")
@@ -3227,7 +3212,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 await callback_query.message.answer(
@@ -3237,7 +3222,7 @@ def register_handlers(dp):
                 return
             
             # Notify artisan to confirm payment
-            artisan = get_artisan_by_id(order['artisan_id'])
+            artisan = await adb.get_artisan_by_id(order['artisan_id'])
             if artisan and artisan.get('telegram_id'):
                 # Create confirmation keyboard for artisan
                 keyboard = InlineKeyboardMarkup(row_width=1)
@@ -3289,8 +3274,7 @@ def register_handlers(dp):
                 return
                 
             # Get payment details
-            from db import debug_order_payment
-            payment_details = debug_order_payment(order_id)
+            payment_details = await adb.debug_order_payment(order_id)
             
             if not payment_details:
                 await message.answer(f"Sifariş #{order_id} üçün ödəniş məlumatları tapılmadı")
@@ -3326,7 +3310,7 @@ def register_handlers(dp):
             order_id = int(callback_query.data.split('_')[-1])
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             
             if not order:
                 await callback_query.message.answer(
@@ -3385,7 +3369,7 @@ def register_handlers(dp):
             
             # Set context for receipt upload
             telegram_id = callback_query.from_user.id
-            set_user_context(telegram_id, {
+            await adb.set_user_context(telegram_id, {
                 "action": "resend_payment_receipt",
                 "order_id": order_id
             })
@@ -3410,7 +3394,7 @@ def register_handlers(dp):
         """Handle the pay_customer_fine command for blocked customers"""
         try:
             telegram_id = message.from_user.id
-            customer = get_customer_by_telegram_id(telegram_id)
+            customer = await adb.get_customer_by_telegram_id(telegram_id)
             
             if not customer:
                 await message.answer(
@@ -3419,7 +3403,7 @@ def register_handlers(dp):
                 return
                 
             # Check if customer is blocked
-            is_blocked, reason, amount, block_until = get_customer_blocked_status(customer['id'])
+            is_blocked, reason, amount, block_until = await adb.get_customer_blocked_status(customer['id'])
             
             if not is_blocked:
                 await message.answer(
@@ -3470,7 +3454,7 @@ def register_handlers(dp):
                 "action": "customer_fine_receipt"
             }
             
-            set_user_context(telegram_id, context_data)
+            await adb.set_user_context(telegram_id, context_data)
             
             await callback_query.message.answer(
                 "📸 Zəhmət olmasa, ödəniş qəbzinin şəklini göndərin.\n\n"
@@ -3545,7 +3529,7 @@ def register_handlers(dp):
                 return
             
             # Get order details
-            order = get_order_details(order_id)
+            order = await adb.get_order_details(order_id)
             if not order:
                 await message.answer(f"❌ Sifariş #{order_id} tapılmadı.")
                 await state.finish()
@@ -3553,7 +3537,7 @@ def register_handlers(dp):
                 return
             
             # Add review to database
-            success = add_review(
+            success = await adb.add_review(
                 order_id=order_id,
                 customer_id=order['customer_id'],
                 artisan_id=order['artisan_id'],
@@ -3569,7 +3553,7 @@ def register_handlers(dp):
                 )
                 
                 # Notify artisan about the review but keep it anonymous
-                artisan_telegram_id = get_artisan_by_id(order['artisan_id']).get('telegram_id')
+                artisan_telegram_id = (await adb.get_artisan_by_id(order['artisan_id'])).get('telegram_id')
                 if artisan_telegram_id:
                     await bot.send_message(
                         chat_id=artisan_telegram_id,
@@ -3623,23 +3607,21 @@ def register_handlers(dp):
             telegram_id = callback_query.from_user.id
             
             # Check if customer exists and is blocked
-            from db import get_customer_by_telegram_id, get_customer_blocked_status
             
-            customer = get_customer_by_telegram_id(telegram_id)
+            customer = await adb.get_customer_by_telegram_id(telegram_id)
             if not customer:
                 await callback_query.answer("❌ Müştəri məlumatları tapılmadı.", show_alert=True)
                 return
             
             # Check block status
-            is_blocked, reason, amount, block_until = get_customer_blocked_status(customer['id'])
+            is_blocked, reason, amount, block_until = await adb.get_customer_blocked_status(customer['id'])
             
             if not is_blocked:
                 await callback_query.answer("✅ Hesabınızda heç bir blok yoxdur.", show_alert=True)
                 return
             
             # Set user context for fine receipt upload
-            from db import set_user_context
-            set_user_context(telegram_id, {
+            await adb.set_user_context(telegram_id, {
                 'action': 'fine_payment',
                 'user_type': 'customer',
                 'customer_id': customer['id'],
@@ -3677,7 +3659,7 @@ def register_handlers(dp):
                 rating = int(parts[2])
                 
                 # Get order details to check customer ID
-                order = get_order_details(order_id)
+                order = await adb.get_order_details(order_id)
                 if not order:
                     await callback_query.answer("Bu sifariş tapılmadı.")
                     return
@@ -3685,8 +3667,7 @@ def register_handlers(dp):
                 customer_id = order.get('customer_id')
                 
                 # Check if the customer has already reviewed this order
-                from db import has_customer_reviewed_order
-                if has_customer_reviewed_order(order_id, customer_id):
+                if await adb.has_customer_reviewed_order(order_id, customer_id):
                     await callback_query.answer("Bu sifarişi artıq qiymətləndirmisiniz.")
                     
                     # Delete the review message with the stars
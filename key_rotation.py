@@ -0,0 +1,273 @@
+# key_rotation.py
+"""
+Re-encrypt stored values after an encryption key rotation.
+
+Rotating the key without downtime:
+
+    1. Put the new key in ENCRYPTION_KEY and move the old one to the front
+       of ENCRYPTION_OLD_KEYS, then restart the bot. New values are
+       encrypted with the new key; values under the old one still decrypt.
+    2. The bot re-encrypts every encrypted column in the background
+       (REENCRYPT_ON_STARTUP). From a shell:
+
+           python key_rotation.py status          # progress per table
+           python key_rotation.py run             # re-encrypt until done
+           python key_rotation.py run --restart   # walk every table again
+
+    3. Once status shows every table finished with 0 failed, remove the
+       old key from ENCRYPTION_OLD_KEYS.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from crypto_service import KEY_ID, SEARCH_KEY_DERIVED, decrypt_data, reencrypt_data
+from db_async import adb, run_db
+from timer_service import timers
+from config import (
+    WORKER_ID, ENCRYPTION_OLD_KEYS, REENCRYPT_BATCH_SIZE, REENCRYPT_PAUSE_MS, REENCRYPT_LEASE_SECONDS
+)
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Every column written with encrypt_data, as
+# (table, primary key columns, encrypted columns, blind index entity)
+ENCRYPTED_COLUMNS = [
+    ("customers", ("id",), ("telegram_id", "name", "phone"), "customer"),
+    ("artisans", ("id",), ("telegram_id", "name", "phone", "payment_card_number", "payment_card_holder"), "artisan"),
+    ("payment_card_details", ("id",), ("card_number", "card_holder"), None),
+    ("fsm_states", ("state_key",), ("data", "bucket"), None),
+    ("notification_outbox", ("id",), ("chat_id", "payload"), None),
+    ("order_notifications", ("id",), ("chat_id",), None),
+]
+
+LEASE_NAME = "reencryption"
+
+
+def reencrypt_rows(rows, key_columns, columns, search_entity=None):
+    """Re-encrypt one batch read by get_reencryption_batch (CPU bound, runs off the loop)
+
+    Returns:
+        tuple: (updates, counts, search_values) for save_reencryption_batch
+    """
+    updates = []
+    search_values = []
+    counts = {"scanned": len(rows), "rotated": 0, "failed": 0}
+    width = len(key_columns)
+    for row in rows:
+        key, values = row[:width], row[width:]
+        stored = {}
+        for column, value in zip(columns, values):
+            new_value, status = reencrypt_data(value)
+            if status == "rotated":
+                updates.append((column, key, value, new_value))
+                counts["rotated"] += 1
+            elif status == "failed":
+                counts["failed"] += 1
+            stored[column] = new_value
+
+        if search_entity:
+            # The blind index key is derived from the encryption key, so the
+            # tokens written under the old key no longer match any search
+            plaintexts = {}
+            for field in ('name', 'phone'):
+                value = stored.get(field)
+                plaintext = decrypt_data(value)
+                if value is not None and plaintext != value:
+                    plaintexts[field] = plaintext
+            search_values.append((key[0], plaintexts))
+    return updates, counts, search_values
+
+
+class ReencryptionJob:
+    """Walks every encrypted column and re-encrypts old values with the primary key
+
+    Tables are read in primary key order, `batch_size` rows at a time
+    (keyset pagination, so a batch costs the same at any depth). After each
+    batch the rewritten values and the checkpoint are committed together,
+    the cluster-wide lease is renewed and the job sleeps `pause_ms`, so it
+    can run next to live traffic. A restarted or taken-over job continues
+    after the last checkpoint; a new primary key starts every table over.
+    """
+
+    def __init__(self, owner=WORKER_ID, batch_size=REENCRYPT_BATCH_SIZE, pause_ms=REENCRYPT_PAUSE_MS,
+                 lease_seconds=REENCRYPT_LEASE_SECONDS):
+        self.owner = owner
+        self.batch_size = batch_size
+        self.pause_ms = pause_ms
+        self.lease_seconds = lease_seconds
+        self._started = False
+        self._running = False
+        self._finished = False
+        self._current = None
+        self._stats = {
+            "batches": 0, "scanned": 0, "rotated": 0, "written": 0, "failed": 0,
+            "active_seconds": 0.0, "tables": {},
+        }
+
+    def start(self):
+        """Re-encrypt in the background, retrying every lease period until done"""
+        if self._started:
+            return
+        self._started = True
+        timers.every("reencryption", self.lease_seconds, self.run)
+        logger.info(f"Re-encryption job started as {self.owner} for key {KEY_ID}")
+
+    async def run(self, restart=False):
+        """Re-encrypt every table not yet finished under the current key
+
+        Returns:
+            bool: True if every table is finished
+        """
+        if self._running or (self._finished and not restart):
+            return self._finished
+        self._running = True
+        try:
+            finished = True
+            for table, key_columns, columns, search_entity in ENCRYPTED_COLUMNS:
+                if not await self._run_table(table, key_columns, columns, search_entity, restart):
+                    finished = False
+                    break
+            self._finished = finished
+            if finished:
+                logger.info(f"Every encrypted column is under key {KEY_ID}")
+            return finished
+        finally:
+            self._running = False
+            self._current = None
+
+    async def _run_table(self, table, key_columns, columns, search_entity, restart):
+        """Re-encrypt one table from its checkpoint; False if it stopped early"""
+        if not await adb.acquire_job_lease(LEASE_NAME, self.owner, self.lease_seconds):
+            return False
+        progress = await adb.start_reencryption(table, KEY_ID, restart)
+        if progress is None:
+            return False
+        if progress['finished_at']:
+            return True
+
+        self._current = table
+        if not SEARCH_KEY_DERIVED:
+            search_entity = None
+        last_key = progress['last_key']
+        logger.info(f"Re-encrypting {table} after {last_key or 'the start'}")
+        while True:
+            started = time.monotonic()
+            rows = await adb.get_reencryption_batch(table, key_columns, columns, last_key, self.batch_size)
+            if not rows:
+                await adb.finish_reencryption(table, KEY_ID)
+                break
+
+            updates, counts, search_values = await run_db(
+                reencrypt_rows, rows, key_columns, columns, search_entity
+            )
+            last_key = list(rows[-1][:len(key_columns)])
+            elapsed = time.monotonic() - started
+            written = await adb.save_reencryption_batch(
+                table, key_columns, updates, KEY_ID, last_key, counts, elapsed, search_entity, search_values
+            )
+            if written is None:
+                return False
+            self._record(table, counts, written, elapsed)
+
+            if len(rows) < self.batch_size:
+                await adb.finish_reencryption(table, KEY_ID)
+                break
+            if not await adb.acquire_job_lease(LEASE_NAME, self.owner, self.lease_seconds):
+                logger.warning(f"Lost the re-encryption lease while on {table}, another worker continues")
+                return False
+            await asyncio.sleep(self.pause_ms / 1000)
+
+        table_stats = self._stats["tables"].get(table, {})
+        logger.info(
+            f"Re-encrypted {table}: {table_stats.get('rotated', 0)} values rotated, "
+            f"{table_stats.get('failed', 0)} unreadable, {table_stats.get('scanned', 0)} rows scanned by this worker"
+        )
+        return True
+
+    def _record(self, table, counts, written, elapsed):
+        table_stats = self._stats["tables"].setdefault(
+            table, {"batches": 0, "scanned": 0, "rotated": 0, "written": 0, "failed": 0, "active_seconds": 0.0}
+        )
+        for stats in (self._stats, table_stats):
+            stats["batches"] += 1
+            stats["scanned"] += counts["scanned"]
+            stats["rotated"] += counts["rotated"]
+            stats["failed"] += counts["failed"]
+            stats["written"] += written
+            stats["active_seconds"] += elapsed
+
+    def stats(self):
+        """Get re-encryption counters of this process
+
+        Returns:
+            dict: Batches, rows scanned, values rotated / written / unreadable
+                  per table and in total, rows per second and the table in progress
+        """
+        active = self._stats["active_seconds"]
+        return dict(
+            self._stats,
+            tables={table: dict(stats) for table, stats in self._stats["tables"].items()},
+            active_seconds=round(active, 3),
+            rows_per_second=round(self._stats["scanned"] / active, 1) if active else 0.0,
+            current=self._current,
+            finished=self._finished,
+        )
+
+
+reencryption = ReencryptionJob()
+
+
+def start_reencryption_job():
+    """Start the background job when there are retired keys to get rid of"""
+    if ENCRYPTION_OLD_KEYS.strip():
+        reencryption.start()
+
+
+# -------------------------
+# COMMAND LINE
+# -------------------------
+
+async def print_status():
+    """Print the checkpoint of every table"""
+    progress = {row['table_name']: row for row in await adb.get_reencryption_progress()}
+    print(f"Primary key {KEY_ID}")
+    print(f"{'table':<22} {'status':<9} {'scanned':>9} {'rotated':>9} {'failed':>7} {'rows/s':>8}  last key")
+    for table, *_ in ENCRYPTED_COLUMNS:
+        row = progress.get(table)
+        if not row or row['key_fingerprint'] != KEY_ID:
+            print(f"{table:<22} {'pending':<9}")
+            continue
+        status = 'finished' if row['finished_at'] else 'running'
+        rate = row['scanned'] / row['active_seconds'] if row['active_seconds'] else 0.0
+        print(f"{table:<22} {status:<9} {row['scanned']:>9} {row['rotated']:>9} {row['failed']:>7} "
+              f"{rate:>8.0f}  {row['last_key'] or '-'}")
+
+
+async def run_until_done(restart=False):
+    """Re-encrypt every table in the foreground and print the totals"""
+    started = time.monotonic()
+    finished = await reencryption.run(restart=restart)
+    stats = reencryption.stats()
+    print(
+        f"{'Finished' if finished else 'Stopped (lease held elsewhere or a database error)'}: "
+        f"{stats['scanned']} rows scanned, {stats['rotated']} values rotated, "
+        f"{stats['failed']} unreadable in {time.monotonic() - started:.1f}s "
+        f"({stats['rows_per_second']} rows/s)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", choices=["status", "run"], default="status")
+    parser.add_argument("--restart", action="store_true", help="walk every table again from the start")
+    args = parser.parse_args()
+    if args.command == "status":
+        asyncio.run(print_status())
+    else:
+        asyncio.run(run_until_done(args.restart))
@@ -0,0 +1,233 @@
+# migrations.py
+"""
+Versioned schema migrations for Artisan Booking Bot.
+
+The bot calls run_migrations() once at startup. When the database is
+current that is a single SELECT; db_setup is only imported, and the
+steps only run, when something is pending. From a shell:
+
+    python migrations.py status     # applied / pending versions with timings
+    python migrations.py apply      # apply pending migrations, timing each one
+"""
+import argparse
+import logging
+import time
+import mysql.connector
+from mysql.connector import errorcode
+from config import DB_CONFIG
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Every schema change lives here, in the order it is applied, as
+# (version, name, function in db_setup). Each step gets an open autocommit
+# cursor. Never edit or renumber an applied step; add a new one at the end.
+MIGRATIONS = [
+    (1, "baseline tables", "create_tables"),
+    (2, "tables created by handlers on first use", "create_request_path_tables"),
+    (3, "baseline indexes", "create_indexes"),
+    (4, "order status backfill", "backfill_order_statuses"),
+    (5, "artisan location index", "migrate_artisan_location_index"),
+    (6, "admin stats rollup indexes", "migrate_admin_stats_rollup"),
+    (7, "scheduled task leases", "migrate_scheduled_tasks"),
+    (8, "payment event indexes", "migrate_payment_events"),
+    (9, "sample services", "seed_services"),
+    (10, "admin search blind index", "create_search_index"),
+    (11, "re-encryption checkpoints", "create_reencryption_progress"),
+    (12, "double-encrypted artisan repair", "repair_double_encrypted_artisans"),
+    (13, "encrypted notification outbox", "encrypt_notification_outbox"),
+    (14, "hashed FSM state keys", "hash_fsm_state_keys"),
+    (15, "encrypted order notification chats", "encrypt_order_notification_chats"),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Serializes bot processes that start at the same time
+MIGRATION_LOCK = "artisan_bot_migrations"
+MIGRATION_LOCK_SECONDS = 300
+
+
+def connect():
+    """Open an autocommit connection to the bot database"""
+    conn = mysql.connector.connect(
+        host=DB_CONFIG["host"],
+        user=DB_CONFIG["user"],
+        password=DB_CONFIG["password"],
+        database=DB_CONFIG["database"],
+        port=DB_CONFIG.get("port", 3306)
+    )
+    # DDL commits implicitly in MySQL anyway
+    conn.autocommit = True
+    return conn
+
+
+def current_version(cursor):
+    """Get the highest applied version, 0 for a database without schema_version"""
+    try:
+        cursor.execute("SELECT MAX(version) FROM schema_version")
+        row = cursor.fetchone()
+    except mysql.connector.Error as e:
+        if e.errno == errorcode.ER_NO_SUCH_TABLE:
+            return 0
+        raise
+    return row[0] or 0
+
+
+def get_applied_migrations(cursor):
+    """Get the recorded migrations
+
+    Returns:
+        dict: version -> (name, applied_at, duration_ms)
+    """
+    try:
+        cursor.execute("SELECT version, name, applied_at, duration_ms FROM schema_version ORDER BY version")
+    except mysql.connector.Error as e:
+        if e.errno != errorcode.ER_BAD_FIELD_ERROR:
+            raise
+        # Recorded before timings were; the column is added by the next apply
+        cursor.execute("SELECT version, name, applied_at, NULL FROM schema_version ORDER BY version")
+    return {row[0]: row[1:] for row in cursor.fetchall()}
+
+
+def _prepare_version_table(cursor):
+    """Create schema_version, or add the columns an older one lacks"""
+    import db_setup
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            duration_ms INT
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+    ''')
+    # Tables created before timings were recorded
+    db_setup.ensure_column(cursor, 'schema_version', 'duration_ms', 'INT')
+
+
+def _apply_pending(cursor):
+    """Apply every migration missing from schema_version, holding the migration lock
+
+    Returns:
+        list: (version, name, duration_ms) of the applied migrations
+    """
+    import db_setup
+
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK, MIGRATION_LOCK_SECONDS))
+    if not cursor.fetchone()[0]:
+        raise RuntimeError("Timed out waiting for another process to finish migrating")
+    # The lock is released when the connection closes
+
+    _prepare_version_table(cursor)
+    # Another process may have migrated while we waited for the lock
+    done = get_applied_migrations(cursor)
+
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if version in done:
+            continue
+        logger.info(f"Applying migration {version}: {name}")
+        started = time.perf_counter()
+        getattr(db_setup, step)(cursor)
+        duration_ms = int((time.perf_counter() - started) * 1000)
+        cursor.execute(
+            "INSERT INTO schema_version (version, name, duration_ms) VALUES (%s, %s, %s)",
+            (version, name, duration_ms)
+        )
+        logger.info(f"Migration {version} applied in {duration_ms} ms")
+        applied.append((version, name, duration_ms))
+    return applied
+
+
+def run_migrations():
+    """Bring the schema up to date; called once at startup
+
+    The request path assumes the schema the migrations create exists. A
+    current database costs one read. A failing migration is not recorded,
+    so it is retried on the next start, and the error is raised because
+    the bot can not run on a half-built schema.
+
+    Returns:
+        list: Versions applied by this call
+    """
+    conn = None
+    started = time.perf_counter()
+    try:
+        conn = connect()
+        cursor = conn.cursor()
+
+        version = current_version(cursor)
+        if version >= LATEST_VERSION:
+            logger.info(
+                f"Database schema is at version {version} "
+                f"(checked in {(time.perf_counter() - started) * 1000:.1f} ms)"
+            )
+            return []
+
+        logger.info(f"Database schema is at version {version}, migrating to {LATEST_VERSION}")
+        applied = _apply_pending(cursor)
+        logger.info(
+            f"Applied migrations {[item[0] for item in applied]} "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+        return [item[0] for item in applied]
+    except Exception as e:
+        logger.error(f"Migration failed: {e}")
+        raise
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+
+# -------------------------
+# COMMAND LINE
+# -------------------------
+
+def print_status():
+    """Print every migration with its applied time and duration"""
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        applied = get_applied_migrations(cursor) if current_version(cursor) else {}
+    finally:
+        conn.close()
+
+    print(f"{'version':>7}  {'status':<8} {'applied at':<19} {'ms':>8}  name")
+    for version, name, _ in MIGRATIONS:
+        if version in applied:
+            _, applied_at, duration_ms = applied[version]
+            duration = duration_ms if duration_ms is not None else '-'
+            print(f"{version:>7}  {'applied':<8} {str(applied_at):<19} {duration:>8}  {name}")
+        else:
+            print(f"{version:>7}  {'pending':<8} {'':<19} {'':>8}  {name}")
+
+
+def apply_migrations():
+    """Apply pending migrations and print how long each one took"""
+    conn = connect()
+    started = time.perf_counter()
+    try:
+        applied = _apply_pending(conn.cursor())
+    finally:
+        conn.close()
+
+    if not applied:
+        print(f"Nothing to apply, schema is at version {LATEST_VERSION}")
+        return
+    print(f"{'version':>7}  {'ms':>8}  name")
+    for version, name, duration_ms in applied:
+        print(f"{version:>7}  {duration_ms:>8}  {name}")
+    print(f"Applied {len(applied)} migrations in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", choices=["status", "apply"], default="apply")
+    args = parser.parse_args()
+    if args.command == "status":
+        print_status()
+    else:
+        apply_migrations()
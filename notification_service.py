@@ -5,9 +5,17 @@ from config import *
 import logging
 from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from dispatcher import bot, dp
+from aiogram.utils.exceptions import MessageToEditNotFound, MessageCantBeEdited, MessageNotModified
+from dispatcher import dp
+from telegram_dispatcher import telegram
+from outbox_service import outbox_message, send_via_outbox
 from db import *
 from db_encryption_wrapper import wrap_get_dict_function
+from db_async import adb, run_db
+from timer_service import (
+    timers, timer_handler, TASK_BLOCK_CUSTOMER_TIMEOUT, TASK_BLOCK_ARTISAN_TIMEOUT,
+    TASK_PAYMENT_INVALID_RECEIPT, TASK_PAYMENT_TRANSFER
+)
 
 # Set up logging
 logging.basicConfig(
@@ -16,96 +24,150 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-async def notify_artisan_about_new_order(order_id, artisan_id):
-    """Ustaya yeni sipariş hakkında bildirim gönderir"""
+def _format_new_order_notification(order_id, order, customer):
+    """Build the new-order offer text and its accept/reject keyboard
+    
+    Args:
+        order_id (int): ID of the order
+        order (dict): Order details
+        customer (dict): Decrypted customer, or None
+        
+    Returns:
+        tuple: (message_text, keyboard)
+    """
+    customer_name = customer.get('name', 'Müştəri') if customer else 'Müştəri'
+    
+    # Sipariş bilgilerini hazırla
+    service = order.get('service', '')
+    subservice = order.get('subservice', '')
+    service_text = f"{service} ({subservice})" if subservice else service
+    location_name = order.get('location_name', 'Müəyyən edilməmiş')
+    
+    # Format date and time
+    date_time = order.get('date_time')
     try:
-        # Use the non-masked version to get the correct telegram_id
-        artisan = get_artisan_by_id(artisan_id)
-        order = get_order_details(order_id)
+        import datetime
+        dt_obj = datetime.datetime.strptime(str(date_time), "%Y-%m-%d %H:%M:%S")
+        formatted_date = dt_obj.strftime("%d.%m.%Y")
+        formatted_time = dt_obj.strftime("%H:%M")
+    except Exception as e:
+        print(f"Error formatting date: {e}")
+        formatted_date = str(date_time).split(" ")[0] if date_time else "Bilinmiyor"
+        formatted_time = str(date_time).split(" ")[1] if date_time and " " in str(date_time) else "Bilinmiyor"
+    
+    # Kabul/Ret düğmeli InlineKeyboard oluştur
+    keyboard = InlineKeyboardMarkup(row_width=2)
+    keyboard.add(
+        InlineKeyboardButton("✅ Qəbul et", callback_data=f"accept_order_{order_id}"),
+        InlineKeyboardButton("❌ İmtina et", callback_data=f"reject_order_{order_id}")
+    )
+    
+    # Bildirim mesajını hazırla
+    message_text = (
+        f"🔔 *Yeni sifariş #{order_id}*\n\n"
+        f"👤 *Müştəri:* {customer_name}\n"
+        f"🛠 *Xidmət:* {service_text}\n"
+        f"📍 *Yer:* {location_name}\n"
+        f"📅 *Tarix:* {formatted_date}\n"
+        f"🕒 *Saat:* {formatted_time}\n"
+        f"📝 *Qeyd:* {order.get('note', '')}\n\n"
+        f"Zəhmət olmasa, sifarişi qəbul və ya imtina edin."
+    )
+    return message_text, keyboard
+
+
+async def notify_artisans_about_new_order(order_id, artisan_ids, concurrency=NEW_ORDER_NOTIFY_CONCURRENCY):
+    """Bir siparişi birden fazla ustaya aynı anda bildirir
+    
+    The order, the customer and the artisans are loaded once and the offer is
+    rendered once; the sends then run concurrently, at most `concurrency` at a
+    time, in the order of `artisan_ids` (closest artisans first).
+    
+    Args:
+        order_id (int): ID of the order
+        artisan_ids (list): IDs of the artisans to notify
+        concurrency (int): Maximum number of sends in flight
         
-        if not artisan or not order:
-            logger.error(f"Artisan or order not found. Artisan ID: {artisan_id}, Order ID: {order_id}")
-            return False
+    Returns:
+        dict: artisan_id -> True if the offer was delivered, False otherwise
+    """
+    artisan_ids = [artisan_id for artisan_id in dict.fromkeys(artisan_ids) if artisan_id]
+    results = {artisan_id: False for artisan_id in artisan_ids}
+    if not artisan_ids:
+        return results
+    
+    try:
+        order = await adb.get_order_details(order_id)
+        if not order:
+            logger.error(f"Order not found. Order ID: {order_id}")
+            return results
+        
+        customer = await run_db(wrap_get_dict_function(get_customer_by_id), order.get('customer_id'))
+        message_text, keyboard = _format_new_order_notification(order_id, order, customer)
+        
+        artisans = {artisan['id']: artisan for artisan in await adb.get_artisans_by_ids(artisan_ids)}
+    except Exception as e:
+        logger.error(f"Error preparing new order notifications for order {order_id}: {e}", exc_info=True)
+        return results
+    
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    
+    async def send(artisan_id):
+        artisan = artisans.get(artisan_id)
+        if not artisan:
+            logger.error(f"Artisan not found. Artisan ID: {artisan_id}, Order ID: {order_id}")
+            return
         
-        # Telegram ID'yi doğrudan kullanmak yerine dict'ten alıyoruz
         telegram_id = artisan.get('telegram_id')
         if not telegram_id:
             logger.error(f"Artisan telegram_id not found for artisan ID: {artisan_id}")
-            return False
-        
-        # Müşteri bilgilerini al
-        customer = wrap_get_dict_function(get_customer_by_id)(order.get('customer_id'))
-        customer_name = customer.get('name', 'Müştəri') if customer else 'Müştəri'
-        
-        # Sipariş bilgilerini hazırla
-        service = order.get('service', '')
-        subservice = order.get('subservice', '')
-        service_text = f"{service} ({subservice})" if subservice else service
-        location_name = order.get('location_name', 'Müəyyən edilməmiş')
-        
-        # Format date and time
-        date_time = order.get('date_time')
-        try:
-            import datetime
-            dt_obj = datetime.datetime.strptime(str(date_time), "%Y-%m-%d %H:%M:%S")
-            formatted_date = dt_obj.strftime("%d.%m.%Y")
-            formatted_time = dt_obj.strftime("%H:%M")
-        except Exception as e:
-            print(f"Error formatting date: {e}")
-            formatted_date = str(date_time).split(" ")[0] if date_time else "Bilinmiyor"
-            formatted_time = str(date_time).split(" ")[1] if date_time and " " in str(date_time) else "Bilinmiyor"
-        
-        # Kabul/Ret düğmeli InlineKeyboard oluştur
-        keyboard = InlineKeyboardMarkup(row_width=2)
-        keyboard.add(
-            InlineKeyboardButton("✅ Qəbul et", callback_data=f"accept_order_{order_id}"),
-            InlineKeyboardButton("❌ İmtina et", callback_data=f"reject_order_{order_id}")
-        )
-        
-        # Bildirim mesajını hazırla
-        message_text = (
-            f"🔔 *Yeni sifariş #{order_id}*\n\n"
-            f"👤 *Müştəri:* {customer_name}\n"
-            f"🛠 *Xidmət:* {service_text}\n"
-            f"📍 *Yer:* {location_name}\n"
-            f"📅 *Tarix:* {formatted_date}\n"
-            f"🕒 *Saat:* {formatted_time}\n"
-            f"📝 *Qeyd:* {order.get('note', '')}\n\n"
-            f"Zəhmət olmasa, sifarişi qəbul və ya imtina edin."
-        )
-        
-        # Ustaya mesaj gönder
-        await bot.send_message(
-            chat_id=telegram_id,
-            text=message_text,
-            reply_markup=keyboard,
-            parse_mode="Markdown"
-        )
+            return
         
-        return True
+        async with semaphore:
+            try:
+                message = await telegram.send_message(
+                    chat_id=telegram_id,
+                    text=message_text,
+                    reply_markup=keyboard,
+                    parse_mode="Markdown"
+                )
+                results[artisan_id] = True
+                delivered.append((artisan_id, telegram_id, message.message_id))
+            except Exception as e:
+                logger.error(f"Failed to notify artisan {artisan_id} about order {order_id}: {e}")
     
-    except Exception as e:
-        logger.error(f"Error in notify_artisan_about_new_order: {e}", exc_info=True)
-        return False
+    delivered = []
+    await asyncio.gather(*(send(artisan_id) for artisan_id in artisan_ids))
+    
+    # Kimlere hangi mesajla bildirildiğini kaydet - sipariş alınınca sadece bunlar güncellenir
+    if delivered:
+        await adb.record_order_notifications(order_id, delivered)
+    return results
+
+
+async def notify_artisan_about_new_order(order_id, artisan_id):
+    """Ustaya yeni sipariş hakkında bildirim gönderir"""
+    results = await notify_artisans_about_new_order(order_id, [artisan_id])
+    return results.get(artisan_id, False)
 
 # notification_service.py içindeki notify_customer_about_order_status fonksiyonunu güncelle
 
-async def notify_customer_about_order_status(order_id, status):
+async def notify_customer_about_order_status(order_id, status, outbox=None):
     """Müşteriye sipariş durumu hakkında bildirim gönderir"""
     try:
         # Sipariş bilgilerini al
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Error: Order not found. Order ID: {order_id}")
             return False
         
         # Müşteri ve usta bilgilerini al
-        customer = wrap_get_dict_function(get_customer_by_id)(order.get('customer_id'))
+        customer = await run_db(wrap_get_dict_function(get_customer_by_id), order.get('customer_id'))
         
         # Ustanın bilgilerini alıp şifrelerini manuel olarak çöz
         from crypto_service import decrypt_data
         from db_encryption_wrapper import decrypt_dict_data
-        artisan = get_artisan_by_id(order.get('artisan_id'))
+        artisan = await adb.get_artisan_by_id(order.get('artisan_id'))
         
         if not customer or not artisan:
             logger.error(f"Error: Customer or artisan not found for order ID: {order_id}")
@@ -120,7 +182,7 @@ async def notify_customer_about_order_status(order_id, status):
         artisan_id = order.get('artisan_id')
         
         # Usta bilgilerini deşifre et
-        artisan = get_artisan_by_id(artisan_id)
+        artisan = await adb.get_artisan_by_id(artisan_id)
         artisan_decrypted = decrypt_dict_data(artisan, mask=False)
         artisan_name = artisan_decrypted.get('name', 'Usta')
         artisan_phone = artisan_decrypted.get('phone', 'Telefon')
@@ -132,7 +194,7 @@ async def notify_customer_about_order_status(order_id, status):
             subservice = order.get('subservice')
             if subservice:
                 # Alt servis için fiyat aralığını al
-                price_range = get_artisan_price_ranges(artisan_id, subservice)
+                price_range = await adb.get_artisan_price_ranges(artisan_id, subservice)
                 if price_range:
                     min_price = price_range.get('min_price', 0)
                     max_price = price_range.get('max_price', 0)
@@ -168,8 +230,10 @@ async def notify_customer_about_order_status(order_id, status):
             )
         
         # Mesajı gönder
-        await bot.send_message(
+        await send_via_outbox(
+            f"order_status:{order_id}:{status}",
             chat_id=telegram_id,
+            outbox=outbox,
             text=message_text,
             parse_mode="Markdown"
         )
@@ -198,7 +262,8 @@ async def notify_customer_no_artisan(customer_telegram_id, order_id):
         keyboard.add(KeyboardButton("🌍 Yaxınlıqdakı ustaları göstər"))
         
         # Müşteriye mesaj gönder
-        await bot.send_message(
+        await send_via_outbox(
+            f"no_artisan:{order_id}",
             chat_id=customer_telegram_id,
             text=message_text,
             reply_markup=keyboard,
@@ -217,7 +282,7 @@ async def notify_artisan_about_price_acceptance(order_id):
     """Notify artisan that customer has accepted the price"""
     try:
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for price acceptance notification")
             return False
@@ -237,7 +302,7 @@ async def notify_artisan_about_price_acceptance(order_id):
         
         # Get artisan details
         artisan_id = order['artisan_id']
-        artisan = get_artisan_by_id(artisan_id)
+        artisan = await adb.get_artisan_by_id(artisan_id)
         
         if not artisan or not artisan.get('telegram_id'):
             logger.error(f"Artisan not found or telegram_id missing for order {order_id}")
@@ -246,7 +311,7 @@ async def notify_artisan_about_price_acceptance(order_id):
         # Get customer details for the message in a safe way
         customer_name = "Müştəri"  # Default fallback name
         try:
-            customer = get_customer_by_id(order['customer_id'])
+            customer = await adb.get_customer_by_id(order['customer_id'])
             if customer:
                 # Try to get and decrypt customer name
                 from crypto_service import decrypt_data
@@ -262,7 +327,8 @@ async def notify_artisan_about_price_acceptance(order_id):
             # Continue with default name
         
         # Send notification
-        await bot.send_message(
+        await send_via_outbox(
+            f"price_accepted:{order_id}",
             chat_id=artisan['telegram_id'],
             text=f"✅ *Qiymət qəbul edildi*\n\n"
                  f"Sifariş #{order_id} üçün təyin etdiyiniz {price_float:.2f} AZN məbləğindəki qiymət "
@@ -289,13 +355,13 @@ async def notify_customer_about_invalid_receipt(order_id):
     """Notify customer about pending receipt verification"""
     try:
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for receipt verification notification")
             return False
         
         # Get customer details
-        customer = wrap_get_dict_function(get_customer_by_id)(order.get('customer_id'))
+        customer = await run_db(wrap_get_dict_function(get_customer_by_id), order.get('customer_id'))
         if not customer:
             logger.error(f"Customer not found for order {order_id}")
             return False
@@ -316,7 +382,8 @@ async def notify_customer_about_invalid_receipt(order_id):
         ))
         
         # Send information message with 24 hour deadline
-        await bot.send_message(
+        await send_via_outbox(
+            f"invalid_receipt:{order_id}",
             chat_id=customer_telegram_id,
             text=f"⚠️ *Xəbərdarlıq: Qəbz gözləmədədir!*\n\n"
                  f"Sifariş #{order_id} üçün göndərdiyiniz ödəniş qəbzi yoxlanılır.\n\n"
@@ -330,22 +397,22 @@ async def notify_customer_about_invalid_receipt(order_id):
         )
         
         # Schedule blocking after 24 hours if not paid
-        import asyncio
-        asyncio.create_task(block_customer_after_timeout(order_id, customer.get('id'), price))
+        await timers.schedule(
+            TASK_BLOCK_CUSTOMER_TIMEOUT, order_id, delay=24 * 60 * 60,
+            data={"customer_id": customer.get('id'), "required_payment": price}
+        )
         
         return True
     except Exception as e:
         logger.error(f"Error in notify_customer_about_invalid_receipt: {e}", exc_info=True)
         return False
 
+@timer_handler(TASK_BLOCK_CUSTOMER_TIMEOUT)
 async def block_customer_after_timeout(order_id, customer_id, required_payment):
-    """Block customer after timeout if payment not made"""
+    """Block customer after timeout if payment not made (runs 24 hours after the receipt warning)"""
     try:
-        # Wait 24 hours
-        await asyncio.sleep(24 * 60 * 60)  # 24 hours
-        
         # Check again if receipt has been verified
-        status = check_receipt_verification_status(order_id)
+        status = await adb.check_receipt_verification_status(order_id)
         
         if status == 'invalid' or status == 'pending':
             # Still not verified, block customer
@@ -353,53 +420,57 @@ async def block_customer_after_timeout(order_id, customer_id, required_payment):
 
             penalty_amount = required_payment * 1.5
 
-            success = block_customer(customer_id, block_reason, penalty_amount)
+            # Bildirim bloklama ile aynı transaction'da outbox'a yazılır
+            notices = []
+            customer = await run_db(wrap_get_dict_function(get_customer_by_id), customer_id)
+            if customer and customer.get('telegram_id'):
+                # Create an inline keyboard with a "Pay Fine" button
+                keyboard = InlineKeyboardMarkup()
+                keyboard.add(InlineKeyboardButton("💰 Cəriməni ödə", callback_data="pay_customer_fine"))
+
+                notices.append(outbox_message(
+                    f"block_customer:{order_id}",
+                    chat_id=customer['telegram_id'],
+                    text=f"⛔ <b>Hesabınız bloklandı</b>\n\n"
+                         f"Səbəb: {block_reason}\n\n"
+                         f"Bloku açmaq üçün {required_payment:.2f} AZN ödəniş etməlisiniz.\n"
+                         f"Ödəniş etmək üçün aşağıdakı düyməni istifadə edin:",
+                    reply_markup=keyboard,
+                    parse_mode="HTML"
+                ))
+            else:
+                logger.error(f"Could not notify customer {customer_id} about being blocked")
+
+            success = await adb.block_customer(customer_id, block_reason, penalty_amount, outbox=notices)
             
             if success:
-                # Get customer telegram ID
-                customer = get_customer_by_id(customer_id)
-                if customer and customer.get('telegram_id'):
-                    # Create an inline keyboard with a "Pay Fine" button
-                    keyboard = InlineKeyboardMarkup()
-                    keyboard.add(InlineKeyboardButton("💰 Cəriməni ödə", callback_data="pay_customer_fine"))
-
-                    await bot.send_message(
-                        chat_id=customer['telegram_id'],
-                        text=f"⛔ <b>Hesabınız bloklandı</b>\n\n"
-                             f"Səbəb: {block_reason}\n\n"
-                             f"Bloku açmaq üçün {required_payment:.2f} AZN ödəniş etməlisiniz.\n"
-                             f"Ödəniş etmək üçün aşağıdakı düyməni istifadə edin:",
-                        reply_markup=keyboard,
-                        parse_mode="HTML"
-                    )
-                    logger.info(f"Customer {customer_id} blocked for invalid receipt on order {order_id}")
-                else:
-                    logger.error(f"Could not notify customer {customer_id} about being blocked")
+                logger.info(f"Customer {customer_id} blocked for invalid receipt on order {order_id}")
             else:
-                logger.error(f"Failed to block customer {customer_id} after invalid receipt timeout")
+                raise RuntimeError(f"Failed to block customer {customer_id} after invalid receipt timeout")
     except Exception as e:
         logger.error(f"Error in block_customer_after_timeout: {e}", exc_info=True)
+        raise
 
 
 async def notify_artisan_about_payment_transfer(order_id):
     """Notify artisan about payment transfer"""
     try:
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for payment transfer notification")
             return False
         
         # Get payment method to check if it's cash payment
         # If cash payment, no need to notify artisan about transfer
-        payment_details = debug_order_payment(order_id)
+        payment_details = await adb.debug_order_payment(order_id)
         if payment_details and payment_details.get('payment_method') == 'cash':
             logger.info(f"Skipping payment transfer notification for cash payment. Order ID: {order_id}")
             return True
         
         # Get artisan details
         artisan_id = order.get('artisan_id')
-        artisan = get_artisan_by_id(artisan_id)
+        artisan = await adb.get_artisan_by_id(artisan_id)
         if not artisan:
             logger.error(f"Artisan not found for order {order_id}")
             return False
@@ -412,16 +483,16 @@ async def notify_artisan_about_payment_transfer(order_id):
         # Get payment amount
         artisan_amount = 0
         try:
-            from db import execute_query
             query = "SELECT artisan_amount FROM order_payments WHERE order_id = %s"
-            result = execute_query(query, (order_id,), fetchone=True)
+            result = await adb.execute_query(query, (order_id,), fetchone=True)
             if result:
                 artisan_amount = float(result[0])
         except Exception as e:
             logger.error(f"Error getting artisan_amount: {e}")
         
         # Send payment notification
-        await bot.send_message(
+        await send_via_outbox(
+            f"payment_transfer:{order_id}",
             chat_id=telegram_id,
             text=f"💰 *Ödəniş köçürüldü*\n\n"
                  f"Sifariş #{order_id} üçün ödəniş hesabınıza köçürüldü.\n"
@@ -434,6 +505,20 @@ async def notify_artisan_about_payment_transfer(order_id):
     except Exception as e:
         logger.error(f"Error in notify_artisan_about_payment_transfer: {e}")
         return False
+
+
+@timer_handler(TASK_PAYMENT_INVALID_RECEIPT)
+async def handle_invalid_receipt_event(order_id):
+    """Payment event queued when a card receipt is marked invalid"""
+    if not await notify_customer_about_invalid_receipt(order_id):
+        raise RuntimeError(f"Invalid receipt notification for order {order_id} could not be queued")
+
+
+@timer_handler(TASK_PAYMENT_TRANSFER)
+async def handle_payment_transfer_event(order_id):
+    """Payment event queued when the admin payment to the artisan is completed"""
+    if not await notify_artisan_about_payment_transfer(order_id):
+        raise RuntimeError(f"Payment transfer notification for order {order_id} could not be queued")
     
 
 # Add this to notification_service.py
@@ -442,18 +527,18 @@ async def send_review_request_to_customer(order_id):
     """Send a review request to the customer after order completion"""
     try:
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for review request")
             return False
         
         # Get customer and artisan information
-        customer = wrap_get_dict_function(get_customer_by_id)(order.get('customer_id'))
+        customer = await run_db(wrap_get_dict_function(get_customer_by_id), order.get('customer_id'))
         
         # Ustanın bilgilerini alıp şifrelerini manuel olarak çöz ve maskele
         from crypto_service import decrypt_data
         from db_encryption_wrapper import decrypt_dict_data
-        artisan = get_artisan_by_id(order.get('artisan_id'))
+        artisan = await adb.get_artisan_by_id(order.get('artisan_id'))
         
         if not customer or not artisan:
             logger.error(f"Customer or artisan not found for order {order_id}")
@@ -466,8 +551,7 @@ async def send_review_request_to_customer(order_id):
             return False
         
         # Check if customer has already reviewed this order to prevent duplicate reviews
-        from db import has_customer_reviewed_order
-        if has_customer_reviewed_order(order_id, customer.get('id')):
+        if await adb.has_customer_reviewed_order(order_id, customer.get('id')):
             logger.info(f"Customer {customer.get('id')} has already reviewed order {order_id}, skipping review request")
             return True
         
@@ -478,11 +562,10 @@ async def send_review_request_to_customer(order_id):
         
         artisan_id = order.get('artisan_id')
         # Əvvəlki kod: artisan = get_artisan_by_id(artisan_id)
-        from crypto_service import decrypt_data
         
         # db.py-dəki get_artisan_by_id funksiyası artıq deşifrə edilmiş versiya qaytarır,
         # amma bəzən ola bilər ki, deşifrələmə tam işləməsin
-        artisan = get_artisan_by_id(artisan_id)
+        artisan = await adb.get_artisan_by_id(artisan_id)
         
         # Əlavə təhlükəsizlik üçün əl ilə də deşifrə edirik
         artisan_decrypted = decrypt_dict_data(artisan, mask=False)
@@ -512,7 +595,8 @@ async def send_review_request_to_customer(order_id):
             f"Zəhmət olmasa, ustanın xidmətini qiymətləndirərək başqalarına da kömək edin."
         )
         
-        await bot.send_message(
+        await send_via_outbox(
+            f"review_request:{order_id}",
             chat_id=telegram_id,
             text=message_text,
             reply_markup=keyboard,
@@ -531,13 +615,13 @@ async def notify_artisan_about_invalid_commission(order_id):
     """Notify artisan about invalid commission receipt"""
     try:
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for invalid commission notification")
             return False
         
         # Get artisan details
-        artisan = get_artisan_by_id(order.get('artisan_id'))
+        artisan = await adb.get_artisan_by_id(order.get('artisan_id'))
         if not artisan:
             logger.error(f"Artisan not found for order {order_id}")
             return False
@@ -548,7 +632,7 @@ async def notify_artisan_about_invalid_commission(order_id):
             return False
         
         # Get payment details from order_payments table
-        payment_details = debug_order_payment(order_id)
+        payment_details = await adb.debug_order_payment(order_id)
         admin_fee = 0
         
         if payment_details and payment_details.get('admin_fee') is not None:
@@ -582,7 +666,8 @@ async def notify_artisan_about_invalid_commission(order_id):
         ))
         
         # Send warning message with 18 hour deadline
-        await bot.send_message(
+        await send_via_outbox(
+            f"invalid_commission:{order_id}",
             chat_id=artisan_telegram_id,
             text=f"⚠️ *Xəbərdarlıq: Komissiya qəbzi təsdiqlənmədi!*\n\n"
                  f"Sifariş #{order_id} üçün göndərdiyiniz komissiya ödənişi qəbzi doğrulanmadı.\n\n"
@@ -595,9 +680,11 @@ async def notify_artisan_about_invalid_commission(order_id):
             parse_mode="Markdown"
         )
         
-        # Schedule blocking after delay if not paid
-        import asyncio
-        asyncio.create_task(block_artisan_after_timeout(order_id, artisan.get('id'), total_amount))
+        # Schedule blocking after 18 hours if not paid
+        await timers.schedule(
+            TASK_BLOCK_ARTISAN_TIMEOUT, order_id, delay=18 * 60 * 60,
+            data={"artisan_id": artisan.get('id'), "required_payment": float(total_amount)}
+        )
         
         return True
     except Exception as e:
@@ -606,35 +693,30 @@ async def notify_artisan_about_invalid_commission(order_id):
 
 # notification_service.py içindeki block_artisan_after_timeout fonksiyonunu güncelleyelim
 
+@timer_handler(TASK_BLOCK_ARTISAN_TIMEOUT)
 async def block_artisan_after_timeout(order_id, artisan_id, required_payment):
-    """Block artisan after timeout if payment not made"""
+    """Block artisan after timeout if payment not made (runs 18 hours after the commission warning)"""
     try:
-        # Wait 24 hours
-        await asyncio.sleep(18 * 60 * 60)  # 24 hours
-        
         # Check if artisan has resubmitted a receipt
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
+        result = await adb.execute_query(
             """
             SELECT COUNT(*) FROM notification_log
             WHERE notification_type = 'commission_resubmitted'
             AND target_id = %s
-            AND created_at > NOW() - INTERVAL '18 hours'
+            AND created_at > NOW() - INTERVAL 18 HOUR
             """,
-            (order_id,)
+            (order_id,),
+            fetchone=True
         )
         
-        resubmitted = cursor.fetchone()[0] > 0
-        conn.close()
+        resubmitted = bool(result and result[0] > 0)
         
         if resubmitted:
             logger.info(f"Blocking cancelled for artisan {artisan_id} on order {order_id} - receipt resubmitted")
             return
         
         # Check again if receipt has been verified
-        status = check_receipt_verification_status(order_id)
+        status = await adb.check_receipt_verification_status(order_id)
         
         if status == 'invalid':
             # Still not verified, block artisan
@@ -643,27 +725,31 @@ async def block_artisan_after_timeout(order_id, artisan_id, required_payment):
             # Add additional penalty
             penalty_amount = required_payment * 1.5  # 50% additional penalty
             
-            success = block_artisan(artisan_id, block_reason, penalty_amount)
+            # Bildirim bloklama ile aynı transaction'da outbox'a yazılır
+            notices = []
+            artisan = await adb.get_artisan_by_id(artisan_id)
+            if artisan and artisan.get('telegram_id'):
+                notices.append(outbox_message(
+                    f"block_artisan:{order_id}",
+                    chat_id=artisan['telegram_id'],
+                    text=f"⛔ *Hesabınız bloklandı*\n\n"
+                         f"Səbəb: {block_reason}\n\n"
+                         f"Bloku açmaq üçün {penalty_amount:.2f} AZN ödəniş etməlisiniz.\n"
+                         f"Ödəniş etmək üçün: /pay_fine komandası ilə ətraflı məlumat ala bilərsiniz.",
+                    parse_mode="Markdown"
+                ))
+            else:
+                logger.error(f"Could not notify artisan {artisan_id} about being blocked")
+            
+            success = await adb.block_artisan(artisan_id, block_reason, penalty_amount, outbox=notices)
             
             if success:
-                # Get artisan telegram ID
-                artisan = get_artisan_by_id(artisan_id)
-                if artisan and artisan.get('telegram_id'):
-                    await bot.send_message(
-                        chat_id=artisan['telegram_id'],
-                        text=f"⛔ *Hesabınız bloklandı*\n\n"
-                             f"Səbəb: {block_reason}\n\n"
-                             f"Bloku açmaq üçün {penalty_amount:.2f} AZN ödəniş etməlisiniz.\n"
-                             f"Ödəniş etmək üçün: /pay_fine komandası ilə ətraflı məlumat ala bilərsiniz.",
-                        parse_mode="Markdown"
-                    )
-                    logger.info(f"Artisan {artisan_id} blocked for invalid commission receipt on order {order_id}")
-                else:
-                    logger.error(f"Could not notify artisan {artisan_id} about being blocked")
+                logger.info(f"Artisan {artisan_id} blocked for invalid commission receipt on order {order_id}")
             else:
-                logger.error(f"Failed to block artisan {artisan_id} after invalid receipt timeout")
+                raise RuntimeError(f"Failed to block artisan {artisan_id} after invalid receipt timeout")
     except Exception as e:
         logger.error(f"Error in block_artisan_after_timeout: {e}", exc_info=True)
+        raise
 
 # notification_service.py içinde yeni bir fonksiyon ekleyelim
 
@@ -671,7 +757,7 @@ async def notify_artisan_commission_receipt_received(artisan_id, order_id):
     """Notify artisan that commission receipt was received and will be reviewed"""
     try:
         # Get artisan details
-        artisan = get_artisan_by_id(artisan_id)
+        artisan = await adb.get_artisan_by_id(artisan_id)
         if not artisan:
             logger.error(f"Artisan {artisan_id} not found for receipt notification")
             return False
@@ -682,7 +768,8 @@ async def notify_artisan_commission_receipt_received(artisan_id, order_id):
             return False
         
         # Send notification to artisan
-        await bot.send_message(
+        await send_via_outbox(
+            f"commission_receipt_received:{order_id}",
             chat_id=telegram_id,
             text=f"✅ *Komissiya qəbzi qəbul edildi*\n\n"
                 f"Sifariş #{order_id} üçün göndərdiyiniz yeni komissiya ödənişi qəbzi qəbul edildi və yoxlanılması üçün göndərildi.\n\n"
@@ -700,6 +787,10 @@ async def cancel_order_notifications_for_other_artisans(order_id, accepted_artis
     """
     Cancels order notifications for all artisans except the one who accepted the order
     
+    Only the artisans recorded in order_notifications got the offer; their
+    original message is edited in place so the accept/reject buttons go away.
+    If the message can no longer be edited, a short notice is sent instead.
+    
     Args:
         order_id (int): ID of the order
         accepted_artisan_id (int): ID of the artisan who accepted the order
@@ -708,52 +799,52 @@ async def cancel_order_notifications_for_other_artisans(order_id, accepted_artis
         bool: True if successful, False otherwise
     """
     try:
-        # Get all artisans who might have received the notification
-        from db import get_connection, execute_query
-        from geo_helpers import calculate_distance
-        
-        # Get order details
-        order = get_order_details(order_id)
-        if not order:
-            logger.error(f"Order {order_id} not found for notification cancellation")
-            return False
-        
-        # Get artisans who may have received the notification
-        query = """
-            SELECT id, telegram_id 
-            FROM artisans 
-            WHERE active = TRUE 
-            AND service = %s 
-            AND id != %s
-        """
+        from crypto_service import decrypt_data
         
-        artisans = execute_query(query, (order['service'], accepted_artisan_id), fetchall=True)
+        notifications = await adb.get_order_notifications(order_id, exclude_artisan_id=accepted_artisan_id)
         
-        if not artisans:
+        if not notifications:
             logger.info(f"No other artisans to cancel notifications for order {order_id}")
             return True
-            
-        cancellation_count = 0
         
-        # Send cancellation message to all other artisans
-        for artisan in artisans:
-            artisan_id = artisan[0]
-            artisan_telegram_id = artisan[1]
-            
-            if artisan_telegram_id:
+        text = (
+            f"ℹ️ *Sifariş artıq mövcud deyil*\n\n"
+            f"Sifariş #{order_id} başqa bir usta tərəfindən götürülüb."
+        )
+        semaphore = asyncio.Semaphore(max(1, NEW_ORDER_NOTIFY_CONCURRENCY))
+        withdrawn = []
+        
+        async def withdraw(notification):
+            artisan_id = notification['artisan_id']
+            chat_id = decrypt_data(notification['chat_id'])
+            if not str(chat_id).lstrip('-').isdigit():
+                logger.error(f"Could not decrypt the offer chat of artisan {artisan_id} for order {order_id}")
+                return
+            chat_id = int(chat_id)
+            async with semaphore:
                 try:
-                    # Try to edit any existing messages for this order
-                    await bot.send_message(
-                        chat_id=artisan_telegram_id,
-                        text=f"ℹ️ *Sifariş artıq mövcud deyil*\n\n"
-                             f"Sifariş #{order_id} başqa bir usta tərəfindən götürülüb.",
+                    await telegram.edit_message_text(
+                        text, chat_id, notification['message_id'],
                         parse_mode="Markdown"
                     )
-                    cancellation_count += 1
+                except (MessageToEditNotFound, MessageCantBeEdited):
+                    # Usta mesajı silmiş - yeni mesajla bildir
+                    try:
+                        await telegram.send_message(chat_id=chat_id, text=text, parse_mode="Markdown")
+                    except Exception as e:
+                        logger.error(f"Error cancelling notification for artisan {artisan_id}: {e}")
+                        return
+                except MessageNotModified:
+                    pass
                 except Exception as e:
                     logger.error(f"Error cancelling notification for artisan {artisan_id}: {e}")
+                    return
+                withdrawn.append(artisan_id)
+        
+        await asyncio.gather(*(withdraw(notification) for notification in notifications))
+        await adb.mark_order_notifications(order_id, withdrawn, 'withdrawn')
         
-        logger.info(f"Cancelled order notifications for {cancellation_count} artisans for order {order_id}")
+        logger.info(f"Cancelled order notifications for {len(withdrawn)} artisans for order {order_id}")
         return True
         
     except Exception as e:
@@ -1,17 +1,21 @@
 # order_status_service.py dosyasını oluşturalım
 
-import asyncio
 import datetime
 from aiogram import Bot, types
 from aiogram.types import *
 from dispatcher import bot, dp
 from db import (
-    get_artisan_by_id, get_customer_by_id, get_order_details,
-    update_order_status, set_order_price, update_payment_method,
+    get_artisan_by_id, set_order_price, update_payment_method,
     get_connection
 )
 import logging
 from db_encryption_wrapper import wrap_get_dict_function
+from db_async import adb, run_db
+from timer_service import (
+    timers, timer_handler, TASK_ORDER_ACCEPTANCE, TASK_DIRECT_ORDER_ACCEPTANCE,
+    TASK_ARRIVAL_CHECK, TASK_ARRIVAL_WARNING, TASK_PRICE_REMINDER, TASK_FINAL_PRICE_WARNING,
+    TASK_DELAY_REMINDER
+)
 
 # Set up logging
 logging.basicConfig(
@@ -88,11 +92,17 @@ async def schedule_arrival_check(order_id, artisan_id, scheduled_time):
         # Schedule arrival check notification
         logger.info(f"Scheduling arrival check for order {order_id} in {delay} seconds")
         
-        # Wait until scheduled time
-        await asyncio.sleep(delay)
+        await timers.schedule(TASK_ARRIVAL_CHECK, order_id, delay=delay, data={"artisan_id": artisan_id})
         
+    except Exception as e:
+        logger.error(f"Error in schedule_arrival_check: {e}", exc_info=True)
+
+@timer_handler(TASK_ARRIVAL_CHECK)
+async def send_arrival_check(order_id, artisan_id):
+    """Ask the artisan whether they reached the customer (runs at the scheduled time)"""
+    try:
         # Check if order is still active
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.info(f"Order {order_id} not found for arrival check. Skipping.")
             return
@@ -102,7 +112,7 @@ async def schedule_arrival_check(order_id, artisan_id, scheduled_time):
             return
         
         # Get artisan details
-        artisan = wrap_get_dict_function(get_artisan_by_id)(order['artisan_id'])
+        artisan = await run_db(wrap_get_dict_function(get_artisan_by_id), order['artisan_id'])
         if not artisan:
             logger.error(f"Artisan {artisan_id} not found for arrival check")
             return
@@ -131,24 +141,22 @@ async def schedule_arrival_check(order_id, artisan_id, scheduled_time):
             logger.info(f"Arrival check notification sent for order {order_id} to artisan {artisan_id}")
         except Exception as send_error:
             logger.error(f"Failed to send arrival notification: {send_error}")
+            raise
         
     except Exception as e:
-        logger.error(f"Error in schedule_arrival_check: {e}", exc_info=True)
+        logger.error(f"Error in send_arrival_check: {e}", exc_info=True)
+        raise
 
-async def check_order_acceptance(order_id, customer_id, timeout_seconds):
+@timer_handler(TASK_ORDER_ACCEPTANCE)
+async def check_order_acceptance(order_id, customer_id):
     """Sifarişin müəyyən müddət ərzində qəbul edilib-edilmədiyini yoxlayan funksiya"""
     try:
         if not order_id:
             logger.error("check_order_acceptance called with None order_id")
             return
-            
-        logger.info(f"Waiting {timeout_seconds} seconds to check order {order_id}")
-        
-        # Belirtilen süre kadar bekle
-        await asyncio.sleep(timeout_seconds)
         
         # Siparişin güncel durumunu kontrol et
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         
         if not order:
             logger.error(f"Order {order_id} not found in check_order_acceptance")
@@ -161,10 +169,10 @@ async def check_order_acceptance(order_id, customer_id, timeout_seconds):
             logger.info(f"Order {order_id} is still in 'searching' status, canceling")
             
             # Siparişi iptal et
-            update_order_status(order_id, "cancelled")
+            await adb.update_order_status(order_id, "cancelled")
             
             # Müşteriye bildir
-            customer = get_customer_by_id(customer_id)
+            customer = await adb.get_customer_by_id(customer_id)
             if customer and customer.get('telegram_id'):
                 # Müştəriyə bildiriş göndərmək
                 await bot.send_message(
@@ -193,21 +201,18 @@ async def check_order_acceptance(order_id, customer_id, timeout_seconds):
             
     except Exception as e:
         logger.error(f"Error in check_order_acceptance: {e}", exc_info=True)
+        raise
 
-async def check_direct_order_acceptance(order_id, customer_id, artisan_id, timeout_seconds):
+@timer_handler(TASK_DIRECT_ORDER_ACCEPTANCE)
+async def check_direct_order_acceptance(order_id, customer_id, artisan_id):
     """Check if direct order (from specific artisan) is accepted within timeout"""
     try:
         if not order_id:
             logger.error("check_direct_order_acceptance called with None order_id")
             return
-            
-        logger.info(f"Waiting {timeout_seconds} seconds to check direct order {order_id} for artisan {artisan_id}")
-        
-        # Wait for the specified time
-        await asyncio.sleep(timeout_seconds)
         
         # Check the current order status
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         
         if not order:
             logger.error(f"Direct order {order_id} not found in check_direct_order_acceptance")
@@ -220,10 +225,10 @@ async def check_direct_order_acceptance(order_id, customer_id, artisan_id, timeo
             logger.info(f"Direct order {order_id} is still in 'searching' status, canceling")
             
             # Cancel the order
-            update_order_status(order_id, "cancelled")
+            await adb.update_order_status(order_id, "cancelled")
             
             # Notify customer with specific message for direct orders
-            customer = get_customer_by_id(customer_id)
+            customer = await adb.get_customer_by_id(customer_id)
             if customer and customer.get('telegram_id'):
                 # Send special message for direct order rejection/timeout
                 await bot.send_message(
@@ -252,18 +257,19 @@ async def check_direct_order_acceptance(order_id, customer_id, artisan_id, timeo
             
     except Exception as e:
         logger.error(f"Error in check_direct_order_acceptance: {e}", exc_info=True)
+        raise
 
 async def notify_customer_about_arrival(order_id, status):
     """Müşteriye ustanın varış durumu hakkında bildirim gönderir"""
     try:
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for arrival notification")
             return False
         
         # Get customer details
-        customer = get_customer_by_id(order['customer_id'])
+        customer = await adb.get_customer_by_id(order['customer_id'])
         if not customer:
             logger.error(f"Customer not found for order {order_id}")
             return False
@@ -274,7 +280,7 @@ async def notify_customer_about_arrival(order_id, status):
             return False
         
         # Get artisan details
-        artisan = wrap_get_dict_function(get_artisan_by_id)(order['artisan_id'])
+        artisan = await run_db(wrap_get_dict_function(get_artisan_by_id), order['artisan_id'])
         if not artisan:
             logger.error(f"Artisan not found for order {order_id}")
             return False
@@ -325,7 +331,7 @@ async def send_delay_reminder(order_id):
     """Send a 30-minute delay reminder to the artisan"""
     try:
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for delay reminder")
             return False
@@ -336,7 +342,7 @@ async def send_delay_reminder(order_id):
             return False
         
         # Get artisan details
-        artisan = wrap_get_dict_function(get_artisan_by_id)(order['artisan_id'])
+        artisan = await run_db(wrap_get_dict_function(get_artisan_by_id), order['artisan_id'])
         if not artisan:
             logger.error(f"Artisan not found for order {order_id}")
             return False
@@ -370,17 +376,22 @@ async def send_delay_reminder(order_id):
         logger.error(f"Error sending delay reminder for order {order_id}: {e}")
         return False
 
+@timer_handler(TASK_DELAY_REMINDER)
+async def process_delay_reminder(order_id, **data):
+    """Send a due delay reminder (rows from create_delay_reminder carry {'type': 'delay_reminder'})"""
+    if not await send_delay_reminder(order_id):
+        raise RuntimeError(f"Delay reminder for order {order_id} was not delivered")
+
 async def handle_delayed_arrival(order_id):
     """Handle artisan delay by creating a database-scheduled reminder"""
     try:
         import datetime
-        from db import create_delay_reminder
         
         # Calculate execution time (30 minutes from now)
         execution_time = datetime.datetime.now() + datetime.timedelta(minutes=30)
         
         # Create delay reminder in database
-        task_id = create_delay_reminder(order_id, execution_time)
+        task_id = await adb.create_delay_reminder(order_id, execution_time)
         
         if task_id:
             logger.info(f"Scheduled delay reminder for order {order_id} at {execution_time}")
@@ -393,20 +404,18 @@ async def handle_delayed_arrival(order_id):
         logger.error(f"Error in handle_delayed_arrival: {e}")
         return False
 
+@timer_handler(TASK_ARRIVAL_WARNING)
 async def handle_arrival_warning(order_id):
-    """Ustanın varış uyarısını yönetir"""
+    """Ustanın varış uyarısını yönetir (runs 5 minutes after the customer reports a no-show)"""
     try:
-        # Wait for 5 minutes
-        await asyncio.sleep(5 * 60)  # 5 minutes
-        
         # Check if order is still active
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order or order['status'] != 'accepted':
             logger.info(f"Order {order_id} is no longer active or not in accepted state. Skipping arrival warning.")
             return
         
         # Get customer details to ask again
-        customer = get_customer_by_id(order['customer_id'])
+        customer = await adb.get_customer_by_id(order['customer_id'])
         if not customer:
             logger.error(f"Customer not found for order {order_id}")
             return
@@ -434,19 +443,20 @@ async def handle_arrival_warning(order_id):
         
     except Exception as e:
         logger.error(f"Error in handle_arrival_warning: {e}")
+        raise
 
 async def block_artisan_for_no_show(order_id):
     """Ustayı varış yapmaması nedeniyle bloklar"""
     try:
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for blocking artisan")
             return False
         
         # Get artisan details
         artisan_id = order['artisan_id']
-        artisan = wrap_get_dict_function(get_artisan_by_id)(artisan_id)
+        artisan = await run_db(wrap_get_dict_function(get_artisan_by_id), artisan_id)
         if not artisan:
             logger.error(f"Artisan not found for order {order_id}")
             return False
@@ -457,7 +467,7 @@ async def block_artisan_for_no_show(order_id):
             return False
         
         # Get customer details
-        customer = get_customer_by_id(order['customer_id'])
+        customer = await adb.get_customer_by_id(order['customer_id'])
         if not customer:
             logger.error(f"Customer not found for order {order_id}")
             return False
@@ -468,15 +478,14 @@ async def block_artisan_for_no_show(order_id):
             return False
         
         # Block artisan
-        from db import block_artisan
         block_reason = f"Sifariş #{order_id} üçün məkana gəlmədiniz"
         required_payment = 10.0  # Default penalty amount
         
-        success = block_artisan(artisan_id, block_reason, required_payment)
+        success = await adb.block_artisan(artisan_id, block_reason, required_payment)
         
         if success:
             # Cancel the order
-            update_order_status(order_id, "cancelled")
+            await adb.update_order_status(order_id, "cancelled")
             
             # Notify artisan
             await bot.send_message(
@@ -516,14 +525,14 @@ async def request_price_from_artisan(order_id):
     """Ustadan fiyat girişi ister"""
     try:
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for price request")
             return False
         
         # Get artisan details
         artisan_id = order['artisan_id']
-        artisan = wrap_get_dict_function(get_artisan_by_id)(artisan_id)
+        artisan = await run_db(wrap_get_dict_function(get_artisan_by_id), artisan_id)
         if not artisan:
             logger.error(f"Artisan not found for order {order_id}")
             return False
@@ -545,15 +554,14 @@ async def request_price_from_artisan(order_id):
         
         # Set context to handle price input
         import datetime
-        from db import set_user_context
-        set_user_context(telegram_id, {
+        await adb.set_user_context(telegram_id, {
             "action": "set_price",
             "order_id": order_id,
             "deadline": datetime.datetime.now() + datetime.timedelta(minutes=30)
         })
         
         # Schedule reminder after 25 minutes
-        asyncio.create_task(remind_price_setting(telegram_id, order_id, 25))
+        await timers.schedule(TASK_PRICE_REMINDER, order_id, delay=25 * 60)
         
         return True
         
@@ -561,14 +569,17 @@ async def request_price_from_artisan(order_id):
         logger.error(f"Error in request_price_from_artisan: {e}")
         return False
 
-async def remind_price_setting(telegram_id, order_id, minutes):
+async def _get_order_artisan_telegram_id(order):
+    """Get the telegram ID of the artisan assigned to an order"""
+    artisan = await run_db(wrap_get_dict_function(get_artisan_by_id), order['artisan_id'])
+    return artisan.get('telegram_id') if artisan else None
+
+@timer_handler(TASK_PRICE_REMINDER)
+async def remind_price_setting(order_id):
     """Ustaya fiyat belirlemesi için hatırlatma gönderir"""
     try:
-        # Wait for specified minutes
-        await asyncio.sleep(minutes * 60)
-        
         # Check if price has been set
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for price reminder")
             return
@@ -578,9 +589,13 @@ async def remind_price_setting(telegram_id, order_id, minutes):
             logger.info(f"Price already set for order {order_id}, skipping reminder")
             return
         
+        telegram_id = await _get_order_artisan_telegram_id(order)
+        if not telegram_id:
+            logger.error(f"Telegram ID not found for artisan of order {order_id}")
+            return
+        
         # Get user context to check if still waiting for price
-        from db import get_user_context
-        context = get_user_context(telegram_id)
+        context = await adb.get_user_context(telegram_id)
         
         if not context or context.get('action') != 'set_price' or context.get('order_id') != order_id:
             logger.info(f"User context changed, not waiting for price for order {order_id}")
@@ -596,19 +611,18 @@ async def remind_price_setting(telegram_id, order_id, minutes):
         )
         
         # Schedule final warning after 5 more minutes
-        asyncio.create_task(final_price_warning(telegram_id, order_id))
+        await timers.schedule(TASK_FINAL_PRICE_WARNING, order_id, delay=5 * 60)
         
     except Exception as e:
         logger.error(f"Error in remind_price_setting: {e}")
+        raise
 
-async def final_price_warning(telegram_id, order_id):
+@timer_handler(TASK_FINAL_PRICE_WARNING)
+async def final_price_warning(order_id):
     """Ustaya fiyat belirlemesi için son uyarı gönderir"""
     try:
-        # Wait for 5 minutes
-        await asyncio.sleep(5 * 60)
-        
         # Check if price has been set
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for final price warning")
             return
@@ -618,29 +632,31 @@ async def final_price_warning(telegram_id, order_id):
             logger.info(f"Price already set for order {order_id}, skipping final warning")
             return
         
+        telegram_id = await _get_order_artisan_telegram_id(order)
+        if not telegram_id:
+            logger.error(f"Telegram ID not found for artisan of order {order_id}")
+            return
+        
         # Get user context to check if still waiting for price
-        from db import get_user_context
-        context = get_user_context(telegram_id)
+        context = await adb.get_user_context(telegram_id)
         
         if not context or context.get('action') != 'set_price' or context.get('order_id') != order_id:
             logger.info(f"User context changed, not waiting for price for order {order_id}")
             return
         
         # Clear context
-        from db import clear_user_context
-        clear_user_context(telegram_id)
+        await adb.clear_user_context(telegram_id)
         
         # Block artisan
         artisan_id = order['artisan_id']
-        from db import block_artisan
         block_reason = f"Sifariş #{order_id} üçün qiyməti təyin etmədiniz"
         required_payment = 10.0  # Default penalty amount
         
-        success = block_artisan(artisan_id, block_reason, required_payment)
+        success = await adb.block_artisan(artisan_id, block_reason, required_payment)
         
         if success:
             # Cancel the order
-            update_order_status(order_id, "cancelled")
+            await adb.update_order_status(order_id, "cancelled")
             
             # Notify artisan
             await bot.send_message(
@@ -653,7 +669,7 @@ async def final_price_warning(telegram_id, order_id):
             )
             
             # Notify customer
-            customer = get_customer_by_id(order['customer_id'])
+            customer = await adb.get_customer_by_id(order['customer_id'])
             if customer and customer.get('telegram_id'):
                 await bot.send_message(
                     chat_id=customer['telegram_id'],
@@ -664,4 +680,5 @@ async def final_price_warning(telegram_id, order_id):
                 )
         
     except Exception as e:
-        logger.error(f"Error in final_price_warning: {e}")
\ No newline at end of file
+        logger.error(f"Error in final_price_warning: {e}")
+        raise
\ No newline at end of file
@@ -0,0 +1,190 @@
+# outbox_service.py
+
+import asyncio
+import logging
+import uuid
+from aiogram.utils.exceptions import BadRequest, Unauthorized
+import db
+from db_async import adb
+from timer_service import timers
+from telegram_dispatcher import telegram, PRIORITY_TRANSACTIONAL
+from config import (
+    WORKER_ID, OUTBOX_BATCH_SIZE, OUTBOX_POLL_SECONDS, OUTBOX_LEASE_SECONDS,
+    OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BASE_SECONDS, OUTBOX_RETRY_MAX_SECONDS,
+    OUTBOX_RETENTION_DAYS
+)
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Errors that will not go away by retrying (bot blocked, chat gone, bad markup)
+PERMANENT_ERRORS = (Unauthorized, BadRequest)
+
+
+def outbox_message(idempotency_key, chat_id, text=None, method="send_message", **kwargs):
+    """Build a notification_outbox row for a Bot API call
+
+    Args:
+        idempotency_key (str): Unique name of the notification, e.g.
+            'block_customer:42'; a second message with the same key is dropped,
+            so it must name the event, not the attempt
+        chat_id (int): Target chat (decrypted Telegram ID)
+        text (str, optional): Message text
+        method (str): Bot method name
+        **kwargs: Other Bot method arguments; keyboards are stored as JSON
+
+    Returns:
+        dict: Message for db.add_outbox_messages / db.enqueue_outbox_messages
+    """
+    if not idempotency_key:
+        raise ValueError("Outbox messages need an idempotency key")
+    payload = dict(kwargs)
+    if text is not None:
+        payload['text'] = text
+    markup = payload.get('reply_markup')
+    if markup is not None and hasattr(markup, 'to_python'):
+        payload['reply_markup'] = markup.to_python()
+    return {
+        "idempotency_key": idempotency_key,
+        "chat_id": int(chat_id),
+        "method": method,
+        "payload": payload,
+    }
+
+
+async def send_via_outbox(idempotency_key, chat_id, text=None, method="send_message", outbox=None, **kwargs):
+    """Queue a notification in the outbox and wake the worker
+
+    Use this instead of telegram.send_message for messages that must survive
+    a Telegram outage or a restart. When the message belongs to a database
+    change, pass outbox_message(...) to that change's db function instead,
+    so both commit together.
+
+    Args:
+        outbox (list, optional): Append the message here instead of queueing
+            it, for the caller to pass to the db function of its change
+
+    Returns:
+        bool: True if the message was queued (or appended)
+    """
+    message = outbox_message(idempotency_key, chat_id, text, method, **kwargs)
+    if outbox is not None:
+        outbox.append(message)
+        return True
+    return await adb.enqueue_outbox_messages([message])
+
+
+class OutboxWorker:
+    """Delivers notification_outbox messages through the Telegram dispatcher
+
+    Messages are claimed in batches with a lease, so several bot processes
+    can drain the same outbox. A failed delivery is retried with exponential
+    backoff; permanent errors and messages that run out of attempts become
+    dead letters, which admins can inspect and requeue. Delivery is
+    at-least-once: a crash between the send and the status update resends
+    the message after the lease expires.
+    """
+
+    def __init__(self, owner=WORKER_ID, batch_size=OUTBOX_BATCH_SIZE, poll_interval=OUTBOX_POLL_SECONDS,
+                 lease_seconds=OUTBOX_LEASE_SECONDS, max_attempts=OUTBOX_MAX_ATTEMPTS,
+                 retry_base=OUTBOX_RETRY_BASE_SECONDS, retry_max=OUTBOX_RETRY_MAX_SECONDS):
+        self.owner = owner
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._loop = None
+        self._draining = False
+        self._again = False
+        self._stats = {"sent": 0, "retried": 0, "dead": 0, "drains": 0}
+
+    def start(self):
+        """Drain on every commit of this process and every poll_interval seconds"""
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        db.add_outbox_listener(self._on_enqueued)
+        timers.every("outbox_drain", self.poll_interval, self.drain)
+        timers.every("outbox_purge", 24 * 60 * 60, self.purge, exclusive=True)
+        logger.info(f"Outbox worker started as {self.owner}")
+
+    def _on_enqueued(self):
+        """db listener; runs on whichever thread committed the messages"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._kick)
+
+    def _kick(self):
+        if self._draining:
+            self._again = True
+        else:
+            asyncio.ensure_future(self.drain())
+
+    def retry_delay(self, attempts):
+        """Seconds to wait after the given number of failed attempts"""
+        return min(self.retry_base * 2 ** max(attempts - 1, 0), self.retry_max)
+
+    async def drain(self):
+        """Deliver every due message, batch by batch"""
+        if self._draining:
+            self._again = True
+            return
+        self._draining = True
+        try:
+            while True:
+                self._again = False
+                token = f"{self.owner}:{uuid.uuid4().hex[:12]}"
+                messages = await adb.claim_outbox_messages(token, self.batch_size, self.lease_seconds)
+                if messages:
+                    self._stats["drains"] += 1
+                    results = await asyncio.gather(*(self._deliver(token, message) for message in messages))
+                    sent = [message['id'] for message, delivered in zip(messages, results) if delivered]
+                    await adb.complete_outbox_messages(sent, token)
+                if len(messages) < self.batch_size and not self._again:
+                    return
+        finally:
+            self._draining = False
+
+    async def _deliver(self, token, message):
+        try:
+            await telegram.call(message['method'], message['chat_id'], PRIORITY_TRANSACTIONAL, **message['payload'])
+        except PERMANENT_ERRORS as e:
+            self._stats["dead"] += 1
+            logger.warning(f"Outbox message {message['idempotency_key']} cannot be delivered: {e}")
+            await adb.fail_outbox_message(message['id'], token, f"{type(e).__name__}: {e}")
+            return False
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if message['attempts'] >= self.max_attempts:
+                self._stats["dead"] += 1
+                logger.error(f"Outbox message {message['idempotency_key']} failed {message['attempts']} times: {e}")
+                await adb.fail_outbox_message(message['id'], token, error)
+            else:
+                self._stats["retried"] += 1
+                delay = self.retry_delay(message['attempts'])
+                logger.warning(f"Outbox message {message['idempotency_key']} failed, retrying in {delay}s: {e}")
+                await adb.fail_outbox_message(message['id'], token, error, retry_in=delay)
+            return False
+        self._stats["sent"] += 1
+        return True
+
+    async def purge(self):
+        deleted = await adb.purge_sent_outbox_messages(OUTBOX_RETENTION_DAYS)
+        if deleted:
+            logger.info(f"Purged {deleted} delivered outbox messages")
+
+    def stats(self):
+        """Get delivery counters of this process
+
+        Returns:
+            dict: Sent, retried and dead-lettered messages, drain rounds and owner
+        """
+        return dict(self._stats, owner=self.owner, draining=self._draining)
+
+
+outbox = OutboxWorker()
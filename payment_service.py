@@ -2,18 +2,19 @@
 
 from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from dispatcher import bot, dp
+from dispatcher import dp
+from outbox_service import outbox_message, send_via_outbox
 from db import (
-    get_artisan_by_id, get_customer_by_id, get_order_details,
-    set_order_price, update_payment_method, save_payment_receipt,
+    get_customer_by_id, set_order_price, save_payment_receipt,
     get_connection, set_user_context, clear_user_context
 )
 import logging
-import asyncio
 import datetime
-from config import COMMISSION_RATES, ADMIN_CARD_NUMBER, ADMIN_CARD_HOLDER, DB_CONFIG
+from config import COMMISSION_RATES, ADMIN_CARD_NUMBER, ADMIN_CARD_HOLDER
 from crypto_service import encrypt_data, decrypt_data, mask_card_number, mask_name
 from db_encryption_wrapper import wrap_get_dict_function
+from db_async import adb, run_db
+from timer_service import timers, timer_handler, TASK_ADMIN_PAYMENT_DEADLINE, TASK_BLOCK_ARTISAN_NONPAYMENT
 
 # Set up logging
 logging.basicConfig(
@@ -22,17 +23,17 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-async def notify_customer_about_price(order_id, price):
+async def notify_customer_about_price(order_id, price, outbox=None):
     """Müşteriye belirlenen fiyat hakkında bildirim gönderir"""
     try:
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for price notification")
             return False
         
         # Get customer details
-        customer = wrap_get_dict_function(get_customer_by_id)(order.get('customer_id'))
+        customer = await run_db(wrap_get_dict_function(get_customer_by_id), order.get('customer_id'))
         if not customer:
             logger.error(f"Customer not found for order {order_id}")
             return False
@@ -46,7 +47,7 @@ async def notify_customer_about_price(order_id, price):
         artisan_name = "Usta"  # Default fallback name
         try:
             # Get artisan data
-            artisan_encrypted = get_artisan_by_id(order['artisan_id'])
+            artisan_encrypted = await adb.get_artisan_by_id(order['artisan_id'])
             
             if artisan_encrypted:
                 # Try to safely decrypt artisan data
@@ -85,8 +86,10 @@ async def notify_customer_about_price(order_id, price):
         )
         
         # Send message
-        await bot.send_message(
+        await send_via_outbox(
+            f"price_offer:{order_id}:{price}",
             chat_id=customer_telegram_id,
+            outbox=outbox,
             text=message_text,
             reply_markup=keyboard,
             parse_mode="Markdown"
@@ -106,7 +109,7 @@ async def notify_customer_about_payment_options(order_id):
     """Müşteriye ödeme seçenekleri gösterir"""
     try:
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for payment options")
             return False
@@ -139,13 +142,14 @@ async def notify_customer_about_payment_options(order_id):
         
         # Send payment options to customer
         customer_id = order.get('customer_id')
-        customer = get_customer_by_id(customer_id)
+        customer = await adb.get_customer_by_id(customer_id)
         
         if not customer or not customer.get('telegram_id'):
             logger.error(f"Customer not found or missing telegram_id for order {order_id}")
             return False
             
-        await bot.send_message(
+        await send_via_outbox(
+            f"payment_options:{order_id}",
             chat_id=customer['telegram_id'],
             text=f"💰 *Ödəniş məlumatları*\n\n"
                  f"Sifariş #{order_id} üçün ödəniş məbləği: *{price:.2f} AZN*\n\n"
@@ -164,18 +168,22 @@ async def notify_customer_about_payment_options(order_id):
         return False
     
 
-async def notify_artisan_about_payment_method(order_id, payment_method):
-    """Ustaya seçilen ödeme yöntemi hakkında bildirim gönderir"""
+async def notify_artisan_about_payment_method(order_id, payment_method, outbox=None):
+    """Ustaya seçilen ödeme yöntemi hakkında bildirim gönderir
+
+    Saves the payment method; the artisan's notice and any messages passed
+    in `outbox` are committed together with it.
+    """
     try:
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for payment method notification")
             return False
         
         # Get artisan details
         artisan_id = order['artisan_id']
-        artisan = get_artisan_by_id(artisan_id)
+        artisan = await adb.get_artisan_by_id(artisan_id)
         if not artisan:
             logger.error(f"Artisan not found for order {order_id}")
             return False
@@ -229,18 +237,22 @@ async def notify_artisan_about_payment_method(order_id, payment_method):
             
             reply_markup = None
         
-        # Send notification to artisan
-        await bot.send_message(
+        # Notify artisan - the notice is committed together with the payment method
+        notices = list(outbox or [])
+        await send_via_outbox(
+            f"payment_method:{order_id}:{payment_method}",
             chat_id=telegram_id,
+            outbox=notices,
             text=message_text,
             reply_markup=reply_markup,
             parse_mode="Markdown"
         )
         
         # Update payment method in database
-        success = update_payment_method(order_id, payment_method)
+        success = await adb.update_payment_method(order_id, payment_method, outbox=notices)
         if not success:
             logger.error(f"Failed to update payment method for order {order_id}")
+            return False
         
         # Log successful notification
         logger.info(f"Payment method notification sent to artisan for order {order_id}: {payment_method}")
@@ -252,17 +264,17 @@ async def notify_artisan_about_payment_method(order_id, payment_method):
         return False
 
 
-async def notify_customer_about_card_payment(order_id):
+async def notify_customer_about_card_payment(order_id, outbox=None):
     """Müşteriye kart ödeme bilgileri gönderir"""
     try:
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for card payment notification")
             return False
         
         # Get customer details
-        customer = get_customer_by_id(order['customer_id'])
+        customer = await adb.get_customer_by_id(order['customer_id'])
         if not customer:
             logger.error(f"Customer not found for order {order_id}")
             return False
@@ -273,7 +285,7 @@ async def notify_customer_about_card_payment(order_id):
             return False
         
         # Get artisan details
-        artisan = get_artisan_by_id(order['artisan_id'])
+        artisan = await adb.get_artisan_by_id(order['artisan_id'])
         if not artisan:
             logger.error(f"Artisan not found for order {order_id}")
             return False
@@ -295,8 +307,10 @@ async def notify_customer_about_card_payment(order_id):
         ))
         
         # Send card payment details to customer
-        await bot.send_message(
+        await send_via_outbox(
+            f"card_payment:{order_id}",
             chat_id=customer_telegram_id,
+            outbox=outbox,
             text=f"💳 *Kartla ödəniş*\n\n"
                  f"Sifariş: #{order_id}\n"
                  f"Məbləğ: {order.get('price', 0)} AZN\n\n"
@@ -315,17 +329,17 @@ async def notify_customer_about_card_payment(order_id):
         logger.error(f"Error in notify_customer_about_card_payment: {e}")
         return False
 
-async def notify_customer_about_cash_payment(order_id):
+async def notify_customer_about_cash_payment(order_id, outbox=None):
     """Müşteriye nakit ödeme hakkında bildirim gönderir"""
     try:
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for cash payment notification")
             return False
         
         # Get customer details
-        customer = get_customer_by_id(order['customer_id'])
+        customer = await adb.get_customer_by_id(order['customer_id'])
         if not customer:
             logger.error(f"Customer not found for order {order_id}")
             return False
@@ -343,8 +357,10 @@ async def notify_customer_about_cash_payment(order_id):
         ))
         
         # Send cash payment notification to customer
-        await bot.send_message(
+        await send_via_outbox(
+            f"cash_payment:{order_id}",
             chat_id=customer_telegram_id,
+            outbox=outbox,
             text=f"💵 *Ödəniş*\n\n"
                  f"Sifariş: #{order_id}\n"
                  f"Məbləğ: {order.get('price', 0)} AZN\n\n"
@@ -361,14 +377,16 @@ async def notify_customer_about_cash_payment(order_id):
         logger.error(f"Error in notify_customer_about_cash_payment: {e}")
         return False
 
+@timer_handler(TASK_ADMIN_PAYMENT_DEADLINE)
 async def handle_admin_payment_deadline(order_id):
-    """Ustanın admin ödeme süre sınırını yönetir"""
+    """Ustanın admin ödeme süre sınırını yönetir
+    
+    Runs as a timer 24 hours after the cash payment:
+    timers.schedule(TASK_ADMIN_PAYMENT_DEADLINE, order_id, delay=24 * 60 * 60)
+    """
     try:
-        # Wait for 24 hours
-        await asyncio.sleep(24 * 60 * 60)  # 24 hours
-        
         # Get order details
-        order = get_order_details(order_id)
+        order = await adb.get_order_details(order_id)
         if not order:
             logger.error(f"Order {order_id} not found for admin payment deadline")
             return
@@ -385,7 +403,7 @@ async def handle_admin_payment_deadline(order_id):
         
         # Get artisan details
         artisan_id = order['artisan_id']
-        artisan = get_artisan_by_id(artisan_id)
+        artisan = await adb.get_artisan_by_id(artisan_id)
         if not artisan:
             logger.error(f"Artisan not found for order {order_id}")
             return
@@ -410,7 +428,8 @@ async def handle_admin_payment_deadline(order_id):
         total_amount = admin_fee + fine_amount
         
         # Send warning to artisan
-        await bot.send_message(
+        await send_via_outbox(
+            f"admin_payment_deadline:{order_id}",
             chat_id=telegram_id,
             text=f"⚠️ *Komissiya ödənişi xəbərdarlığı*\n\n"
                  f"Sifariş #{order_id} üçün komissiya ödənişi müddəti bitdi.\n\n"
@@ -425,46 +444,49 @@ async def handle_admin_payment_deadline(order_id):
         )
         
         # Schedule blocking after 6 more hours if not paid
-        asyncio.create_task(block_artisan_for_nonpayment(order_id, artisan_id, total_amount, 6))
+        await timers.schedule(
+            TASK_BLOCK_ARTISAN_NONPAYMENT, order_id, delay=6 * 60 * 60,
+            data={"artisan_id": artisan_id, "amount": float(total_amount)}
+        )
         
     except Exception as e:
         logger.error(f"Error in handle_admin_payment_deadline: {e}")
+        raise
 
-async def block_artisan_for_nonpayment(order_id, artisan_id, amount, hours):
+@timer_handler(TASK_BLOCK_ARTISAN_NONPAYMENT)
+async def block_artisan_for_nonpayment(order_id, artisan_id, amount):
     """Ödeme yapmaması durumunda ustayı bloklar"""
     try:
-        # Wait for specified hours
-        await asyncio.sleep(hours * 60 * 60)
-        
         # Check if payment has been made
         # This would require additional database fields
         # For now, assume it hasn't been paid
         
         # Block artisan
-        from db import block_artisan
         block_reason = f"Sifariş #{order_id} üçün komissiya ödənişi edilmədi"
         
-        success = block_artisan(artisan_id, block_reason, amount)
-        
-        if success:
-            # Get artisan telegram ID
-            artisan = get_artisan_by_id(artisan_id)
-            if not artisan or not artisan.get('telegram_id'):
-                logger.error(f"Could not get telegram ID for artisan {artisan_id}")
-                return
-            
-            # Notify artisan
-            await bot.send_message(
+        # Notify artisan - the notice is committed together with the block
+        notices = []
+        artisan = await adb.get_artisan_by_id(artisan_id)
+        if artisan and artisan.get('telegram_id'):
+            notices.append(outbox_message(
+                f"block_artisan_nonpayment:{order_id}",
                 chat_id=artisan['telegram_id'],
                 text=f"⛔ *Hesabınız bloklandı*\n\n"
                      f"Səbəb: {block_reason}\n\n"
                      f"Bloku açmaq üçün {amount} AZN ödəniş etməlisiniz.\n"
                      f"Ödəniş etmək üçün: /pay_fine komandası ilə ətraflı məlumat ala bilərsiniz.",
                 parse_mode="Markdown"
-            )
+            ))
+        else:
+            logger.error(f"Could not get telegram ID for artisan {artisan_id}")
+        
+        success = await adb.block_artisan(artisan_id, block_reason, amount, outbox=notices)
+        if not success:
+            raise RuntimeError(f"Failed to block artisan {artisan_id} for nonpayment on order {order_id}")
         
     except Exception as e:
         logger.error(f"Error in block_artisan_for_nonpayment: {e}")
+        raise
 
 
 def secure_store_card_details(order_id, card_number, card_holder=None):
@@ -478,6 +500,7 @@ def secure_store_card_details(order_id, card_number, card_holder=None):
     Returns:
         bool: Success or failure
     """
+    conn = None
     try:
         # Encrypt sensitive data
         encrypted_card_number = encrypt_data(card_number)
@@ -486,29 +509,6 @@ def secure_store_card_details(order_id, card_number, card_holder=None):
         conn = get_connection()
         cursor = conn.cursor()
         
-        # Check if table exists
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM information_schema.tables 
-            WHERE table_schema = %s 
-            AND table_name = 'payment_card_details'
-        """, (DB_CONFIG['database'],))
-        
-        table_exists = cursor.fetchone()[0] > 0
-        
-        # Create table if it doesn't exist
-        if not table_exists:
-            cursor.execute("""
-                CREATE TABLE payment_card_details (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    order_id INT NOT NULL,
-                    card_number TEXT NOT NULL,
-                    card_holder TEXT,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
-                )
-            """)
-        
         # Insert or update card details
         cursor.execute("""
             INSERT INTO payment_card_details (order_id, card_number, card_holder, created_at)
@@ -540,23 +540,11 @@ def get_card_details(order_id, mask=True):
     Returns:
         dict: Card details or None
     """
+    conn = None
     try:
         conn = get_connection()
         cursor = conn.cursor(dictionary=True)
         
-        # Check if table exists
-        cursor.execute("""
-            SELECT COUNT(*) as count 
-            FROM information_schema.tables 
-            WHERE table_schema = %s 
-            AND table_name = 'payment_card_details'
-        """, (DB_CONFIG['database'],))
-        
-        table_exists = cursor.fetchone()['count'] > 0
-        
-        if not table_exists:
-            return None
-        
         # Get card details
         cursor.execute("""
             SELECT card_number, card_holder
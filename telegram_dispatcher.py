@@ -0,0 +1,318 @@
+# telegram_dispatcher.py
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+import aiohttp
+from aiogram.utils.exceptions import RetryAfter, NetworkError
+from dispatcher import bot
+from config import (
+    TELEGRAM_SEND_CONCURRENCY, TELEGRAM_GLOBAL_RATE, TELEGRAM_PER_CHAT_RATE,
+    TELEGRAM_PER_CHAT_BURST, TELEGRAM_SEND_MAX_RETRIES
+)
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Priority lanes, lower values are sent first
+PRIORITY_TRANSACTIONAL = 0  # Order, payment and account messages
+PRIORITY_NORMAL = 1         # Admin announcements
+PRIORITY_BULK = 2           # Advertisements and other broadcasts
+
+PRIORITY_NAMES = {
+    PRIORITY_TRANSACTIONAL: "transactional",
+    PRIORITY_NORMAL: "normal",
+    PRIORITY_BULK: "bulk",
+}
+
+# Idle per-chat buckets are dropped once this many are tracked
+MAX_TRACKED_CHATS = 10000
+
+
+class TokenBucket:
+    """Token bucket that hands out send slots at `rate` per second"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Get the seconds until a token is available, 0.0 if one is available now"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        """Take a token; call after wait_time() returned 0.0"""
+        self._refill()
+        self.tokens -= 1
+
+    def is_full(self):
+        elapsed = time.monotonic() - self.updated
+        return self.tokens + elapsed * self.rate >= self.capacity
+
+
+class _Job:
+    __slots__ = ('method', 'chat_id', 'kwargs', 'priority', 'future', 'attempts', 'queued_at')
+
+    def __init__(self, method, chat_id, kwargs, priority, future):
+        self.method = method
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future = future
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+
+
+class TelegramDispatcher:
+    """Central, rate-limited queue for outbound Bot API calls
+
+    Calls are queued per chat and sent in submission order. Chats whose
+    next call may be sent wait in a queue ordered by the priority lane of
+    that call, and a fixed number of worker coroutines take chats from it.
+    Each call takes a slot from the global token bucket and from its chat's
+    bucket, so bursts never exceed Telegram's limits. A chat that has no
+    slot yet, or is backing off, is put back in the queue with a timer
+    instead of holding a worker, so a busy chat never delays the others.
+    A 429 (RetryAfter) pauses every chat for the requested time and the
+    call is retried; network errors are retried with exponential backoff.
+    Any other error is raised to the caller unchanged, so BotBlocked and
+    similar can still be handled where the call is made.
+    """
+
+    def __init__(self, concurrency=TELEGRAM_SEND_CONCURRENCY, global_rate=TELEGRAM_GLOBAL_RATE,
+                 per_chat_rate=TELEGRAM_PER_CHAT_RATE, per_chat_burst=TELEGRAM_PER_CHAT_BURST,
+                 max_retries=TELEGRAM_SEND_MAX_RETRIES):
+        self.concurrency = concurrency
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        # A small burst keeps any one-second window under global_rate * 1.2
+        self._global_bucket = TokenBucket(global_rate, max(1, int(global_rate / 5)))
+        self._chat_buckets = {}
+        self._chat_jobs = {}    # chat_id -> deque of jobs, only while the chat has jobs
+        self._paused_until = 0.0
+        self._queue = None      # (priority, sequence, chat_id) of chats ready to send
+        self._workers = []
+        self._sequence = itertools.count()
+        self._stats = {
+            name: {"sent": 0, "failed": 0, "retry_after": 0, "network_retries": 0,
+                   "total_wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            for name in PRIORITY_NAMES.values()
+        }
+
+    # -------------------------
+    # PUBLIC API
+    # -------------------------
+
+    def submit(self, method, chat_id, priority=PRIORITY_TRANSACTIONAL, **kwargs):
+        """Queue a Bot API call without waiting for it
+
+        Args:
+            method (str): Bot method name, e.g. 'send_message'
+            chat_id (int): Target chat
+            priority (int): PRIORITY_TRANSACTIONAL, PRIORITY_NORMAL or PRIORITY_BULK
+            **kwargs: Arguments of the Bot method other than chat_id
+
+        Returns:
+            asyncio.Future: Resolves to the Bot API result or its exception
+        """
+        self._ensure_workers()
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(method, chat_id, kwargs, priority, future)
+        jobs = self._chat_jobs.get(chat_id)
+        if jobs is None:
+            self._chat_jobs[chat_id] = deque([job])
+            self._enqueue_chat(chat_id)
+        else:
+            # The chat is already queued, waiting or being sent to
+            jobs.append(job)
+        return future
+
+    async def call(self, method, chat_id, priority=PRIORITY_TRANSACTIONAL, **kwargs):
+        """Queue a Bot API call and wait for its result"""
+        return await self.submit(method, chat_id, priority, **kwargs)
+
+    async def send_message(self, chat_id, text, priority=PRIORITY_TRANSACTIONAL, **kwargs):
+        return await self.call("send_message", chat_id, priority, text=text, **kwargs)
+
+    async def send_photo(self, chat_id, photo, priority=PRIORITY_TRANSACTIONAL, **kwargs):
+        return await self.call("send_photo", chat_id, priority, photo=photo, **kwargs)
+
+    async def send_media_group(self, chat_id, media, priority=PRIORITY_TRANSACTIONAL, **kwargs):
+        return await self.call("send_media_group", chat_id, priority, media=media, **kwargs)
+
+    async def edit_message_text(self, text, chat_id, message_id, priority=PRIORITY_TRANSACTIONAL, **kwargs):
+        return await self.call("edit_message_text", chat_id, priority, text=text, message_id=message_id, **kwargs)
+
+    # -------------------------
+    # WORKERS
+    # -------------------------
+
+    def _ensure_workers(self):
+        if self._workers:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"telegram-send-{i}")
+            for i in range(self.concurrency)
+        ]
+
+    async def _worker(self):
+        while True:
+            _, _, chat_id = await self._queue.get()
+            try:
+                await self._process(chat_id)
+            except Exception as e:
+                logger.error(f"Unexpected error in Telegram dispatcher: {e}", exc_info=True)
+                jobs = self._chat_jobs.get(chat_id)
+                if jobs:
+                    job = jobs[0]
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                    self._next_job(chat_id)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, chat_id):
+        """Send the next call of a chat, or put the chat back to wait for its slot"""
+        jobs = self._chat_jobs.get(chat_id)
+        while jobs and jobs[0].future.done():
+            # The caller gave up (cancelled) while the call was queued
+            jobs.popleft()
+        if not jobs:
+            self._chat_jobs.pop(chat_id, None)
+            return
+
+        delay = self._slot_delay(chat_id)
+        if delay > 0:
+            self._defer_chat(chat_id, delay)
+            return
+
+        job = jobs[0]
+        stats = self._stats[PRIORITY_NAMES.get(job.priority, "normal")]
+        if job.attempts == 0:
+            waited = time.monotonic() - job.queued_at
+            stats["total_wait_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+
+        try:
+            result = await getattr(bot, job.method)(chat_id=job.chat_id, **job.kwargs)
+        except RetryAfter as e:
+            stats["retry_after"] += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + e.timeout)
+            logger.warning(f"Flood control on chat {job.chat_id}, pausing sends for {e.timeout}s")
+            if not self._give_up(job, e, stats):
+                self._defer_chat(chat_id, e.timeout)
+                return
+        except (NetworkError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            stats["network_retries"] += 1
+            if not self._give_up(job, e, stats):
+                self._defer_chat(chat_id, min(2 ** job.attempts, 30))
+                return
+        except Exception as e:
+            stats["failed"] += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            stats["sent"] += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        self._next_job(chat_id)
+
+    def _give_up(self, job, error, stats):
+        """Count a retry; fail the job once retries are exhausted"""
+        job.attempts += 1
+        if job.attempts <= self.max_retries:
+            return False
+        stats["failed"] += 1
+        logger.error(f"Giving up {job.method} to chat {job.chat_id} after {job.attempts} attempts: {error}")
+        if not job.future.done():
+            job.future.set_exception(error)
+        return True
+
+    def _next_job(self, chat_id):
+        """Drop the chat's finished call and queue the chat again if it has more"""
+        jobs = self._chat_jobs.get(chat_id)
+        if jobs:
+            jobs.popleft()
+        if jobs:
+            self._enqueue_chat(chat_id)
+        else:
+            self._chat_jobs.pop(chat_id, None)
+
+    def _enqueue_chat(self, chat_id):
+        jobs = self._chat_jobs.get(chat_id)
+        if jobs:
+            self._queue.put_nowait((jobs[0].priority, next(self._sequence), chat_id))
+
+    def _defer_chat(self, chat_id, delay):
+        """Queue the chat again after `delay` seconds without holding a worker"""
+        asyncio.get_running_loop().call_later(delay, self._enqueue_chat, chat_id)
+
+    def _slot_delay(self, chat_id):
+        """Take a send slot for the chat if one is free
+
+        Returns:
+            float: 0.0 if the slot was taken, otherwise seconds until one may be free
+        """
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_TRACKED_CHATS:
+                self._prune_chat_buckets()
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+
+        delay = max(bucket.wait_time(), self._global_bucket.wait_time(), self._paused_until - time.monotonic())
+        if delay > 0:
+            return delay
+        bucket.take()
+        self._global_bucket.take()
+        return 0.0
+
+    def _prune_chat_buckets(self):
+        for chat_id in [c for c, b in self._chat_buckets.items() if b.is_full()]:
+            del self._chat_buckets[chat_id]
+
+    # -------------------------
+    # METRICS
+    # -------------------------
+
+    def stats(self):
+        """Get per-lane send counters, queue depth and pause state
+
+        Returns:
+            dict: Counters keyed by lane name plus queue information
+        """
+        lanes = {}
+        for name, stats in self._stats.items():
+            handled = stats["sent"] + stats["failed"]
+            lanes[name] = dict(
+                stats,
+                total_wait_seconds=round(stats["total_wait_seconds"], 3),
+                max_wait_seconds=round(stats["max_wait_seconds"], 3),
+                avg_wait_seconds=round(stats["total_wait_seconds"] / handled, 3) if handled else 0.0,
+            )
+        return {
+            "lanes": lanes,
+            "queued": sum(len(jobs) for jobs in self._chat_jobs.values()),
+            "queued_chats": len(self._chat_jobs),
+            "workers": len(self._workers),
+            "tracked_chats": len(self._chat_buckets),
+            "paused_for_seconds": round(max(self._paused_until - time.monotonic(), 0.0), 1),
+        }
+
+
+telegram = TelegramDispatcher()
@@ -0,0 +1,10 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# config.py reads these at import time; the unit tests never reach MySQL or Telegram
+os.environ.setdefault("DB_PORT", "3306")
+os.environ.setdefault("BOT_TOKEN", "123456:unit-test-token")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,139 @@
+# tests/test_decrypted_row.py
+
+import copy
+import json
+import pickle
+
+import pytest
+
+import db_encryption_wrapper
+from crypto_service import encrypt_data
+from db_encryption_wrapper import DecryptedRow, decrypt_dict_data
+
+
+@pytest.fixture
+def decrypted(monkeypatch):
+    """Record which ciphertexts the rows decrypt"""
+    calls = []
+    real_decrypt = db_encryption_wrapper.decrypt_data
+
+    def counting_decrypt(value):
+        calls.append(value)
+        return real_decrypt(value)
+
+    monkeypatch.setattr(db_encryption_wrapper, "decrypt_data", counting_decrypt)
+    return calls
+
+
+def _row(mask=False):
+    return decrypt_dict_data({
+        "id": 7,
+        "name": encrypt_data("Aysel Məmmədova"),
+        "phone": encrypt_data("+994501234567"),
+        "status": "active",
+        "card_holder": None,
+    }, mask=mask)
+
+
+def test_decrypts_each_field_once_on_first_access(decrypted):
+    row = _row()
+    assert isinstance(row, DecryptedRow)
+    assert row["id"] == 7
+    assert decrypted == []
+
+    assert row["name"] == "Aysel Məmmədova"
+    assert row.get("name") == "Aysel Məmmədova"
+    assert len(decrypted) == 1
+
+    assert row.get("phone") == "+994501234567"
+    assert row.get("missing", "default") == "default"
+    assert row["card_holder"] is None
+    assert len(decrypted) == 2
+
+
+@pytest.mark.parametrize("view", [
+    lambda row: dict(row),
+    lambda row: {**row},
+    lambda row: dict(row.items()),
+    lambda row: dict(zip(row.keys(), row.values())),
+    lambda row: json.loads(json.dumps(row, ensure_ascii=False)),
+    lambda row: row.copy(),
+    lambda row: copy.copy(row),
+    lambda row: copy.deepcopy(row),
+    lambda row: pickle.loads(pickle.dumps(row)),
+    lambda row: row | {},
+])
+def test_whole_row_views_see_plaintext(view):
+    result = view(_row())
+    assert result == {
+        "id": 7,
+        "name": "Aysel Məmmədova",
+        "phone": "+994501234567",
+        "status": "active",
+        "card_holder": None,
+    }
+
+
+def test_copies_are_plain_dicts():
+    row = _row()
+    for result in (row.copy(), copy.deepcopy(row), pickle.loads(pickle.dumps(row)), row | {}):
+        assert type(result) is dict
+
+
+def test_compares_by_plaintext():
+    row = _row()
+    assert row == {"id": 7, "name": "Aysel Məmmədova", "phone": "+994501234567",
+                   "status": "active", "card_holder": None}
+    assert row != {"id": 7}
+    with pytest.raises(TypeError):
+        hash(row)
+
+
+def test_written_values_are_not_decrypted(decrypted):
+    row = _row()
+    row["name"] = "Leyla"
+    row.update(phone="+994551112233")
+    row |= {"card_holder": "LEYLA"}
+
+    assert dict(row) == {
+        "id": 7,
+        "name": "Leyla",
+        "phone": "+994551112233",
+        "status": "active",
+        "card_holder": "LEYLA",
+    }
+    assert decrypted == []
+
+
+def test_update_consumes_an_iterator_once():
+    row = _row()
+    row.update(iter([("name", "Leyla"), ("status", "blocked")]))
+    assert row["name"] == "Leyla"
+    assert row["status"] == "blocked"
+
+
+def test_pop_setdefault_and_del():
+    row = _row()
+    assert row.setdefault("name", "unused") == "Aysel Məmmədova"
+    assert row.pop("phone") == "+994501234567"
+    assert row.pop("phone", None) is None
+    del row["name"]
+    assert dict(row) == {"id": 7, "status": "active", "card_holder": None}
+
+
+def test_masked_rows_mask_after_decrypting():
+    row = _row(mask=True)
+    assert row.masked
+    assert row["phone"] == "+994-**-***-4567"
+    assert row["name"] != "Aysel Məmmədova"
+
+
+def test_masking_a_decrypted_row_does_not_decrypt_again(decrypted):
+    row = _row()
+    assert row["phone"] == "+994501234567"
+    masked = decrypt_dict_data(row, mask=True)
+
+    assert masked["phone"] == "+994-**-***-4567"
+    assert len(decrypted) == 2   # phone by the first row, name while re-wrapping
+    assert decrypt_dict_data(masked, mask=True) is masked
+    assert decrypt_dict_data(row) is row
@@ -0,0 +1,91 @@
+# tests/test_decryption_cache.py
+
+import sys
+
+import crypto_service
+from crypto_service import DecryptionCache
+
+
+def _entry_size(plaintext):
+    return sys.getsizeof(plaintext) + DecryptionCache.ENTRY_OVERHEAD
+
+
+def test_get_returns_what_was_put():
+    cache = DecryptionCache(max_entries=10, max_bytes=1 << 20)
+    assert cache.get("ciphertext-a") is None
+    cache.put("ciphertext-a", "Aysel")
+    assert cache.get("ciphertext-a") == "Aysel"
+    assert cache.get("ciphertext-b") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 1)
+    assert stats["hit_rate"] == round(1 / 3, 4)
+    assert stats["bytes"] == _entry_size("Aysel")
+
+
+def test_evicts_least_recently_used_entry():
+    cache = DecryptionCache(max_entries=2, max_bytes=1 << 20)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")          # "b" is now the oldest
+    cache.put("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_evicts_to_stay_under_the_byte_cap():
+    plaintext = "x" * 100
+    cache = DecryptionCache(max_entries=100, max_bytes=2 * _entry_size(plaintext))
+    for ciphertext in ("a", "b", "c"):
+        cache.put(ciphertext, plaintext)
+
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["bytes"] == 2 * _entry_size(plaintext)
+    assert cache.get("a") is None
+
+
+def test_put_replaces_an_entry_without_double_counting():
+    cache = DecryptionCache(max_entries=10, max_bytes=1 << 20)
+    cache.put("a", "short")
+    cache.put("a", "a longer plaintext")
+
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["bytes"] == _entry_size("a longer plaintext")
+    assert cache.get("a") == "a longer plaintext"
+
+
+def test_zero_entries_disables_the_cache():
+    cache = DecryptionCache(max_entries=0, max_bytes=1 << 20)
+    cache.put("a", "1")
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_purge_drops_everything():
+    cache = DecryptionCache(max_entries=10, max_bytes=1 << 20)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.purge()
+
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["purges"]) == (0, 0, 1)
+    assert cache.get("a") is None
+
+
+def test_decrypt_data_caches_plaintexts_but_not_failures():
+    crypto_service.purge_decryption_cache()
+    ciphertext = crypto_service.encrypt_data("+994501234567")
+
+    assert crypto_service.decrypt_data(ciphertext) == "+994501234567"
+    hits = crypto_service.get_decryption_cache_stats()["hits"]
+    assert crypto_service.decrypt_data(ciphertext) == "+994501234567"
+    assert crypto_service.get_decryption_cache_stats()["hits"] == hits + 1
+
+    # Undecryptable input comes back unchanged and is not remembered
+    assert crypto_service.decrypt_data("not a ciphertext") == "not a ciphertext"
+    assert crypto_service._decryption_cache.get("not a ciphertext") is None
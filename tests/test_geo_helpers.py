@@ -0,0 +1,57 @@
+# tests/test_geo_helpers.py
+
+import math
+
+import pytest
+
+import geo_helpers
+from geo_helpers import calculate_distance, calculate_distances
+
+BAKU = (40.4093, 49.8671)
+CANDIDATES = [
+    (40.4093, 49.8671),    # same point
+    (40.3777, 49.8920),    # a few km away
+    (40.6828, 46.3606),    # Ganja, ~300 km
+    (None, 49.8671),       # missing latitude
+    (40.4093, None),       # missing longitude
+    (-33.8688, 151.2093),  # Sydney, far side of the earth
+]
+
+
+def _scalar(radius=None):
+    distances = [calculate_distance(*BAKU, lat, lon) for lat, lon in CANDIDATES]
+    limit = math.inf if radius is None else radius
+    return distances, [math.isfinite(d) and d <= limit for d in distances]
+
+
+@pytest.fixture(params=["python", "numpy"])
+def backend(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(geo_helpers, "np", None)
+    elif geo_helpers.np is None:
+        pytest.skip("numpy is not installed")
+    return request.param
+
+
+@pytest.mark.parametrize("radius", [None, 0.0, 10.0, 500.0])
+def test_calculate_distances_matches_scalar(backend, radius):
+    latitudes = [lat for lat, _ in CANDIDATES]
+    longitudes = [lon for _, lon in CANDIDATES]
+
+    distances, mask = calculate_distances(*BAKU, latitudes, longitudes, radius=radius)
+    expected_distances, expected_mask = _scalar(radius)
+
+    assert len(distances) == len(CANDIDATES)
+    for got, expected in zip(distances, expected_distances):
+        if math.isinf(expected):
+            assert math.isinf(got)
+        else:
+            assert got == pytest.approx(expected, rel=1e-9, abs=1e-9)
+    assert [bool(m) for m in mask] == expected_mask
+
+
+def test_calculate_distances_empty(backend):
+    distances, mask = calculate_distances(*BAKU, [], [])
+
+    assert len(distances) == 0
+    assert len(mask) == 0
@@ -0,0 +1,56 @@
+# tests/test_key_rotation.py
+
+import key_rotation
+from crypto_service import decrypt_data, encrypt_data
+from key_rotation import reencrypt_rows
+
+
+def test_rewrites_only_values_that_need_it():
+    current = encrypt_data("Aysel")
+    rows = [
+        (1, current, "FAILED_ENC:+994501234567"),
+        (2, None, "plaintext"),
+    ]
+    updates, counts, search_values = reencrypt_rows(rows, ("id",), ("name", "phone"))
+
+    assert counts == {"scanned": 2, "rotated": 1, "failed": 0}
+    assert search_values == []
+    [(column, key, old_value, new_value)] = updates
+    assert (column, key, old_value) == ("phone", (1,), "FAILED_ENC:+994501234567")
+    assert decrypt_data(new_value) == "+994501234567"
+
+
+def test_counts_values_no_key_decrypts(monkeypatch):
+    statuses = {"old": ("new", "rotated"), "lost": ("lost", "failed")}
+    monkeypatch.setattr(key_rotation, "reencrypt_data", lambda value: statuses.get(value, (value, "current")))
+
+    rows = [("k1", "old", "lost"), ("k2", "same", "old")]
+    updates, counts, _ = reencrypt_rows(rows, ("state_key",), ("data", "bucket"))
+
+    assert counts == {"scanned": 2, "rotated": 2, "failed": 1}
+    assert updates == [
+        ("data", ("k1",), "old", "new"),
+        ("bucket", ("k2",), "old", "new"),
+    ]
+
+
+def test_composite_keys_are_split_off_the_front():
+    rows = [(3, "fr", "FAILED_ENC:Leyla")]
+    updates, counts, _ = reencrypt_rows(rows, ("id", "lang"), ("name",))
+
+    assert counts["rotated"] == 1
+    assert updates[0][:3] == ("name", (3, "fr"), "FAILED_ENC:Leyla")
+
+
+def test_collects_search_plaintexts_for_the_blind_index():
+    rows = [
+        (1, encrypt_data("123456789"), encrypt_data("Aysel"), "FAILED_ENC:+994501234567"),
+        (2, encrypt_data("987654321"), None, "not encrypted"),
+    ]
+    _, _, search_values = reencrypt_rows(rows, ("id",), ("telegram_id", "name", "phone"), "customer")
+
+    # Only name and phone are indexed, and only values that really decrypt
+    assert search_values == [
+        (1, {"name": "Aysel", "phone": "+994501234567"}),
+        (2, {}),
+    ]
@@ -0,0 +1,115 @@
+# tests/test_telegram_dispatcher.py
+
+import asyncio
+import random
+
+import pytest
+
+import telegram_dispatcher
+from telegram_dispatcher import (
+    TelegramDispatcher, PRIORITY_TRANSACTIONAL, PRIORITY_NORMAL, PRIORITY_BULK
+)
+
+
+class FakeBot:
+    """Records send_message calls; a text listed in `errors` raises that error"""
+
+    def __init__(self, errors=None, jitter=0.0):
+        self.sent = []
+        self.errors = errors or {}
+        self.jitter = jitter
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(random.uniform(0, self.jitter))
+        if text in self.errors:
+            raise self.errors[text]
+        self.sent.append((chat_id, text))
+        return text
+
+
+@pytest.fixture
+def fake_bot(monkeypatch):
+    def install(**kwargs):
+        bot = FakeBot(**kwargs)
+        monkeypatch.setattr(telegram_dispatcher, "bot", bot)
+        return bot
+    return install
+
+
+def _dispatcher(**kwargs):
+    options = dict(concurrency=4, global_rate=10000, per_chat_rate=10000, per_chat_burst=10000, max_retries=2)
+    options.update(kwargs)
+    return TelegramDispatcher(**options)
+
+
+def test_calls_to_one_chat_keep_submission_order(fake_bot):
+    bot = fake_bot(jitter=0.002)
+    priorities = [PRIORITY_TRANSACTIONAL, PRIORITY_NORMAL, PRIORITY_BULK]
+
+    async def run():
+        dispatcher = _dispatcher()
+        futures = [
+            dispatcher.submit("send_message", i % 3, priority=random.choice(priorities), text=f"{i % 3}:{i}")
+            for i in range(60)
+        ]
+        await asyncio.gather(*futures)
+        return dispatcher
+
+    dispatcher = asyncio.run(run())
+
+    for chat_id in range(3):
+        texts = [text for chat, text in bot.sent if chat == chat_id]
+        assert [int(text.split(":")[1]) for text in texts] == sorted(int(text.split(":")[1]) for text in texts)
+        assert len(texts) == 20
+    assert dispatcher.stats()["queued"] == 0
+
+
+def test_chat_waiting_for_its_slot_does_not_hold_the_worker(fake_bot):
+    bot = fake_bot()
+
+    async def run():
+        # One worker; chat 1 may only send one message per 0.2 s
+        dispatcher = _dispatcher(concurrency=1, per_chat_rate=5, per_chat_burst=1)
+        first = [dispatcher.submit("send_message", 1, text=f"busy {i}") for i in range(3)]
+        other = dispatcher.submit("send_message", 2, text="other")
+        await other
+        sent_before_other = list(bot.sent)
+        await asyncio.gather(*first)
+        return sent_before_other
+
+    sent_before_other = asyncio.run(run())
+
+    assert sent_before_other == [(1, "busy 0"), (2, "other")]
+    assert [text for chat, text in bot.sent if chat == 1] == ["busy 0", "busy 1", "busy 2"]
+
+
+def test_errors_reach_the_caller_and_later_calls_still_run(fake_bot):
+    bot = fake_bot(errors={"bad": ValueError("rejected")})
+
+    async def run():
+        dispatcher = _dispatcher()
+        futures = [dispatcher.submit("send_message", 7, text=text) for text in ("a", "bad", "c")]
+        return await asyncio.gather(*futures, return_exceptions=True), dispatcher
+
+    results, dispatcher = asyncio.run(run())
+
+    assert results[0] == "a" and results[2] == "c"
+    assert isinstance(results[1], ValueError)
+    assert bot.sent == [(7, "a"), (7, "c")]
+    assert dispatcher.stats()["lanes"]["transactional"]["failed"] == 1
+
+
+def test_cancelled_calls_are_skipped(fake_bot):
+    bot = fake_bot()
+
+    async def run():
+        dispatcher = _dispatcher(concurrency=1)
+        keep = dispatcher.submit("send_message", 3, text="keep")
+        dropped = dispatcher.submit("send_message", 3, text="dropped")
+        dropped.cancel()
+        last = dispatcher.submit("send_message", 3, text="last")
+        await asyncio.gather(keep, last)
+
+    asyncio.run(run())
+
+    assert bot.sent == [(3, "keep"), (3, "last")]
@@ -0,0 +1,183 @@
+# tests/test_user_context_store.py
+
+import threading
+
+import pytest
+
+from user_context_store import UserContextStore
+
+
+class FakeTable:
+    """In-memory user_context table with the loader / saver signatures"""
+
+    def __init__(self, rows=None):
+        self.rows = dict(rows or {})
+        self.loads = []
+        self.batches = []
+        self.fail = False
+
+    def load(self, key):
+        self.loads.append(key)
+        return self.rows.get(key)
+
+    def save(self, upserts, deletes):
+        if self.fail:
+            raise RuntimeError("database unavailable")
+        self.batches.append((dict(upserts), list(deletes)))
+        self.rows.update(upserts)
+        for key in deletes:
+            self.rows.pop(key, None)
+
+
+@pytest.fixture
+def table():
+    return FakeTable({"1": '{"action": "old"}'})
+
+
+def _store(table, flush_delay=60, ttl_seconds=300):
+    # A long flush_delay keeps the timer out of the way; tests call flush()
+    return UserContextStore(table.load, table.save, ttl_seconds=ttl_seconds, flush_delay=flush_delay)
+
+
+def test_reads_are_cached(table):
+    store = _store(table)
+
+    assert store.get("1") == '{"action": "old"}'
+    assert store.get("1") == '{"action": "old"}'
+    assert store.get("2") is None
+    assert store.get("2") is None
+
+    assert table.loads == ["1", "2"]
+    assert store.stats()["hits"] == 2
+
+
+def test_writes_within_the_window_are_coalesced(table):
+    store = _store(table)
+
+    store.set("1", None)
+    store.set("1", '{"action": "a"}')
+    store.set("1", '{"action": "b"}')
+    store.set("2", '{"action": "c"}')
+
+    assert store.get("1") == '{"action": "b"}'
+    assert table.batches == []
+    assert store.flush() is True
+    assert table.batches == [({"1": '{"action": "b"}', "2": '{"action": "c"}'}, [])]
+    assert store.stats()["coalesced"] == 2
+
+
+def test_unchanged_writes_are_skipped(table):
+    store = _store(table)
+    store.get("1")
+
+    store.set("1", '{"action": "old"}')
+
+    assert store.flush() is True
+    assert table.batches == []
+    assert store.stats()["skipped"] == 1
+
+
+def test_clear_is_saved_as_a_delete(table):
+    store = _store(table)
+
+    store.set("1", None)
+    store.flush()
+
+    assert table.batches == [({}, ["1"])]
+    assert "1" not in table.rows
+    assert store.get("1") is None
+
+
+def test_immediate_mode_persists_before_returning(table):
+    store = _store(table, flush_delay=0)
+
+    assert store.set("3", '{"action": "now"}') is True
+    assert table.rows["3"] == '{"action": "now"}'
+
+    table.fail = True
+    assert store.set("3", '{"action": "lost"}') is False
+
+
+def test_failed_flush_keeps_the_writes(table):
+    store = _store(table)
+    store.set("1", '{"action": "retry"}')
+
+    table.fail = True
+    assert store.flush() is False
+    assert store.get("1") == '{"action": "retry"}'
+
+    table.fail = False
+    assert store.flush() is True
+    assert table.rows["1"] == '{"action": "retry"}'
+
+
+def test_failed_flush_does_not_undo_a_newer_write(table):
+    store = _store(table)
+    store.set("1", '{"action": "first"}')
+    table.fail = True
+
+    def save_then_overwrite(upserts, deletes):
+        # The user writes again while the failing batch is in flight
+        store.set("1", '{"action": "second"}')
+        table.save(upserts, deletes)
+
+    store.saver = save_then_overwrite
+    assert store.flush() is False
+
+    table.fail = False
+    store.saver = table.save
+    store.flush()
+    assert table.rows["1"] == '{"action": "second"}'
+
+
+def test_discard_drops_unsaved_writes(table):
+    store = _store(table)
+    store.set("1", '{"action": "pending"}')
+
+    store.discard("1")
+    store.flush()
+
+    assert table.batches == []
+    # The next read goes back to the table
+    assert store.get("1") == '{"action": "old"}'
+    assert table.loads == ["1"]
+
+
+def test_discard_waits_for_a_running_flush(table):
+    store = _store(table)
+    store.set("1", '{"action": "in flight"}')
+    saving = threading.Event()
+    release = threading.Event()
+
+    def slow_save(upserts, deletes):
+        saving.set()
+        release.wait(5)
+        table.save(upserts, deletes)
+
+    store.saver = slow_save
+    flusher = threading.Thread(target=store.flush)
+    flusher.start()
+    assert saving.wait(5)
+
+    discarded = threading.Event()
+    discarder = threading.Thread(target=lambda: (store.discard("1"), discarded.set()))
+    discarder.start()
+    assert not discarded.wait(0.1)
+
+    release.set()
+    flusher.join(5)
+    discarder.join(5)
+    assert discarded.is_set()
+    # Once discard returns, the row can be deleted without a write landing after it
+    table.rows.pop("1")
+    store.flush()
+    assert "1" not in table.rows
+
+
+def test_expired_entries_are_reloaded(table):
+    store = _store(table, ttl_seconds=0)
+
+    store.get("1")
+    store.get("1")
+
+    assert table.loads == ["1", "1"]
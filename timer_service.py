@@ -0,0 +1,406 @@
+# timer_service.py
+
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime, timedelta
+import db
+from db_async import adb
+from config import WORKER_ID, TASK_LEASE_SECONDS, TASK_SYNC_SECONDS, TASK_MAX_ATTEMPTS
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Timer types (scheduled_tasks.task_type); reference_id is always an order ID
+TASK_ORDER_ACCEPTANCE = "order_acceptance_check"
+TASK_DIRECT_ORDER_ACCEPTANCE = "direct_order_acceptance_check"
+TASK_ARRIVAL_CHECK = "arrival_check"
+TASK_ARRIVAL_WARNING = "arrival_warning"
+TASK_PRICE_REMINDER = "price_reminder"
+TASK_FINAL_PRICE_WARNING = "final_price_warning"
+TASK_ADMIN_PAYMENT_DEADLINE = "admin_payment_deadline"
+TASK_BLOCK_ARTISAN_NONPAYMENT = "block_artisan_nonpayment"
+TASK_BLOCK_CUSTOMER_TIMEOUT = "block_customer_timeout"
+TASK_BLOCK_ARTISAN_TIMEOUT = "block_artisan_timeout"
+TASK_DELAY_REMINDER = "delay_reminder"
+# Payment events queued by the db payment writers (db.PAYMENT_EVENT_TASKS)
+TASK_PAYMENT_INVALID_RECEIPT = "payment_invalid_receipt"
+TASK_PAYMENT_TRANSFER = "payment_transfer"
+
+_handlers = {}
+
+
+def timer_handler(task_type):
+    """Register a coroutine function as the handler of a timer type
+
+    The handler is awaited as handler(reference_id, **data), where data is
+    the dict passed to TimerService.schedule(). A handler that raises marks
+    the task as failed; anything else marks it completed.
+
+    Args:
+        task_type (str): Timer type the handler serves
+    """
+    def decorator(func):
+        registered = _handlers.get(task_type)
+        if registered is not None and registered is not func:
+            raise ValueError(f"Timer type {task_type} already has a handler: {registered.__qualname__}")
+        _handlers[task_type] = func
+        return func
+    return decorator
+
+
+class TimerService:
+    """Durable timers on top of the scheduled_tasks table
+
+    Every timer is written to MySQL before it is armed, so it survives a
+    restart. In process, pending timers sit in a min-heap ordered by
+    execution time and a single runner coroutine sleeps until the earliest
+    one is due, instead of one sleeping coroutine per timer. Cancelled
+    timers are dropped from the lookup dict and skipped lazily when their
+    heap entry surfaces.
+
+    Rows inserted into scheduled_tasks by other code (e.g. create_delay_reminder)
+    are announced through db.add_scheduled_task_listener and wake the runner
+    if they are due sooner than anything armed. Recurring maintenance jobs
+    registered with every() share the same heap but are not persisted.
+
+    Several bot processes can share the table: a due timer is claimed with
+    an owner + lease_expires_at update that only one worker can win, the
+    lease is renewed while the handler runs, and a periodic sync arms timers
+    created by other workers as well as tasks whose worker died mid-run.
+    """
+
+    def __init__(self, owner=WORKER_ID, lease_seconds=TASK_LEASE_SECONDS,
+                 sync_interval=TASK_SYNC_SECONDS, max_attempts=TASK_MAX_ATTEMPTS):
+        """
+        Args:
+            owner (str): Worker ID written to lease_owner
+            lease_seconds (int): Lease length; heartbeats renew it every third of that
+            sync_interval (int): Seconds between scans for foreign and expired tasks
+            max_attempts (int): Claims per task before it is given up as failed
+        """
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.sync_interval = sync_interval
+        self.max_attempts = max_attempts
+        self._heap = []        # (execution_time, sequence, key)
+        self._pending = {}     # key -> task dict; key is the task ID, or "periodic:<name>"
+        self._periodic = {}    # name -> (interval_seconds, coroutine function, exclusive)
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._loop = None
+        self._runner = None
+        self._in_flight = set()
+        self._stats = {
+            "scheduled": 0, "cancelled": 0, "completed": 0, "failed": 0, "skipped": 0,
+            "recovered": 0, "synced": 0, "lost_leases": 0, "abandoned": 0,
+        }
+        self._lag = {}         # task_type -> lag counters
+
+    # -------------------------
+    # LIFECYCLE
+    # -------------------------
+
+    async def start(self):
+        """Load pending timers from the database and start the runner
+
+        Tasks whose worker died mid-run are taken over once their lease
+        expires, and timers that fell due while the bot was down fire
+        immediately.
+        """
+        if self._runner is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        db.add_scheduled_task_listener(self._on_task_created)
+
+        tasks = await adb.get_claimable_scheduled_tasks(sorted(_handlers), self.max_attempts)
+        now = datetime.now()
+        overdue = 0
+        for task in tasks:
+            if self._push(task) and task['execution_time'] <= now:
+                overdue += 1
+        self._stats["recovered"] += len(tasks)
+
+        logger.info(
+            f"Timer service started as {self.owner} with {len(tasks)} pending timers ({overdue} overdue)"
+        )
+        self._runner = asyncio.create_task(self._run())
+        self.every("timer_sync", self.sync_interval, self._sync, run_now=False)
+
+    async def _sync(self):
+        """Arm timers created by other workers and tasks whose lease expired"""
+        abandoned = await adb.fail_abandoned_scheduled_tasks(self.max_attempts)
+        if abandoned:
+            self._stats["abandoned"] += abandoned
+            logger.error(f"Gave up on {abandoned} timers after {self.max_attempts} attempts")
+
+        # Look one interval ahead so timers due before the next sync are armed in time
+        tasks = await adb.get_claimable_scheduled_tasks(
+            sorted(_handlers), self.max_attempts, horizon_seconds=self.sync_interval * 2
+        )
+        armed = sum(1 for task in tasks if self._push(task))
+        if armed:
+            self._stats["synced"] += armed
+            logger.info(f"Armed {armed} timers from other workers or expired leases")
+
+    async def stop(self):
+        """Stop the runner; pending timers stay in the database"""
+        if self._runner is None:
+            return
+        db.remove_scheduled_task_listener(self._on_task_created)
+        self._runner.cancel()
+        try:
+            await self._runner
+        except asyncio.CancelledError:
+            pass
+        self._runner = None
+
+    # -------------------------
+    # SCHEDULING
+    # -------------------------
+
+    async def schedule(self, task_type, reference_id, delay=None, run_at=None, data=None):
+        """Persist and arm a timer
+
+        Args:
+            task_type (str): Registered timer type
+            reference_id (int): ID of the order the timer belongs to
+            delay (float, optional): Seconds from now
+            run_at (datetime, optional): Absolute execution time (used when delay is None)
+            data (dict, optional): JSON-serialisable keyword arguments for the handler
+
+        Returns:
+            int: Task ID or None if the timer could not be stored
+        """
+        if task_type not in _handlers:
+            raise ValueError(f"No handler registered for timer type {task_type}")
+        if delay is None and run_at is None:
+            raise ValueError("Either delay or run_at is required")
+
+        execution_time = run_at if delay is None else datetime.now() + timedelta(seconds=delay)
+        data = data or {}
+
+        task_id = await adb.create_scheduled_task(task_type, reference_id, execution_time, data)
+        if task_id is None:
+            logger.error(f"Could not schedule {task_type} timer for {reference_id}")
+            return None
+
+        self._push({
+            "id": task_id,
+            "task_type": task_type,
+            "reference_id": reference_id,
+            "execution_time": execution_time,
+            "data": data,
+        })
+        self._stats["scheduled"] += 1
+        logger.info(f"Scheduled {task_type} timer {task_id} for {reference_id} at {execution_time}")
+        return task_id
+
+    async def cancel(self, task_types, reference_id):
+        """Cancel pending timers of an order
+
+        Args:
+            task_types (str or list): Timer type(s) to cancel
+            reference_id (int): ID of the order
+
+        Returns:
+            int: Number of cancelled timers
+        """
+        if isinstance(task_types, str):
+            task_types = [task_types]
+
+        task_ids = await adb.cancel_scheduled_tasks(list(task_types), reference_id)
+        if not task_ids:
+            return 0
+
+        for task_id in task_ids:
+            self._pending.pop(task_id, None)
+        self._stats["cancelled"] += len(task_ids)
+        logger.info(f"Cancelled {len(task_ids)} timer(s) {list(task_types)} for {reference_id}")
+        return len(task_ids)
+
+    def every(self, name, interval, func, exclusive=False, run_now=True):
+        """Run a coroutine function now and then every `interval` seconds
+
+        The next run is armed when the current one finishes, so a slow job
+        never overlaps itself. Periodic jobs live only in memory.
+
+        Args:
+            name (str): Job name, also the task type in lag metrics
+            interval (float): Seconds between the end of one run and the next
+            func (callable): Coroutine function taking no arguments
+            exclusive (bool): Run on one worker of the cluster only; the worker
+                holding the job lease keeps it while it keeps running the job
+            run_now (bool): Run immediately instead of after the first interval
+        """
+        if interval <= 0:
+            raise ValueError("Interval must be positive")
+        self._periodic[name] = (interval, func, exclusive)
+        first_run = datetime.now() if run_now else datetime.now() + timedelta(seconds=interval)
+        self._push({
+            "id": f"periodic:{name}",
+            "task_type": name,
+            "execution_time": first_run,
+            "periodic": True,
+        })
+
+    def _push(self, task):
+        """Arm a timer in memory; returns False if it is already armed"""
+        key = task['id']
+        if key in self._pending:
+            return False
+        self._pending[key] = task
+        heapq.heappush(self._heap, (task['execution_time'], next(self._sequence), key))
+        # Only a new earliest timer changes how long the runner should sleep
+        if self._heap[0][2] == key:
+            self._wakeup.set()
+        return True
+
+    def _on_task_created(self, task):
+        """db listener; runs on whichever thread inserted the row"""
+        if task['task_type'] in _handlers and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._push, task)
+
+    # -------------------------
+    # RUNNER
+    # -------------------------
+
+    def _next_delay(self):
+        """Seconds until the earliest live timer, or None if there is none"""
+        while self._heap and self._heap[0][2] not in self._pending:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return (self._heap[0][0] - datetime.now()).total_seconds()
+
+    async def _run(self):
+        while True:
+            try:
+                self._wakeup.clear()
+                delay = self._next_delay()
+                if delay is None:
+                    await self._wakeup.wait()
+                elif delay > 0:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    self._dispatch_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in timer service runner: {e}", exc_info=True)
+                await asyncio.sleep(1)
+
+    def _dispatch_due(self):
+        now = datetime.now()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, key = heapq.heappop(self._heap)
+            task = self._pending.pop(key, None)
+            if task is None:
+                continue
+            runner = self._execute_periodic if task.get('periodic') else self._execute
+            job = asyncio.create_task(runner(task))
+            self._in_flight.add(job)
+            job.add_done_callback(self._in_flight.discard)
+
+    async def _execute(self, task):
+        task_id, task_type = task['id'], task['task_type']
+
+        # Another worker may have claimed it, or it was cancelled since it was armed
+        if not await adb.claim_scheduled_task(task_id, self.owner, self.lease_seconds, self.max_attempts):
+            self._stats["skipped"] += 1
+            logger.info(f"Timer {task_id} ({task_type}) was claimed elsewhere or is no longer pending, skipping")
+            return
+
+        lag = self._record_lag(task)
+        logger.info(f"Running {task_type} timer {task_id} for {task['reference_id']} ({lag:.1f}s late)")
+
+        heartbeat = asyncio.create_task(self._heartbeat(task_id))
+        status = 'completed'
+        try:
+            await _handlers[task_type](task['reference_id'], **task['data'])
+        except Exception as e:
+            status = 'failed'
+            logger.error(f"Timer {task_id} ({task_type}) failed: {e}", exc_info=True)
+        finally:
+            heartbeat.cancel()
+
+        self._stats[status] += 1
+        if not await adb.finish_scheduled_task(task_id, self.owner, status):
+            logger.warning(f"Timer {task_id} ({task_type}) finished after its lease was taken over")
+
+    async def _heartbeat(self, task_id):
+        """Renew a claimed task's lease until the handler returns"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await adb.renew_scheduled_task_lease(task_id, self.owner, self.lease_seconds):
+                self._stats["lost_leases"] += 1
+                logger.warning(f"Lost the lease of timer {task_id}, another worker may run it again")
+                return
+
+    async def _execute_periodic(self, task):
+        name = task['task_type']
+        interval, func, exclusive = self._periodic[name]
+        try:
+            # Hold the lease for two intervals: the owner renews it on its next
+            # run, and other workers take over only if that run never happens
+            if exclusive and not await adb.acquire_job_lease(name, self.owner, interval * 2):
+                return
+            self._record_lag(task)
+            await func()
+        except Exception as e:
+            logger.error(f"Periodic job {name} failed: {e}", exc_info=True)
+        finally:
+            task = dict(task, execution_time=datetime.now() + timedelta(seconds=interval))
+            self._push(task)
+
+    def _record_lag(self, task):
+        """Track how late a timer started compared to its execution time"""
+        lag = max((datetime.now() - task['execution_time']).total_seconds(), 0.0)
+        counters = self._lag.setdefault(task['task_type'], {"runs": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        counters["runs"] += 1
+        counters["total_seconds"] += lag
+        counters["max_seconds"] = max(counters["max_seconds"], lag)
+        counters["last_seconds"] = lag
+        return lag
+
+    # -------------------------
+    # METRICS
+    # -------------------------
+
+    def stats(self):
+        """Get timer counters, the next due time and start lag per task type
+
+        Returns:
+            dict: Pending and in-flight counts, lifetime counters and lag in ms
+        """
+        delay = self._next_delay()
+        lag = {
+            task_type: {
+                "runs": counters["runs"],
+                "avg_ms": round(counters["total_seconds"] / counters["runs"] * 1000, 1),
+                "max_ms": round(counters["max_seconds"] * 1000, 1),
+                "last_ms": round(counters["last_seconds"] * 1000, 1),
+            }
+            for task_type, counters in self._lag.items()
+        }
+        return dict(
+            self._stats,
+            owner=self.owner,
+            pending=len(self._pending),
+            in_flight=len(self._in_flight),
+            next_due_in_seconds=round(delay, 1) if delay is not None else None,
+            handlers=sorted(_handlers),
+            periodic=sorted(self._periodic),
+            lag=lag,
+        )
+
+
+timers = TimerService()
@@ -0,0 +1,215 @@
+# user_context_store.py
+
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class UserContextStore:
+    """Process-local cache and write buffer in front of the user_context table
+
+    Values are the JSON strings stored in user_context.context_data, keyed
+    by the telegram_id string. Reads are served from an LRU cache for
+    `ttl_seconds`. Writes update the cache at once and are persisted after
+    `flush_delay` seconds in one batch, so a clear followed by a set (or
+    several sets) within the window costs one statement; writes that do not
+    change the cached value are skipped. With flush_delay 0 every write is
+    persisted before it returns.
+
+    The database side is injected: `loader(key)` returns the stored JSON or
+    None, `saver(upserts, deletes)` persists {key: json} and [key] in one
+    transaction. Both run on the calling / flushing thread.
+    """
+
+    def __init__(self, loader, saver, max_entries=10000, ttl_seconds=300, flush_delay=0.2):
+        self.loader = loader
+        self.saver = saver
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.flush_delay = flush_delay
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._cache = OrderedDict()   # key -> (json or None, expires_at)
+        self._dirty = {}              # key -> json or None (delete)
+        self._inflight = {}           # writes taken by the running flush
+        self._timer = None
+        self._stats = {
+            "hits": 0, "misses": 0, "reads": 0, "read_seconds": 0.0,
+            "writes": 0, "skipped": 0, "coalesced": 0, "flushes": 0,
+            "flushed_rows": 0, "flush_seconds": 0.0, "errors": 0,
+        }
+        atexit.register(self.flush)
+
+    # -------------------------
+    # READS
+    # -------------------------
+
+    def get(self, key):
+        """Get the stored JSON of a user, or None"""
+        now = time.monotonic()
+        with self._lock:
+            pending = self._pending(key)
+            if pending is not None:
+                self._stats["hits"] += 1
+                return pending[0]
+            entry = self._cache.get(key)
+            if entry is not None and entry[1] > now:
+                self._stats["hits"] += 1
+                self._cache.move_to_end(key)
+                return entry[0]
+            self._stats["misses"] += 1
+
+        started = time.perf_counter()
+        try:
+            value = self.loader(key)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._stats["reads"] += 1
+                self._stats["read_seconds"] += elapsed
+
+        with self._lock:
+            # A write that raced with the load is newer than what was read
+            pending = self._pending(key)
+            if pending is not None:
+                return pending[0]
+            self._remember(key, value)
+        return value
+
+    def _pending(self, key):
+        """Unsaved value of a key as a 1-tuple, or None when nothing is pending"""
+        if key in self._dirty:
+            return (self._dirty[key],)
+        if key in self._inflight:
+            return (self._inflight[key],)
+        return None
+
+    def _remember(self, key, value):
+        self._cache[key] = (value, time.monotonic() + self.ttl_seconds)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    # -------------------------
+    # WRITES
+    # -------------------------
+
+    def set(self, key, value):
+        """Store a user's JSON (None deletes it)
+
+        Returns:
+            bool: False only when an immediate (flush_delay 0) write failed
+        """
+        with self._lock:
+            self._stats["writes"] += 1
+            if key in self._dirty:
+                if self._dirty[key] == value:
+                    self._stats["skipped"] += 1
+                    return True
+                self._stats["coalesced"] += 1
+            else:
+                entry = self._cache.get(key)
+                if entry is not None and entry[1] > time.monotonic() and entry[0] == value:
+                    self._stats["skipped"] += 1
+                    return True
+            self._dirty[key] = value
+            self._remember(key, value)
+
+            if self.flush_delay > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.flush_delay, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return True
+
+        return self.flush()
+
+    def flush(self):
+        """Persist buffered writes in one batch
+
+        Returns:
+            bool: True if the batch was saved (or there was nothing to save)
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._timer = None
+                dirty, self._dirty = self._dirty, {}
+                self._inflight = dirty
+            if not dirty:
+                return True
+
+            upserts = {key: value for key, value in dirty.items() if value is not None}
+            deletes = [key for key, value in dirty.items() if value is None]
+            started = time.perf_counter()
+            try:
+                self.saver(upserts, deletes)
+            except Exception as e:
+                logger.error(f"Could not save {len(dirty)} user contexts: {e}")
+                with self._lock:
+                    self._stats["errors"] += 1
+                    # Keep them for the next flush unless they were overwritten meanwhile
+                    for key, value in dirty.items():
+                        self._dirty.setdefault(key, value)
+                    if self._timer is None and self.flush_delay > 0:
+                        self._timer = threading.Timer(max(self.flush_delay, 1.0), self.flush)
+                        self._timer.daemon = True
+                        self._timer.start()
+                return False
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self._inflight = {}
+                    self._stats["flushes"] += 1
+                    self._stats["flush_seconds"] += elapsed
+
+            with self._lock:
+                self._stats["flushed_rows"] += len(dirty)
+            return True
+
+    def discard(self, key):
+        """Drop the cached value and any unsaved write of a key
+
+        Used before the key's row is deleted. Waits for a running flush, so
+        no write buffered before the call can reach the table afterwards.
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._dirty.pop(key, None)
+                self._cache.pop(key, None)
+
+    def invalidate(self, key=None):
+        """Forget cached values (all of them when key is None)"""
+        with self._lock:
+            if key is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(key, None)
+
+    # -------------------------
+    # METRICS
+    # -------------------------
+
+    def stats(self):
+        """Get cache, coalescing and latency counters
+
+        Returns:
+            dict: Counters plus average read and flush latency in milliseconds
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached"] = len(self._cache)
+            stats["pending"] = len(self._dirty)
+        stats["avg_read_ms"] = round(stats["read_seconds"] * 1000 / stats["reads"], 3) if stats["reads"] else 0.0
+        stats["avg_flush_ms"] = round(stats["flush_seconds"] * 1000 / stats["flushes"], 3) if stats["flushes"] else 0.0
+        stats["read_seconds"] = round(stats["read_seconds"], 3)
+        stats["flush_seconds"] = round(stats["flush_seconds"], 3)
+        return stats